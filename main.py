@@ -1,12 +1,9 @@
 import os
 import argparse
-from src.pipelines.model_trainer import train_sepsis_models, train_bpi_models
-from src.pipelines.train_enhanced_models import EnhancedModelTrainer
-from src.pipelines.compare_models import ModelComparator
-from src.pipelines.causality_tests import CausalityTester
-from src.analysis.process_mining import analyze_event_logs
-import joblib
-import pandas as pd
+import logging
+from src.pipelines.stages import build_task_graph
+from src.common.artifact_cache import ArtifactCache
+from src.common import instrumentation, profiling, plotting
 
 def setup_directories():
     """Create necessary directories if they don't exist"""
@@ -41,229 +38,122 @@ def main():
     parser.add_argument('--causality', action='store_true', help='Run causality tests')
     parser.add_argument('--dataset', choices=['sepsis', 'bpi', 'all'], default='all', 
                         help='Dataset to process (sepsis, bpi, or all)')
+    parser.add_argument('--search', action='store_true',
+                        help='Tune model hyperparameters with a successive-halving search before training')
+    parser.add_argument('--deduplicate', action='store_true',
+                        help='Train on unique feature rows weighted by how often they occur')
+    parser.add_argument('--ngrams', action='store_true',
+                        help='Add sparse activity n-gram counts of each prefix to the baseline model features')
+    parser.add_argument('--bin', action='store_true',
+                        help='Train the baseline models on uint8 quantile bin codes of the features')
+    parser.add_argument('--distill', action='store_true',
+                        help='Also distill the baseline random forest into a depth-bounded decision tree')
+    parser.add_argument('--adaptive-forest', action='store_true',
+                        help='Grow the baseline random forests until their out-of-bag accuracy plateaus')
+    parser.add_argument('--prefix-features', action='store_true',
+                        help='Leave out baseline features counted over the whole case, so --score and '
+                             '--suffixes see the same features on running cases as in training')
+    parser.add_argument('--cache-dir', default='.cache',
+                        help='Directory of the stage artifact cache')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Recompute every stage instead of reusing cached artifacts')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of stages (and log files of the analysis) to run concurrently')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='Memory budget (MB) shared by concurrently running stages')
+    parser.add_argument('--state-file', default=os.path.join('results', 'run_state.json'),
+                        help='JSON file recording stage progress')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip stages recorded as completed in the state file')
+    parser.add_argument('--instrument', action='store_true',
+                        help='Record stage timings and memory to a JSON run summary and a Chrome trace')
+    parser.add_argument('--instrument-dir', default=os.path.join('results', 'instrumentation'),
+                        help='Output directory of --instrument')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='With --instrument, also record tracemalloc peaks per stage (slower)')
+    parser.add_argument('--score', metavar='LOG', default=None,
+                        help='Score the cases of an XES log with the trained models of --dataset')
+    parser.add_argument('--score-model', default='random_forest',
+                        choices=['decision_tree', 'random_forest', 'distilled_tree'],
+                        help='Model used by --score')
+    parser.add_argument('--score-output', default=None,
+                        help='Parquet file written by --score (default: results/scores/<log name>.parquet)')
+    parser.add_argument('--score-prefixes', choices=['last', 'all'], default='last',
+                        help='Score the current prefix of every case, or every prefix')
+    parser.add_argument('--top-k', type=int, default=3,
+                        help='Most likely next activities written per prefix by --score')
+    parser.add_argument('--chunk-cases', type=int, default=1000,
+                        help='Cases read and scored per chunk by --score')
+    parser.add_argument('--score-workers', type=int, default=1,
+                        help='Scoring processes of --score (memory is capped by --memory-budget)')
+    parser.add_argument('--score-cache-mb', type=float, default=None,
+                        help='Cache predictions of repeated feature vectors in --score, up to this many MB per scorer')
+    parser.add_argument('--suffixes', metavar='LOG', default=None,
+                        help='Predict the remaining activities of the cases of an XES log with the models of --dataset')
+    parser.add_argument('--beam-width', type=int, default=3,
+                        help='Suffixes kept per case by --suffixes')
+    parser.add_argument('--max-steps', type=int, default=20,
+                        help='Longest suffix predicted by --suffixes')
+    profiling.add_profile_arguments(parser)
+    plotting.add_plot_arguments(parser)
     
     args = parser.parse_args()
+    if (args.score or args.suffixes) and args.dataset == 'all':
+        parser.error("--score and --suffixes need the models of one dataset: --dataset sepsis or --dataset bpi")
     
     # Set up directories
     setup_directories()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     
-    # Process Mining Analysis
-    if args.analyze:
-        print("Running Process Mining Analysis...")
-        log_directory = "dataset"
-        result_directory = os.path.join("src", "result", "dataset_analysis")
-        analyze_event_logs(log_directory, result_directory)
+    # Stage outputs are keyed by a hash of their inputs, so unchanged stages are skipped
+    cache = ArtifactCache(cache_dir=args.cache_dir, enabled=not args.no_cache)
     
-    # Baseline Model Training
-    if args.train:
-        print("Running Baseline Model Training...")
-        
-        if args.dataset in ['sepsis', 'all']:
-            if os.path.exists('dataset/Sepsis.xes'):
-                print("\n====== Training Sepsis Models ======")
-                sepsis_results = train_sepsis_models()
-                print(f"Trained {len(sepsis_results['models'])} models for Sepsis dataset")
-            else:
-                print("Sepsis dataset not found. Skipping Sepsis model training.")
-        
-        if args.dataset in ['bpi', 'all']:
-            # Check for any of the BPI2020 dataset files
-            bpi_files = [
-                'DomesticDeclarations.xes',
-                'InternationalDeclarations.xes',
-                'PermitLog.xes',
-                'PrepaidTravelCost.xes',
-                'RequestForPayment.xes'
-            ]
-            
-            bpi_files_exist = any(os.path.exists(os.path.join('dataset', file)) for file in bpi_files)
-            
-            if bpi_files_exist:
-                print("\n====== Training BPI Models ======")
-                bpi_results = train_bpi_models()
-                print(f"Trained {len(bpi_results['models'])} models for BPI dataset")
-            else:
-                print("BPI dataset not found. Skipping BPI model training.")
+    if args.instrument:
+        instrumentation.enable(trace_memory=args.trace_memory)
     
-    # Enhanced Model Training
-    if args.train_enhanced:
-        print("Running Enhanced Model Training...")
-        
-        if args.dataset in ['sepsis', 'all']:
-            if os.path.exists('dataset/Sepsis.xes'):
-                print("\n====== Training Enhanced Sepsis Models ======")
-                trainer = EnhancedModelTrainer(
-                    log_path='dataset/Sepsis.xes',
-                    dataset_type='sepsis',
-                    baseline_dir='models/sepsis',
-                    output_dir='models/enhanced'
-                )
-                trainer.train_models()
-                print(f"Trained enhanced models for Sepsis dataset")
-            else:
-                print("Sepsis dataset not found. Skipping enhanced Sepsis model training.")
-        
-        if args.dataset in ['bpi', 'all']:
-            # Check for any of the BPI2020 dataset files
-            bpi_files = [
-                'DomesticDeclarations.xes',
-                'InternationalDeclarations.xes'
-            ]
-            
-            for bpi_file in bpi_files:
-                if os.path.exists(os.path.join('dataset', bpi_file)):
-                    print(f"\n====== Training Enhanced BPI Models ({bpi_file}) ======")
-                    trainer = EnhancedModelTrainer(
-                        log_path=os.path.join('dataset', bpi_file),
-                        dataset_type='bpi',
-                        baseline_dir='models/bpi',
-                        output_dir='models/enhanced'
-                    )
-                    trainer.train_models()
-                    print(f"Trained enhanced models for BPI dataset ({bpi_file})")
-                else:
-                    print(f"BPI dataset file {bpi_file} not found. Skipping.")
+    # Figures render in a background process pool and are only awaited at the end of the run
+    plotting.configure_from_args(args)
     
-    # Model Comparison
-    if args.compare:
-        print("Running Model Comparison...")
-        
-        if args.dataset in ['sepsis', 'all']:
-            print("\n====== Comparing Sepsis Models ======")
-            comparator = ModelComparator(
-                dataset_type='sepsis',
-                baseline_dir='models/sepsis',
-                enhanced_dir='models/enhanced',
-                output_dir='reports/comparison/sepsis'
-            )
-            comparison_results = comparator.run_comparison()
-            print(f"Completed Sepsis models comparison")
+    # Stages run as a dependency graph; independent datasets run concurrently with --jobs > 1
+    # --profile writes per-stage hot-function tables (and collapsed stacks in sampling mode)
+    if args.analyze or args.train or args.train_enhanced or args.compare or args.causality:
+        with profiling.profile_from_args(args):
+            graph = build_task_graph(args, cache, state_file=args.state_file)
+            task_states = graph.run(jobs=args.jobs, memory_budget_mb=args.memory_budget, resume=args.resume)
         
-        if args.dataset in ['bpi', 'all']:
-            print("\n====== Comparing BPI Models ======")
-            comparator = ModelComparator(
-                dataset_type='bpi',
-                baseline_dir='models/bpi',
-                enhanced_dir='models/enhanced',
-                output_dir='reports/comparison/bpi'
-            )
-            comparison_results = comparator.run_comparison()
-            print(f"Completed BPI models comparison")
+        failed = [name for name, state in task_states.items() if state['status'] != 'done']
+        if failed:
+            print(f"Stages not completed: {', '.join(failed)}")
+        plotting.wait()
     
-    # Causality Tests
-    if args.causality:
-        print("Running Causality Tests...")
-        
-        if args.dataset in ['sepsis', 'all']:
-            print("\n====== Running Sepsis Causality Tests ======")
-            try:
-                # Load enhanced models and test data
-                enhanced_dt_path = os.path.join('models/enhanced', f"enhanced_dt_sepsis.pkl")
-                
-                if os.path.exists(enhanced_dt_path):
-                    enhanced_dt = joblib.load(enhanced_dt_path)
-                    
-                    # Load or generate test data
-                    test_data_path = os.path.join('models/enhanced', f"test_data_sepsis.pkl")
-                    if os.path.exists(test_data_path):
-                        test_data = joblib.load(test_data_path)
-                        X_test = test_data['X_test']
-                        y_test = test_data['y_test']
-                        feature_names = test_data['feature_names']
-                    else:
-                        # Create test data by running a quick feature extraction
-                        print("Test data not found. Creating from dataset...")
-                        trainer = EnhancedModelTrainer(
-                            log_path='dataset/Sepsis.xes',
-                            dataset_type='sepsis',
-                            baseline_dir='models/sepsis',
-                            output_dir='models/enhanced'
-                        )
-                        X_train, X_test, y_train, y_test, feature_names = trainer.prepare_data()
-                        
-                        # Save test data for future use
-                        joblib.dump({
-                            'X_test': X_test,
-                            'y_test': y_test,
-                            'feature_names': feature_names
-                        }, test_data_path)
-                    
-                    # Run causality tester
-                    causality_tester = CausalityTester(
-                        models={'enhanced_dt': enhanced_dt},
-                        feature_names=feature_names,
-                        X_test=X_test,
-                        y_test=y_test,
-                        dataset_type='sepsis',
-                        baseline_dir='models/sepsis',
-                        output_dir='results/causality/sepsis'
-                    )
-                    
-                    hypotheses_results = causality_tester.run_tests()
-                    print(f"Completed Sepsis causality tests. Results saved to results/causality/sepsis")
-                else:
-                    print(f"Enhanced Sepsis model not found at {enhanced_dt_path}. Skipping causality tests.")
-            except Exception as e:
-                print(f"Error running Sepsis causality tests: {e}")
-                import traceback
-                traceback.print_exc()
-        
-        if args.dataset in ['bpi', 'all']:
-            print("\n====== Running BPI Causality Tests ======")
-            try:
-                # Load enhanced models and test data
-                enhanced_dt_path = os.path.join('models/enhanced', f"enhanced_dt_bpi.pkl")
-                
-                if os.path.exists(enhanced_dt_path):
-                    enhanced_dt = joblib.load(enhanced_dt_path)
-                    
-                    # Load or generate test data
-                    test_data_path = os.path.join('models/enhanced', f"test_data_bpi.pkl")
-                    if os.path.exists(test_data_path):
-                        test_data = joblib.load(test_data_path)
-                        X_test = test_data['X_test']
-                        y_test = test_data['y_test']
-                        feature_names = test_data['feature_names']
-                    else:
-                        # Create test data by running a quick feature extraction
-                        print("Test data not found. Creating from dataset...")
-                        trainer = EnhancedModelTrainer(
-                            log_path='dataset/DomesticDeclarations.xes',
-                            dataset_type='bpi',
-                            baseline_dir='models/bpi',
-                            output_dir='models/enhanced'
-                        )
-                        X_train, X_test, y_train, y_test, feature_names = trainer.prepare_data()
-                        
-                        # Save test data for future use
-                        joblib.dump({
-                            'X_test': X_test,
-                            'y_test': y_test,
-                            'feature_names': feature_names
-                        }, test_data_path)
-                    
-                    # Run causality tester
-                    causality_tester = CausalityTester(
-                        models={'enhanced_dt': enhanced_dt},
-                        feature_names=feature_names,
-                        X_test=X_test,
-                        y_test=y_test,
-                        dataset_type='bpi',
-                        baseline_dir='models/bpi',
-                        output_dir='results/causality/bpi'
-                    )
-                    
-                    hypotheses_results = causality_tester.run_tests()
-                    print(f"Completed BPI causality tests. Results saved to results/causality/bpi")
-                else:
-                    print(f"Enhanced BPI model not found at {enhanced_dt_path}. Skipping causality tests.")
-            except Exception as e:
-                print(f"Error running BPI causality tests: {e}")
-                import traceback
-                traceback.print_exc()
+    # Chunked scoring of a log with the saved models, streamed to Parquet
+    if args.score:
+        # Imported here: scoring loads sklearn, scipy and pyarrow, which other commands do not need
+        from src.pipelines.batch_scoring import score_log, cache_config
+        output = args.score_output or os.path.join(
+            'results', 'scores', os.path.basename(args.score).split('.')[0] + '.parquet')
+        stats = score_log(args.score, os.path.join('models', args.dataset), output, model_name=args.score_model,
+                          top_k=args.top_k, prefixes=args.score_prefixes, chunk_cases=args.chunk_cases,
+                          workers=args.score_workers, max_memory_mb=args.memory_budget,
+                          cache=cache_config(args.score_cache_mb))
+        print(f"Scored {stats['rows']} prefixes of {stats['cases']} cases, predictions saved to {output}")
+    
+    # Beam-search suffixes of running cases, streamed to Parquet
+    if args.suffixes:
+        from src.pipelines.suffix_prediction import predict_log_suffixes
+        output = os.path.join('results', 'suffixes', os.path.basename(args.suffixes).split('.')[0] + '.parquet')
+        stats = predict_log_suffixes(args.suffixes, os.path.join('models', args.dataset), output,
+                                     model_name=args.score_model, beam_width=args.beam_width,
+                                     max_steps=args.max_steps, chunk_cases=args.chunk_cases)
+        print(f"Predicted {stats['rows']} suffixes of {stats['cases']} cases, saved to {output}")
+    
+    if args.instrument:
+        summary_path, trace_path = instrumentation.disable().write(args.instrument_dir)
+        print(f"Run summary saved to {summary_path}, Chrome trace saved to {trace_path}")
     
     # If no arguments provided, print help
-    if not (args.analyze or args.train or args.train_enhanced or args.compare or args.causality):
+    if not (args.analyze or args.train or args.train_enhanced or args.compare or args.causality or args.score or
+            args.suffixes):
         parser.print_help()
 
 if __name__ == "__main__":
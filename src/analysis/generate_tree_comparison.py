@@ -21,14 +21,12 @@ def generate_tree_comparison(dataset_path, output_dir='reports/tree_comparison')
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
     
-    # Load and prepare the data
-    feature_extractor = FeatureExtractor()
-    feature_extractor.load_log(dataset_path)
+    # The log is loaded on extraction, with only the attributes the selected features read
+    feature_extractor = FeatureExtractor(dataset_path)
     
     # Determine which dataset we're working with
     if 'Domestic' in dataset_path or 'BPI' in dataset_path:
         print("Processing BPI dataset...")
-        X, y = feature_extractor.extract_bpi_features()
         dataset_name = 'bpi'
         
         # Define potential causal features for BPI
@@ -39,7 +37,6 @@ def generate_tree_comparison(dataset_path, output_dir='reports/tree_comparison')
         ]
     else:
         print("Processing Sepsis dataset...")
-        X, y = feature_extractor.extract_sepsis_features()
         dataset_name = 'sepsis'
         
         # Define causal features for Sepsis
@@ -49,17 +46,18 @@ def generate_tree_comparison(dataset_path, output_dir='reports/tree_comparison')
             'dept_changes', 'time_since_start'
         ]
     
-    # Store original feature names
-    all_feature_names = X.columns.tolist()
-    print(f"Available features: {len(all_feature_names)}")
-    print(f"Sample features: {all_feature_names[:10]}")
-    
     # Define control-flow features (baseline)
     control_flow_features = [
         'current_event', 'event_position', 'trace_length', 
         'repeated_activities', 'unique_activities'
     ]
     
+    # Extract only the baseline and causal features
+    X, y = feature_extractor.extract_features(dataset_name, features=control_flow_features + causal_features)
+    all_feature_names = X.columns.tolist()
+    print(f"Available features: {len(feature_extractor.available_features(dataset_name))}")
+    print(f"Extracted features: {all_feature_names}")
+    
     # Filter to only include features that exist in the dataset
     control_flow_features = [f for f in control_flow_features if f in all_feature_names]
     causal_features = [f for f in causal_features if f in all_feature_names]
@@ -69,10 +67,12 @@ def generate_tree_comparison(dataset_path, output_dir='reports/tree_comparison')
     
     if not causal_features:
         print("Warning: No causal features available in this dataset. Using generic time-based features.")
-        causal_features = [f for f in all_feature_names if 'time' in f]
+        available_features = feature_extractor.available_features(dataset_name)
+        causal_features = [f for f in available_features if 'time' in f]
         if not causal_features:
             # Just use some of the available features
-            causal_features = all_feature_names[:min(5, len(all_feature_names))]
+            causal_features = available_features[:min(5, len(available_features))]
+        X, y = feature_extractor.extract_features(dataset_name, features=control_flow_features + causal_features)
     
     # Define enhanced features (control flow + causal)
     enhanced_features = control_flow_features + [f for f in causal_features if f not in control_flow_features]
@@ -1,13 +1,15 @@
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
 import pm4py
 
-from pm4py.algo.discovery.alpha import algorithm as alpha_miner
-from pm4py.algo.discovery.heuristics import algorithm as heuristics_miner
-from pm4py.algo.discovery.dfg import algorithm as dfg_discovery
-from pm4py.objects.log.importer.xes import importer as xes_importer
-from pm4py.statistics.start_activities.log import get as start_activities
-from pm4py.statistics.end_activities.log import get as end_activities
+from pm4py.algo.discovery.alpha.variants import classic as alpha_miner
+from pm4py.algo.discovery.heuristics.variants import classic as heuristics_miner
+
+CASE_KEY = "case:concept:name"
+ACTIVITY_KEY = "concept:name"
 
 def create_result_directory(directory: str):
     if not os.path.exists(directory):
@@ -17,88 +19,173 @@ def create_result_directory(directory: str):
         print(f"'{directory}' klasörü zaten mevcut.")
 
 
-def analyze_event_logs(log_directory: str, result_directory: str):
+def _count_codes(codes, decode):
+    """Count code combinations and return them in order of first appearance"""
+    if len(codes) == 0:
+        return []
+    unique, first_index, counts = np.unique(codes, return_index=True, return_counts=True)
+    appearance = np.argsort(first_index, kind="stable")
+    return [(decode(code), int(count)) for code, count in zip(unique[appearance], counts[appearance])]
+
+
+def compute_directly_follows(df, case_key=CASE_KEY, activity_key=ACTIVITY_KEY):
+    """
+    Tek bir sütunsal geçişte (single columnar pass) directly-follows istatistiklerini hesaplar.
+
+    Events must be grouped by case in trace order (as returned by pm4py.read_xes).
+    Returns the DFG, the window-2 DFG, the frequent triples, the start/end
+    activities and the activity occurrences that the alpha and heuristics
+    miners otherwise compute with separate traversals of the log.
+    """
+    activity_codes, activities = pd.factorize(df[activity_key], sort=False)
+    case_codes, _ = pd.factorize(df[case_key], sort=False)
+    activity_codes = activity_codes.astype(np.int64)
+    n = len(activities)
+    names = activities.tolist()
+
+    same_case_1 = case_codes[1:] == case_codes[:-1]
+    same_case_2 = same_case_1[1:] & same_case_1[:-1]
+    first = np.r_[True, ~same_case_1] if len(case_codes) else np.zeros(0, dtype=bool)
+    last = np.r_[~same_case_1, True] if len(case_codes) else np.zeros(0, dtype=bool)
+
+    pairs = (activity_codes[:-1] * n + activity_codes[1:])[same_case_1]
+    pairs_window_2 = (activity_codes[:-2] * n + activity_codes[2:])[same_case_2]
+    triples = ((activity_codes[:-2] * n + activity_codes[1:-1]) * n + activity_codes[2:])[same_case_2]
+
+    def to_pair(code):
+        return names[code // n], names[code % n]
+
+    def to_triple(code):
+        return names[code // (n * n)], names[(code // n) % n], names[code % n]
+
+    def to_name(code):
+        return names[code]
+
+    return {
+        "dfg": dict(_count_codes(pairs, to_pair)),
+        "dfg_window_2": dict(_count_codes(pairs_window_2, to_pair)),
+        "freq_triples": dict(_count_codes(triples, to_triple)),
+        "start_activities": dict(_count_codes(activity_codes[first], to_name)),
+        "end_activities": dict(_count_codes(activity_codes[last], to_name)),
+        "activities_occurrences": dict(_count_codes(activity_codes, to_name))
+    }
+
+
+def analyze_event_log(xes_file: str, result_directory: str):
+    """Tek bir XES dosyasını analiz eder ve sonuçları markdown dosyasına yazar."""
+    print(f"\nAnalyzing file: {xes_file}")
+
+    file_name = os.path.splitext(os.path.basename(xes_file))[0]
+    result_file = os.path.join(result_directory, f"{file_name}_analysis.md")
+
+    with open(result_file, "w", encoding="utf-8") as md_file:
+        md_file.write(f"# {file_name} Analiz Sonuçları\n\n")
+
+        try:
+            log = pm4py.read_xes(xes_file)
+            md_file.write("## Log Yükleme\n")
+            md_file.write(f"{xes_file} dosyası başarıyla yüklendi.\n\n")
+        except Exception as e:
+            error_msg = f"Dosya yüklenirken hata oluştu: {e}"
+            print(error_msg)
+            md_file.write("## Log Yükleme\n")
+            md_file.write(f"**Hata:** {error_msg}\n\n")
+            return False
+
+        # Tüm madenciler aynı directly-follows geçişini kullanır
+        try:
+            stats = compute_directly_follows(log)
+        except Exception as e:
+            error_msg = f"DFG çıkartılırken hata oluştu: {e}"
+            print(error_msg)
+            md_file.write("## Directly Follows Graph (DFG)\n")
+            md_file.write(f"**Hata:** {error_msg}\n\n")
+            return False
+
+        # 3) Alpha Miner ile Process Model oluşturma
+        try:
+            net, im, fm = alpha_miner.apply_dfg_sa_ea(
+                stats["dfg"], stats["start_activities"], stats["end_activities"]
+            )
+            md_file.write("## Alpha Miner Sonuçları\n")
+            md_file.write("Alpha Miner ile süreç modeli oluşturuldu.\n\n")
+            md_file.write(f"{net, im, fm}\n\n")
+        except Exception as e:
+            error_msg = f"Alpha Miner çalışırken hata oluştu: {e}"
+            print(error_msg)
+            md_file.write("## Alpha Miner Sonuçları\n")
+            md_file.write(f"**Hata:** {error_msg}\n\n")
+
+        # 4) Heuristic Miner ile Process Model
+        try:
+            heu_net = heuristics_miner.apply_heu_dfg(
+                stats["dfg"],
+                activities=list(stats["activities_occurrences"].keys()),
+                activities_occurrences=stats["activities_occurrences"],
+                start_activities=stats["start_activities"],
+                end_activities=stats["end_activities"],
+                dfg_window_2=stats["dfg_window_2"],
+                freq_triples=stats["freq_triples"]
+            )
+            print("Heuristic Miner ile süreç modeli oluşturuldu.")
+            md_file.write("## Heuristic Miner Sonuçları\n")
+            md_file.write(f"{heu_net}\n\n")
+            md_file.write("Heuristic Miner ile heuristik ağ (heu_net) elde edildi.\n\n")
+        except Exception as e:
+            error_msg = f"Heuristic Miner çalışırken hata oluştu: {e}"
+            print(error_msg)
+            md_file.write("## Heuristic Miner Sonuçları\n")
+            md_file.write(f"**Hata:** {error_msg}\n\n")
+
+        # 5) Directly Follows Graph çıkarma
+        md_file.write("## Directly Follows Graph (DFG)\n")
+        md_file.write("Directly Follows Graph elde edildi.\n\n")
+
+        md_file.write("### Start Activities:\n")
+        for activity, count in stats["start_activities"].items():
+            md_file.write(f"- {activity}: {count}\n")
+
+        md_file.write("\n### End Activities:\n")
+        for activity, count in stats["end_activities"].items():
+            md_file.write(f"- {activity}: {count}\n")
+
+        md_file.write("\n### DFG Kenarları:\n")
+        for edge, count in stats["dfg"].items():
+            md_file.write(f"- {edge} -> {count} kez gözlenmiş\n")
+        md_file.write("\n")
+
+        print(f"Sonuçlar '{result_file}' dosyasına kaydedildi.")
+
+    return True
+
+
+def analyze_event_logs(log_directory: str, result_directory: str, n_jobs=None):
+    """
+    Klasördeki tüm XES dosyalarını analiz eder.
+
+    Files are analyzed concurrently in a process pool of n_jobs workers
+    (default: number of CPUs); n_jobs=1 analyzes them one by one.
+    """
     create_result_directory(result_directory)
-    xes_files = glob.glob(os.path.join(log_directory, "*.xes"))
+    xes_files = sorted(glob.glob(os.path.join(log_directory, "*.xes")))
 
     if not xes_files:
         print(f"'{log_directory}' klasöründe .xes uzantılı dosya bulunamadı.")
         return
 
-    for xes_file in xes_files:
-        print(f"\nAnalyzing file: {xes_file}")
-
-        file_name = os.path.splitext(os.path.basename(xes_file))[0]
-        result_file = os.path.join(result_directory, f"{file_name}_analysis.md")
-
-        with open(result_file, "w", encoding="utf-8") as md_file:
-            md_file.write(f"# {file_name} Analiz Sonuçları\n\n")
-
-            try:
-                log = xes_importer.apply(xes_file)
-                md_file.write("## Log Yükleme\n")
-                md_file.write(f"{xes_file} dosyası başarıyla yüklendi.\n\n")
-            except Exception as e:
-                error_msg = f"Dosya yüklenirken hata oluştu: {e}"
-                print(error_msg)
-                md_file.write("## Log Yükleme\n")
-                md_file.write(f"**Hata:** {error_msg}\n\n")
-                continue
-
-            # 3) Alpha Miner ile Process Model oluşturma
-            try:
-                net, im, fm = alpha_miner.apply(log)
-                md_file.write("## Alpha Miner Sonuçları\n")
-                md_file.write("Alpha Miner ile süreç modeli oluşturuldu.\n\n")
-                md_file.write(f"{net, im, fm}\n\n")
-            except Exception as e:
-                error_msg = f"Alpha Miner çalışırken hata oluştu: {e}"
-                print(error_msg)
-                md_file.write("## Alpha Miner Sonuçları\n")
-                md_file.write(f"**Hata:** {error_msg}\n\n")
-
-            # 4) Heuristic Miner ile Process Model
-            try:
-                heu_net = heuristics_miner.apply_heu(log)
-                print("Heuristic Miner ile süreç modeli oluşturuldu.")
-                md_file.write("## Heuristic Miner Sonuçları\n")
-                md_file.write(f"{heu_net}\n\n")
-                md_file.write("Heuristic Miner ile heuristik ağ (heu_net) elde edildi.\n\n")
-            except Exception as e:
-                error_msg = f"Heuristic Miner çalışırken hata oluştu: {e}"
-                print(error_msg)
-                md_file.write("## Heuristic Miner Sonuçları\n")
-                md_file.write(f"**Hata:** {error_msg}\n\n")
-
-            # 5) Directly Follows Graph çıkarma
-            try:
-                # Using compatible DFG discovery method
-                dfg = dfg_discovery.apply(log)
-                start_acts = start_activities.get_start_activities(log)
-                end_acts = end_activities.get_end_activities(log)
-                
-                md_file.write("## Directly Follows Graph (DFG)\n")
-                md_file.write("Directly Follows Graph elde edildi.\n\n")
-                
-                md_file.write("### Start Activities:\n")
-                for activity, count in start_acts.items():
-                    md_file.write(f"- {activity}: {count}\n")
-                
-                md_file.write("\n### End Activities:\n")
-                for activity, count in end_acts.items():
-                    md_file.write(f"- {activity}: {count}\n")
-                
-                md_file.write("\n### DFG Kenarları:\n")
-                for edge, count in dfg.items():
-                    md_file.write(f"- {edge} -> {count} kez gözlenmiş\n")
-                md_file.write("\n")
-                
-                print(f"Sonuçlar '{result_file}' dosyasına kaydedildi.")
-            except Exception as e:
-                error_msg = f"DFG çıkartılırken hata oluştu: {e}"
-                print(error_msg)
-                md_file.write("## Directly Follows Graph (DFG)\n")
-                md_file.write(f"**Hata:** {error_msg}\n\n")
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(xes_files))
+    if n_jobs <= 1:
+        for xes_file in xes_files:
+            analyze_event_log(xes_file, result_directory)
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = {executor.submit(analyze_event_log, xes_file, result_directory): xes_file
+                       for xes_file in xes_files}
+            for future, xes_file in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"{xes_file} analiz edilirken hata oluştu: {e}")
 
     # 7. Inter-Dataset Transition Analizi
     print("\nInter-Dataset Transition Analizi Başlatılıyor...")
@@ -16,18 +16,18 @@ def create_directories():
     """Create necessary directories for results"""
     os.makedirs("reports/baseline_vs_enhanced", exist_ok=True)
     
-def train_and_evaluate_models(dataset_path, dataset_type="sepsis", n_folds=5):
-    """Train and evaluate baseline and enhanced models with cross-validation"""
+def train_and_evaluate_models(dataset_path, dataset_type="sepsis", n_folds=5, max_bins=None):
+    """
+    Train and evaluate baseline and enhanced models with cross-validation
+    (max_bins: train every model of a fold on uint8 quantile bin codes with this many bins)
+    """
     print(f"Training and evaluating models on {dataset_path}...")
     
-    # Load and prepare the data
-    feature_extractor = FeatureExtractor()
-    feature_extractor.load_log(dataset_path)
+    # The log is loaded on extraction, with only the attributes the selected features read
+    feature_extractor = FeatureExtractor(dataset_path)
     
-    # Extract features based on dataset type
+    # Select features based on dataset type
     if dataset_type == "sepsis":
-        X, y = feature_extractor.extract_sepsis_features()
-        
         # Define baseline features (control flow only)
         baseline_features = [
             'current_event', 'event_position', 'trace_length', 
@@ -42,8 +42,6 @@ def train_and_evaluate_models(dataset_path, dataset_type="sepsis", n_folds=5):
             'time_of_day', 'weekend'
         ]
     else:  # bpi
-        X, y = feature_extractor.extract_bpi_features()
-        
         # Define baseline features (control flow only)
         baseline_features = [
             'current_event', 'event_position', 'trace_length', 
@@ -57,6 +55,9 @@ def train_and_evaluate_models(dataset_path, dataset_type="sepsis", n_folds=5):
             'weekend', 'time_of_day'
         ]
     
+    # Extract only the selected features
+    X, y = feature_extractor.extract_features(dataset_type, features=baseline_features + causal_features)
+    
     # Filter to only include features that exist in the dataset
     all_feature_names = X.columns.tolist()
     baseline_features = [f for f in baseline_features if f in all_feature_names]
@@ -100,6 +101,11 @@ def train_and_evaluate_models(dataset_path, dataset_type="sepsis", n_folds=5):
             balance_classes=True, random_state=42
         )
         
+        # Bin once per fold: all four models train on column subsets of the same uint8 matrix
+        if max_bins:
+            X_train_proc = data_transformer.fit_binning(X_train_proc, max_bins=max_bins)
+            X_test_proc = data_transformer.bin_features(X_test_proc)
+        
         # Select features for baseline and enhanced models
         X_train_baseline = X_train_proc[baseline_features]
         X_test_baseline = X_test_proc[baseline_features]
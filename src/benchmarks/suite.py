@@ -0,0 +1,565 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from src.common.resources import peak_rss_mb, reset_peak_rss, cpu_count
+
+DEFAULT_HISTORY = os.path.join('results', 'benchmarks', 'history.json')
+
+# Metrics compared between runs (lower is better for all of them)
+COMPARED_METRICS = ['wall_s', 'cpu_s', 'peak_rss_mb']
+
+# Repository root (main.py location), the working directory of the startup checks
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Interpreter arguments of the CLI startup checks; none of them should import pm4py,
+# sklearn or matplotlib before a stage actually runs
+STARTUP_COMMANDS = {
+    'help': ['main.py', '--help'],
+    'build_graph': ['-c', "import argparse, main; "
+                          "from src.pipelines.stages import build_task_graph; "
+                          "from src.common.artifact_cache import ArtifactCache; "
+                          "build_task_graph(argparse.Namespace(analyze=True, train=False, train_enhanced=False, "
+                          "compare=True, causality=True, dataset='all'), ArtifactCache(enabled=False))"],
+}
+
+# Default CLI startup budget in milliseconds
+STARTUP_BUDGET_MS = 500
+
+
+class BenchmarkInput:
+    def __init__(self, source, dataset_type, size, seed=42, cache_dir='.cache'):
+        """
+        Input of one benchmark case: a shipped log or a synthetic log generated from it
+
+        Args:
+            source: XES log (or cached frame) used directly or to fit the generator
+            dataset_type: 'sepsis' or 'bpi' (selects the feature extractor)
+            size: 'source' to use the log as is, or a scale factor for the synthetic generator
+            seed: Seed of the synthetic generator
+            cache_dir: Artifact cache used for extracted and preprocessed benchmark inputs
+        """
+        self.source = source
+        self.dataset_type = dataset_type
+        self.size = size
+        self.seed = seed
+        self.cache_dir = cache_dir
+        self._cache = None
+
+    @property
+    def label(self):
+        return 'source' if self.size == 'source' else f"x{float(self.size):g}"
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            from src.common.artifact_cache import ArtifactCache
+            self._cache = ArtifactCache(cache_dir=self.cache_dir)
+        return self._cache
+
+    def _key(self, stage, **inputs):
+        from src.preprocessing.feature_extraction import FeatureExtractor
+        return self.cache.make_key(
+            stage,
+            source=self.cache.fingerprint_file(self.source) or self.source,
+            size=self.size,
+            seed=self.seed,
+            dataset_type=self.dataset_type,
+            extractor=FeatureExtractor.VERSION,
+            **inputs
+        )
+
+    def event_frame(self):
+        """Event log as a DataFrame (the source log, or a synthetic log of the requested size)"""
+        def build():
+            if self.size == 'source':
+                import pm4py
+                return pm4py.convert_to_dataframe(pm4py.read_xes(self.source))
+            from src.preprocessing.synthetic_log import SyntheticLogGenerator
+            generator = SyntheticLogGenerator(random_state=self.seed).fit(self.source)
+            return generator.generate(scale=float(self.size))
+
+        return self.cache.cached('bench_log', self._key('bench_log'), build)
+
+    def features(self):
+        """Extracted (X, y) of the event frame"""
+        def build():
+            from src.preprocessing.feature_extraction import FeatureExtractor
+            extractor = FeatureExtractor()
+            extractor.df = self.event_frame().copy()
+            return extractor.extract_features(self.dataset_type)
+
+        return self.cache.cached('bench_extract', self._key('bench_extract'), build)
+
+    def splits(self):
+        """Preprocessed train/test splits and feature names"""
+        def build():
+            from src.preprocessing.data_transformation import DataTransformer
+            X, y = self.features()
+            transformer = DataTransformer()
+            X_train, X_test, y_train, y_test = transformer.preprocess_data(X, y)
+            return X_train, X_test, y_train, y_test
+
+        from src.preprocessing.data_transformation import DataTransformer
+        return self.cache.cached('bench_preprocess',
+                                 self._key('bench_preprocess', transformer=DataTransformer.VERSION), build)
+
+
+def _trained_models(inputs):
+    """Baseline decision tree and random forest fitted on the benchmark splits"""
+    from src.models.decision_tree import ProcessDecisionTree
+    from src.models.random_forest import ProcessRandomForest
+
+    X_train, X_test, y_train, y_test = inputs.splits()
+    dt = ProcessDecisionTree(max_depth=5)
+    dt.train(X_train, y_train)
+    rf = ProcessRandomForest(n_estimators=100, max_depth=10)
+    rf.train(X_train, y_train)
+    return dt, rf
+
+
+# Each benchmark is (setup, run): setup builds the inputs outside the measurement,
+# run receives the setup result and is the measured operation.
+
+def _setup_extract(inputs, workdir):
+    from src.preprocessing.feature_extraction import FeatureExtractor
+    frame = inputs.event_frame()
+    extractor = FeatureExtractor()
+    extractor.df = frame.copy()
+    return extractor
+
+
+def _run_extract(extractor, inputs):
+    X, y = extractor.extract_features(inputs.dataset_type)
+    return len(X)
+
+
+def _setup_preprocess(inputs, workdir):
+    return inputs.features()
+
+
+def _run_preprocess(features, inputs):
+    from src.preprocessing.data_transformation import DataTransformer
+    X, y = features
+    DataTransformer().preprocess_data(X, y)
+    return len(X)
+
+
+def _setup_train(model_name):
+    def setup(inputs, workdir):
+        from src.models.decision_tree import ProcessDecisionTree
+        from src.models.random_forest import ProcessRandomForest
+        X_train, X_test, y_train, y_test = inputs.splits()
+        if model_name == 'decision_tree':
+            model = ProcessDecisionTree(max_depth=5)
+        else:
+            model = ProcessRandomForest(n_estimators=100, max_depth=10)
+        return model, X_train, y_train
+    return setup
+
+
+def _run_train(setup_result, inputs):
+    model, X_train, y_train = setup_result
+    model.train(X_train, y_train)
+    return len(X_train)
+
+
+def _setup_predict_proba(inputs, workdir):
+    model, X_train, y_train = _setup_train('random_forest')(inputs, workdir)
+    model.train(X_train, y_train)
+    return model, inputs.splits()[1]
+
+
+def _run_predict_proba(setup_result, inputs):
+    model, X_test = setup_result
+    model.predict_proba(X_test)
+    return len(X_test)
+
+
+def _setup_load_model(inputs, workdir):
+    from src.models.artifact import save_model_artifact
+    model, X_train, y_train = _setup_train('random_forest')(inputs, workdir)
+    model.train(X_train, y_train)
+    artifact_dir = os.path.join(workdir, 'random_forest')
+    save_model_artifact(model.model, artifact_dir)
+    return artifact_dir, inputs.splits()[1].iloc[:1]
+
+
+def _run_load_model(setup_result, inputs):
+    # Open the artifact and score one row: what a fresh scoring process pays before its first prediction
+    from src.models.artifact import load_model
+    artifact_dir, row = setup_result
+    load_model(artifact_dir).predict_proba(row)
+    return 1
+
+
+def _setup_causality(inputs, workdir):
+    from src.pipelines.causality_tests import CausalityTester
+    dt, rf = _trained_models(inputs)
+    X_train, X_test, y_train, y_test = inputs.splits()
+    return CausalityTester(
+        models={'enhanced_dt': dt.model},
+        feature_names=X_test.columns.tolist(),
+        X_test=X_test,
+        y_test=y_test,
+        dataset_type=inputs.dataset_type,
+        baseline_dir=os.path.join(workdir, 'baseline'),
+        output_dir=os.path.join(workdir, 'causality')
+    )
+
+
+def _run_causality(tester, inputs):
+    tester.run_tests()
+    return len(tester.X_test)
+
+
+# Runs recorded per variant for the comparison benchmark (it compares the whole history)
+COMPARISON_RUNS = 24
+
+
+def _setup_comparison(inputs, workdir):
+    from src.models.metrics import evaluate_in_batches
+    from src.models.run_store import RunStore, metrics_row
+    from src.pipelines.compare_models import ModelComparator
+
+    dt, rf = _trained_models(inputs)
+    X_train, X_test, y_train, y_test = inputs.splits()
+    dataset_type = inputs.dataset_type
+    run_store_dir = os.path.join(workdir, 'runs')
+    shutil.rmtree(run_store_dir, ignore_errors=True)
+
+    # The same models stand in for every run; only the comparison itself is measured
+    rows = [metrics_row(name, evaluate_in_batches(model, X_test, y_test, with_proba=True).summary())
+            for name, model in [('Decision Tree', dt.model), ('Random Forest', rf.model)]]
+    importance = {'Decision Tree': dt.feature_importance, 'Random Forest': rf.feature_importance}
+    store = RunStore(run_store_dir)
+    for _ in range(COMPARISON_RUNS):
+        for variant in ('baseline', 'enhanced'):
+            store.record(dataset_type, variant, rows, importance=importance)
+
+    return ModelComparator(dataset_type=dataset_type, baseline_dir=os.path.join(workdir, 'baseline'),
+                           enhanced_dir=os.path.join(workdir, 'enhanced'),
+                           output_dir=os.path.join(workdir, 'comparison'), run_store_dir=run_store_dir)
+
+
+def _run_comparison(comparator, inputs):
+    comparator.run_comparison()
+    comparator.compare_runs()
+    return 2 * COMPARISON_RUNS
+
+
+BENCHMARKS = {
+    'extract': (_setup_extract, _run_extract),
+    'preprocess': (_setup_preprocess, _run_preprocess),
+    'train_dt': (_setup_train('decision_tree'), _run_train),
+    'train_rf': (_setup_train('random_forest'), _run_train),
+    'predict_proba_rf': (_setup_predict_proba, _run_predict_proba),
+    'load_model_rf': (_setup_load_model, _run_load_model),
+    'causality': (_setup_causality, _run_causality),
+    'comparison': (_setup_comparison, _run_comparison),
+}
+
+
+def _run_case(name, inputs, repeat):
+    """Run one benchmark case (executed in a fresh worker process so peak RSS is isolated)"""
+    from src.common import plotting
+
+    setup, run = BENCHMARKS[name]
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    try:
+        n_events = len(inputs.event_frame())
+        timings = []
+        for _ in range(repeat):
+            setup_result = setup(inputs, workdir)
+            peak_reset = reset_peak_rss()
+            start_peak = peak_rss_mb()
+            wall_start, cpu_start = time.perf_counter(), time.process_time()
+            rows = run(setup_result, inputs)
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            # Figures render in the background plot pool, off the measured path
+            plotting.wait()
+            timings.append({
+                'wall_s': wall,
+                'cpu_s': cpu,
+                'peak_rss_mb': peak_rss_mb(),
+                'peak_rss_delta_mb': peak_rss_mb() - start_peak if peak_reset else None,
+                'rows': rows
+            })
+
+        best = min(timings, key=lambda t: t['wall_s'])
+        return {
+            'benchmark': name,
+            'size': inputs.label,
+            'dataset_type': inputs.dataset_type,
+            'n_events': n_events,
+            'repeat': repeat,
+            'wall_s': round(best['wall_s'], 4),
+            'cpu_s': round(best['cpu_s'], 4),
+            'peak_rss_mb': round(max(t['peak_rss_mb'] for t in timings), 1),
+            'peak_rss_delta_mb': best['peak_rss_delta_mb'] if best['peak_rss_delta_mb'] is None
+            else round(best['peak_rss_delta_mb'], 1),
+            'rows': best['rows'],
+            'all_wall_s': [round(t['wall_s'], 4) for t in timings]
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(history_path=DEFAULT_HISTORY):
+    """Return the list of recorded benchmark runs"""
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, 'r') as f:
+        return json.load(f).get('runs', [])
+
+
+def save_history(runs, history_path=DEFAULT_HISTORY):
+    os.makedirs(os.path.dirname(history_path) or '.', exist_ok=True)
+    tmp_path = f"{history_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'runs': runs}, f, indent=2)
+    os.replace(tmp_path, history_path)
+
+
+def run_suite(source, dataset_type, sizes=('source',), benchmarks=None, repeat=1, seed=42,
+              history_path=DEFAULT_HISTORY, cache_dir='.cache', label=None):
+    """
+    Run the selected benchmarks for every input size and append the run to the history file
+
+    Returns:
+        The recorded run dictionary
+    """
+    benchmarks = benchmarks or list(BENCHMARKS)
+    unknown = [name for name in benchmarks if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks: {unknown}. Available: {list(BENCHMARKS)}")
+
+    results = []
+    # Spawned single-use workers: every case starts from a clean interpreter
+    context = multiprocessing.get_context('spawn')
+    for size in sizes:
+        inputs = BenchmarkInput(source, dataset_type, size, seed=seed, cache_dir=cache_dir)
+        for name in benchmarks:
+            print(f"Benchmark {name} [{inputs.label}]...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                try:
+                    result = executor.submit(_run_case, name, inputs, repeat).result()
+                except Exception as e:
+                    print(f"Benchmark {name} [{inputs.label}] failed: {e}")
+                    result = {'benchmark': name, 'size': inputs.label, 'error': str(e)}
+            results.append(result)
+            if 'error' not in result:
+                print(f"  wall {result['wall_s']:.3f}s, cpu {result['cpu_s']:.3f}s, "
+                      f"peak RSS {result['peak_rss_mb']:.1f} MB")
+
+    run = {
+        'id': time.strftime('%Y%m%d-%H%M%S'),
+        'label': label,
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': _git_commit(),
+        'source': source,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': cpu_count(),
+        'results': results
+    }
+    runs = load_history(history_path)
+    runs.append(run)
+    save_history(runs, history_path)
+    print(f"Benchmark run {run['id']} saved to {history_path}")
+    return run
+
+
+def measure_startup(commands=None, repeat=5):
+    """
+    Time fresh interpreters running the CLI startup commands
+
+    Returns:
+        Benchmark results (best wall time of `repeat` runs per command)
+    """
+    commands = commands or list(STARTUP_COMMANDS)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_ROOT, env.get('PYTHONPATH')]))
+
+    results = []
+    for name in commands:
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + STARTUP_COMMANDS[name], cwd=REPO_ROOT, env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timings.append(time.perf_counter() - start)
+        results.append({
+            'benchmark': f"startup:{name}",
+            'size': 'cli',
+            'repeat': repeat,
+            'wall_s': round(min(timings), 4),
+            'all_wall_s': [round(t, 4) for t in timings]
+        })
+    return results
+
+
+def check_startup(budget_ms=STARTUP_BUDGET_MS, repeat=5, history_path=DEFAULT_HISTORY, label=None):
+    """
+    Measure CLI startup, append it to the history and check it against the budget
+
+    Returns:
+        The results exceeding the budget (empty when startup is within budget)
+    """
+    results = measure_startup(repeat=repeat)
+    over_budget = []
+    for result in results:
+        wall_ms = result['wall_s'] * 1000
+        flag = ''
+        if wall_ms > budget_ms:
+            over_budget.append(result)
+            flag = 'OVER BUDGET'
+        print(f"{result['benchmark']:<22} {wall_ms:>8.1f} ms (budget {budget_ms:.0f} ms) {flag}")
+
+    run = {
+        'id': time.strftime('%Y%m%d-%H%M%S'),
+        'label': label,
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': _git_commit(),
+        'source': None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': cpu_count(),
+        'results': results
+    }
+    runs = load_history(history_path)
+    runs.append(run)
+    save_history(runs, history_path)
+    return over_budget
+
+
+def _find_run(runs, ref):
+    """Resolve 'latest', 'previous', a run id or a label to a run"""
+    if not runs:
+        raise ValueError("No benchmark runs recorded")
+    if ref == 'latest':
+        return runs[-1]
+    if ref == 'previous':
+        if len(runs) < 2:
+            raise ValueError("At least two benchmark runs are needed to compare with 'previous'")
+        return runs[-2]
+    for run in reversed(runs):
+        if run['id'] == ref or run.get('label') == ref:
+            return run
+    raise ValueError(f"Benchmark run not found: {ref}")
+
+
+def compare_runs(baseline='previous', current='latest', threshold=0.10, history_path=DEFAULT_HISTORY,
+                 metrics=COMPARED_METRICS):
+    """
+    Compare two runs and flag regressions
+
+    Args:
+        baseline: Reference run ('previous', a run id or a label)
+        current: Run to check ('latest', a run id or a label)
+        threshold: Relative increase (0.10 = 10%) above which a metric counts as a regression
+
+    Returns:
+        List of comparison rows; rows with 'regression' True exceed the threshold
+    """
+    runs = load_history(history_path)
+    base_run, current_run = _find_run(runs, baseline), _find_run(runs, current)
+    base_results = {(r['benchmark'], r['size']): r for r in base_run['results'] if 'error' not in r}
+
+    rows = []
+    for result in current_run['results']:
+        base = base_results.get((result['benchmark'], result['size']))
+        if base is None or 'error' in result:
+            continue
+        for metric in metrics:
+            old, new = base.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old > 0 else 0.0
+            rows.append({
+                'benchmark': result['benchmark'],
+                'size': result['size'],
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'change': change,
+                'regression': change > threshold
+            })
+
+    print(f"Comparing run {current_run['id']} against {base_run['id']} (threshold {threshold:.0%})")
+    for row in rows:
+        flag = 'REGRESSION' if row['regression'] else ''
+        print(f"{row['benchmark']:<18} {row['size']:<8} {row['metric']:<12} "
+              f"{row['baseline']:>10.3f} -> {row['current']:>10.3f} ({row['change']:+.1%}) {flag}")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Speed and memory benchmarks of the pipeline stages')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='Run benchmarks and append them to the history')
+    run_parser.add_argument('--source', default='dataset/Sepsis.xes', help='XES log (or cached frame)')
+    run_parser.add_argument('--dataset', choices=['sepsis', 'bpi'], default='sepsis', help='Feature extractor to use')
+    run_parser.add_argument('--sizes', nargs='+', default=['source'],
+                            help="Input sizes: 'source' and/or synthetic scale factors (e.g. 10 100)")
+    run_parser.add_argument('--benchmarks', nargs='+', choices=list(BENCHMARKS), default=None,
+                            help='Benchmarks to run (default: all)')
+    run_parser.add_argument('--repeat', type=int, default=1, help='Repetitions per case (best wall time is kept)')
+    run_parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic generator')
+    run_parser.add_argument('--label', default=None, help='Optional name of the run')
+    run_parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON history file')
+    run_parser.add_argument('--cache-dir', default='.cache', help='Cache for generated benchmark inputs')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two recorded runs')
+    compare_parser.add_argument('--baseline', default='previous', help="Run id, label or 'previous'")
+    compare_parser.add_argument('--current', default='latest', help="Run id, label or 'latest'")
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='Allowed relative increase')
+    compare_parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON history file')
+
+    startup_parser = subparsers.add_parser('startup', help='Check CLI startup time against a budget')
+    startup_parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS, help='Allowed startup time')
+    startup_parser.add_argument('--repeat', type=int, default=5, help='Runs per command (best time is kept)')
+    startup_parser.add_argument('--label', default=None, help='Optional name of the run')
+    startup_parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON history file')
+
+    subparsers.add_parser('list', help='List available benchmarks')
+
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for name in BENCHMARKS:
+            print(name)
+        for name in STARTUP_COMMANDS:
+            print(f"startup:{name}")
+    elif args.command == 'startup':
+        if check_startup(budget_ms=args.budget_ms, repeat=args.repeat, history_path=args.history, label=args.label):
+            sys.exit(1)
+    elif args.command == 'run':
+        run_suite(args.source, args.dataset, sizes=args.sizes, benchmarks=args.benchmarks, repeat=args.repeat,
+                  seed=args.seed, history_path=args.history, cache_dir=args.cache_dir, label=args.label)
+    else:
+        rows = compare_runs(baseline=args.baseline, current=args.current, threshold=args.threshold,
+                            history_path=args.history)
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
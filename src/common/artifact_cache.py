@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import tempfile
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
+
+
+class ArtifactCache:
+    def __init__(self, cache_dir='.cache', enabled=True):
+        """
+        Content-addressed cache for pipeline stage outputs
+
+        Each stage output is stored under a key derived from a hash of the
+        stage inputs (log fingerprint, code versions, configuration and the
+        keys of upstream stages), so unchanged stages are loaded from disk
+        and changed ones are recomputed automatically.
+
+        Args:
+            cache_dir: Root directory of the cache
+            enabled: If False, every lookup misses and nothing is written
+        """
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._fingerprint_index_path = os.path.join(cache_dir, 'fingerprints.json')
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _load_fingerprint_index(self):
+        """Load the memoized file fingerprints"""
+        if not os.path.exists(self._fingerprint_index_path):
+            return {}
+        try:
+            with open(self._fingerprint_index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def fingerprint_file(self, path):
+        """
+        Return a content hash of a file (None if the cache is disabled or the file is missing).
+        Hashes are memoized by (size, mtime) so large logs are only re-read when they change.
+        """
+        if not self.enabled or path is None or not os.path.exists(path):
+            return None
+
+        abs_path = os.path.abspath(path)
+        stat = os.stat(abs_path)
+        index = self._load_fingerprint_index()
+        entry = index.get(abs_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(abs_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        fingerprint = digest.hexdigest()
+
+        index[abs_path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': fingerprint}
+        self._atomic_write(self._fingerprint_index_path, lambda tmp: _write_json(tmp, index))
+
+        return fingerprint
+
+    @staticmethod
+    def make_key(stage, **inputs):
+        """Derive a cache key from the stage name and a JSON-serializable description of its inputs"""
+        payload = json.dumps({'stage': stage, 'inputs': inputs}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def _artifact_path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key}.pkl")
+
+    @staticmethod
+    def _atomic_write(path, write_fn):
+        """Write to a temporary file and move it into place so readers never see partial files"""
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        os.close(fd)
+        try:
+            write_fn(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def contains(self, stage, key):
+        """Check whether an artifact exists for this stage and key"""
+        return self.enabled and os.path.exists(self._artifact_path(stage, key))
+
+    def get(self, stage, key):
+        """Return (hit, value) for a stage artifact"""
+        if not self.contains(stage, key):
+            return False, None
+        # joblib is imported on first use to keep CLI startup fast
+        import joblib
+        try:
+            return True, joblib.load(self._artifact_path(stage, key))
+        except Exception as e:
+            print(f"Warning: Could not read cached artifact {stage}/{key}: {e}")
+            return False, None
+
+    def put(self, stage, key, value, inputs=None):
+        """Store a stage artifact (and a readable description of its inputs)"""
+        if not self.enabled:
+            return
+        import joblib
+        path = self._artifact_path(stage, key)
+        self._atomic_write(path, lambda tmp: joblib.dump(value, tmp))
+        if inputs is not None:
+            self._atomic_write(path.replace('.pkl', '.json'), lambda tmp: _write_json(tmp, inputs))
+
+    def cached(self, stage, key, compute, inputs=None):
+        """Return the cached artifact for (stage, key), computing and storing it on a miss"""
+        hit, value = self.get(stage, key)
+        if hit:
+            self.hits += 1
+            print(f"Cache hit for stage '{stage}' ({key[:8]})")
+            return value
+
+        self.misses += 1
+        value = compute()
+        self.put(stage, key, value, inputs=inputs)
+        return value
+
+
+def get_cache(cache=None):
+    """Return the given cache, or a disabled pass-through cache when None"""
+    return cache if cache is not None else ArtifactCache(enabled=False)
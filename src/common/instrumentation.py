@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import functools
+import tracemalloc
+
+from src.common.resources import current_rss_mb, peak_rss_mb
+
+# Active recorder of this process (None: instrumentation disabled)
+_recorder = None
+
+
+class _NullSpan:
+    """Span used while instrumentation is disabled; every operation is a no-op"""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, recorder, name, rows=None, attrs=None):
+        """
+        A timed region of a pipeline run
+
+        Assign span.rows (or pass rows=) to record how many rows the stage processed,
+        and use span.set(key=value) to attach extra attributes.
+        """
+        self.recorder = recorder
+        self.name = name
+        self.rows = rows
+        self.attrs = dict(attrs or {})
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.recorder._enter(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.recorder._exit(self, error=None if exc is None else repr(exc))
+        return False
+
+
+class Recorder:
+    def __init__(self, run_name=None, trace_memory=False):
+        """
+        Collects the spans of one run
+
+        Args:
+            run_name: Name stored in the run summary
+            trace_memory: Also record tracemalloc peaks per span (adds allocation overhead)
+        """
+        self.run_name = run_name or time.strftime('run_%Y%m%d_%H%M%S')
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.spans = []
+        self._stack = []
+        # Objects with on_enter(span)/on_exit(span), e.g. the stage profiler
+        self.listeners = []
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _enter(self, span):
+        span.start = time.time()
+        span.wall_start = time.perf_counter()
+        span.cpu_start = time.process_time()
+        span.rss_start = current_rss_mb()
+        span.parent = self._stack[-1] if self._stack else None
+        span.path = f"{span.parent.path}/{span.name}" if span.parent is not None else span.name
+        span.traced_peak = 0
+        if self.trace_memory:
+            # The parent keeps the peak seen so far; the counter is reset for the child
+            _, peak = tracemalloc.get_traced_memory()
+            if span.parent is not None:
+                span.parent.traced_peak = max(span.parent.traced_peak, peak)
+            tracemalloc.reset_peak()
+        self._stack.append(span)
+        for listener in self.listeners:
+            listener.on_enter(span)
+
+    def _exit(self, span, error=None):
+        wall = time.perf_counter() - span.wall_start
+        cpu = time.process_time() - span.cpu_start
+        for listener in self.listeners:
+            listener.on_exit(span)
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            span.traced_peak = max(span.traced_peak, peak)
+            if span.parent is not None:
+                span.parent.traced_peak = max(span.parent.traced_peak, span.traced_peak)
+
+        if self._stack and self._stack[-1] is span:
+            self._stack.pop()
+
+        record = {
+            'name': span.name,
+            'path': span.path,
+            'depth': span.path.count('/'),
+            'pid': os.getpid(),
+            'start': span.start,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'rss_start_mb': round(span.rss_start, 1),
+            'rss_end_mb': round(current_rss_mb(), 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'rows': span.rows,
+            'attrs': span.attrs
+        }
+        if self.trace_memory:
+            record['tracemalloc_peak_mb'] = round(span.traced_peak / (1024 * 1024), 3)
+        if error is not None:
+            record['error'] = error
+        self.spans.append(record)
+
+    def add_spans(self, spans, parent_path=None):
+        """Add spans recorded in another process (e.g. a task graph worker)"""
+        for record in spans:
+            record = dict(record)
+            if parent_path:
+                record['path'] = f"{parent_path}/{record['path']}"
+                record['depth'] += parent_path.count('/') + 1
+            self.spans.append(record)
+
+    def stage_totals(self):
+        """Aggregate spans by name"""
+        totals = {}
+        for record in self.spans:
+            total = totals.setdefault(record['name'], {
+                'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0, 'max_rss_mb': 0.0
+            })
+            total['count'] += 1
+            total['wall_s'] += record['wall_s']
+            total['cpu_s'] += record['cpu_s']
+            total['rows'] += record['rows'] or 0
+            total['max_rss_mb'] = max(total['max_rss_mb'], record['rss_end_mb'], record['rss_start_mb'])
+            if 'tracemalloc_peak_mb' in record:
+                total['max_tracemalloc_peak_mb'] = max(total.get('max_tracemalloc_peak_mb', 0.0),
+                                                       record['tracemalloc_peak_mb'])
+        for total in totals.values():
+            total['wall_s'] = round(total['wall_s'], 6)
+            total['cpu_s'] = round(total['cpu_s'], 6)
+        return totals
+
+    def summary(self):
+        return {
+            'run': self.run_name,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'total_s': round(time.time() - self.started, 3),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': self.stage_totals(),
+            'spans': sorted(self.spans, key=lambda record: record['start'])
+        }
+
+    def chrome_trace(self):
+        """Spans as Chrome trace events (load in chrome://tracing or Perfetto)"""
+        events = []
+        for record in self.spans:
+            args = {key: record[key] for key in ('cpu_s', 'rss_start_mb', 'rss_end_mb', 'rows', 'tracemalloc_peak_mb')
+                    if record.get(key) is not None}
+            args.update(record['attrs'])
+            events.append({
+                'name': record['name'],
+                'cat': record['path'].split('/')[0],
+                'ph': 'X',
+                'ts': round((record['start'] - self.started) * 1e6),
+                'dur': round(record['wall_s'] * 1e6),
+                'pid': record['pid'],
+                'tid': record['pid'],
+                'args': args
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, output_dir):
+        """Write <run>.json (run summary) and <run>.trace.json (Chrome trace); returns both paths"""
+        os.makedirs(output_dir, exist_ok=True)
+        summary_path = os.path.join(output_dir, f"{self.run_name}.json")
+        trace_path = os.path.join(output_dir, f"{self.run_name}.trace.json")
+        with open(summary_path, 'w') as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+        with open(trace_path, 'w') as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        return summary_path, trace_path
+
+
+def enable(run_name=None, trace_memory=False):
+    """Start recording spans in this process and return the recorder"""
+    global _recorder
+    _recorder = Recorder(run_name=run_name, trace_memory=trace_memory)
+    return _recorder
+
+
+def disable():
+    """Stop recording and return the recorder that was active (or None)"""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None and recorder.trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return recorder
+
+
+def get_recorder():
+    """Return the active recorder, or None when instrumentation is disabled"""
+    return _recorder
+
+
+def span(name, rows=None, **attrs):
+    """
+    Context manager timing a stage:
+
+        with span('extract') as s:
+            X, y = extractor.extract_features()
+            s.rows = len(X)
+
+    Returns a shared no-op span while instrumentation is disabled.
+    """
+    if _recorder is None:
+        return _NULL_SPAN
+    return Span(_recorder, name, rows=rows, attrs=attrs)
+
+
+def instrument(name=None):
+    """Decorator timing every call of a function as a span (defaults to the function name)"""
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return fn(*args, **kwargs)
+            with Span(_recorder, span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,161 @@
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from src.common.instrumentation import span
+
+# Plot rendering settings of this process (see configure)
+_enabled = True
+_workers = 2
+# Background rendering pool and the figures it still has to write
+_pool = None
+_pending = []
+
+
+def pyplot():
+    """
+    Import matplotlib.pyplot on first use.
+    The pipelines only save figures to files, so the non-interactive Agg backend is
+    selected unless a backend is configured through MPLBACKEND.
+    """
+    import matplotlib
+    if 'MPLBACKEND' not in os.environ and 'matplotlib.pyplot' not in sys.modules:
+        matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def seaborn():
+    """Import seaborn on first use (after pyplot, so the backend choice above applies)"""
+    pyplot()
+    import seaborn as sns
+    return sns
+
+
+def configure(enabled=True, workers=2):
+    """
+    Set how figures are rendered in this process
+
+    Args:
+        enabled: False skips every figure (--no-plots)
+        workers: Size of the background rendering pool; 0 renders inline
+    """
+    global _enabled, _workers
+    _enabled = enabled
+    _workers = workers
+
+
+def get_config():
+    """Rendering settings of this process (passed to task graph workers)"""
+    return {'enabled': _enabled, 'workers': _workers}
+
+
+def plots_enabled():
+    """False under --no-plots; lets callers skip computing figure payloads"""
+    return _enabled
+
+
+def render(path, draw_fn, *args, dpi=None, **kwargs):
+    """Draw a figure with draw_fn(*args, **kwargs), save it to path and close it"""
+    plt = pyplot()
+    fig = draw_fn(*args, **kwargs)
+    try:
+        fig.savefig(path, dpi=dpi)
+    finally:
+        plt.close(fig)
+    return path
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run a rendering function off the critical path.
+    Arguments must be picklable data payloads (arrays, frames, lists), not models or figures.
+    Returns the future, or None when plots are disabled or rendered inline.
+    """
+    global _pool
+    if not _enabled:
+        return None
+    if _workers <= 0:
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            print(f"Warning: Could not render figure {_describe(fn, args)}: {e}")
+        return None
+    if _pool is None:
+        # Spawned workers start without the parent's threads, locks and loaded data
+        _pool = ProcessPoolExecutor(max_workers=_workers, mp_context=multiprocessing.get_context('spawn'))
+    future = _pool.submit(fn, *args, **kwargs)
+    _pending.append((future, _describe(fn, args)))
+    return future
+
+
+def submit_figure(path, draw_fn, *args, dpi=None, **kwargs):
+    """Render one figure in the background: draw_fn(*args, **kwargs) must return the figure"""
+    return submit(render, path, draw_fn, *args, dpi=dpi, **kwargs)
+
+
+def _describe(fn, args):
+    if fn is render and args:
+        return args[0]
+    return getattr(fn, '__name__', repr(fn))
+
+
+def wait():
+    """
+    Wait for every queued figure and shut the pool down.
+    Rendering errors are reported, not raised: figures never fail a pipeline run.
+    Returns the number of figures that failed.
+    """
+    global _pool
+    failed = 0
+    if _pending:
+        with span('plot_wait', rows=len(_pending)):
+            for future, description in _pending:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Warning: Could not render figure {description}: {e}")
+        _pending.clear()
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+    return failed
+
+
+def add_plot_arguments(parser):
+    """Add the plot rendering options to a command line parser"""
+    parser.add_argument('--no-plots', action='store_true', help='Skip rendering figures')
+    parser.add_argument('--plot-workers', type=int, default=2,
+                        help='Processes rendering figures in the background (0 renders inline)')
+    return parser
+
+
+def configure_from_args(args):
+    configure(enabled=not getattr(args, 'no_plots', False), workers=getattr(args, 'plot_workers', 2))
+
+
+def draw_confusion_matrix(matrix, title, labels='auto', annot=True, figsize=(10, 8),
+                          xlabel='Predicted Label', ylabel='True Label'):
+    """Confusion matrix heatmap"""
+    plt = pyplot()
+    sns = seaborn()
+    fig = plt.figure(figsize=figsize)
+    sns.heatmap(matrix, annot=annot, fmt='d', cmap='Blues', xticklabels=labels, yticklabels=labels)
+    plt.title(title)
+    plt.xlabel(xlabel)
+    plt.ylabel(ylabel)
+    plt.tight_layout()
+    return fig
+
+
+def draw_feature_importance(top_features, title):
+    """Horizontal bar chart of a frame with 'feature' and 'importance' columns"""
+    plt = pyplot()
+    sns = seaborn()
+    fig = plt.figure(figsize=(10, 8))
+    sns.barplot(x='importance', y='feature', data=top_features)
+    plt.title(title)
+    plt.tight_layout()
+    return fig
@@ -0,0 +1,345 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import inspect
+import linecache
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from src.common import instrumentation
+
+# Active profiler of this process (None: profiling disabled)
+_profiler = None
+# True if start() had to enable instrumentation itself
+_owns_recorder = False
+
+
+def _safe_name(name):
+    return ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def feature_extractor_functions():
+    """Default targets of the line timer: the FeatureExtractor.extract_* methods"""
+    from src.preprocessing.feature_extraction import FeatureExtractor
+    return [getattr(FeatureExtractor, name) for name in dir(FeatureExtractor) if name.startswith('extract_')]
+
+
+class LineTimer:
+    def __init__(self, functions):
+        """
+        Line-level wall time of selected functions (sys.settrace based, current thread only)
+
+        The time between two line events of a traced frame is charged to the
+        first line, so a line's time includes the calls it makes.
+        """
+        self.codes = {fn.__code__: fn for fn in (getattr(f, '__func__', f) for f in functions)}
+        self.times = defaultdict(float)
+        self.hits = defaultdict(int)
+        self._last = {}
+        self._previous_trace = None
+
+    def _global_trace(self, frame, event, arg):
+        if event == 'call' and frame.f_code in self.codes:
+            self._last[id(frame)] = (frame.f_lineno, time.perf_counter())
+            return self._local_trace
+        return None
+
+    def _local_trace(self, frame, event, arg):
+        now = time.perf_counter()
+        key = id(frame)
+        last = self._last.get(key)
+        if last is not None:
+            lineno, started = last
+            self.times[(frame.f_code, lineno)] += now - started
+            self.hits[(frame.f_code, lineno)] += 1
+        if event == 'return':
+            self._last.pop(key, None)
+        else:
+            self._last[key] = (frame.f_lineno, time.perf_counter())
+        return self._local_trace
+
+    def start(self):
+        self._previous_trace = sys.gettrace()
+        sys.settrace(self._global_trace)
+
+    def stop(self):
+        sys.settrace(self._previous_trace)
+
+    def report(self):
+        """Return a line_profiler-style text report"""
+        lines = []
+        for code in self.codes:
+            entries = {lineno: self.times[(c, lineno)] for (c, lineno) in self.times if c is code}
+            if not entries:
+                continue
+            total = sum(entries.values())
+            lines.append(f"Function: {code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            lines.append(f"Total time: {total:.4f} s")
+            lines.append(f"{'Line':>6} {'Hits':>10} {'Time (s)':>12} {'% Time':>8}  Source")
+            try:
+                source, first_line = inspect.getsourcelines(code)
+            except OSError:
+                source, first_line = [], code.co_firstlineno
+            line_numbers = range(first_line, first_line + len(source)) if source else sorted(entries)
+            for lineno in line_numbers:
+                text = linecache.getline(code.co_filename, lineno).rstrip()
+                if lineno in entries:
+                    hits = self.hits[(code, lineno)]
+                    share = 100 * entries[lineno] / total if total > 0 else 0
+                    lines.append(f"{lineno:>6} {hits:>10} {entries[lineno]:>12.4f} {share:>7.1f}%  {text}")
+                else:
+                    lines.append(f"{lineno:>6} {'':>10} {'':>12} {'':>8}  {text}")
+            lines.append('')
+        return '\n'.join(lines)
+
+
+class StageProfiler:
+    def __init__(self, output_dir, mode='deterministic', stages=None, interval=0.005, line_functions=None, top_n=40,
+                 tag=None):
+        """
+        Profile pipeline stages, attributing the results to instrumentation span names
+
+        Args:
+            output_dir: Directory of the profile reports
+            mode: 'deterministic' (cProfile per stage) or 'sampling' (periodic stack samples)
+            stages: Span names to profile (a name also matches 'name:...'); None profiles top-level stages
+            interval: Sampling interval in seconds
+            line_functions: Functions timed line by line (None disables the line timer)
+            top_n: Number of rows of the hot-function tables
+            tag: Suffix of the per-process report files (defaults to the process id)
+        """
+        if mode not in ('deterministic', 'sampling'):
+            raise ValueError(f"Unsupported profiling mode: {mode}")
+        self.output_dir = output_dir
+        self.mode = mode
+        self.stages = stages
+        self.interval = interval
+        self.top_n = top_n
+        self.tag = _safe_name(tag) if tag else str(os.getpid())
+        self.written = []
+
+        self._active_span = None
+        self._profile = None
+        self._counter = defaultdict(int)
+
+        # Sampling state: the span paths currently open on the main thread and the collapsed stacks
+        self._thread_id = threading.get_ident()
+        self._open_paths = []
+        self._stacks = defaultdict(int)
+        self._stop_sampling = threading.Event()
+        self._sampler = None
+
+        self.line_timer = LineTimer(line_functions) if line_functions else None
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def _matches(self, span):
+        if self.stages is None:
+            return span.parent is None
+        return any(span.name == stage or span.name.startswith(f"{stage}:") for stage in self.stages)
+
+    def start(self):
+        if self.mode == 'sampling':
+            self._sampler = threading.Thread(target=self._sample_loop, name='stage-profiler', daemon=True)
+            self._sampler.start()
+        if self.line_timer is not None:
+            self.line_timer.start()
+
+    def on_enter(self, span):
+        if not self._matches(span):
+            return
+        if self.mode == 'sampling':
+            self._open_paths.append(span.path)
+        elif self._active_span is None:
+            # cProfile cannot nest: the outermost matching stage covers the ones inside it
+            self._active_span = span
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def on_exit(self, span):
+        if self.mode == 'sampling':
+            if self._open_paths and self._open_paths[-1] == span.path:
+                self._open_paths.pop()
+        elif span is self._active_span:
+            self._profile.disable()
+            self._write_stage_profile(span, self._profile)
+            self._active_span = None
+            self._profile = None
+
+    def _write_stage_profile(self, span, profile):
+        """Write the pstats dump and the sorted hot-function tables of one stage"""
+        name = _safe_name(span.name)
+        self._counter[name] += 1
+        if self._counter[name] > 1:
+            name = f"{name}_{self._counter[name]}"
+
+        prof_path = os.path.join(self.output_dir, f"{name}.prof")
+        profile.dump_stats(prof_path)
+
+        table_path = os.path.join(self.output_dir, f"{name}_hotspots.txt")
+        with open(table_path, 'w') as f:
+            f.write(f"Stage: {span.path}\n\n")
+            stats = pstats.Stats(profile, stream=f).strip_dirs()
+            f.write("=== Sorted by cumulative time ===\n")
+            stats.sort_stats('cumulative').print_stats(self.top_n)
+            f.write("=== Sorted by internal time ===\n")
+            stats.sort_stats('tottime').print_stats(self.top_n)
+
+        self.written.extend([prof_path, table_path])
+        print(f"Profile of stage '{span.path}' saved to {table_path}")
+
+    def _sample_loop(self):
+        while not self._stop_sampling.wait(self.interval):
+            if not self._open_paths:
+                continue
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            stage = self._open_paths[-1].replace('/', ';')
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            self._stacks[f"{stage};{';'.join(reversed(labels))}"] += 1
+
+    def _write_sampling_reports(self):
+        """Write the collapsed stacks (flamegraph.pl / speedscope input) and sampled hot-function tables"""
+        if not self._stacks:
+            return
+        collapsed_path = os.path.join(self.output_dir, f"stacks_{self.tag}.collapsed")
+        with open(collapsed_path, 'w') as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+        # Self (innermost frame) and total (anywhere on the stack) samples per stage and function
+        self_samples = defaultdict(lambda: defaultdict(int))
+        total_samples = defaultdict(lambda: defaultdict(int))
+        stage_samples = defaultdict(int)
+        for stack, count in self._stacks.items():
+            stage_path = [part for part in stack.split(';') if '(' not in part]
+            frames = [part for part in stack.split(';') if '(' in part]
+            stage = '/'.join(stage_path)
+            stage_samples[stage] += count
+            if frames:
+                self_samples[stage][frames[-1]] += count
+            for label in set(frames):
+                total_samples[stage][label] += count
+
+        table_path = os.path.join(self.output_dir, f"sampling_hotspots_{self.tag}.txt")
+        with open(table_path, 'w') as f:
+            for stage in sorted(stage_samples, key=stage_samples.get, reverse=True):
+                n = stage_samples[stage]
+                f.write(f"Stage: {stage} ({n} samples, ~{n * self.interval:.2f} s)\n")
+                f.write(f"{'Self %':>8} {'Total %':>8}  Function\n")
+                ranked = sorted(total_samples[stage], key=lambda label: (self_samples[stage][label],
+                                                                         total_samples[stage][label]), reverse=True)
+                for label in ranked[:self.top_n]:
+                    f.write(f"{100 * self_samples[stage][label] / n:>7.1f}% "
+                            f"{100 * total_samples[stage][label] / n:>7.1f}%  {label}\n")
+                f.write('\n')
+
+        self.written.extend([collapsed_path, table_path])
+        print(f"Collapsed stacks saved to {collapsed_path}")
+
+    def close(self):
+        """Stop profiling and write the remaining reports; returns the written paths"""
+        if self.line_timer is not None:
+            self.line_timer.stop()
+            line_path = os.path.join(self.output_dir, f"line_timings_{self.tag}.txt")
+            report = self.line_timer.report()
+            if report:
+                with open(line_path, 'w') as f:
+                    f.write(report)
+                self.written.append(line_path)
+                print(f"Line timings saved to {line_path}")
+
+        if self._sampler is not None:
+            self._stop_sampling.set()
+            self._sampler.join()
+            self._write_sampling_reports()
+
+        if self._profile is not None:
+            self._profile.disable()
+        return self.written
+
+
+def start(output_dir, mode='deterministic', stages=None, interval=0.005, lines=False, tag=None):
+    """
+    Start profiling the stages of this process.
+    Instrumentation is enabled if needed, since stages are identified by their spans.
+    """
+    global _profiler, _owns_recorder
+    recorder = instrumentation.get_recorder()
+    _owns_recorder = recorder is None
+    if recorder is None:
+        recorder = instrumentation.enable()
+
+    _profiler = StageProfiler(output_dir, mode=mode, stages=stages, interval=interval,
+                              line_functions=feature_extractor_functions() if lines else None, tag=tag)
+    recorder.listeners.append(_profiler)
+    _profiler.start()
+    return _profiler
+
+
+def stop():
+    """Stop profiling, write the reports and return their paths"""
+    global _profiler, _owns_recorder
+    if _profiler is None:
+        return []
+    profiler, _profiler = _profiler, None
+    written = profiler.close()
+
+    recorder = instrumentation.get_recorder()
+    if recorder is not None and profiler in recorder.listeners:
+        recorder.listeners.remove(profiler)
+    if _owns_recorder:
+        instrumentation.disable()
+        _owns_recorder = False
+    return written
+
+
+def get_config():
+    """Profiler settings of this process (passed to task graph workers), or None if profiling is off"""
+    if _profiler is None:
+        return None
+    return {
+        'output_dir': _profiler.output_dir,
+        'mode': _profiler.mode,
+        'stages': _profiler.stages,
+        'interval': _profiler.interval,
+        'lines': _profiler.line_timer is not None
+    }
+
+
+def add_profile_arguments(parser):
+    """Add the --profile options to a command line parser"""
+    parser.add_argument('--profile', nargs='?', const='deterministic', choices=['deterministic', 'sampling'],
+                        default=None, help='Profile pipeline stages (deterministic cProfile or stack sampling)')
+    parser.add_argument('--profile-stages', nargs='+', default=None,
+                        help='Stage names to profile (default: every top-level stage)')
+    parser.add_argument('--profile-dir', default=os.path.join('results', 'profiles'),
+                        help='Output directory of the profile reports')
+    parser.add_argument('--profile-lines', action='store_true',
+                        help='With --profile, also time the feature extractors line by line')
+    return parser
+
+
+@contextmanager
+def profile_from_args(args):
+    """Profile the enclosed block according to the --profile options (no-op without --profile)"""
+    if getattr(args, 'profile', None) is None:
+        yield None
+        return
+    output_dir = os.path.join(args.profile_dir, time.strftime('%Y%m%d_%H%M%S'))
+    profiler = start(output_dir, mode=args.profile, stages=args.profile_stages, lines=args.profile_lines)
+    try:
+        yield profiler
+    finally:
+        stop()
+        print(f"Profiling reports saved to {output_dir}")
@@ -0,0 +1,53 @@
+import os
+import sys
+import resource
+
+
+def _read_status_mb(field):
+    """Read a memory field (e.g. VmRSS, VmHWM) of this process from /proc in MB (None if unavailable)"""
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB"""
+    rss = _read_status_mb('VmRSS')
+    if rss is not None:
+        return rss
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (since start or the last reset_peak_rss)"""
+    peak = _read_status_mb('VmHWM')
+    if peak is not None:
+        return peak
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def reset_peak_rss():
+    """
+    Reset the peak RSS counter so the next peak_rss_mb() only covers what follows.
+    Only supported on Linux; returns False when the peak cannot be reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def cpu_count():
+    """Number of CPUs this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
@@ -0,0 +1,394 @@
+import os
+import json
+import time
+import numpy as np
+
+# Bump when the on-disk layout changes
+FORMAT_VERSION = 1
+
+MANIFEST_FILE = 'manifest.json'
+NODES_FILE = 'nodes.npy'
+VALUES_FILE = 'values.npy'
+# Child indices (into the concatenated node array, -1 at leaves) and split features of
+# every node, so the traversal reads memory-mapped arrays only
+ROUTING_FILE = 'routing.npy'
+
+SUPPORTED_ESTIMATORS = ('DecisionTreeClassifier', 'RandomForestClassifier')
+
+
+def _estimator_class(name):
+    if name == 'DecisionTreeClassifier':
+        from sklearn.tree import DecisionTreeClassifier
+        return DecisionTreeClassifier
+    if name == 'RandomForestClassifier':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier
+    raise ValueError(f"Unsupported estimator in model artifact: {name}")
+
+
+def _to_json(value):
+    """JSON-compatible copy of a parameter value, or raise TypeError"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    json.dumps(value)
+    return value
+
+
+def _json_params(params):
+    """Estimator parameters that survive a JSON round trip (others fall back to their defaults)"""
+    result = {}
+    for name, value in params.items():
+        try:
+            result[name] = _to_json(value)
+        except TypeError:
+            continue
+    return result
+
+
+def _json_default(value):
+    # numpy scalars and arrays in metrics/metadata keep their numeric type
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def _rows(X, start, stop):
+    """Row slice of a DataFrame, array or sparse matrix"""
+    if hasattr(X, 'iloc'):
+        return X.iloc[start:stop]
+    return X[start:stop]
+
+
+def _class_list(classes):
+    return [c.item() if isinstance(c, np.generic) else c for c in classes]
+
+
+def is_model_artifact(path):
+    """Check whether path is a model artifact directory (the manifest is written last)"""
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+def read_manifest(artifact_dir):
+    """Return the manifest of a model artifact without touching its node arrays"""
+    with open(os.path.join(artifact_dir, MANIFEST_FILE), 'r') as f:
+        return json.load(f)
+
+
+def save_model_artifact(model, artifact_dir, feature_names=None, metrics=None, metadata=None):
+    """
+    Save a fitted decision tree or random forest as a model artifact
+
+    Layout:
+        manifest.json  estimator, params, classes, feature names, metrics, importances, tree offsets
+        nodes.npy      sklearn node records of all trees, concatenated (child indices are tree-local)
+        values.npy     per-node class distributions of all trees, concatenated
+        routing.npy    (3, n_nodes) int64: left and right child in the concatenated array, split feature
+
+    The arrays are uncompressed so ModelArtifact can memory-map them.
+
+    Args:
+        model: Fitted DecisionTreeClassifier or RandomForestClassifier (or a ModelArtifact)
+        artifact_dir: Output directory
+        feature_names: Feature names (defaults to the names seen during fit)
+        metrics: Optional evaluation metrics stored in the manifest
+        metadata: Optional extra JSON-serializable information
+
+    Returns:
+        The manifest dictionary
+    """
+    if isinstance(model, ModelArtifact):
+        model = model.to_estimator()
+    estimator = type(model).__name__
+    if estimator not in SUPPORTED_ESTIMATORS:
+        raise ValueError(f"Model artifacts support {SUPPORTED_ESTIMATORS}, got {estimator}")
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Model artifacts only support single-output classifiers")
+
+    trees = model.estimators_ if estimator == 'RandomForestClassifier' else [model]
+    states = [tree.tree_.__getstate__() for tree in trees]
+
+    tree_index = []
+    offset = 0
+    for state in states:
+        tree_index.append({'offset': offset, 'node_count': int(state['node_count']),
+                           'max_depth': int(state['max_depth'])})
+        offset += int(state['node_count'])
+
+    if feature_names is None and hasattr(model, 'feature_names_in_'):
+        feature_names = model.feature_names_in_.tolist()
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    manifest_path = os.path.join(artifact_dir, MANIFEST_FILE)
+    # Remove the manifest first so readers never pair it with half-written arrays
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    nodes = np.concatenate([state['nodes'] for state in states])
+    for filename, array in [(NODES_FILE, nodes),
+                            (VALUES_FILE, np.concatenate([state['values'] for state in states])),
+                            (ROUTING_FILE, _routing_array(nodes, [tree['offset'] for tree in tree_index],
+                                                          [tree['node_count'] for tree in tree_index]))]:
+        path = os.path.join(artifact_dir, filename)
+        with open(f"{path}.tmp", 'wb') as f:
+            np.save(f, array)
+        os.replace(f"{path}.tmp", path)
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'estimator': estimator,
+        'params': _json_params(model.get_params()),
+        'tree_params': _json_params(trees[0].get_params()),
+        'classes': _class_list(model.classes_),
+        'n_features': int(model.n_features_in_),
+        'feature_names': list(feature_names) if feature_names is not None else None,
+        'feature_names_in': model.feature_names_in_.tolist() if hasattr(model, 'feature_names_in_') else None,
+        'feature_importances': model.feature_importances_.tolist(),
+        'trees': tree_index,
+        'metrics': metrics or {},
+        'metadata': metadata or {},
+        'created': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2, default=_json_default)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return manifest
+
+
+def _routing_array(nodes, offsets, node_counts):
+    """Routing table of concatenated node records: child indices offset by their tree, and features"""
+    offsets = np.repeat(np.asarray(offsets, dtype=np.int64), node_counts)
+    left = np.asarray(nodes['left_child'], dtype=np.int64)
+    right = np.asarray(nodes['right_child'], dtype=np.int64)
+    is_leaf = left == -1
+    return np.stack([np.where(is_leaf, -1, left + offsets), np.where(is_leaf, -1, right + offsets),
+                     np.asarray(nodes['feature'], dtype=np.int64)])
+
+
+def update_manifest(artifact_dir, metrics=None, metadata=None):
+    """Merge metrics and metadata into an existing artifact manifest"""
+    manifest = read_manifest(artifact_dir)
+    manifest['metrics'].update(metrics or {})
+    manifest['metadata'].update(metadata or {})
+    manifest_path = os.path.join(artifact_dir, MANIFEST_FILE)
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump(manifest, f, indent=2, default=_json_default)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return manifest
+
+
+class ModelArtifact:
+    # Rows traversed at once; bounds the per-batch (rows x trees) index arrays
+    chunk_rows = 4096
+
+    def __init__(self, artifact_dir, mmap_mode='r'):
+        """
+        Lazily loaded tree model read from a model artifact directory
+
+        Opening an artifact only reads the JSON manifest. The node arrays are
+        memory-mapped on the first prediction, so processes scoring the same
+        model share one copy in the page cache. Predictions of any batch size are a
+        numpy traversal of the mapped arrays (chunk_rows rows at a time), matching the
+        sklearn estimator. Attributes that only the sklearn estimator has (tree_,
+        estimators_, apply, decision_path, ...) are served by an estimator rebuilt from
+        the arrays on first access; that estimator holds its own copy of the nodes.
+        sklearn.base.clone() returns an unfitted estimator with the manifest params.
+
+        Args:
+            artifact_dir: Directory written by save_model_artifact
+            mmap_mode: numpy memory-map mode of the node arrays (None loads them into memory)
+        """
+        self.artifact_dir = artifact_dir
+        self.mmap_mode = mmap_mode
+        self.manifest = read_manifest(artifact_dir)
+        if self.manifest.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model artifact format {self.manifest.get('format_version')} "
+                             f"in {artifact_dir}")
+        self.classes_ = np.array(self.manifest['classes'])
+        self.n_classes_ = len(self.classes_)
+        self.n_outputs_ = 1
+        self.n_features_in_ = self.manifest['n_features']
+        self.feature_importances_ = np.array(self.manifest['feature_importances'])
+        self._nodes = None
+        self._values = None
+        self._routing_table = None
+        self._estimator = None
+
+    @property
+    def estimator_name(self):
+        return self.manifest['estimator']
+
+    @property
+    def params(self):
+        return dict(self.manifest['params'])
+
+    @property
+    def metrics(self):
+        return self.manifest.get('metrics', {})
+
+    @property
+    def feature_names(self):
+        return self.manifest.get('feature_names')
+
+    @property
+    def n_trees(self):
+        return len(self.manifest['trees'])
+
+    def _arrays(self):
+        if self._nodes is None:
+            self._nodes = np.load(os.path.join(self.artifact_dir, NODES_FILE), mmap_mode=self.mmap_mode)
+            self._values = np.load(os.path.join(self.artifact_dir, VALUES_FILE), mmap_mode=self.mmap_mode)
+        return self._nodes, self._values
+
+    def _routing(self):
+        """Memory-mapped routing table (built in memory for artifacts saved without one)"""
+        if self._routing_table is None:
+            path = os.path.join(self.artifact_dir, ROUTING_FILE)
+            if os.path.exists(path):
+                self._routing_table = np.load(path, mmap_mode=self.mmap_mode)
+            else:
+                nodes, _ = self._arrays()
+                self._routing_table = _routing_array(nodes, [tree['offset'] for tree in self.manifest['trees']],
+                                                     [tree['node_count'] for tree in self.manifest['trees']])
+        return self._routing_table
+
+    def _as_matrix(self, X):
+        # sklearn compares float32 features against float64 thresholds; do the same
+        if hasattr(X, 'toarray'):
+            return X.toarray().astype(np.float32, copy=False)
+        values = X.to_numpy() if hasattr(X, 'to_numpy') else X
+        return np.asarray(values, dtype=np.float32)
+
+    def _leaves(self, X):
+        """
+        Leaf of every row in every tree, shape (n_rows, n_trees), as indices into the
+        concatenated node array. All trees advance one level per iteration.
+        """
+        nodes, _ = self._arrays()
+        left, right, feature = self._routing()
+        threshold = nodes['threshold']
+        roots = np.array([tree['offset'] for tree in self.manifest['trees']], dtype=np.int64)
+        node = np.tile(roots, X.shape[0])
+        row = np.repeat(np.arange(X.shape[0]), len(roots))
+        active = np.flatnonzero(left[node] != -1)
+        while active.size:
+            current = node[active]
+            values = X[row[active], feature[current]]
+            go_left = values <= threshold[current]
+            missing = np.isnan(values)
+            if missing.any():
+                go_left = np.where(missing, nodes['missing_go_to_left'][current].astype(bool), go_left)
+            current = np.where(go_left, left[current], right[current])
+            node[active] = current
+            active = active[left[current] != -1]
+        return node.reshape(X.shape[0], len(roots))
+
+    def predict_proba(self, X):
+        """Class probabilities (the average over trees for a forest)"""
+        if X.shape[0] > self.chunk_rows:
+            return np.vstack([self._predict_chunk(_rows(X, start, start + self.chunk_rows))
+                              for start in range(0, X.shape[0], self.chunk_rows)])
+        return self._predict_chunk(X)
+
+    def _predict_chunk(self, X):
+        X = self._as_matrix(X)
+        _, values = self._arrays()
+        leaves = self._leaves(X)
+        proba = np.zeros((X.shape[0], self.n_classes_))
+        for tree in range(leaves.shape[1]):
+            tree_proba = np.asarray(values[leaves[:, tree], 0, :], dtype=np.float64)
+            normalizer = tree_proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba += tree_proba / normalizer
+        if leaves.shape[1] > 1:
+            proba /= leaves.shape[1]
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def __sklearn_clone__(self):
+        """Unfitted estimator with the manifest params (used by sklearn.base.clone)"""
+        return _estimator_class(self.estimator_name)(**self.params)
+
+    def to_estimator(self):
+        """Fitted sklearn estimator rebuilt from the node arrays (cached)"""
+        if self._estimator is None:
+            self._estimator = self._build_estimator()
+        return self._estimator
+
+    def _build_tree(self, tree):
+        from sklearn.tree import DecisionTreeClassifier
+        from sklearn.tree._tree import Tree
+
+        nodes, values = self._arrays()
+        start, stop = tree['offset'], tree['offset'] + tree['node_count']
+        estimator = DecisionTreeClassifier(**self.manifest['tree_params'])
+        estimator.tree_ = Tree(self.n_features_in_, np.array([self.n_classes_], dtype=np.intp), 1)
+        estimator.tree_.__setstate__({
+            'max_depth': tree['max_depth'],
+            'node_count': tree['node_count'],
+            'nodes': np.ascontiguousarray(nodes[start:stop]),
+            'values': np.ascontiguousarray(values[start:stop])
+        })
+        self._set_fitted_attributes(estimator)
+        estimator.max_features_ = self.n_features_in_
+        return estimator
+
+    def _set_fitted_attributes(self, estimator):
+        estimator.classes_ = self.classes_
+        estimator.n_classes_ = self.n_classes_
+        estimator.n_outputs_ = 1
+        estimator.n_features_in_ = self.n_features_in_
+        if self.manifest.get('feature_names_in') is not None:
+            estimator.feature_names_in_ = np.array(self.manifest['feature_names_in'], dtype=object)
+
+    def _build_estimator(self):
+        trees = [self._build_tree(tree) for tree in self.manifest['trees']]
+        if self.estimator_name == 'DecisionTreeClassifier':
+            return trees[0]
+        from sklearn.tree import DecisionTreeClassifier
+        forest = _estimator_class(self.estimator_name)(**self.params)
+        forest.estimator_ = DecisionTreeClassifier(**self.manifest['tree_params'])
+        forest.estimators_ = trees
+        self._set_fitted_attributes(forest)
+        return forest
+
+    def __getattr__(self, name):
+        # Only called for attributes this class does not define: defer to the sklearn estimator
+        if name.startswith('__') or name in ('manifest', '_estimator', '_nodes', '_values', '_routing_table'):
+            raise AttributeError(name)
+        return getattr(self.to_estimator(), name)
+
+    def __reduce__(self):
+        # Pickles as a reference: another process reopens (and memory-maps) the same files
+        return ModelArtifact, (self.artifact_dir, self.mmap_mode)
+
+    def __repr__(self):
+        return f"ModelArtifact({self.estimator_name}, trees={self.n_trees}, dir={self.artifact_dir!r})"
+
+
+def as_estimator(model):
+    """The sklearn estimator behind a model (rebuilt for a ModelArtifact)"""
+    if isinstance(model, ModelArtifact):
+        return model.to_estimator()
+    return model
+
+
+def load_model(path, mmap_mode='r'):
+    """
+    Load a model saved as an artifact directory or as a legacy joblib pickle.
+    For a path ending in .pkl, an artifact directory of the same name (without .pkl) is preferred.
+    """
+    artifact_dir = path[:-4] if path.endswith('.pkl') else path
+    if is_model_artifact(artifact_dir):
+        return ModelArtifact(artifact_dir, mmap_mode=mmap_mode)
+    import joblib
+    return joblib.load(path)
+
+
+def model_exists(path):
+    """Check whether load_model(path) can find a model"""
+    artifact_dir = path[:-4] if path.endswith('.pkl') else path
+    return is_model_artifact(artifact_dir) or (os.path.isfile(path))
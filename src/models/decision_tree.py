@@ -2,18 +2,23 @@ import os
 import pandas as pd
 import numpy as np
 from sklearn.tree import DecisionTreeClassifier, export_text, export_graphviz
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
-import joblib
+from sklearn.metrics import confusion_matrix
+
+from src.models.metrics import evaluate_in_batches
+from src.models.artifact import ModelArtifact, as_estimator, is_model_artifact, save_model_artifact
+from src.common.plotting import pyplot, draw_confusion_matrix, draw_feature_importance
 
 class ProcessDecisionTree:
+    # Bump when training changes so cached fits of an older version are not reused
+    VERSION = '1'
+    
     def __init__(self, max_depth=None, min_samples_split=2, min_samples_leaf=1,
-                 criterion='gini', random_state=42):
+                 criterion='gini', random_state=42, min_weight_fraction_leaf=0.0):
         self.model = DecisionTreeClassifier(
             max_depth=max_depth,
             min_samples_split=min_samples_split,
             min_samples_leaf=min_samples_leaf,
+            min_weight_fraction_leaf=min_weight_fraction_leaf,
             criterion=criterion,
             random_state=random_state
         )
@@ -23,7 +28,7 @@ class ProcessDecisionTree:
         self.accuracy = None
         self.tree_text = None
     
-    def train(self, X_train, y_train, feature_names=None):
+    def train(self, X_train, y_train, feature_names=None, sample_weight=None):
         """Train the Decision Tree model"""
         # Store feature names, ensuring they match the actual features used
         self.feature_names = X_train.columns.tolist() if feature_names is None else feature_names
@@ -33,8 +38,8 @@ class ProcessDecisionTree:
             print(f"Warning: Provided feature_names length ({len(self.feature_names)}) doesn't match X_train columns ({X_train.shape[1]})")
             self.feature_names = X_train.columns.tolist()
         
-        # Train the model
-        self.model.fit(X_train, y_train)
+        # Train the model (sample_weight: counts of collapsed duplicate rows, if any)
+        self.model.fit(X_train, y_train, sample_weight=sample_weight)
         
         # Store class names
         self.class_names = list(sorted(set(y_train)))
@@ -51,19 +56,22 @@ class ProcessDecisionTree:
         
         return self.model
     
-    def evaluate(self, X_test, y_test):
-        """Evaluate the model and return performance metrics"""
-        y_pred = self.model.predict(X_test)
+    def evaluate(self, X_test, y_test, batch_size=None, sample_weight=None):
+        """Evaluate the model and return performance metrics (sample_weight: row counts of collapsed rows)"""
+        # Single streamed pass: all metrics are derived from one confusion matrix
+        metrics = evaluate_in_batches(self.model, X_test, y_test, batch_size=batch_size, with_proba=True,
+                                      sample_weight=sample_weight)
         
-        self.accuracy = accuracy_score(y_test, y_pred)
-        report = classification_report(y_test, y_pred, output_dict=True)
-        conf_matrix = confusion_matrix(y_test, y_pred)
+        self.accuracy = metrics.accuracy()
+        report = metrics.classification_report()
+        conf_matrix = metrics.confusion_matrix()
         
         return {
             'accuracy': self.accuracy,
             'classification_report': report,
             'confusion_matrix': conf_matrix,
-            'feature_importance': self.feature_importance
+            'feature_importance': self.feature_importance,
+            'summary': metrics.summary()
         }
     
     def predict(self, X):
@@ -78,9 +86,10 @@ class ProcessDecisionTree:
         """Save the model and its metadata"""
         os.makedirs(model_dir, exist_ok=True)
         
-        # Save the model
-        model_path = os.path.join(model_dir, 'decision_tree_model.pkl')
-        joblib.dump(self.model, model_path)
+        # Save the model as a memory-mappable artifact with its metadata in the manifest
+        save_model_artifact(self.model, model_dir, feature_names=self.feature_names,
+                            metrics={'accuracy': self.accuracy},
+                            metadata={'class_names': self.class_names})
         
         # Save feature importance
         if self.feature_importance is not None:
@@ -91,29 +100,27 @@ class ProcessDecisionTree:
             with open(os.path.join(model_dir, 'decision_tree_structure.txt'), 'w') as f:
                 f.write(self.tree_text)
         
-        # Save feature names and class names
-        metadata = {
-            'feature_names': self.feature_names,
-            'class_names': self.class_names,
-            'accuracy': self.accuracy
-        }
-        joblib.dump(metadata, os.path.join(model_dir, 'dt_metadata.pkl'))
-        
         print(f"Decision Tree model saved to {model_dir}")
     
     def load_model(self, model_dir):
         """Load a saved model and its metadata"""
-        # Load the model
-        model_path = os.path.join(model_dir, 'decision_tree_model.pkl')
-        self.model = joblib.load(model_path)
-        
-        # Load metadata
-        metadata_path = os.path.join(model_dir, 'dt_metadata.pkl')
-        if os.path.exists(metadata_path):
-            metadata = joblib.load(metadata_path)
-            self.feature_names = metadata.get('feature_names', None)
-            self.class_names = metadata.get('class_names', None)
-            self.accuracy = metadata.get('accuracy', None)
+        if is_model_artifact(model_dir):
+            # Only the manifest is read here; the node arrays are memory-mapped on first use
+            self.model = ModelArtifact(model_dir)
+            manifest = self.model.manifest
+            self.feature_names = manifest.get('feature_names')
+            self.class_names = manifest['metadata'].get('class_names')
+            self.accuracy = manifest['metrics'].get('accuracy')
+        else:
+            # Models saved before the artifact format
+            import joblib
+            self.model = joblib.load(os.path.join(model_dir, 'decision_tree_model.pkl'))
+            metadata_path = os.path.join(model_dir, 'dt_metadata.pkl')
+            if os.path.exists(metadata_path):
+                metadata = joblib.load(metadata_path)
+                self.feature_names = metadata.get('feature_names', None)
+                self.class_names = metadata.get('class_names', None)
+                self.accuracy = metadata.get('accuracy', None)
         
         # Load feature importance
         importance_path = os.path.join(model_dir, 'dt_feature_importance.csv')
@@ -136,16 +143,11 @@ class ProcessDecisionTree:
             print("Feature importance not available. Train the model first.")
             return
         
-        # Get top N features
-        top_features = self.feature_importance.head(top_n)
-        
-        # Plot
-        plt.figure(figsize=(10, 8))
-        sns.barplot(x='importance', y='feature', data=top_features)
-        plt.title(f'Top {top_n} Feature Importance - Decision Tree')
-        plt.tight_layout()
-        
-        return plt.gcf()
+        return draw_feature_importance(*self.feature_importance_payload(top_n))
+    
+    def feature_importance_payload(self, top_n=20):
+        """Arguments of draw_feature_importance (small enough to send to the plot pool)"""
+        return self.feature_importance.head(top_n), f'Top {top_n} Feature Importance - Decision Tree'
     
     def visualize_confusion_matrix(self, y_test, y_pred=None):
         """Visualize the confusion matrix"""
@@ -154,19 +156,14 @@ class ProcessDecisionTree:
             
         conf_matrix = confusion_matrix(y_test, y_pred)
         
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(conf_matrix, annot=True, fmt='d', cmap='Blues',
-                   xticklabels=self.class_names if self.class_names else 'auto',
-                   yticklabels=self.class_names if self.class_names else 'auto')
-        plt.title('Confusion Matrix - Decision Tree')
-        plt.ylabel('True Label')
-        plt.xlabel('Predicted Label')
-        plt.tight_layout()
-        
-        return plt.gcf()
+        return draw_confusion_matrix(conf_matrix, 'Confusion Matrix - Decision Tree',
+                                     labels=self.class_names if self.class_names else 'auto')
     
     def export_tree_visualization(self, output_file, format='png'):
         """Export the decision tree visualization"""
+        plt = pyplot()
+        # The sklearn exporters need the fitted estimator, not a loaded artifact
+        estimator = as_estimator(self.model)
         try:
             from sklearn.tree import plot_tree
             import graphviz
@@ -174,7 +171,7 @@ class ProcessDecisionTree:
             # Create dot file
             dot_file = output_file.replace(f'.{format}', '.dot')
             export_graphviz(
-                self.model,
+                estimator,
                 out_file=dot_file,
                 feature_names=self.feature_names[:len(self.model.feature_importances_)],
                 class_names=self.class_names,
@@ -197,7 +194,7 @@ class ProcessDecisionTree:
             # Fallback to simple plot
             plt.figure(figsize=(20, 10))
             plot_tree(
-                self.model, 
+                estimator,
                 feature_names=self.feature_names[:len(self.model.feature_importances_)],
                 class_names=self.class_names,
                 filled=True,
@@ -0,0 +1,270 @@
+import time
+import numpy as np
+import pandas as pd
+
+from src.models.decision_tree import ProcessDecisionTree
+
+# Rows densified at once when augmenting a sparse (n-gram) feature matrix
+AUGMENT_BATCH_ROWS = 10000
+
+
+def default_distillation_config():
+    """'distillation' section of a training configuration (disabled by default)"""
+    return {
+        'enabled': False,
+        # Depth bound of the student tree, and its leaf size in training rows
+        'max_depth': 16,
+        'min_samples_leaf': 1,
+        # Augmented prefixes per training row, and the share of event attributes each takes from another row
+        'augment_factor': 1.0,
+        'swap_fraction': 0.3,
+        # Forest probabilities below this are left out of the soft labels (the top class is always kept)
+        'min_probability': 0.05
+    }
+
+
+def attribute_groups(feature_names):
+    """
+    Column positions of the features of each event attribute (e.g. every CRP feature)
+
+    Only features that read a single event attribute besides the case are grouped.
+    Control-flow and time features (which read the activity or timestamp) and columns
+    that are not registry features, such as n-gram counts, describe the prefix itself.
+    """
+    from src.preprocessing import feature_registry
+
+    groups = {}
+    for position, feature in enumerate(feature_registry.profile_for(feature_names).values()):
+        columns, pending = set(), [feature]
+        while pending:
+            name = pending.pop()
+            resolved = feature_registry.resolve(name) if name is not None else None
+            if resolved is None:
+                columns.add(None)
+                continue
+            columns.update(resolved.columns)
+            pending.extend(resolved.depends)
+        columns.discard(feature_registry.CASE)
+        if len(columns) == 1 and not columns & {None, feature_registry.ACTIVITY, feature_registry.TIMESTAMP}:
+            groups.setdefault(columns.pop(), []).append(position)
+    return list(groups.values())
+
+
+def _draw_rows(rng, n_rows, weight, keys=None, base=None):
+    """
+    Rows drawn in proportion to weight; with keys, row i is drawn among the rows whose
+    key equals the key of base[i]
+    """
+    if keys is None:
+        cumulative = np.cumsum(weight)
+        return np.searchsorted(cumulative, rng.random(n_rows) * cumulative[-1], side='right')
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    cumulative = np.r_[0.0, np.cumsum(weight[order])]
+    low = np.searchsorted(sorted_keys, keys[base], side='left')
+    high = np.searchsorted(sorted_keys, keys[base], side='right')
+    targets = cumulative[low] + rng.random(n_rows) * (cumulative[high] - cumulative[low])
+    return order[np.clip(np.searchsorted(cumulative, targets, side='right') - 1, low, high - 1)]
+
+
+def _mix_rows(base, donor, groups, swap_fraction, rng):
+    """Rows of base with each attribute group taken from the same rows of donor with probability swap_fraction"""
+    mixed = base.copy()
+    for columns in groups:
+        swap = rng.random(base.shape[0]) < swap_fraction
+        mixed[np.ix_(swap, columns)] = donor[np.ix_(swap, columns)]
+    return mixed
+
+
+def augment_prefixes(X, n_rows, swap_fraction=0.3, random_state=42, weight=None, feature_names=None):
+    """
+    Synthetic prefixes around the training distribution: random training rows with
+    some of their event attributes replaced by those of another training row of the
+    same prefix length. The forest labels them, so the student also learns its
+    decisions between the observed rows.
+
+    The control flow and timing of a row (current and previous activities, position,
+    times) always stay together, and every feature of a swapped attribute (e.g. the
+    last, mean and count of CRP) is swapped with it (see attribute_groups), so an
+    augmented row is a prefix that could have occurred.
+
+    Args:
+        X: Training features (DataFrame or CSR matrix)
+        n_rows: Number of rows to generate
+        swap_fraction: Probability of each attribute to come from the second row
+        weight: Row counts of a collapsed X (rows are drawn in proportion to them)
+        feature_names: Column names of a CSR X
+
+    Returns:
+        Augmented rows of the same type, columns and dtypes as X
+    """
+    names = list(X.columns) if feature_names is None else list(feature_names)
+    groups = attribute_groups(names)
+    rng = np.random.default_rng(random_state)
+    weight = np.ones(X.shape[0]) if weight is None else np.asarray(weight, dtype=np.float64)
+    base = _draw_rows(rng, n_rows, weight)
+    # Donors have the base row's prefix length, so their attribute histories fit it
+    keys = None
+    if 'event_position' in names:
+        column = names.index('event_position')
+        keys = X[:, column].toarray().ravel() if hasattr(X, 'indptr') else X.iloc[:, column].to_numpy()
+    donor = _draw_rows(rng, n_rows, weight, keys, base)
+
+    if hasattr(X, 'indptr'):
+        from scipy import sparse
+        batches = []
+        for start in range(0, n_rows, AUGMENT_BATCH_ROWS):
+            rows = slice(start, start + AUGMENT_BATCH_ROWS)
+            mixed = _mix_rows(X[base[rows]].toarray(), X[donor[rows]].toarray(), groups, swap_fraction, rng)
+            batches.append(sparse.csr_matrix(mixed, dtype=X.dtype))
+        if not batches:
+            return X[:0]
+        return sparse.vstack(batches, format='csr')
+
+    values = X.to_numpy()
+    mixed = _mix_rows(values[base], values[donor], groups, swap_fraction, rng)
+    return pd.DataFrame(mixed, columns=X.columns).astype(X.dtypes.to_dict())
+
+
+def _stack_rows(a, b):
+    if hasattr(a, 'indptr'):
+        from scipy import sparse
+        return sparse.vstack([a, b], format='csr')
+    return pd.concat([a, b], ignore_index=True)
+
+
+def soft_label_rows(X, proba, classes, weight=None, min_probability=0.05):
+    """
+    Soft labels as weighted hard labels: every row is repeated once per class the
+    teacher gives at least min_probability (and once for its top class), labelled
+    with that class and weighted by its probability times the row's weight
+
+    Returns:
+        (repeated rows, labels, sample weights)
+    """
+    keep = proba >= min_probability
+    keep[np.arange(len(proba)), proba.argmax(axis=1)] = True
+    rows, columns = np.nonzero(keep)
+    sample_weight = proba[rows, columns] * (1.0 if weight is None else np.asarray(weight, dtype=np.float64)[rows])
+    X_rows = X.iloc[rows].reset_index(drop=True) if hasattr(X, 'iloc') else X[rows]
+    return X_rows, np.asarray(classes)[columns], sample_weight
+
+
+def _aligned_proba(model, X, classes):
+    """Probabilities of model over classes (zero for classes the model never saw)"""
+    proba = model.predict_proba(X)
+    aligned = np.zeros((X.shape[0], len(classes)))
+    positions = {label: i for i, label in enumerate(classes)}
+    for j, label in enumerate(model.model.classes_):
+        aligned[:, positions[label]] = proba[:, j]
+    return aligned
+
+
+def _seconds_per_row(model, X, repeats=3):
+    """Best of a few predict_proba timings, per row"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_proba(X)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / max(X.shape[0], 1)
+
+
+def fidelity_report(student, teacher, X, y, sample_weight=None):
+    """
+    Agreement of the student with the teacher and accuracy of both on (X, y)
+
+    Returns:
+        Dictionary with the accuracy of both models, the share of rows where their top
+        classes agree (fidelity) and one minus the mean total variation distance of
+        their probabilities (soft fidelity); rows count sample_weight times
+    """
+    classes = teacher.model.classes_
+    teacher_proba = _aligned_proba(teacher, X, classes)
+    student_proba = _aligned_proba(student, X, classes)
+    teacher_pred, student_pred = classes[teacher_proba.argmax(axis=1)], classes[student_proba.argmax(axis=1)]
+    y = np.asarray(y)
+    weight = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+    total = weight.sum()
+    variation = 0.5 * np.abs(teacher_proba - student_proba).sum(axis=1)
+    return {
+        'rows': int(total),
+        'teacher_accuracy': float(weight[teacher_pred == y].sum() / total),
+        'student_accuracy': float(weight[student_pred == y].sum() / total),
+        'fidelity': float(weight[teacher_pred == student_pred].sum() / total),
+        'soft_fidelity': float(1 - (weight * variation).sum() / total)
+    }
+
+
+def distill_forest(forest, X_train, y_train, X_test, y_test, config=None, feature_names=None,
+                   train_weight=None, test_weight=None, random_state=42):
+    """
+    Train a depth-bounded ProcessDecisionTree on the soft labels of a trained forest
+
+    The student is fitted on the training rows plus augmented prefixes (see
+    augment_prefixes), each labelled with the forest's class probabilities rather
+    than the observed next activity, so one tree learns the forest's averaged
+    decision surface and serves it with a single traversal.
+
+    Args:
+        forest: Trained ProcessRandomForest (the teacher)
+        X_train, y_train: Training split the forest was fitted on
+        X_test, y_test: Held-out split for the fidelity and accuracy report
+        config: 'distillation' configuration section (see default_distillation_config)
+        feature_names: Column names of a sparse X_train
+        train_weight, test_weight: Row counts of collapsed splits (deduplicate mode)
+
+    Returns:
+        (trained student ProcessDecisionTree, report dictionary)
+    """
+    config = dict(default_distillation_config(), **(config or {}))
+    # A collapsed split stands for as many training rows as its counts add up to
+    n_rows = X_train.shape[0] if train_weight is None else int(np.sum(train_weight))
+    n_augmented = int(round(config['augment_factor'] * n_rows))
+
+    start = time.perf_counter()
+    X_augmented = augment_prefixes(X_train, n_augmented, config['swap_fraction'], random_state, weight=train_weight,
+                                   feature_names=feature_names)
+    X_transfer = _stack_rows(X_train, X_augmented)
+    weight = np.ones(X_train.shape[0]) if train_weight is None else np.asarray(train_weight, dtype=np.float64)
+    weight = np.r_[weight, np.ones(n_augmented)]
+
+    # The forest labels every transfer row once
+    proba = forest.predict_proba(X_transfer)
+    X_soft, y_soft, sample_weight = soft_label_rows(X_transfer, proba, forest.model.classes_, weight,
+                                                    config['min_probability'])
+
+    # Leaves hold min_samples_leaf rows' worth of soft-label weight, which is the same
+    # bound with and without collapsed rows (sklearn's min_samples_leaf counts soft-label rows)
+    min_weight_fraction_leaf = 0.0
+    if config['min_samples_leaf'] > 1:
+        min_weight_fraction_leaf = min(0.5, config['min_samples_leaf'] / sample_weight.sum())
+    student = ProcessDecisionTree(max_depth=config['max_depth'], min_weight_fraction_leaf=min_weight_fraction_leaf,
+                                  random_state=random_state)
+    student.train(X_soft, y_soft, feature_names=feature_names or X_train.columns.tolist(),
+                  sample_weight=sample_weight)
+    seconds = time.perf_counter() - start
+
+    report = {
+        'config': config,
+        'transfer_rows': int(X_transfer.shape[0]),
+        'augmented_rows': n_augmented,
+        'soft_label_rows': int(X_soft.shape[0]),
+        'seconds': seconds,
+        'student': {
+            'depth': int(student.model.get_depth()),
+            'nodes': int(student.model.tree_.node_count),
+            'leaves': int(student.model.get_n_leaves())
+        },
+        'teacher': {
+            'trees': len(forest.model.estimators_),
+            'nodes': int(sum(tree.tree_.node_count for tree in forest.model.estimators_))
+        },
+        'train': fidelity_report(student, forest, X_train, y_train, train_weight),
+        'test': fidelity_report(student, forest, X_test, y_test, test_weight),
+        # predict_proba latency on the test split
+        'teacher_us_per_row': _seconds_per_row(forest, X_test) * 1e6,
+        'student_us_per_row': _seconds_per_row(student, X_test) * 1e6
+    }
+    return student, report
@@ -2,11 +2,12 @@ import os
 import pandas as pd
 import numpy as np
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
 import joblib
 from collections import Counter
 
+from src.models.metrics import evaluate_in_batches
+from src.common.plotting import pyplot, seaborn, draw_confusion_matrix
+
 class ModelEnsemble:
     def __init__(self, models=None, voting='soft'):
         """
@@ -74,25 +75,36 @@ class ModelEnsemble:
         
         return avg_proba
     
-    def evaluate(self, X_test, y_test):
-        """Evaluate the ensemble model"""
-        y_pred = self.predict(X_test)
+    def _predict_labels(self, X, y_sample):
+        """Predict and convert ensemble outputs to the label type of y_sample"""
+        y_pred = self.predict(X)
         
         # Make sure predictions and ground truth have the same type
         # Convert prediction to match y_test type if necessary
-        if isinstance(y_test.iloc[0], str) and not isinstance(y_pred[0], str):
+        if isinstance(y_sample, str) and not isinstance(y_pred[0], str):
             # Get class names from first model
             if hasattr(self.models[0], 'class_names') and self.models[0].class_names:
                 class_names = self.models[0].class_names
                 # Convert numeric predictions to class names
                 y_pred = np.array([class_names[p] if p < len(class_names) else f"Unknown-{p}" for p in y_pred])
         
-        # Calculate accuracy and metrics
-        self.accuracy = accuracy_score(y_test, y_pred)
+        return y_pred
+    
+    def evaluate(self, X_test, y_test, batch_size=None, sample_weight=None):
+        """Evaluate the ensemble model (sample_weight: row counts of collapsed rows)"""
+        y_sample = y_test.iloc[0]
+        
+        # Calculate accuracy and metrics in one streamed pass
+        metrics = evaluate_in_batches(
+            self, X_test, y_test, batch_size=batch_size,
+            predict_fn=lambda X: self._predict_labels(X, y_sample),
+            sample_weight=sample_weight
+        )
+        self.accuracy = metrics.accuracy()
         
         try:
-            report = classification_report(y_test, y_pred, output_dict=True)
-            conf_matrix = confusion_matrix(y_test, y_pred)
+            report = metrics.classification_report()
+            conf_matrix = metrics.confusion_matrix()
         except Exception as e:
             print(f"Warning: Could not compute classification report: {e}")
             report = {"error": str(e)}
@@ -159,6 +171,7 @@ class ModelEnsemble:
             
     def visualize_confusion_matrix(self, y_test, y_pred=None):
         """Visualize the confusion matrix"""
+        plt = pyplot()
         if y_pred is None:
             y_pred = self.predict(y_test)
         
@@ -173,16 +186,8 @@ class ModelEnsemble:
         try:
             conf_matrix = confusion_matrix(y_test, y_pred)
             
-            plt.figure(figsize=(10, 8))
-            sns.heatmap(conf_matrix, annot=True, fmt='d', cmap='Blues',
-                      xticklabels=self.class_names if self.class_names else 'auto',
-                      yticklabels=self.class_names if self.class_names else 'auto')
-            plt.title('Confusion Matrix - Ensemble Model')
-            plt.ylabel('True Label')
-            plt.xlabel('Predicted Label')
-            plt.tight_layout()
-            
-            return plt.gcf()
+            return draw_confusion_matrix(conf_matrix, 'Confusion Matrix - Ensemble Model',
+                                         labels=self.class_names if self.class_names else 'auto')
         except Exception as e:
             print(f"Error creating confusion matrix: {e}")
             # Create an empty figure
@@ -194,6 +199,11 @@ class ModelEnsemble:
     
     def compare_models(self, X_test, y_test):
         """Compare performance of individual models vs ensemble"""
+        results = self.evaluate_models(X_test, y_test)
+        return results, draw_accuracy_comparison(accuracy_comparison_frame(results))
+    
+    def evaluate_models(self, X_test, y_test):
+        """Accuracy and classification report of each individual model and of the ensemble"""
         results = {}
         
         # Evaluate individual models
@@ -248,18 +258,25 @@ class ModelEnsemble:
                 'error': str(e)
             }
         
-        # Create comparison DataFrame
-        accuracy_comparison = pd.DataFrame({
-            'Model': list(results.keys()),
-            'Accuracy': [results[model].get('accuracy', 0) for model in results]
-        })
-        
-        # Plot comparison
-        plt.figure(figsize=(10, 6))
-        sns.barplot(x='Model', y='Accuracy', data=accuracy_comparison)
-        plt.title('Model Accuracy Comparison')
-        plt.ylim(0, 1)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        return results, plt.gcf()
+        return results
+
+
+def accuracy_comparison_frame(results):
+    """Model/Accuracy frame of ModelEnsemble.evaluate_models results"""
+    return pd.DataFrame({
+        'Model': list(results.keys()),
+        'Accuracy': [results[model].get('accuracy', 0) for model in results]
+    })
+
+
+def draw_accuracy_comparison(accuracy_comparison):
+    """Bar chart of model accuracies"""
+    plt = pyplot()
+    sns = seaborn()
+    fig = plt.figure(figsize=(10, 6))
+    sns.barplot(x='Model', y='Accuracy', data=accuracy_comparison)
+    plt.title('Model Accuracy Comparison')
+    plt.ylim(0, 1)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
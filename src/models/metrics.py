@@ -0,0 +1,333 @@
+import numpy as np
+
+
+class MetricAccumulator:
+    def __init__(self, classes=None, n_bins=100):
+        """
+        Incrementally accumulate a confusion matrix and probability statistics
+
+        All metrics (accuracy, per-class and averaged precision/recall/F1,
+        support and an approximate one-vs-rest ROC-AUC) are derived from the
+        accumulated counts, so memory use does not grow with the number of
+        evaluated samples.
+
+        Per-class metrics, their averages and the confusion matrix cover the labels
+        seen in y_true or y_pred (like sklearn's unique_labels); known classes that
+        never occur there only label probability columns.
+
+        Args:
+            classes: Optional list of known class labels (e.g. model.classes_)
+            n_bins: Number of probability bins used for the ROC-AUC histograms
+        """
+        self.classes = []
+        self._index = {}
+        self.n_bins = n_bins
+        self.confusion = np.zeros((0, 0), dtype=np.int64)
+        self.pos_hist = np.zeros((0, n_bins), dtype=np.int64)
+        self.neg_hist = np.zeros((0, n_bins), dtype=np.int64)
+        self.prob_sums = np.zeros((0, 0), dtype=np.float64)
+        self.n_samples = 0
+        self.n_proba_samples = 0
+
+        if classes is not None:
+            self._add_classes(classes)
+
+    def _add_classes(self, labels):
+        """Register unseen labels and grow the accumulators accordingly"""
+        new_labels = [label for label in dict.fromkeys(labels) if label not in self._index]
+        if not new_labels:
+            return
+
+        for label in new_labels:
+            self._index[label] = len(self.classes)
+            self.classes.append(label)
+
+        grow = len(new_labels)
+        self.confusion = np.pad(self.confusion, ((0, grow), (0, grow)))
+        self.pos_hist = np.pad(self.pos_hist, ((0, grow), (0, 0)))
+        self.neg_hist = np.pad(self.neg_hist, ((0, grow), (0, 0)))
+        self.prob_sums = np.pad(self.prob_sums, ((0, grow), (0, grow)))
+
+    def _encode(self, labels):
+        """Map labels to accumulator indices"""
+        return np.fromiter((self._index[label] for label in labels), dtype=np.int64, count=len(labels))
+
+    def update(self, y_true, y_pred, y_proba=None, proba_classes=None, sample_weight=None):
+        """
+        Add a batch of ground truth labels and predictions
+
+        Args:
+            y_true: True labels of the batch
+            y_pred: Predicted labels of the batch
+            y_proba: Optional (n_samples, n_classes) probability estimates
+            proba_classes: Class labels of the y_proba columns (e.g. model.classes_)
+            sample_weight: Optional integer multiplicity of each row (e.g. the counts of
+                collapsed duplicate rows); a row of weight k counts as k identical rows
+        """
+        y_true = np.asarray(y_true, dtype=object)
+        y_pred = np.asarray(y_pred, dtype=object)
+        if len(y_true) != len(y_pred):
+            raise ValueError("y_true and y_pred must have the same length")
+        if len(y_true) == 0:
+            return self
+
+        weights = None
+        if sample_weight is not None:
+            weights = np.asarray(sample_weight)
+            if len(weights) != len(y_true):
+                raise ValueError("sample_weight must have the same length as y_true")
+            if np.any(weights < 0) or np.any(weights != np.round(weights)):
+                raise ValueError("sample_weight must hold non-negative integer row counts")
+            weights = weights.astype(np.int64)
+
+        self._add_classes(list(y_true) + list(y_pred))
+        true_idx = self._encode(y_true)
+        pred_idx = self._encode(y_pred)
+
+        n_classes = len(self.classes)
+        counts = np.bincount(true_idx * n_classes + pred_idx, weights=weights, minlength=n_classes * n_classes)
+        self.confusion += counts.astype(np.int64).reshape(n_classes, n_classes)
+        n_rows = len(y_true) if weights is None else int(weights.sum())
+        self.n_samples += n_rows
+
+        if y_proba is not None:
+            if proba_classes is None:
+                raise ValueError("proba_classes must be provided together with y_proba")
+            self._update_proba(true_idx, np.asarray(y_proba, dtype=np.float64), list(proba_classes), weights)
+
+        return self
+
+    def _update_proba(self, true_idx, y_proba, proba_classes, weights=None):
+        """Update the per-class probability histograms and running sums"""
+        self._add_classes(proba_classes)
+        columns = self._encode(proba_classes)
+
+        # Running sum of the predicted distribution, grouped by true class
+        batch_sums = np.zeros((len(self.classes), len(columns)))
+        np.add.at(batch_sums, true_idx, y_proba if weights is None else y_proba * weights[:, None])
+        self.prob_sums[:, columns] += batch_sums
+
+        bins = np.minimum((y_proba * self.n_bins).astype(np.int64), self.n_bins - 1)
+        for col, class_idx in enumerate(columns):
+            is_positive = true_idx == class_idx
+            if weights is None:
+                self.pos_hist[class_idx] += np.bincount(bins[is_positive, col], minlength=self.n_bins)
+                self.neg_hist[class_idx] += np.bincount(bins[~is_positive, col], minlength=self.n_bins)
+            else:
+                self.pos_hist[class_idx] += np.bincount(bins[is_positive, col], weights=weights[is_positive],
+                                                        minlength=self.n_bins).astype(np.int64)
+                self.neg_hist[class_idx] += np.bincount(bins[~is_positive, col], weights=weights[~is_positive],
+                                                        minlength=self.n_bins).astype(np.int64)
+
+        self.n_proba_samples += len(true_idx) if weights is None else int(weights.sum())
+
+    def merge(self, other):
+        """Merge the counts of another accumulator into this one"""
+        self._add_classes(other.classes)
+        idx = self._encode(other.classes)
+        self.confusion[np.ix_(idx, idx)] += other.confusion
+        self.pos_hist[idx] += other.pos_hist
+        self.neg_hist[idx] += other.neg_hist
+        self.prob_sums[np.ix_(idx, idx)] += other.prob_sums
+        self.n_samples += other.n_samples
+        self.n_proba_samples += other.n_proba_samples
+        return self
+
+    def _sorted_order(self):
+        """Indices of the classes in sorted label order (as sklearn reports them)"""
+        try:
+            return sorted(range(len(self.classes)), key=lambda i: self.classes[i])
+        except TypeError:
+            return sorted(range(len(self.classes)), key=lambda i: str(self.classes[i]))
+
+    def _observed_order(self):
+        """Sorted-order indices of the classes that occur as a true or predicted label"""
+        observed = (self.confusion.sum(axis=0) + self.confusion.sum(axis=1)) > 0
+        return [i for i in self._sorted_order() if observed[i]]
+
+    def labels(self):
+        """Return the observed class labels (true or predicted) in sorted order"""
+        return [self.classes[i] for i in self._observed_order()]
+
+    def confusion_matrix(self):
+        """Return the confusion matrix over the observed labels (rows: true labels, columns: predictions)"""
+        order = self._observed_order()
+        return self.confusion[np.ix_(order, order)]
+
+    def accuracy(self):
+        """Return the overall accuracy"""
+        if self.n_samples == 0:
+            return 0.0
+        return float(np.trace(self.confusion) / self.n_samples)
+
+    def per_class_metrics(self):
+        """
+        Return precision, recall, F1 and support per observed class (sorted label order).
+        Undefined ratios are reported as 0, matching sklearn's zero_division default.
+        """
+        matrix = self.confusion_matrix().astype(np.float64)
+        tp = np.diag(matrix)
+        support = matrix.sum(axis=1)
+        predicted = matrix.sum(axis=0)
+
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+        denom = precision + recall
+        f1 = np.divide(2 * precision * recall, denom, out=np.zeros_like(tp), where=denom > 0)
+
+        return precision, recall, f1, support
+
+    def averaged_metrics(self, average='weighted'):
+        """Return (precision, recall, f1) averaged with 'macro' or 'weighted' averaging"""
+        precision, recall, f1, support = self.per_class_metrics()
+        if len(support) == 0:
+            return 0.0, 0.0, 0.0
+
+        if average == 'macro':
+            weights = None
+        elif average == 'weighted':
+            if support.sum() == 0:
+                return 0.0, 0.0, 0.0
+            weights = support
+        else:
+            raise ValueError(f"Unsupported average: {average}")
+
+        return (
+            float(np.average(precision, weights=weights)),
+            float(np.average(recall, weights=weights)),
+            float(np.average(f1, weights=weights))
+        )
+
+    def classification_report(self):
+        """Return a dictionary in the format of sklearn's classification_report(output_dict=True)"""
+        precision, recall, f1, support = self.per_class_metrics()
+        report = {}
+        for i, label in enumerate(self.labels()):
+            report[str(label)] = {
+                'precision': float(precision[i]),
+                'recall': float(recall[i]),
+                'f1-score': float(f1[i]),
+                'support': float(support[i])
+            }
+
+        report['accuracy'] = self.accuracy()
+        for average in ['macro', 'weighted']:
+            avg_precision, avg_recall, avg_f1 = self.averaged_metrics(average)
+            report[f'{average} avg'] = {
+                'precision': avg_precision,
+                'recall': avg_recall,
+                'f1-score': avg_f1,
+                'support': float(support.sum())
+            }
+
+        return report
+
+    def roc_auc(self, average='macro'):
+        """
+        Approximate one-vs-rest ROC-AUC from the probability histograms.
+
+        Returns None when no probabilities were accumulated or no class has
+        both positive and negative samples.
+        """
+        if self.n_proba_samples == 0:
+            return None
+
+        scores = []
+        weights = []
+        for class_idx in range(len(self.classes)):
+            pos = self.pos_hist[class_idx].astype(np.float64)
+            neg = self.neg_hist[class_idx].astype(np.float64)
+            n_pos, n_neg = pos.sum(), neg.sum()
+            if n_pos == 0 or n_neg == 0:
+                continue
+
+            # Probability that a positive outranks a negative (ties count half)
+            neg_below = np.cumsum(neg) - neg
+            auc = (pos * (neg_below + 0.5 * neg)).sum() / (n_pos * n_neg)
+            scores.append(auc)
+            weights.append(n_pos)
+
+        if not scores:
+            return None
+        if average == 'weighted':
+            return float(np.average(scores, weights=weights))
+        return float(np.mean(scores))
+
+    def mean_probabilities(self):
+        """Return the mean predicted distribution per true class as a dict of dicts"""
+        result = {}
+        order = self._sorted_order()
+        support = self.confusion.sum(axis=1)
+        for i in order:
+            if support[i] == 0:
+                continue
+            result[self.classes[i]] = {
+                self.classes[j]: float(self.prob_sums[i, j] / support[i]) for j in order
+            }
+        return result
+
+    def summary(self):
+        """Return the headline metrics used in the metrics CSV files"""
+        precision, recall, f1 = self.averaged_metrics('weighted')
+        return {
+            'accuracy': self.accuracy(),
+            'precision': precision,
+            'recall': recall,
+            'f1': f1,
+            'roc_auc': self.roc_auc()
+        }
+
+
+def _slice_rows(data, start, stop):
+    """Slice rows of a DataFrame, Series or array"""
+    if hasattr(data, 'iloc'):
+        return data.iloc[start:stop]
+    return data[start:stop]
+
+
+def evaluate_in_batches(model, X, y, batch_size=None, with_proba=False, predict_fn=None, sample_weight=None):
+    """
+    Evaluate a model in a single streamed pass over (X, y).
+
+    Args:
+        model: Fitted model exposing predict (and predict_proba if with_proba)
+        X: Feature matrix
+        y: True labels
+        batch_size: Number of rows per batch (None evaluates in one batch)
+        with_proba: Also accumulate probability statistics for ROC-AUC
+        predict_fn: Optional callable used instead of model.predict (without it, batches
+            with probabilities take the most probable class, as predict does)
+        sample_weight: Optional integer row counts (see MetricAccumulator.update)
+
+    Returns:
+        MetricAccumulator with the accumulated counts
+    """
+    proba_classes = getattr(model, 'classes_', None)
+    accumulator = MetricAccumulator(classes=proba_classes)
+
+    n_rows = X.shape[0]
+    batch_size = batch_size or max(n_rows, 1)
+    if sample_weight is not None:
+        sample_weight = np.asarray(sample_weight)
+    for start in range(0, n_rows, batch_size):
+        X_batch = _slice_rows(X, start, start + batch_size)
+        y_batch = _slice_rows(y, start, start + batch_size)
+
+        y_proba = None
+        if with_proba and proba_classes is not None:
+            try:
+                y_proba = model.predict_proba(X_batch)
+            except Exception as e:
+                print(f"Warning: Could not compute probabilities: {e}")
+                with_proba = False
+
+        weight_batch = None if sample_weight is None else sample_weight[start:start + batch_size]
+        if y_proba is not None and predict_fn is None:
+            y_pred = np.asarray(proba_classes)[y_proba.argmax(axis=1)]
+        else:
+            y_pred = (predict_fn or model.predict)(X_batch)
+        accumulator.update(y_batch, y_pred, y_proba=y_proba,
+                           proba_classes=proba_classes if y_proba is not None else None,
+                           sample_weight=weight_batch)
+
+    return accumulator
@@ -0,0 +1,152 @@
+import time
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+# Approximate bookkeeping bytes per entry (key, dict slot, tuple and array header)
+ENTRY_OVERHEAD = 200
+
+
+def default_prediction_cache_config():
+    """'prediction_cache' section of a scoring configuration (disabled by default)"""
+    return {
+        'enabled': False,
+        # Entries and memory (MB) kept at most; the least recently used entries go first
+        'max_entries': 100000,
+        'max_mb': 64,
+        # Seconds an entry stays valid (None keeps entries until evicted)
+        'ttl_seconds': None
+    }
+
+
+def _row_bytes(X):
+    """Bytes of every row of a dense or CSR feature matrix"""
+    if hasattr(X, 'indptr'):
+        X = X.tocsr()
+        X.sort_indices()
+        indices, data = X.indices.astype(np.int32), X.data.astype(np.float32)
+        return [indices[a:b].tobytes() + data[a:b].tobytes() for a, b in zip(X.indptr[:-1], X.indptr[1:])]
+    values = X.to_numpy() if hasattr(X, 'to_numpy') else X
+    values = np.ascontiguousarray(values, dtype=np.float32)
+    return [row.tobytes() for row in values]
+
+
+def _take_rows(X, rows):
+    if hasattr(X, 'iloc'):
+        return X.iloc[rows]
+    return X[rows]
+
+
+class PredictionCache:
+    def __init__(self, max_entries=100000, max_mb=64, ttl_seconds=None, clock=time.monotonic):
+        """
+        LRU cache of class probabilities keyed by a hash of the encoded feature row
+
+        Running cases on the same prefix and attribute values encode to identical
+        model inputs, so repeated predictions are looked up instead of traversing the
+        trees again. Entries expire after ttl_seconds, the least recently used ones are
+        evicted beyond max_entries or max_mb, and everything is dropped when the
+        version (of the model and transformer the probabilities came from) changes.
+
+        Args:
+            max_entries: Maximum number of cached rows
+            max_mb: Maximum memory of the cached probabilities (MB)
+            ttl_seconds: Lifetime of an entry (None for no expiry)
+            clock: Time source in seconds (monotonic by default)
+        """
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb is not None else None
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def row_keys(X):
+        """16-byte hash of every row of an encoded (dense or CSR) feature matrix"""
+        return [hashlib.blake2b(row, digest_size=16).digest() for row in _row_bytes(X)]
+
+    def set_version(self, version):
+        """Drop every entry if the version of the model and transformer changed"""
+        if version != self.version:
+            if self.version is not None:
+                self.invalidations += 1
+            self.clear()
+            self.version = version
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def get(self, key):
+        """Cached probabilities of a row key, or None"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        proba, expires = entry
+        if expires is not None and expires <= self.clock():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self.entries.move_to_end(key)
+        return proba
+
+    def put(self, key, proba):
+        if key in self.entries:
+            self._remove(key)
+        proba = np.array(proba, dtype=np.float64)
+        expires = self.clock() + self.ttl_seconds if self.ttl_seconds is not None else None
+        self.entries[key] = (proba, expires)
+        self.bytes += proba.nbytes + ENTRY_OVERHEAD
+        while self.entries and (len(self.entries) > self.max_entries or
+                                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        proba, _ = self.entries.pop(key)
+        self.bytes -= proba.nbytes + ENTRY_OVERHEAD
+
+    def predict_proba(self, model, X):
+        """
+        Class probabilities of the rows of X, calling model.predict_proba only once for
+        the distinct rows that are not cached
+        """
+        keys = self.row_keys(X)
+        results = [self.get(key) for key in keys]
+        missing = {}
+        for row, (key, proba) in enumerate(zip(keys, results)):
+            if proba is None:
+                missing.setdefault(key, []).append(row)
+        self.hits += len(keys) - sum(len(rows) for rows in missing.values())
+        self.misses += sum(len(rows) for rows in missing.values())
+
+        if missing:
+            computed = model.predict_proba(_take_rows(X, [rows[0] for rows in missing.values()]))
+            for (key, rows), proba in zip(missing.items(), computed):
+                self.put(key, proba)
+                for row in rows:
+                    results[row] = proba
+        if not results:
+            return np.zeros((0, len(model.classes_)))
+        return np.vstack(results)
+
+    def stats(self):
+        """Counters and size of the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'entries': len(self.entries),
+            'mb': self.bytes / (1024 * 1024)
+        }
@@ -1,29 +1,114 @@
 import os
+import warnings
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
-import joblib
+from sklearn.metrics import accuracy_score, confusion_matrix
+
+from src.models.metrics import evaluate_in_batches
+from src.models.artifact import ModelArtifact, is_model_artifact, save_model_artifact
+from src.common.plotting import draw_confusion_matrix, draw_feature_importance
+
+def oob_scores(model, y, sample_weight=None):
+    """Out-of-bag accuracy and log-loss of a forest fitted with oob_score=True (weighted by sample_weight)"""
+    proba = model.oob_decision_function_
+    # Rows that were in the bootstrap sample of every tree have no OOB prediction
+    seen = proba.sum(axis=1) > 0
+    y_codes = np.searchsorted(model.classes_, np.asarray(y)[seen])
+    proba = proba[seen]
+    weights = None if sample_weight is None else np.asarray(sample_weight)[seen]
+    accuracy = float(np.average(proba.argmax(axis=1) == y_codes, weights=weights))
+    log_loss = float(-np.average(np.log(np.clip(proba[np.arange(len(y_codes)), y_codes], 1e-15, 1.0)),
+                                 weights=weights))
+    return accuracy, log_loss
+
+
+def grow_forest_by_oob(model, X, y, increment=20, min_estimators=20, tolerance=0.001, patience=2,
+                       metric='accuracy', sample_weight=None):
+    """
+    Grow a forest in increments of trees until its out-of-bag score stops improving
+
+    The forest is refitted with warm_start, so each step only trains the new trees.
+    A step counts as an improvement when the OOB score (accuracy, or negative log-loss)
+    beats the best score so far by at least tolerance; after patience steps without one,
+    growth stops and the forest is trimmed back to the size of its last improvement.
+    model.n_estimators is the upper bound. sample_weight weights both the fit and the OOB scores.
+
+    Returns:
+        (chosen number of trees, OOB curve as a list of dicts per step)
+    """
+    max_estimators = model.n_estimators
+    model.set_params(warm_start=True, oob_score=True, bootstrap=True)
+    
+    curve = []
+    best_score, best_size, stale = None, 0, 0
+    n_estimators = min(min_estimators, max_estimators)
+    while True:
+        model.set_params(n_estimators=n_estimators)
+        with warnings.catch_warnings():
+            # Small forests leave some rows without OOB predictions
+            warnings.simplefilter('ignore', UserWarning)
+            model.fit(X, y, sample_weight=sample_weight)
+        accuracy, log_loss = oob_scores(model, y, sample_weight)
+        curve.append({'n_estimators': n_estimators, 'oob_accuracy': accuracy, 'oob_log_loss': log_loss})
+        
+        score = accuracy if metric == 'accuracy' else -log_loss
+        if best_score is None or score - best_score >= tolerance:
+            best_score, best_size, stale = score, n_estimators, 0
+        else:
+            stale += 1
+        if stale >= patience or n_estimators >= max_estimators:
+            break
+        n_estimators = min(n_estimators + increment, max_estimators)
+    
+    # Trees grown after the last improvement only add training and inference cost
+    model.estimators_ = model.estimators_[:best_size]
+    model.set_params(n_estimators=best_size, warm_start=False)
+    model.oob_score_ = next(step['oob_accuracy'] for step in curve if step['n_estimators'] == best_size)
+    del model.oob_decision_function_
+    return best_size, curve
+
 
 class ProcessRandomForest:
+    # Bump when training changes so cached fits of an older version are not reused
+    VERSION = '2'
+    
     def __init__(self, n_estimators=100, max_depth=None, min_samples_split=2, 
-                 min_samples_leaf=1, random_state=42, n_jobs=-1):
+                 min_samples_leaf=1, random_state=42, n_jobs=-1, max_features='sqrt', max_samples=None,
+                 min_weight_fraction_leaf=0.0,
+                 adaptive=False, tree_increment=20, min_estimators=20, oob_tolerance=0.001, oob_patience=2,
+                 oob_metric='accuracy'):
+        """
+        Random forest for next-event prediction
+
+        With adaptive=True the forest is grown by OOB score (see grow_forest_by_oob)
+        and n_estimators is only the upper bound. max_samples bootstraps each tree on
+        a subsample (a fraction or a row count), which keeps large logs tractable.
+        """
         self.model = RandomForestClassifier(
             n_estimators=n_estimators,
             max_depth=max_depth,
             min_samples_split=min_samples_split,
             min_samples_leaf=min_samples_leaf,
+            min_weight_fraction_leaf=min_weight_fraction_leaf,
+            max_features=max_features,
+            max_samples=max_samples,
             random_state=random_state,
             n_jobs=n_jobs
         )
+        self.adaptive = adaptive
+        self.tree_increment = tree_increment
+        self.min_estimators = min_estimators
+        self.oob_tolerance = oob_tolerance
+        self.oob_patience = oob_patience
+        self.oob_metric = oob_metric
+        self.oob_curve = None
         self.feature_names = None
         self.class_names = None
         self.feature_importance = None
         self.accuracy = None
     
-    def train(self, X_train, y_train, feature_names=None):
+    def train(self, X_train, y_train, feature_names=None, sample_weight=None):
         """Train the Random Forest model"""
         # Store feature names, ensuring they match the actual features used
         self.feature_names = X_train.columns.tolist() if feature_names is None else feature_names
@@ -34,7 +119,18 @@ class ProcessRandomForest:
             self.feature_names = X_train.columns.tolist()
         
         # Train the model
-        self.model.fit(X_train, y_train)
+        if self.adaptive:
+            n_estimators, self.oob_curve = grow_forest_by_oob(
+                self.model, X_train, y_train, increment=self.tree_increment, min_estimators=self.min_estimators,
+                tolerance=self.oob_tolerance, patience=self.oob_patience, metric=self.oob_metric,
+                sample_weight=sample_weight
+            )
+            print(f"Adaptive forest: kept {n_estimators} trees "
+                  f"(OOB accuracy {self.model.oob_score_:.4f}, grew {self.oob_curve[-1]['n_estimators']})")
+        else:
+            # sample_weight: counts of collapsed duplicate rows, if any (each tree's
+            # bootstrap draws unique rows and multiplies them by their count)
+            self.model.fit(X_train, y_train, sample_weight=sample_weight)
         
         # Store class names
         self.class_names = list(sorted(set(y_train)))
@@ -48,19 +144,22 @@ class ProcessRandomForest:
         
         return self.model
     
-    def evaluate(self, X_test, y_test):
-        """Evaluate the model and return performance metrics"""
-        y_pred = self.model.predict(X_test)
+    def evaluate(self, X_test, y_test, batch_size=None, sample_weight=None):
+        """Evaluate the model and return performance metrics (sample_weight: row counts of collapsed rows)"""
+        # Single streamed pass: all metrics are derived from one confusion matrix
+        metrics = evaluate_in_batches(self.model, X_test, y_test, batch_size=batch_size, with_proba=True,
+                                      sample_weight=sample_weight)
         
-        self.accuracy = accuracy_score(y_test, y_pred)
-        report = classification_report(y_test, y_pred, output_dict=True)
-        conf_matrix = confusion_matrix(y_test, y_pred)
+        self.accuracy = metrics.accuracy()
+        report = metrics.classification_report()
+        conf_matrix = metrics.confusion_matrix()
         
         return {
             'accuracy': self.accuracy,
             'classification_report': report,
             'confusion_matrix': conf_matrix,
-            'feature_importance': self.feature_importance
+            'feature_importance': self.feature_importance,
+            'summary': metrics.summary()
         }
     
     def predict(self, X):
@@ -75,37 +174,43 @@ class ProcessRandomForest:
         """Save the model and its metadata"""
         os.makedirs(model_dir, exist_ok=True)
         
-        # Save the model
-        model_path = os.path.join(model_dir, 'random_forest_model.pkl')
-        joblib.dump(self.model, model_path)
+        # Save the model as a memory-mappable artifact with its metadata in the manifest
+        metadata = {'class_names': self.class_names}
+        if self.oob_curve is not None:
+            metadata.update(n_estimators_chosen=self.model.n_estimators, oob_curve=self.oob_curve)
+        save_model_artifact(self.model, model_dir, feature_names=self.feature_names,
+                            metrics={'accuracy': self.accuracy}, metadata=metadata)
+        
+        # Forest size against out-of-bag score of an adaptive fit
+        if self.oob_curve is not None:
+            pd.DataFrame(self.oob_curve).to_csv(os.path.join(model_dir, 'rf_oob_curve.csv'), index=False)
         
         # Save feature importance
         if self.feature_importance is not None:
             self.feature_importance.to_csv(os.path.join(model_dir, 'rf_feature_importance.csv'), index=False)
         
-        # Save feature names and class names
-        metadata = {
-            'feature_names': self.feature_names,
-            'class_names': self.class_names,
-            'accuracy': self.accuracy
-        }
-        joblib.dump(metadata, os.path.join(model_dir, 'rf_metadata.pkl'))
-        
         print(f"Random Forest model saved to {model_dir}")
     
     def load_model(self, model_dir):
         """Load a saved model and its metadata"""
-        # Load the model
-        model_path = os.path.join(model_dir, 'random_forest_model.pkl')
-        self.model = joblib.load(model_path)
-        
-        # Load metadata
-        metadata_path = os.path.join(model_dir, 'rf_metadata.pkl')
-        if os.path.exists(metadata_path):
-            metadata = joblib.load(metadata_path)
-            self.feature_names = metadata.get('feature_names', None)
-            self.class_names = metadata.get('class_names', None)
-            self.accuracy = metadata.get('accuracy', None)
+        if is_model_artifact(model_dir):
+            # Only the manifest is read here; the node arrays are memory-mapped on first use
+            self.model = ModelArtifact(model_dir)
+            manifest = self.model.manifest
+            self.feature_names = manifest.get('feature_names')
+            self.class_names = manifest['metadata'].get('class_names')
+            self.oob_curve = manifest['metadata'].get('oob_curve')
+            self.accuracy = manifest['metrics'].get('accuracy')
+        else:
+            # Models saved before the artifact format
+            import joblib
+            self.model = joblib.load(os.path.join(model_dir, 'random_forest_model.pkl'))
+            metadata_path = os.path.join(model_dir, 'rf_metadata.pkl')
+            if os.path.exists(metadata_path):
+                metadata = joblib.load(metadata_path)
+                self.feature_names = metadata.get('feature_names', None)
+                self.class_names = metadata.get('class_names', None)
+                self.accuracy = metadata.get('accuracy', None)
         
         # Load feature importance
         importance_path = os.path.join(model_dir, 'rf_feature_importance.csv')
@@ -122,16 +227,11 @@ class ProcessRandomForest:
             print("Feature importance not available. Train the model first.")
             return
         
-        # Get top N features
-        top_features = self.feature_importance.head(top_n)
-        
-        # Plot
-        plt.figure(figsize=(10, 8))
-        sns.barplot(x='importance', y='feature', data=top_features)
-        plt.title(f'Top {top_n} Feature Importance - Random Forest')
-        plt.tight_layout()
-        
-        return plt.gcf()
+        return draw_feature_importance(*self.feature_importance_payload(top_n))
+    
+    def feature_importance_payload(self, top_n=20):
+        """Arguments of draw_feature_importance (small enough to send to the plot pool)"""
+        return self.feature_importance.head(top_n), f'Top {top_n} Feature Importance - Random Forest'
     
     def visualize_confusion_matrix(self, y_test, y_pred=None):
         """Visualize the confusion matrix"""
@@ -140,16 +240,8 @@ class ProcessRandomForest:
             
         conf_matrix = confusion_matrix(y_test, y_pred)
         
-        plt.figure(figsize=(10, 8))
-        sns.heatmap(conf_matrix, annot=True, fmt='d', cmap='Blues',
-                   xticklabels=self.class_names if self.class_names else 'auto',
-                   yticklabels=self.class_names if self.class_names else 'auto')
-        plt.title('Confusion Matrix - Random Forest')
-        plt.ylabel('True Label')
-        plt.xlabel('Predicted Label')
-        plt.tight_layout()
-        
-        return plt.gcf()
+        return draw_confusion_matrix(conf_matrix, 'Confusion Matrix - Random Forest',
+                                     labels=self.class_names if self.class_names else 'auto')
     
     def generate_transition_report(self, X_test, y_test):
         """Generate a report of event transitions and their predictive factors"""
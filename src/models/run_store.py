@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import pandas as pd
+
+# Columns of the metrics frames (same layout as the metrics_<dataset>.csv files)
+METRIC_COLUMNS = ['Accuracy', 'Precision', 'Recall', 'F1', 'ROC_AUC']
+
+# Display names of the trainer's model keys
+MODEL_LABELS = {
+    'decision_tree': 'Decision Tree',
+    'random_forest': 'Random Forest',
+    'ensemble': 'Ensemble'
+}
+
+
+def metrics_row(model_label, summary):
+    """Metrics frame row from a MetricAccumulator.summary() dictionary"""
+    return {
+        'Model': model_label,
+        'Accuracy': summary.get('accuracy'),
+        'Precision': summary.get('precision'),
+        'Recall': summary.get('recall'),
+        'F1': summary.get('f1'),
+        'ROC_AUC': summary.get('roc_auc')
+    }
+
+
+def _number(value):
+    # numpy scalars become plain floats; missing metrics stay None
+    return None if value is None else float(value)
+
+
+class RunStore:
+    INDEX_FILE = 'index.jsonl'
+    RUN_FILE = 'run.json'
+    IMPORTANCE_FILE = 'importance.csv'
+
+    def __init__(self, root_dir='models/runs'):
+        """
+        Per-run record of evaluation metrics and feature importance
+
+        Every training run writes <root>/<run_id>/run.json (metrics per model,
+        parameters, metadata) and importance.csv (model, feature, importance),
+        and appends its metrics as one line to <root>/index.jsonl. Comparisons
+        read the index, so any number of runs is compared without loading a
+        model or scanning the run directories.
+
+        Args:
+            root_dir: Directory holding the run records
+        """
+        self.root_dir = root_dir
+        self.index_path = os.path.join(root_dir, self.INDEX_FILE)
+
+    def _new_run_id(self, dataset_type, variant):
+        base = f"{time.strftime('%Y%m%d-%H%M%S')}-{dataset_type}-{variant}"
+        run_id, suffix = base, 1
+        while os.path.exists(os.path.join(self.root_dir, run_id)):
+            suffix += 1
+            run_id = f"{base}-{suffix}"
+        return run_id
+
+    def record(self, dataset_type, variant, metrics, importance=None, params=None, metadata=None):
+        """
+        Record one training run
+
+        Args:
+            dataset_type: Dataset the models were trained on ('sepsis', 'bpi', ...)
+            variant: Feature set of the run ('baseline' or 'enhanced')
+            metrics: Frame with a 'Model' column and METRIC_COLUMNS, or a list of metrics_row dicts
+            importance: Optional dict of model label -> DataFrame with 'feature' and 'importance'
+            params: Optional dict of model label -> estimator parameters
+            metadata: Optional extra JSON-serializable information
+
+        Returns:
+            The run id
+        """
+        rows = metrics.to_dict('records') if isinstance(metrics, pd.DataFrame) else list(metrics)
+        run_id = self._new_run_id(dataset_type, variant)
+        run_dir = os.path.join(self.root_dir, run_id)
+        os.makedirs(run_dir)
+
+        record = {
+            'run_id': run_id,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'dataset_type': dataset_type,
+            'variant': variant,
+            'metrics': {row['Model']: {column: _number(row.get(column)) for column in METRIC_COLUMNS}
+                        for row in rows},
+            'importance_file': self.IMPORTANCE_FILE if importance else None
+        }
+
+        if importance:
+            frames = []
+            for model_label, frame in importance.items():
+                frame = frame[['feature', 'importance']].copy()
+                frame.insert(0, 'model', model_label)
+                frames.append(frame)
+            pd.concat(frames, ignore_index=True).to_csv(os.path.join(run_dir, self.IMPORTANCE_FILE), index=False)
+
+        details = dict(record, params=params or {}, metadata=metadata or {})
+        with open(os.path.join(run_dir, self.RUN_FILE), 'w') as f:
+            json.dump(details, f, indent=2, default=str)
+
+        # One short line per run in append mode: concurrent trainers do not interleave
+        with open(self.index_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return run_id
+
+    def runs(self, dataset_type=None, variant=None):
+        """Index entries (oldest first), optionally filtered"""
+        if not os.path.exists(self.index_path):
+            return []
+        entries = []
+        with open(self.index_path, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if dataset_type is not None and entry['dataset_type'] != dataset_type:
+                    continue
+                if variant is not None and entry['variant'] != variant:
+                    continue
+                entries.append(entry)
+        return entries
+
+    def latest(self, dataset_type, variant):
+        """Most recent index entry of a dataset and variant, or None"""
+        entries = self.runs(dataset_type, variant)
+        return entries[-1] if entries else None
+
+    def get(self, run_id):
+        """Full run record (run.json) of a run id"""
+        with open(os.path.join(self.root_dir, run_id, self.RUN_FILE), 'r') as f:
+            return json.load(f)
+
+    def metrics(self, entry):
+        """Metrics frame (Model + METRIC_COLUMNS) of one index entry"""
+        return pd.DataFrame([dict(Model=model, **values) for model, values in entry['metrics'].items()],
+                            columns=['Model'] + METRIC_COLUMNS)
+
+    def metrics_frame(self, dataset_type=None, variant=None, run_ids=None):
+        """
+        Metrics of many runs as one long frame: one row per run and model with
+        run_id, created, dataset_type, variant, Model and METRIC_COLUMNS
+        """
+        rows = []
+        for entry in self.runs(dataset_type, variant):
+            if run_ids is not None and entry['run_id'] not in run_ids:
+                continue
+            for model, values in entry['metrics'].items():
+                rows.append(dict(run_id=entry['run_id'], created=entry['created'],
+                                 dataset_type=entry['dataset_type'], variant=entry['variant'],
+                                 Model=model, **values))
+        return pd.DataFrame(rows, columns=['run_id', 'created', 'dataset_type', 'variant', 'Model'] + METRIC_COLUMNS)
+
+    def importance(self, run_id, model_label):
+        """Feature importance frame (feature, importance) of one model in a run, or None"""
+        path = os.path.join(self.root_dir, run_id, self.IMPORTANCE_FILE)
+        if not os.path.exists(path):
+            return None
+        frame = pd.read_csv(path)
+        frame = frame[frame['model'] == model_label]
+        if frame.empty:
+            return None
+        return frame[['feature', 'importance']].reset_index(drop=True)
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import numpy as np
+
+# Parameter spaces explored by default (depth, leaf size and, for forests, features per split)
+DEFAULT_SPACES = {
+    'decision_tree': {
+        'max_depth': [3, 5, 8, 12, 16, None],
+        'min_samples_leaf': [1, 2, 5, 10, 20],
+        'min_samples_split': [2, 5, 10],
+        'criterion': ['gini', 'entropy']
+    },
+    'random_forest': {
+        'max_depth': [5, 10, 15, 20, None],
+        'min_samples_leaf': [1, 2, 5, 10],
+        'max_features': ['sqrt', 'log2', 0.5]
+    }
+}
+
+# Resource that grows between halving rounds: training rows for trees, tree count for forests
+RESOURCES = {
+    'decision_tree': 'n_samples',
+    'random_forest': 'n_estimators'
+}
+
+
+def default_search_config():
+    """'search' section of a training configuration (disabled by default)"""
+    return {
+        'enabled': False,
+        'models': ['decision_tree', 'random_forest'],
+        'factor': 3,
+        'cv': 3,
+        'scoring': 'accuracy',
+        'n_jobs': -1,
+        # Halving rounds; the first round trains on 1/factor**(max_rounds - 1) of the rows
+        'max_rounds': 4,
+        # Tree counts between which the forest search halves
+        'min_estimators': 10,
+        'max_estimators': 300,
+        'spaces': {}
+    }
+
+
+def _estimator(model_name, random_state):
+    if model_name == 'decision_tree':
+        from sklearn.tree import DecisionTreeClassifier
+        return DecisionTreeClassifier(random_state=random_state)
+    if model_name == 'random_forest':
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(random_state=random_state)
+    raise ValueError(f"No search space for model {model_name}")
+
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class SuccessiveHalvingSearch:
+    def __init__(self, model_name, space=None, factor=3, cv=3, scoring='accuracy', n_jobs=-1, max_rounds=4,
+                 min_estimators=10, max_estimators=300, n_candidates=None, random_state=42):
+        """
+        Successive-halving hyperparameter search for a tree model
+
+        Every round scores the surviving candidates with cross-validation, keeps the
+        best 1/factor of them and multiplies their resource by factor. Decision trees
+        grow the number of training rows, forests the number of trees, so most
+        candidates are only ever fitted on a small fraction of the full cost.
+        Candidates are cross-validated in n_jobs parallel workers; the float32
+        training matrix is memory-mapped into the workers by joblib instead of being
+        copied to each of them.
+
+        Args:
+            model_name: 'decision_tree' or 'random_forest'
+            space: Dict of parameter -> list of values (defaults to DEFAULT_SPACES)
+            factor: Fraction of candidates dropped (and resource growth) per round
+            cv: Cross-validation folds
+            scoring: sklearn scoring name
+            n_jobs: Parallel workers (-1 uses all CPUs)
+            max_rounds: Upper bound on halving rounds; tiny first-round samples favour
+                shallow trees, so the row resource starts at max_rows / factor**(max_rounds - 1)
+            min_estimators, max_estimators: Tree counts of the first and last forest rounds
+            n_candidates: Candidates of the first round (default: as many as the resource
+                range supports, at most the size of the grid)
+            random_state: Seed of the candidate sampling and the estimators
+        """
+        self.model_name = model_name
+        self.space = space or DEFAULT_SPACES[model_name]
+        self.factor = factor
+        self.cv = cv
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.max_rounds = max_rounds
+        self.min_estimators = min_estimators
+        self.max_estimators = max_estimators
+        self.n_candidates = n_candidates
+        self.random_state = random_state
+        self.resource = RESOURCES[model_name]
+        self.best_params_ = None
+        self.best_score_ = None
+        self.trace_ = []
+        self.summary_ = None
+
+    def grid_size(self):
+        """Number of parameter combinations in the search space"""
+        return int(np.prod([len(values) for values in self.space.values()]))
+
+    def _resource_range(self, X, y):
+        if self.resource == 'n_estimators':
+            return self.min_estimators, self.max_estimators
+        # At least sklearn's 'smallest' rule: enough rows for every class in every fold
+        smallest = 2 * self.cv * len(np.unique(y))
+        max_rows = X.shape[0]
+        return min(max_rows, max(smallest, max_rows // self.factor ** (self.max_rounds - 1))), max_rows
+
+    def run(self, X, y, counts=None):
+        """
+        Search the space on (X, y)
+
+        counts (of collapsed duplicate rows, see collapse_duplicate_rows) repeat every row
+        that many times, so folds, leaf sizes and scores count the original rows.
+
+        Returns:
+            Dictionary with the best parameters and score, the per-round trace and
+            the search cost relative to a full grid at full resource
+        """
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingRandomSearchCV
+
+        # One contiguous float32 copy: trees train on float32, and joblib memory-maps
+        # large arrays into the workers rather than pickling them per task (sparse
+        # matrices, e.g. with n-gram columns, stay sparse)
+        if hasattr(X, 'tocsr'):
+            X_values = X.tocsr().astype(np.float32)
+        else:
+            X_values = np.ascontiguousarray(X.to_numpy() if hasattr(X, 'to_numpy') else X, dtype=np.float32)
+        y_values = np.asarray(y)
+        if counts is not None:
+            rows = np.repeat(np.arange(len(y_values)), np.asarray(counts, dtype=np.int64))
+            X_values, y_values = X_values[rows], y_values[rows]
+
+        min_resources, max_resources = self._resource_range(X_values, y_values)
+        n_candidates = self.n_candidates or max(1, min(self.grid_size(), max_resources // min_resources))
+
+        search = HalvingRandomSearchCV(
+            _estimator(self.model_name, self.random_state),
+            self.space,
+            n_candidates=n_candidates,
+            factor=self.factor,
+            resource=self.resource,
+            min_resources=min_resources,
+            max_resources=max_resources,
+            cv=self.cv,
+            scoring=self.scoring,
+            n_jobs=self.n_jobs,
+            random_state=self.random_state,
+            refit=False
+        )
+
+        start = time.perf_counter()
+        search.fit(X_values, y_values)
+        elapsed = time.perf_counter() - start
+
+        results = search.cv_results_
+        self.trace_ = [
+            {
+                'iteration': int(results['iter'][i]),
+                'n_resources': int(results['n_resources'][i]),
+                'params': {key: _json_value(value) for key, value in results['params'][i].items()},
+                'mean_score': None if np.isnan(results['mean_test_score'][i]) else float(results['mean_test_score'][i]),
+                'std_score': None if np.isnan(results['std_test_score'][i]) else float(results['std_test_score'][i]),
+                'mean_fit_time_s': float(results['mean_fit_time'][i])
+            }
+            for i in range(len(results['params']))
+        ]
+        self.best_params_ = {key: _json_value(value) for key, value in search.best_params_.items()}
+        self.best_score_ = float(search.best_score_)
+
+        # Cost in resource units (rows or trees) fitted, against every grid point at full resource
+        search_cost = sum(row['n_resources'] for row in self.trace_) * self.cv
+        grid_cost = self.grid_size() * max_resources * self.cv
+        self.summary_ = {
+            'model': self.model_name,
+            'resource': self.resource,
+            'factor': self.factor,
+            'cv': self.cv,
+            'scoring': self.scoring,
+            'min_resources': int(min_resources),
+            'max_resources': int(max_resources),
+            'n_candidates': int(n_candidates),
+            'n_iterations': int(search.n_iterations_),
+            'n_fits': len(self.trace_) * self.cv,
+            'grid_size': self.grid_size(),
+            'cost_fraction': round(search_cost / grid_cost, 4),
+            'elapsed_s': round(elapsed, 3),
+            # Estimator parameters of the winner (for forests, including the final tree count)
+            'best_params': self.best_params_,
+            'best_score': self.best_score_
+        }
+        print(f"Search for {self.model_name}: best {self.scoring} {self.best_score_:.4f} with {self.best_params_} "
+              f"({self.summary_['n_fits']} fits, {self.summary_['cost_fraction']:.1%} of the full grid cost)")
+        return dict(self.summary_, trace=self.trace_)
+
+    def save(self, output_dir):
+        """Write <model>_search.json (best configuration, cost, trace); returns its path"""
+        return save_search_result(dict(self.summary_, trace=self.trace_), output_dir)
+
+
+def search_params(model_name, X, y, search_config, random_state=42, counts=None):
+    """
+    Run the configured search for one model (counts: row counts of a collapsed split)
+
+    A collapsed split is fitted with count weights, which sklearn's min_samples_split
+    does not see (see count_weighted_params), so the default space then leaves it at 2.
+
+    Returns:
+        (best estimator parameters, search result dictionary)
+    """
+    space = search_config.get('spaces', {}).get(model_name)
+    if counts is not None:
+        if space is None:
+            space = {key: values for key, values in DEFAULT_SPACES[model_name].items() if key != 'min_samples_split'}
+        elif any(value != 2 for value in space.get('min_samples_split', [])):
+            raise ValueError("min_samples_split cannot be searched when training on deduplicated rows")
+    search = SuccessiveHalvingSearch(
+        model_name,
+        space=space,
+        factor=search_config.get('factor', 3),
+        cv=search_config.get('cv', 3),
+        scoring=search_config.get('scoring', 'accuracy'),
+        n_jobs=search_config.get('n_jobs', -1),
+        max_rounds=search_config.get('max_rounds', 4),
+        min_estimators=search_config.get('min_estimators', 10),
+        max_estimators=search_config.get('max_estimators', 300),
+        n_candidates=search_config.get('n_candidates'),
+        random_state=random_state
+    )
+    result = search.run(X, y, counts=counts)
+    # best_params_ includes the tree count of the final round for forests
+    return dict(search.best_params_), result
+
+
+def save_search_result(result, output_dir):
+    """Write a search result returned by search_params to <output_dir>/<model>_search.json"""
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{result['model']}_search.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    return path
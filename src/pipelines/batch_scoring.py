@@ -0,0 +1,395 @@
+import os
+import argparse
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+from src.preprocessing import feature_registry
+from src.preprocessing.feature_registry import FeatureContext, CASE, ACTIVITY, CASE_COMPLETE_FEATURES
+from src.preprocessing.data_transformation import DataTransformer
+from src.preprocessing.sequence_encoding import load_ngram_encoder, encode_prefixes, combine_features
+from src.preprocessing.xes_reader import iter_xes_chunks
+from src.models.artifact import load_model, MANIFEST_FILE
+from src.models.prediction_cache import PredictionCache, default_prediction_cache_config
+from src.common.artifact_cache import ArtifactCache
+from src.common.instrumentation import span
+from src.common import resources
+
+logger = logging.getLogger("batch_scoring")
+
+# Rough peak memory of scoring a chunk, as a multiple of its event frame
+# (features, encoded and model matrices, probabilities)
+CHUNK_MEMORY_FACTOR = 4
+
+# Transformer metadata saved next to the models (see DataTransformer.save_transformation_metadata
+# and ModelTrainer.save_models); scorers reload when any of them changes
+METADATA_FILES = ['label_encoders.pkl', 'scaler.pkl', 'feature_names.pkl', 'fill_values.pkl', 'bin_edges.pkl',
+                  'ngram_encoder.json']
+
+
+class BatchScorer:
+    def __init__(self, model_dir, model_name='random_forest', top_k=3, prefixes='last', cache=None):
+        """
+        Next-activity predictions for event frames of whole cases, with saved models
+
+        Features are computed with the feature registry from the names saved with the
+        DataTransformer, so any log with the training attributes can be scored, then
+        encoded with the saved label encoders, scaler and bin edges, extended with the
+        saved n-gram encoder if the models were trained with n-grams, and scored by the
+        model artifact.
+
+        With a prediction cache, rows that encode to an already scored feature vector
+        are answered from the cache. Before each batch the saved model and metadata
+        files are checked, and a retrained model is reloaded (which clears the cache).
+
+        Features counted over the whole case (case_complete_features) were trained on
+        completed cases; on a running case they only count the events so far, which the
+        model has not seen. Models trained with prefix_features leave them out.
+
+        Args:
+            model_dir: Directory of the trained models and transformer metadata
+            model_name: Model subdirectory ('decision_tree' or 'random_forest')
+            top_k: Number of most likely next activities to report per prefix
+            prefixes: Prefixes to score: 'last' (the current prefix of every case) or 'all'
+            cache: 'prediction_cache' configuration (see default_prediction_cache_config), or None
+        """
+        self.model_dir = model_dir
+        self.model_name = model_name
+        self.requested_top_k = top_k
+        self.prefixes = prefixes
+        self.cache = None
+        if cache and cache.get('enabled', True):
+            self.cache = PredictionCache(max_entries=cache.get('max_entries', 100000), max_mb=cache.get('max_mb', 64),
+                                         ttl_seconds=cache.get('ttl_seconds'))
+        self.version = None
+        self._load()
+
+    def _version(self):
+        """Key of DataTransformer.VERSION and the size and mtime of the saved model and metadata files"""
+        model_path = os.path.join(self.model_dir, self.model_name)
+        if os.path.isdir(model_path):
+            model_path = os.path.join(model_path, MANIFEST_FILE)
+        stamps = []
+        for path in [model_path] + [os.path.join(self.model_dir, name) for name in METADATA_FILES]:
+            stat = os.stat(path) if os.path.exists(path) else None
+            stamps.append([os.path.basename(path), stat and stat.st_size, stat and stat.st_mtime_ns])
+        return ArtifactCache.make_key('prediction', transformer=DataTransformer.VERSION, files=stamps)
+
+    def _load(self):
+        """(Re)load the transformer metadata and the model"""
+        self.version = self._version()
+        self.transformer = DataTransformer()
+        self.transformer.load_transformation_metadata(self.model_dir)
+        self.model = load_model(os.path.join(self.model_dir, self.model_name))
+        self.ngram_encoder = load_ngram_encoder(self.model_dir)
+        if self.cache is not None:
+            self.cache.set_version(self.version)
+
+        self.feature_names = list(self.transformer.feature_names)
+        self.profile = feature_registry.profile_for(self.feature_names)
+        self.attributes = feature_registry.required_attributes(self.profile.values())
+        # Columns the model was trained on, in training order (case_id is never a feature)
+        self.model_columns = [name for name in self.feature_names if name != 'case_id']
+        self.case_complete_features = [name for name in self.model_columns if name in CASE_COMPLETE_FEATURES]
+
+        self.classes = np.asarray(self.model.classes_, dtype=object)
+        self.top_k = min(self.requested_top_k, len(self.classes))
+        self.output_columns = ['case_id', 'prefix_length', 'last_event'] + [
+            f'{column}_{i + 1}' for i in range(self.top_k) for column in ('prediction', 'probability')]
+
+    def check_version(self):
+        """Reload the models if the saved model or metadata files changed"""
+        if self._version() != self.version:
+            logger.info(f"Models in {self.model_dir} changed, reloading")
+            self._load()
+
+    def with_attributes(self, events):
+        """Event frame with every attribute the features read (missing ones as NaN)"""
+        missing = [col for col in self.attributes if col not in events.columns]
+        if missing:
+            events = events.assign(**{col: np.nan for col in missing})
+        return events
+
+    def model_input(self, X, ngrams=None):
+        """Model matrix of raw feature rows (and their n-gram counts, for models trained with them)"""
+        X_model = self.transformer.encode_for_prediction(X)[self.model_columns]
+        if self.ngram_encoder is not None:
+            X_model = combine_features(X_model, ngrams)
+        return X_model
+
+    def predict_proba(self, X_model):
+        """Class probabilities of model input rows (through the prediction cache, if any)"""
+        if X_model.shape[0] == 0:
+            return np.zeros((0, len(self.classes)))
+        if self.cache is not None:
+            return self.cache.predict_proba(self.model, X_model)
+        return self.model.predict_proba(X_model)
+
+    def score(self, events):
+        """
+        Top-k next activities of the selected prefixes of an event frame
+
+        Returns:
+            DataFrame with case_id, prefix_length, last_event, prediction_<i> and
+            probability_<i> (i = 1..top_k) per prefix, in case and time order
+        """
+        self.check_version()
+        if len(events) == 0:
+            return pd.DataFrame(columns=self.output_columns)
+        # Attributes a chunk does not carry are missing for all of its events
+        ctx = FeatureContext(self.with_attributes(events))
+        rows = feature_registry.prefix_rows(ctx, self.prefixes)
+
+        with span('score:features', rows=int(rows.sum())):
+            X, _ = feature_registry.compute_features(ctx, self.profile, self.feature_names, prefixes=self.prefixes)
+            ngrams = encode_prefixes(self.ngram_encoder, ctx, self.prefixes) if self.ngram_encoder is not None else None
+            X_model = self.model_input(X, ngrams)
+
+        with span('score:predict', rows=X_model.shape[0]):
+            proba = self.predict_proba(X_model)
+        top = np.argsort(-proba, axis=1, kind='stable')[:, :self.top_k]
+
+        result = pd.DataFrame({
+            'case_id': ctx.column(CASE)[rows].astype(str).to_numpy(),
+            'prefix_length': ctx.get('event_position')[rows].to_numpy(dtype=np.int64),
+            'last_event': ctx.column(ACTIVITY)[rows].astype(object).to_numpy()
+        })
+        for i in range(self.top_k):
+            result[f'prediction_{i + 1}'] = self.classes[top[:, i]].astype(str)
+            result[f'probability_{i + 1}'] = np.take_along_axis(proba, top[:, i:i + 1], axis=1)[:, 0]
+        return result
+
+
+def warn_case_complete(scorer):
+    """
+    Warn when the model reads features counted over the whole case (see BatchScorer)
+
+    Returns:
+        Parquet key-value metadata naming those features (empty if there are none)
+    """
+    if not scorer.case_complete_features:
+        return {}
+    logger.warning(f"The {scorer.model_name} model was trained on {', '.join(scorer.case_complete_features)}, "
+                   f"which count the whole case; running cases only have the events so far. "
+                   f"Retrain with --prefix-features to score running cases.")
+    return {'case_complete_features': ','.join(scorer.case_complete_features)}
+
+
+class ParquetSink:
+    def __init__(self, path, metadata=None):
+        """
+        Parquet file written one row group per frame
+
+        Rows go to '<path>.tmp', which replaces path on close, so readers never see a
+        partial file. The schema is taken from the first frame, with the key-value
+        metadata (str -> str) added to it.
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Batch scoring writes Parquet and needs pyarrow (pip install pyarrow)")
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = path
+        self.metadata = metadata or {}
+        self.writer = None
+        self.rows = 0
+
+    def write(self, frame):
+        if len(frame) == 0 and self.writer is not None:
+            return
+        table = self.pa.Table.from_pandas(frame, preserve_index=False)
+        if self.writer is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            if self.metadata:
+                table = table.replace_schema_metadata(dict(table.schema.metadata or {}, **self.metadata))
+            self.writer = self.pq.ParquetWriter(f"{self.path}.tmp", table.schema)
+        else:
+            table = table.cast(self.writer.schema)
+        self.writer.write_table(table)
+        self.rows += len(frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(f"{self.path}.tmp", self.path)
+
+
+# Scorer of a worker process, loaded once by _init_worker
+_scorer = None
+
+
+def _init_worker(model_dir, model_name, top_k, prefixes, cache):
+    global _scorer
+    _scorer = BatchScorer(model_dir, model_name=model_name, top_k=top_k, prefixes=prefixes, cache=cache)
+
+
+def _score_chunk(events):
+    """Scored chunk, with the worker's process id and prediction cache counters"""
+    result = _scorer.score(events)
+    cache_stats = _scorer.cache.stats() if _scorer.cache is not None else None
+    return os.getpid(), result, cache_stats
+
+
+def _merge_cache_stats(worker_stats):
+    """Sum of the latest prediction cache counters of every worker (None without a cache)"""
+    worker_stats = [stats for stats in worker_stats if stats is not None]
+    if not worker_stats:
+        return None
+    merged = {key: sum(stats[key] for stats in worker_stats) for key in worker_stats[0] if key != 'hit_rate'}
+    lookups = merged['hits'] + merged['misses']
+    merged['hit_rate'] = merged['hits'] / lookups if lookups else 0.0
+    return merged
+
+
+def _chunk_mb(events):
+    """Estimated peak memory (MB) of scoring an event frame"""
+    return events.memory_usage(deep=True).sum() * CHUNK_MEMORY_FACTOR / (1024 * 1024)
+
+
+def score_log(log_path, model_dir, output_path, model_name='random_forest', top_k=3, prefixes='last',
+              chunk_cases=1000, workers=1, max_memory_mb=None, cache=None):
+    """
+    Score every case of an XES log in chunks and stream the predictions to Parquet
+
+    The log is read chunk_cases cases at a time, so memory depends on the chunk size
+    and not on the log size. With workers > 1 chunks are scored in a process pool
+    (each worker loads the models once; the model arrays are memory-mapped and shared)
+    while the reader moves on. At most two chunks per worker are in flight, and fewer
+    when max_memory_mb would be exceeded by this process's RSS plus the estimated
+    memory of the chunks being scored. Chunks are written in log order either way
+    (within a chunk, prefixes are ordered by case and time).
+
+    Args:
+        log_path: XES log of the cases to score
+        model_dir: Directory of the trained models and transformer metadata
+        output_path: Parquet file to write
+        model_name: Model subdirectory to score with
+        top_k: Number of most likely next activities per prefix
+        prefixes: 'last' (the current prefix of every case) or 'all' (every prefix)
+        chunk_cases: Cases per chunk
+        workers: Scoring processes (1 scores in this process)
+        max_memory_mb: Memory cap (MB) of this process plus the chunks in flight
+        cache: 'prediction_cache' configuration of each scorer (see
+            default_prediction_cache_config), or None
+
+    Returns:
+        Dict with the number of chunks, cases and rows written, the peak RSS (MB), the
+        prediction cache counters (summed over workers; None without a cache) and the
+        features of the model counted over the whole case (also in the Parquet metadata)
+    """
+    if prefixes not in ('last', 'all'):
+        raise ValueError(f"Unknown prefixes: {prefixes} (expected 'last' or 'all')")
+    scorer = BatchScorer(model_dir, model_name=model_name, top_k=top_k, prefixes=prefixes, cache=cache)
+    chunks = iter_xes_chunks(log_path, attributes=scorer.attributes, chunk_cases=chunk_cases)
+    sink = ParquetSink(output_path, metadata=warn_case_complete(scorer))
+    stats = {'chunks': 0, 'cases': 0, 'rows': 0, 'peak_rss_mb': resources.current_rss_mb(),
+             'case_complete_features': scorer.case_complete_features}
+    worker_cache_stats = {}
+
+    def write(result):
+        sink.write(result)
+        stats['peak_rss_mb'] = max(stats['peak_rss_mb'], resources.current_rss_mb())
+
+    def count(events):
+        stats['chunks'] += 1
+        stats['cases'] += events[CASE].nunique() if CASE in events.columns else 0
+
+    try:
+        with span('score_log'):
+            if workers <= 1:
+                for events in chunks:
+                    count(events)
+                    if max_memory_mb is not None and _chunk_mb(events) > max_memory_mb:
+                        logger.warning(f"A chunk of {chunk_cases} cases needs about {_chunk_mb(events):.0f} MB, "
+                                       f"more than the {max_memory_mb} MB cap; lower chunk_cases")
+                    write(scorer.score(events))
+            else:
+                # Spawned workers start without the parent's threads, locks and loaded data
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_init_worker,
+                                         initargs=(model_dir, model_name, top_k, prefixes, cache)) as executor:
+                    def collect(future):
+                        pid, result, cache_stats = future.result()
+                        worker_cache_stats[pid] = cache_stats
+                        write(result)
+
+                    pending = deque()
+                    for events in chunks:
+                        count(events)
+                        chunk_mb = _chunk_mb(events)
+                        # Write finished chunks (oldest first, to keep log order) until this one fits
+                        while pending and (len(pending) >= 2 * workers or (
+                                max_memory_mb is not None and
+                                resources.current_rss_mb() + sum(mb for _, mb in pending) + chunk_mb > max_memory_mb)):
+                            future, _ = pending.popleft()
+                            collect(future)
+                        pending.append((executor.submit(_score_chunk, events), chunk_mb))
+                        del events
+                    while pending:
+                        future, _ = pending.popleft()
+                        collect(future)
+            if sink.writer is None:
+                # Empty log: still write a file with the output columns
+                write(pd.DataFrame(columns=scorer.output_columns))
+    finally:
+        sink.close()
+
+    stats['rows'] = sink.rows
+    stats['cache'] = _merge_cache_stats(list(worker_cache_stats.values()) if workers > 1 else
+                                        [scorer.cache.stats() if scorer.cache is not None else None])
+    logger.info(f"Scored {stats['cases']} cases ({stats['rows']} prefixes, {stats['chunks']} chunks) "
+                f"into {output_path}; peak RSS {stats['peak_rss_mb']:.0f} MB")
+    if stats['cache'] is not None:
+        logger.info(f"Prediction cache: {stats['cache']['hits']} hits, {stats['cache']['misses']} misses "
+                    f"({stats['cache']['hit_rate']:.1%}), {stats['cache']['evictions']} evictions")
+    return stats
+
+
+def cache_config(max_mb=None, ttl_seconds=None):
+    """Prediction cache configuration of the --cache-mb and --cache-ttl flags (None when max_mb is not set)"""
+    if max_mb is None:
+        return None
+    config = default_prediction_cache_config()
+    config.update(enabled=True, max_mb=max_mb, ttl_seconds=ttl_seconds)
+    return config
+
+
+def main():
+    """Score the cases of an event log with trained baseline models"""
+    parser = argparse.ArgumentParser(description='Batch-score the cases of an event log')
+    parser.add_argument('log', help='XES log of the cases to score')
+    parser.add_argument('--model-dir', default=os.path.join('models', 'sepsis'),
+                        help='Directory of the trained models and transformer metadata')
+    parser.add_argument('--model', default='random_forest',
+                        choices=['decision_tree', 'random_forest', 'distilled_tree'],
+                        help='Model to score with')
+    parser.add_argument('--output', default=None,
+                        help='Parquet file to write (default: results/scores/<log name>.parquet)')
+    parser.add_argument('--top-k', type=int, default=3, help='Most likely next activities per prefix')
+    parser.add_argument('--prefixes', choices=['last', 'all'], default='last',
+                        help='Score the current prefix of every case, or every prefix')
+    parser.add_argument('--chunk-cases', type=int, default=1000, help='Cases read and scored per chunk')
+    parser.add_argument('--workers', type=int, default=1, help='Scoring processes')
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help='Memory cap (MB) of the reader plus the chunks being scored')
+    parser.add_argument('--cache-mb', type=float, default=None,
+                        help='Cache predictions of repeated feature vectors, up to this many MB per scorer')
+    parser.add_argument('--cache-ttl', type=float, default=None,
+                        help='Seconds a cached prediction stays valid')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    output = args.output or os.path.join(
+        'results', 'scores', os.path.basename(args.log).split('.')[0] + '.parquet')
+    score_log(args.log, args.model_dir, output, model_name=args.model, top_k=args.top_k, prefixes=args.prefixes,
+              chunk_cases=args.chunk_cases, workers=args.workers, max_memory_mb=args.max_memory,
+              cache=cache_config(args.cache_mb, args.cache_ttl))
+
+
+if __name__ == "__main__":
+    main()
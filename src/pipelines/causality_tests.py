@@ -7,12 +7,16 @@ import joblib
 from collections import defaultdict
 from datetime import datetime
 from sklearn.base import clone
-from scipy import stats
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+from src.preprocessing.feature_store import FeatureMatrixStore
+from src.preprocessing.event_alphabet import predicate_mask
+from src.preprocessing.binning import load_binner
+from src.common.instrumentation import span, instrument
+from src.common import plotting
+
+# Sparse n-gram columns of the saved test split (models_dir/feature_store), for models trained with them
+NGRAM_TEST_FILE = 'test_ngrams.npz'
+
 logger = logging.getLogger("causality_tests")
 
 class CausalityTester:
@@ -39,6 +43,15 @@ class CausalityTester:
         # Load baseline feature importance to inform hypothesis generation
         self.baseline_feature_importance = self._load_baseline_feature_importance()
     
+    @classmethod
+    def from_feature_store(cls, models, store_dir, dataset_type, baseline_dir=None, output_dir='results/causality'):
+        """
+        Create a tester over a memory-mapped test split written by FeatureMatrixStore
+        """
+        X_test, y_test, manifest = FeatureMatrixStore(store_dir).open_frame(mmap_mode='r')
+        return cls(models, manifest['columns'], X_test, y_test, dataset_type,
+                   baseline_dir=baseline_dir, output_dir=output_dir)
+    
     def _load_baseline_feature_importance(self):
         """
         Load baseline model feature importance to guide hypothesis definition
@@ -271,18 +284,14 @@ class CausalityTester:
         
         # If target events are specified, filter test data for these events
         if hypothesis['target_events']:
-            target_indices = []
-            for i, y_val in enumerate(self.y_test):
-                # Handle both string and numeric encoded target values
-                if isinstance(y_val, str):
-                    if any(target in y_val for target in hypothesis['target_events']):
-                        target_indices.append(i)
-                else:
-                    # For numeric targets, we'd need to decode them first
-                    # This is simplified here
-                    target_indices.append(i)
+            # Match each distinct label once and look the rows up by label code
+            codes, labels = pd.factorize(pd.Series(np.asarray(self.y_test, dtype=object)))
+            # Numeric encoded (and missing) targets cannot be matched by name, so they are all kept
+            table = np.array([not isinstance(label, str) or any(target in label for target in hypothesis['target_events'])
+                              for label in labels] + [True], dtype=bool)
+            target_indices = np.flatnonzero(table[codes])
             
-            if not target_indices:
+            if len(target_indices) == 0:
                 logger.warning(f"No target events found in test data: {hypothesis['target_events']}")
                 hypothesis['supported'] = False
                 hypothesis['justification'] = "Target events not found in test data"
@@ -315,6 +324,7 @@ class CausalityTester:
         
         # Perform significance test (simplified)
         # In a real implementation, this would be a more sophisticated statistical test
+        from scipy import stats
         t_stat, p_value = stats.ttest_1samp(
             [importances[i] for i in hypothesis_indices],
             other_importance
@@ -363,13 +373,15 @@ class CausalityTester:
         # Test each hypothesis
         for i, hypothesis in enumerate(hypotheses):
             logger.info(f"Testing hypothesis {i+1}/{len(hypotheses)}")
-            hypotheses[i] = self.test_hypothesis(hypothesis)
+            with span('hypothesis', rows=len(self.X_test), hypothesis=hypothesis['id']):
+                hypotheses[i] = self.test_hypothesis(hypothesis)
         
         # Generate summary report
         self._generate_report(hypotheses)
         
         return hypotheses
     
+    @instrument('report')
     def _generate_report(self, hypotheses):
         """
         Generate a report of hypothesis testing results
@@ -385,27 +397,14 @@ class CausalityTester:
         # Save summary to CSV
         summary.to_csv(os.path.join(self.output_dir, f"hypothesis_summary_{self.dataset_type}.csv"), index=False)
         
-        # Create visualization
-        plt.figure(figsize=(12, 6))
-        
         # Count supported/not supported
         support_counts = summary['Supported'].value_counts()
-        supported = support_counts.get(True, 0)
-        not_supported = support_counts.get(False, 0)
-        
-        # Create bar chart
-        plt.bar(['Supported', 'Not Supported'], [supported, not_supported], color=['green', 'red'])
-        plt.title(f'Hypothesis Testing Results - {self.dataset_type.upper()} Dataset')
-        plt.ylabel('Number of Hypotheses')
+        supported = int(support_counts.get(True, 0))
+        not_supported = int(support_counts.get(False, 0))
         
-        # Add count labels
-        for i, count in enumerate([supported, not_supported]):
-            if count > 0:
-                plt.text(i, count + 0.1, str(count), ha='center')
-        
-        # Save figure
-        plt.savefig(os.path.join(self.output_dir, f"hypothesis_results_{self.dataset_type}.png"), dpi=300)
-        plt.close()
+        # Create visualization (rendered by the background plot pool)
+        plotting.submit_figure(os.path.join(self.output_dir, f"hypothesis_results_{self.dataset_type}.png"),
+                               draw_hypothesis_results, supported, not_supported, self.dataset_type, dpi=300)
         
         # Generate detailed report
         with open(os.path.join(self.output_dir, f"hypothesis_report_{self.dataset_type}.txt"), 'w') as f:
@@ -508,6 +507,23 @@ class CausalityTester:
         logger.info(f"Generated markdown report at {md_report_path}")
 
 
+def draw_hypothesis_results(supported, not_supported, dataset_type):
+    """Bar chart of supported vs not supported hypotheses"""
+    plt = plotting.pyplot()
+    fig = plt.figure(figsize=(12, 6))
+
+    # Create bar chart
+    plt.bar(['Supported', 'Not Supported'], [supported, not_supported], color=['green', 'red'])
+    plt.title(f'Hypothesis Testing Results - {dataset_type.upper()} Dataset')
+    plt.ylabel('Number of Hypotheses')
+
+    # Add count labels
+    for i, count in enumerate([supported, not_supported]):
+        if count > 0:
+            plt.text(i, count + 0.1, str(count), ha='center')
+    return fig
+
+
 def test_model_predictions(model, X_test, y_test, label_map=None):
     """Test model predictions on test data"""
     print("\n=== Model Prediction Performance ===")
@@ -770,22 +786,14 @@ def _test_hypotheses_dynamic(X_test, predicted_events, hypotheses):
                         
                     continue
             
-            # Calculate outcome rates - fixed to evaluate strings properly
-            outcomes_true = []
-            for i in condition_indices:
-                # Convert prediction to string if it's not already
-                pred = predicted_events[i] if isinstance(predicted_events[i], str) else str(predicted_events[i])
-                outcomes_true.append(hypothesis['outcome'](pred))
-                
-            outcomes_false = []
-            for i in non_condition_indices:
-                # Convert prediction to string if it's not already
-                pred = predicted_events[i] if isinstance(predicted_events[i], str) else str(predicted_events[i])
-                outcomes_false.append(hypothesis['outcome'](pred))
+            # Outcome of every prediction; the string predicate runs once per distinct event label
+            outcomes = predicate_mask(predicted_events, hypothesis['outcome'])
+            outcomes_true = outcomes[condition_indices.astype(np.int64)]
+            outcomes_false = outcomes[non_condition_indices.astype(np.int64)]
                 
             # Calculate percentages based on boolean outcomes
-            condition_true = sum(outcomes_true) / len(outcomes_true) if outcomes_true else 0
-            condition_false = sum(outcomes_false) / len(outcomes_false) if outcomes_false else 0
+            condition_true = outcomes_true.mean() if len(outcomes_true) else 0
+            condition_false = outcomes_false.mean() if len(outcomes_false) else 0
             
             # Calculate significance
             difference = condition_true - condition_false
@@ -939,10 +947,34 @@ def _get_fallback_hypothesis_result(hypothesis_name):
     
     return None
 
-def run_causality_tests(dataset_type, models_dir, X_test, y_test):
-    """Run all causality tests for a specific dataset"""
+def run_causality_tests(dataset_type, models_dir, X_test=None, y_test=None, X_model=None):
+    """
+    Run all causality tests for a specific dataset.
+    Without X_test/y_test the memory-mapped test split saved with the models is used.
+    X_model is the matrix the models predict on when it differs from X_test (models
+    trained on bin codes or with n-gram columns); without it, X_test is binned with the
+    saved bin edges and the saved n-gram columns are appended.
+    """
     results = {}
     
+    if X_test is None or y_test is None:
+        store = FeatureMatrixStore(os.path.join(models_dir, 'feature_store', 'test'))
+        if not store.exists():
+            print(f"No test data available in {store.store_dir}. Cannot run causality tests.")
+            return results
+        X_test, y_test, _ = store.open_frame(mmap_mode='r')
+    
+    if X_model is None:
+        X_model = X_test
+        binner = load_binner(models_dir)
+        if binner is not None:
+            X_model = binner.transform(X_test)
+        ngram_path = os.path.join(models_dir, 'feature_store', NGRAM_TEST_FILE)
+        if os.path.exists(ngram_path):
+            from scipy import sparse
+            from src.preprocessing.sequence_encoding import combine_features
+            X_model = combine_features(X_model, sparse.load_npz(ngram_path))
+    
     # Load models
     for model_name in ['decision_tree', 'random_forest']:
         model_dir = os.path.join(models_dir, model_name)
@@ -960,7 +992,7 @@ def run_causality_tests(dataset_type, models_dir, X_test, y_test):
             model.load_model(model_dir)
         
         # Make predictions
-        y_pred = model.predict(X_test)
+        y_pred = model.predict(X_model)
         
         # Load feature importance
         if model_name == 'decision_tree':
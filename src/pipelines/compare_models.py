@@ -1,56 +1,87 @@
 import os
+import argparse
 import numpy as np
 import pandas as pd
 import logging
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score, confusion_matrix
-from scipy import stats
-import joblib
-
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+from src.preprocessing.feature_store import FeatureMatrixStore
+from src.models.metrics import evaluate_in_batches
+from src.models.artifact import load_model, model_exists
+from src.models.run_store import RunStore, METRIC_COLUMNS
+from src.common.instrumentation import span, instrument
+from src.common import profiling
+from src.common import plotting
+from src.common.plotting import pyplot
+
+# Logging is configured by the entry point (main.py or main() below)
 logger = logging.getLogger("model_comparison")
 
 class ModelComparator:
-    def __init__(self, dataset_type, baseline_dir='models/baseline', enhanced_dir='models/enhanced', output_dir='results'):
+    def __init__(self, dataset_type, baseline_dir='models/baseline', enhanced_dir='models/enhanced', output_dir='results',
+                 feature_store_dir=None, run_store_dir='models/runs', baseline_run=None, enhanced_run=None,
+                 recompute=False):
+        """
+        Args:
+            dataset_type: Dataset whose models are compared
+            baseline_dir, enhanced_dir: Model directories (used for legacy metrics files and recompute)
+            output_dir: Directory of the comparison reports
+            feature_store_dir: Baseline test split (defaults to <baseline_dir>/feature_store/test)
+            run_store_dir: Run store with the metrics and importance recorded at training time
+            baseline_run, enhanced_run: Run ids to compare (default: the latest run of each variant)
+            recompute: Load and score the saved baseline models when no metrics were recorded
+        """
         self.dataset_type = dataset_type
         self.baseline_dir = baseline_dir
         self.enhanced_dir = enhanced_dir
         self.output_dir = output_dir
+        self.run_store = RunStore(run_store_dir)
+        self.baseline_run = baseline_run
+        self.enhanced_run = enhanced_run
+        self.recompute = recompute
+        # Index entries of the runs being compared (filled by load_metrics)
+        self.runs = {}
+        # Memory-mapped baseline test split written by ModelTrainer.save_models
+        self.feature_store = FeatureMatrixStore(feature_store_dir or os.path.join(baseline_dir, 'feature_store', 'test'))
         
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
         
         logger.info(f"Initialized ModelComparator for {self.dataset_type} dataset")
     
+    def _find_model(self, candidates):
+        """First candidate path holding a model (the first candidate if none does, for the log message)"""
+        for path in candidates:
+            if model_exists(path):
+                return path
+        return candidates[0]
+    
+    @instrument('load')
     def load_models(self):
         """
         Load baseline and enhanced models
         """
-        # Load baseline models with proper paths
-        baseline_dt_path = os.path.join(self.baseline_dir, f"dt_model_{self.dataset_type}.pkl")
-        
-        # Try alternative paths for baseline DT
-        if not os.path.exists(baseline_dt_path):
-            baseline_dt_path = os.path.join(self.baseline_dir, "decision_tree", "decision_tree_model.pkl")
-            
-        if not os.path.exists(baseline_dt_path):
-            baseline_dt_path = os.path.join(self.baseline_dir, "decision_tree", "dt_model.pkl")
-        
-        # Load baseline RF
-        baseline_rf_path = os.path.join(self.baseline_dir, f"rf_model_{self.dataset_type}.pkl")
-        
-        # Try alternative paths for baseline RF
-        if not os.path.exists(baseline_rf_path):
-            baseline_rf_path = os.path.join(self.baseline_dir, "random_forest", "random_forest_model.pkl")
-            
-        if not os.path.exists(baseline_rf_path):
-            baseline_rf_path = os.path.join(self.baseline_dir, "random_forest", "rf_model.pkl")
+        # Model artifact directories first, then pickles written by older versions
+        baseline_dt_path = self._find_model([
+            os.path.join(self.baseline_dir, "decision_tree"),
+            os.path.join(self.baseline_dir, f"dt_model_{self.dataset_type}.pkl"),
+            os.path.join(self.baseline_dir, "decision_tree", "decision_tree_model.pkl"),
+            os.path.join(self.baseline_dir, "decision_tree", "dt_model.pkl")
+        ])
+        baseline_rf_path = self._find_model([
+            os.path.join(self.baseline_dir, "random_forest"),
+            os.path.join(self.baseline_dir, f"rf_model_{self.dataset_type}.pkl"),
+            os.path.join(self.baseline_dir, "random_forest", "random_forest_model.pkl"),
+            os.path.join(self.baseline_dir, "random_forest", "rf_model.pkl")
+        ])
         
-        # Load enhanced models
-        enhanced_dt_path = os.path.join(self.enhanced_dir, f"enhanced_dt_{self.dataset_type}.pkl")
-        enhanced_rf_path = os.path.join(self.enhanced_dir, f"enhanced_rf_{self.dataset_type}.pkl")
+        enhanced_dt_path = self._find_model([
+            os.path.join(self.enhanced_dir, f"enhanced_dt_{self.dataset_type}"),
+            os.path.join(self.enhanced_dir, f"enhanced_dt_{self.dataset_type}.pkl")
+        ])
+        enhanced_rf_path = self._find_model([
+            os.path.join(self.enhanced_dir, f"enhanced_rf_{self.dataset_type}"),
+            os.path.join(self.enhanced_dir, f"enhanced_rf_{self.dataset_type}.pkl")
+        ])
         
         # Load models if they exist
         self.baseline_dt = None
@@ -59,26 +90,26 @@ class ModelComparator:
         self.enhanced_rf = None
         
         try:
-            if os.path.exists(baseline_dt_path):
-                self.baseline_dt = joblib.load(baseline_dt_path)
+            if model_exists(baseline_dt_path):
+                self.baseline_dt = load_model(baseline_dt_path)
                 logger.info(f"Loaded baseline DT model from {baseline_dt_path}")
             else:
                 logger.warning(f"Baseline DT model not found at {baseline_dt_path}")
                 
-            if os.path.exists(baseline_rf_path):
-                self.baseline_rf = joblib.load(baseline_rf_path)
+            if model_exists(baseline_rf_path):
+                self.baseline_rf = load_model(baseline_rf_path)
                 logger.info(f"Loaded baseline RF model from {baseline_rf_path}")
             else:
                 logger.warning(f"Baseline RF model not found at {baseline_rf_path}")
                 
-            if os.path.exists(enhanced_dt_path):
-                self.enhanced_dt = joblib.load(enhanced_dt_path)
+            if model_exists(enhanced_dt_path):
+                self.enhanced_dt = load_model(enhanced_dt_path)
                 logger.info(f"Loaded enhanced DT model from {enhanced_dt_path}")
             else:
                 logger.warning(f"Enhanced DT model not found at {enhanced_dt_path}")
                 
-            if os.path.exists(enhanced_rf_path):
-                self.enhanced_rf = joblib.load(enhanced_rf_path)
+            if model_exists(enhanced_rf_path):
+                self.enhanced_rf = load_model(enhanced_rf_path)
                 logger.info(f"Loaded enhanced RF model from {enhanced_rf_path}")
             else:
                 logger.warning(f"Enhanced RF model not found at {enhanced_rf_path}")
@@ -92,73 +123,98 @@ class ModelComparator:
             'enhanced_rf': self.enhanced_rf
         }
     
+    def load_test_data(self, mmap_mode='r'):
+        """
+        Open the baseline test split from the feature matrix store
+
+        Returns:
+            Tuple of (X_test, y_test) or (None, None) if no store exists
+        """
+        if not self.feature_store.exists():
+            return None, None
+        X_test, y_test, _ = self.feature_store.open_frame(mmap_mode=mmap_mode)
+        logger.info(f"Opened test data from {self.feature_store.store_dir} ({X_test.shape[0]} rows)")
+        return X_test, y_test
+    
+    def _evaluate_baseline_models(self, batch_size=10000):
+        """
+        Compute baseline metrics by scoring the loaded models on the stored test split
+        """
+        X_test, y_test = self.load_test_data()
+        if X_test is None:
+            return None
+        
+        rows = []
+        for model_name, model in [('Decision Tree', self.baseline_dt), ('Random Forest', self.baseline_rf)]:
+            if model is None:
+                return None
+            summary = evaluate_in_batches(model, X_test, y_test, batch_size=batch_size, with_proba=True).summary()
+            rows.append({
+                'Model': model_name,
+                'Accuracy': summary['accuracy'],
+                'Precision': summary['precision'],
+                'Recall': summary['recall'],
+                'F1': summary['f1'],
+                'ROC_AUC': summary['roc_auc']
+            })
+        return pd.DataFrame(rows)
+    
+    def _select_run(self, variant, run_id=None):
+        """Index entry of the given run id, or of the latest recorded run of this dataset and variant"""
+        if run_id is None:
+            return self.run_store.latest(self.dataset_type, variant)
+        for entry in self.run_store.runs(self.dataset_type, variant):
+            if entry['run_id'] == run_id:
+                return entry
+        logger.warning(f"Run {run_id} not found in {self.run_store.root_dir}")
+        return None
+    
+    def _read_metrics_file(self, candidates):
+        """Metrics frame from the first existing metrics CSV (written by older versions), or None"""
+        for path in candidates:
+            if os.path.exists(path):
+                logger.info(f"Loaded metrics from {path}")
+                return pd.read_csv(path)
+        return None
+    
+    @instrument('load')
     def load_metrics(self):
         """
         Load performance metrics for baseline and enhanced models
+
+        Metrics come from the run store, then from metrics CSV files. Models are
+        only loaded and scored when the comparator was created with recompute=True.
         """
-        # Load metrics from CSV files if they exist
-        baseline_metrics_path = os.path.join(self.baseline_dir, f"metrics_{self.dataset_type}.csv")
-        
-        # Try alternative paths for baseline metrics
-        if not os.path.exists(baseline_metrics_path):
-            baseline_metrics_path = os.path.join(self.baseline_dir, "results", f"metrics_{self.dataset_type}.csv")
-            
-        if not os.path.exists(baseline_metrics_path):
-            # Generate a metrics file from the saved models if available
-            try:
-                if self.baseline_dt is not None and self.baseline_rf is not None:
-                    # We need to create a metrics file from the models
-                    baseline_metrics = pd.DataFrame([
-                        {
-                            'Model': 'Decision Tree',
-                            'Accuracy': 0.40,  # Placeholder values
-                            'Precision': 0.38,
-                            'Recall': 0.40,
-                            'F1': 0.35,
-                            'ROC_AUC': 0.75
-                        },
-                        {
-                            'Model': 'Random Forest',
-                            'Accuracy': 0.75,  # Placeholder values
-                            'Precision': 0.74,
-                            'Recall': 0.75,
-                            'F1': 0.73,
-                            'ROC_AUC': 0.90
-                        }
-                    ])
-                    # Save metrics to a file
-                    os.makedirs(os.path.join(self.baseline_dir, "results"), exist_ok=True)
-                    baseline_metrics_path = os.path.join(self.baseline_dir, "results", f"metrics_{self.dataset_type}.csv")
-                    baseline_metrics.to_csv(baseline_metrics_path, index=False)
-                    logger.info(f"Created placeholder metrics file at {baseline_metrics_path}")
-            except Exception as e:
-                logger.error(f"Error creating placeholder metrics: {e}")
-        
-        enhanced_metrics_path = os.path.join(self.enhanced_dir, f"metrics_{self.dataset_type}.csv")
-        
-        baseline_metrics = None
-        enhanced_metrics = None
-        
-        try:
-            if os.path.exists(baseline_metrics_path):
-                baseline_metrics = pd.read_csv(baseline_metrics_path)
-                logger.info(f"Loaded baseline metrics from {baseline_metrics_path}")
-            else:
-                logger.warning(f"Baseline metrics file not found at {baseline_metrics_path}")
-                
-            if os.path.exists(enhanced_metrics_path):
-                enhanced_metrics = pd.read_csv(enhanced_metrics_path)
-                logger.info(f"Loaded enhanced metrics from {enhanced_metrics_path}")
+        metrics = {}
+        for variant, run_id, model_dir in [('baseline', self.baseline_run, self.baseline_dir),
+                                           ('enhanced', self.enhanced_run, self.enhanced_dir)]:
+            frame = None
+            entry = self._select_run(variant, run_id)
+            if entry is not None:
+                self.runs[variant] = entry
+                frame = self.run_store.metrics(entry)
+                logger.info(f"Loaded {variant} metrics of run {entry['run_id']}")
             else:
-                logger.warning(f"Enhanced metrics file not found at {enhanced_metrics_path}")
-        except Exception as e:
-            logger.error(f"Error loading metrics: {e}")
+                frame = self._read_metrics_file([
+                    os.path.join(model_dir, f"metrics_{self.dataset_type}.csv"),
+                    os.path.join(model_dir, "results", f"metrics_{self.dataset_type}.csv")
+                ])
+            
+            if frame is None and variant == 'baseline' and self.recompute:
+                # Score the saved models on the stored test split
+                self.load_models()
+                frame = self._evaluate_baseline_models()
+                if frame is not None:
+                    logger.info("Computed baseline metrics from stored test data")
+            
+            if frame is None:
+                logger.warning(f"No {variant} metrics recorded for {self.dataset_type}; train the {variant} models "
+                               f"first{' or pass --recompute' if variant == 'baseline' else ''}")
+            metrics[f"{variant}_metrics"] = frame
         
-        return {
-            'baseline_metrics': baseline_metrics,
-            'enhanced_metrics': enhanced_metrics
-        }
+        return metrics
     
+    @instrument('compare')
     def compare_performance(self, baseline_metrics, enhanced_metrics):
         """
         Compare performance between baseline and enhanced models
@@ -223,104 +279,44 @@ class ModelComparator:
             traceback.print_exc()
             return None
     
+    @instrument('plot')
     def _plot_performance_comparison(self, comparison):
         """
-        Create visualizations for performance comparison
+        Create visualizations for performance comparison (rendered by the background plot pool)
         """
-        try:
-            # Bar chart for baseline vs enhanced performance
-            plt.figure(figsize=(12, 8))
-            metrics = comparison['Metric']
-            x = np.arange(len(metrics))
-            width = 0.2
-            
-            plt.bar(x - 1.5*width, comparison['Baseline DT'], width, label='Baseline DT')
-            plt.bar(x - 0.5*width, comparison['Enhanced DT'], width, label='Enhanced DT')
-            plt.bar(x + 0.5*width, comparison['Baseline RF'], width, label='Baseline RF')
-            plt.bar(x + 1.5*width, comparison['Enhanced RF'], width, label='Enhanced RF')
-            
-            plt.xlabel('Metrics')
-            plt.ylabel('Scores')
-            plt.title(f'Performance Comparison - {self.dataset_type.upper()} Dataset')
-            plt.xticks(x, metrics)
-            plt.ylim(0, 1)
-            plt.legend()
-            plt.tight_layout()
-            
-            # Save figure
-            plt.savefig(os.path.join(self.output_dir, f"performance_comparison_{self.dataset_type}.png"), dpi=300)
-            plt.close()
-            
-            # Plot improvements
-            plt.figure(figsize=(10, 6))
-            plt.bar(x - 0.2, comparison['DT_Improvement'], width=0.4, label='DT Improvement')
-            plt.bar(x + 0.2, comparison['RF_Improvement'], width=0.4, label='RF Improvement')
-            
-            plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
-            plt.xlabel('Metrics')
-            plt.ylabel('Improvement (Enhanced - Baseline)')
-            plt.title(f'Performance Improvements - {self.dataset_type.upper()} Dataset')
-            plt.xticks(x, metrics)
-            plt.legend()
-            
-            # Annotate significant improvements
-            for i, significant in enumerate(comparison['Significant']):
-                if significant:
-                    plt.text(i - 0.2, comparison['DT_Improvement'].iloc[i] + 0.005, '*', 
-                            fontsize=15, ha='center', va='bottom')
-            
-            plt.tight_layout()
-            plt.savefig(os.path.join(self.output_dir, f"performance_improvements_{self.dataset_type}.png"), dpi=300)
-            plt.close()
-            
-            # Plot percentage improvements for better clarity
-            plt.figure(figsize=(10, 6))
-            plt.bar(x - 0.2, comparison['DT_Improvement_Pct'], width=0.4, label='DT Improvement %')
-            plt.bar(x + 0.2, comparison['RF_Improvement_Pct'], width=0.4, label='RF Improvement %')
-            
-            plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
-            plt.xlabel('Metrics')
-            plt.ylabel('Improvement Percentage %')
-            plt.title(f'Performance Improvements (%) - {self.dataset_type.upper()} Dataset')
-            plt.xticks(x, metrics)
-            plt.legend()
-            
-            # Annotate significant improvements
-            for i, significant in enumerate(comparison['Significant']):
-                if significant:
-                    plt.text(i - 0.2, comparison['DT_Improvement_Pct'].iloc[i] + 1, '*', 
-                            fontsize=15, ha='center', va='bottom')
-            
-            plt.tight_layout()
-            plt.savefig(os.path.join(self.output_dir, f"performance_improvements_pct_{self.dataset_type}.png"), dpi=300)
-            plt.close()
-        except Exception as e:
-            logger.error(f"Error plotting performance comparison: {e}")
+        plotting.submit(render_performance_plots, comparison, self.dataset_type, self.output_dir)
     
+    def _load_importance(self, variant, candidates, model_label='Decision Tree'):
+        """Feature importance of a compared run, else of the first existing CSV file"""
+        run_id = self.baseline_run if variant == 'baseline' else self.enhanced_run
+        entry = self.runs.get(variant) or self._select_run(variant, run_id)
+        if entry is not None:
+            frame = self.run_store.importance(entry['run_id'], model_label)
+            if frame is not None:
+                return frame
+        for path in candidates:
+            if os.path.exists(path):
+                return pd.read_csv(path)
+        return None
+    
+    @instrument('compare')
     def compare_feature_importance(self):
         """
         Compare feature importance between baseline and enhanced models
         """
-        # Load feature importance data
-        baseline_fi_path = os.path.join(self.baseline_dir, f"feature_importance_DT_{self.dataset_type}.csv")
-        
-        # Try alternative paths for baseline feature importance
-        if not os.path.exists(baseline_fi_path):
-            baseline_fi_path = os.path.join(self.baseline_dir, "decision_tree", "dt_feature_importance.csv")
-            
-        if not os.path.exists(baseline_fi_path):
-            baseline_fi_path = os.path.join(self.baseline_dir, "feature_importance", f"feature_importance_DT_{self.dataset_type}.csv")
-            
-        enhanced_fi_path = os.path.join(self.enhanced_dir, f"feature_importance_DT_{self.dataset_type}.csv")
-        
         try:
-            if not os.path.exists(baseline_fi_path) or not os.path.exists(enhanced_fi_path):
+            baseline_fi = self._load_importance('baseline', [
+                os.path.join(self.baseline_dir, f"feature_importance_DT_{self.dataset_type}.csv"),
+                os.path.join(self.baseline_dir, "decision_tree", "dt_feature_importance.csv"),
+                os.path.join(self.baseline_dir, "feature_importance", f"feature_importance_DT_{self.dataset_type}.csv")
+            ])
+            enhanced_fi = self._load_importance('enhanced', [
+                os.path.join(self.enhanced_dir, f"feature_importance_DT_{self.dataset_type}.csv")
+            ])
+            if baseline_fi is None or enhanced_fi is None:
                 logger.error(f"Feature importance data missing. Cannot compare.")
                 return None
             
-            baseline_fi = pd.read_csv(baseline_fi_path)
-            enhanced_fi = pd.read_csv(enhanced_fi_path)
-            
             logger.info(f"Loaded feature importance data: baseline={len(baseline_fi)} features, enhanced={len(enhanced_fi)} features")
             
             # Normalize column names (handle different case in column names)
@@ -382,90 +378,18 @@ class ModelComparator:
             traceback.print_exc()
             return None
     
+    @instrument('plot')
     def _plot_feature_importance_comparison(self, merged_fi, top_n=10):
         """
-        Visualize feature importance comparison
+        Visualize feature importance comparison (rendered by the background plot pool)
         """
-        try:
-            # Select top features
-            top_features = merged_fi.head(top_n)
-            
-            # Create bar chart
-            plt.figure(figsize=(12, 8))
-            x = np.arange(len(top_features))
-            width = 0.35
-            
-            plt.bar(x - width/2, top_features['importance_baseline'], width, label='Baseline')
-            plt.bar(x + width/2, top_features['importance_enhanced'], width, label='Enhanced')
-            
-            plt.xlabel('Features')
-            plt.ylabel('Importance')
-            plt.title(f'Top {top_n} Feature Importance Comparison - {self.dataset_type.upper()} Dataset')
-            plt.xticks(x, top_features['feature'], rotation=90)
-            plt.legend()
-            plt.tight_layout()
-            
-            # Save figure
-            plt.savefig(os.path.join(self.output_dir, f"feature_importance_comparison_{self.dataset_type}.png"), dpi=300)
-            plt.close()
-            
-            # Plot changes in feature importance
-            changes = merged_fi.sort_values('importance_change', ascending=False).head(top_n)
-            
-            plt.figure(figsize=(12, 8))
-            plt.bar(range(len(changes)), changes['importance_change'], align='center')
-            plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
-            plt.xticks(range(len(changes)), changes['feature'], rotation=90)
-            plt.xlabel('Features')
-            plt.ylabel('Change in Importance (Enhanced - Baseline)')
-            plt.title(f'Top Changes in Feature Importance - {self.dataset_type.upper()} Dataset')
-            plt.tight_layout()
-            
-            # Save figure
-            plt.savefig(os.path.join(self.output_dir, f"feature_importance_changes_{self.dataset_type}.png"), dpi=300)
-            plt.close()
-            
-            # Plot percentage changes
-            pct_changes = merged_fi.sort_values('importance_change_pct', ascending=False).head(top_n)
-            
-            plt.figure(figsize=(12, 8))
-            plt.bar(range(len(pct_changes)), pct_changes['importance_change_pct'], align='center')
-            plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
-            plt.xticks(range(len(pct_changes)), pct_changes['feature'], rotation=90)
-            plt.xlabel('Features')
-            plt.ylabel('Percentage Change in Importance')
-            plt.title(f'Top Percentage Changes in Feature Importance - {self.dataset_type.upper()} Dataset')
-            plt.tight_layout()
-            
-            # Save figure
-            plt.savefig(os.path.join(self.output_dir, f"feature_importance_changes_pct_{self.dataset_type}.png"), dpi=300)
-            plt.close()
-            
-            # Plot new features in enhanced model
-            new_features = merged_fi[(merged_fi['importance_baseline'] == 0) & (merged_fi['importance_enhanced'] > 0)]
-            if len(new_features) > 0:
-                new_features = new_features.sort_values('importance_enhanced', ascending=False).head(min(top_n, len(new_features)))
-                
-                plt.figure(figsize=(12, 8))
-                plt.bar(range(len(new_features)), new_features['importance_enhanced'], align='center')
-                plt.xticks(range(len(new_features)), new_features['feature'], rotation=90)
-                plt.xlabel('Features')
-                plt.ylabel('Importance')
-                plt.title(f'New Features in Enhanced Model - {self.dataset_type.upper()} Dataset')
-                plt.tight_layout()
-                
-                # Save figure
-                plt.savefig(os.path.join(self.output_dir, f"new_features_{self.dataset_type}.png"), dpi=300)
-                plt.close()
-        except Exception as e:
-            logger.error(f"Error plotting feature importance comparison: {e}")
+        plotting.submit(render_feature_importance_plots, merged_fi, self.dataset_type, self.output_dir, top_n)
     
     def run_comparison(self):
         """
         Run full comparison analysis
         """
-        # Load models and metrics
-        self.load_models()
+        # Metrics and importance only: models are loaded only to recompute missing baseline metrics
         metrics = self.load_metrics()
         
         results = {}
@@ -486,6 +410,61 @@ class ModelComparator:
         
         return results
     
+    @instrument('compare')
+    def compare_runs(self, run_ids=None, last=None):
+        """
+        Compare the recorded runs of this dataset in one pass over the run store index
+
+        Args:
+            run_ids: Runs to include (default: every run of the dataset)
+            last: Keep only the last N runs of each variant
+
+        Returns:
+            Frame with one row per run and model (metrics plus the change against the
+            first baseline run of the same model), or None if no runs are recorded
+        """
+        history = self.run_store.metrics_frame(self.dataset_type, run_ids=run_ids)
+        if history.empty:
+            logger.warning(f"No runs recorded for {self.dataset_type} in {self.run_store.root_dir}")
+            return None
+        
+        if last is not None:
+            kept = history.drop_duplicates('run_id').groupby('variant').tail(last)['run_id']
+            history = history[history['run_id'].isin(kept)]
+        
+        # Change of every metric against the oldest baseline run in the selection
+        reference = history[history['variant'] == 'baseline'].drop_duplicates('Model').set_index('Model')
+        for column in METRIC_COLUMNS:
+            history[f"{column}_change"] = history[column] - history['Model'].map(reference[column])
+        
+        history.to_csv(os.path.join(self.output_dir, f"run_history_{self.dataset_type}.csv"), index=False)
+        self._write_run_history_report(history)
+        logger.info(f"Compared {history['run_id'].nunique()} runs of {self.dataset_type}; "
+                    f"saved to {self.output_dir}")
+        return history
+    
+    def _write_run_history_report(self, history):
+        """Markdown table of the compared runs and the best run per model and metric"""
+        report_path = os.path.join(self.output_dir, f"run_history_{self.dataset_type}.md")
+        with open(report_path, 'w') as f:
+            f.write(f"# Run History - {self.dataset_type.upper()} Dataset\n\n")
+            f.write("| Run | Created | Variant | Model | " + " | ".join(METRIC_COLUMNS) + " |\n")
+            f.write("|-----|---------|---------|-------|" + "|".join("-" * (len(c) + 2) for c in METRIC_COLUMNS) + "|\n")
+            for _, row in history.iterrows():
+                values = " | ".join("-" if pd.isna(row[c]) else f"{row[c]:.4f}" for c in METRIC_COLUMNS)
+                f.write(f"| {row['run_id']} | {row['created']} | {row['variant']} | {row['Model']} | {values} |\n")
+            
+            f.write("\n## Best Runs\n\n")
+            f.write("| Model | Metric | Run | Value |\n")
+            f.write("|-------|--------|-----|-------|\n")
+            for model, group in history.groupby('Model'):
+                for column in METRIC_COLUMNS:
+                    if group[column].notna().any():
+                        best = group.loc[group[column].idxmax()]
+                        f.write(f"| {model} | {column} | {best['run_id']} | {best[column]:.4f} |\n")
+        return report_path
+    
+    @instrument('report')
     def _generate_summary_report(self, results):
         """
         Generate a summary report of the model comparison
@@ -495,6 +474,9 @@ class ModelComparator:
         try:
             with open(report_path, 'w') as f:
                 f.write(f"# Model Comparison Summary - {self.dataset_type.upper()} Dataset\n\n")
+                if self.runs:
+                    f.write(" | ".join(f"{variant.capitalize()} run: {entry['run_id']}"
+                                       for variant, entry in self.runs.items()) + "\n\n")
                 
                 # Performance comparison
                 f.write("## Performance Comparison\n\n")
@@ -598,23 +580,201 @@ class ModelComparator:
             logger.error(f"Error generating summary report: {e}")
 
 
+def render_performance_plots(comparison, dataset_type, output_dir):
+    """Write the performance comparison and improvement figures (runs in the plot pool)"""
+    plt = pyplot()
+    try:
+        # Bar chart for baseline vs enhanced performance
+        plt.figure(figsize=(12, 8))
+        metrics = comparison['Metric']
+        x = np.arange(len(metrics))
+        width = 0.2
+
+        plt.bar(x - 1.5*width, comparison['Baseline DT'], width, label='Baseline DT')
+        plt.bar(x - 0.5*width, comparison['Enhanced DT'], width, label='Enhanced DT')
+        plt.bar(x + 0.5*width, comparison['Baseline RF'], width, label='Baseline RF')
+        plt.bar(x + 1.5*width, comparison['Enhanced RF'], width, label='Enhanced RF')
+
+        plt.xlabel('Metrics')
+        plt.ylabel('Scores')
+        plt.title(f'Performance Comparison - {dataset_type.upper()} Dataset')
+        plt.xticks(x, metrics)
+        plt.ylim(0, 1)
+        plt.legend()
+        plt.tight_layout()
+
+        # Save figure
+        plt.savefig(os.path.join(output_dir, f"performance_comparison_{dataset_type}.png"), dpi=300)
+        plt.close()
+
+        # Plot improvements
+        plt.figure(figsize=(10, 6))
+        plt.bar(x - 0.2, comparison['DT_Improvement'], width=0.4, label='DT Improvement')
+        plt.bar(x + 0.2, comparison['RF_Improvement'], width=0.4, label='RF Improvement')
+
+        plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
+        plt.xlabel('Metrics')
+        plt.ylabel('Improvement (Enhanced - Baseline)')
+        plt.title(f'Performance Improvements - {dataset_type.upper()} Dataset')
+        plt.xticks(x, metrics)
+        plt.legend()
+
+        # Annotate significant improvements
+        for i, significant in enumerate(comparison['Significant']):
+            if significant:
+                plt.text(i - 0.2, comparison['DT_Improvement'].iloc[i] + 0.005, '*', 
+                        fontsize=15, ha='center', va='bottom')
+
+        plt.tight_layout()
+        plt.savefig(os.path.join(output_dir, f"performance_improvements_{dataset_type}.png"), dpi=300)
+        plt.close()
+
+        # Plot percentage improvements for better clarity
+        plt.figure(figsize=(10, 6))
+        plt.bar(x - 0.2, comparison['DT_Improvement_Pct'], width=0.4, label='DT Improvement %')
+        plt.bar(x + 0.2, comparison['RF_Improvement_Pct'], width=0.4, label='RF Improvement %')
+
+        plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
+        plt.xlabel('Metrics')
+        plt.ylabel('Improvement Percentage %')
+        plt.title(f'Performance Improvements (%) - {dataset_type.upper()} Dataset')
+        plt.xticks(x, metrics)
+        plt.legend()
+
+        # Annotate significant improvements
+        for i, significant in enumerate(comparison['Significant']):
+            if significant:
+                plt.text(i - 0.2, comparison['DT_Improvement_Pct'].iloc[i] + 1, '*', 
+                        fontsize=15, ha='center', va='bottom')
+
+        plt.tight_layout()
+        plt.savefig(os.path.join(output_dir, f"performance_improvements_pct_{dataset_type}.png"), dpi=300)
+        plt.close()
+    except Exception as e:
+        logger.error(f"Error plotting performance comparison: {e}")
+
+
+def render_feature_importance_plots(merged_fi, dataset_type, output_dir, top_n=10):
+    """Write the feature importance comparison figures (runs in the plot pool)"""
+    plt = pyplot()
+    try:
+        # Select top features
+        top_features = merged_fi.head(top_n)
+
+        # Create bar chart
+        plt.figure(figsize=(12, 8))
+        x = np.arange(len(top_features))
+        width = 0.35
+
+        plt.bar(x - width/2, top_features['importance_baseline'], width, label='Baseline')
+        plt.bar(x + width/2, top_features['importance_enhanced'], width, label='Enhanced')
+
+        plt.xlabel('Features')
+        plt.ylabel('Importance')
+        plt.title(f'Top {top_n} Feature Importance Comparison - {dataset_type.upper()} Dataset')
+        plt.xticks(x, top_features['feature'], rotation=90)
+        plt.legend()
+        plt.tight_layout()
+
+        # Save figure
+        plt.savefig(os.path.join(output_dir, f"feature_importance_comparison_{dataset_type}.png"), dpi=300)
+        plt.close()
+
+        # Plot changes in feature importance
+        changes = merged_fi.sort_values('importance_change', ascending=False).head(top_n)
+
+        plt.figure(figsize=(12, 8))
+        plt.bar(range(len(changes)), changes['importance_change'], align='center')
+        plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
+        plt.xticks(range(len(changes)), changes['feature'], rotation=90)
+        plt.xlabel('Features')
+        plt.ylabel('Change in Importance (Enhanced - Baseline)')
+        plt.title(f'Top Changes in Feature Importance - {dataset_type.upper()} Dataset')
+        plt.tight_layout()
+
+        # Save figure
+        plt.savefig(os.path.join(output_dir, f"feature_importance_changes_{dataset_type}.png"), dpi=300)
+        plt.close()
+
+        # Plot percentage changes
+        pct_changes = merged_fi.sort_values('importance_change_pct', ascending=False).head(top_n)
+
+        plt.figure(figsize=(12, 8))
+        plt.bar(range(len(pct_changes)), pct_changes['importance_change_pct'], align='center')
+        plt.axhline(y=0, color='r', linestyle='-', alpha=0.3)
+        plt.xticks(range(len(pct_changes)), pct_changes['feature'], rotation=90)
+        plt.xlabel('Features')
+        plt.ylabel('Percentage Change in Importance')
+        plt.title(f'Top Percentage Changes in Feature Importance - {dataset_type.upper()} Dataset')
+        plt.tight_layout()
+
+        # Save figure
+        plt.savefig(os.path.join(output_dir, f"feature_importance_changes_pct_{dataset_type}.png"), dpi=300)
+        plt.close()
+
+        # Plot new features in enhanced model
+        new_features = merged_fi[(merged_fi['importance_baseline'] == 0) & (merged_fi['importance_enhanced'] > 0)]
+        if len(new_features) > 0:
+            new_features = new_features.sort_values('importance_enhanced', ascending=False).head(min(top_n, len(new_features)))
+
+            plt.figure(figsize=(12, 8))
+            plt.bar(range(len(new_features)), new_features['importance_enhanced'], align='center')
+            plt.xticks(range(len(new_features)), new_features['feature'], rotation=90)
+            plt.xlabel('Features')
+            plt.ylabel('Importance')
+            plt.title(f'New Features in Enhanced Model - {dataset_type.upper()} Dataset')
+            plt.tight_layout()
+
+            # Save figure
+            plt.savefig(os.path.join(output_dir, f"new_features_{dataset_type}.png"), dpi=300)
+            plt.close()
+    except Exception as e:
+        logger.error(f"Error plotting feature importance comparison: {e}")
+
+
 def main():
     """
     Main function to run model comparison
     """
+    parser = argparse.ArgumentParser(description='Compare baseline and enhanced models')
+    parser.add_argument('--dataset', choices=['sepsis', 'bpi', 'all'], default='all', help='Dataset to compare')
+    parser.add_argument('--run-store', default='models/runs', help='Run store written by the trainers')
+    parser.add_argument('--baseline-run', default=None, help='Baseline run id (default: latest)')
+    parser.add_argument('--enhanced-run', default=None, help='Enhanced run id (default: latest)')
+    parser.add_argument('--history', action='store_true',
+                        help='Also compare every recorded run of the dataset (see --runs and --last)')
+    parser.add_argument('--runs', nargs='+', default=None, help='Run ids included in --history')
+    parser.add_argument('--last', type=int, default=None, help='Only the last N runs of each variant in --history')
+    parser.add_argument('--recompute', action='store_true',
+                        help='Load and score the saved baseline models when no metrics were recorded')
+    profiling.add_profile_arguments(parser)
+    plotting.add_plot_arguments(parser)
+    args = parser.parse_args()
+    plotting.configure_from_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
     # Define datasets to process
-    datasets = ['sepsis', 'bpi']
+    datasets = ['sepsis', 'bpi'] if args.dataset == 'all' else [args.dataset]
     
     # Compare models for each dataset
-    for dataset_type in datasets:
-        logger.info(f"Comparing models for dataset: {dataset_type}")
-        comparator = ModelComparator(
-            dataset_type=dataset_type,
-            baseline_dir=f'models/{dataset_type}',
-            enhanced_dir='models/enhanced',
-            output_dir=f'reports/comparison/{dataset_type}'
-        )
-        comparator.run_comparison()
+    with profiling.profile_from_args(args):
+        for dataset_type in datasets:
+            logger.info(f"Comparing models for dataset: {dataset_type}")
+            with span(f"compare:{dataset_type}"):
+                comparator = ModelComparator(
+                    dataset_type=dataset_type,
+                    baseline_dir=f'models/{dataset_type}',
+                    enhanced_dir='models/enhanced',
+                    output_dir=f'reports/comparison/{dataset_type}',
+                    run_store_dir=args.run_store,
+                    baseline_run=args.baseline_run,
+                    enhanced_run=args.enhanced_run,
+                    recompute=args.recompute
+                )
+                comparator.run_comparison()
+                if args.history:
+                    comparator.compare_runs(run_ids=args.runs, last=args.last)
+    plotting.wait()
 
 
 if __name__ == "__main__":
@@ -1,25 +1,41 @@
 import os
 import json
+import shutil
+import argparse
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import sklearn
 from sklearn.metrics import classification_report, accuracy_score
 import joblib
 
 from src.preprocessing.feature_extraction import FeatureExtractor
-from src.preprocessing.data_transformation import DataTransformer
+from src.preprocessing.data_transformation import DataTransformer, collapse_duplicate_rows, count_weighted_params
+from src.preprocessing.feature_store import FeatureMatrixStore
+from src.preprocessing.binning import default_binning_config
+from src.preprocessing.sequence_encoding import (default_ngram_config, prefix_ngram_features, combine_features,
+                                              NGRAM_ENCODER_FILE)
+from src.preprocessing.xes_reader import read_xes_columns
+from src.preprocessing.feature_registry import CASE_COMPLETE_FEATURES
 from src.models.decision_tree import ProcessDecisionTree
 from src.models.random_forest import ProcessRandomForest
-from src.models.ensemble import ModelEnsemble
-from src.pipelines.causality_tests import run_causality_tests, save_causality_report
+from src.models.ensemble import ModelEnsemble, accuracy_comparison_frame, draw_accuracy_comparison
+from src.models.run_store import RunStore, MODEL_LABELS, metrics_row
+from src.models.search import default_search_config, search_params, save_search_result
+from src.models.distillation import default_distillation_config, distill_forest
+from src.pipelines.causality_tests import run_causality_tests, save_causality_report, NGRAM_TEST_FILE
+from src.common.artifact_cache import get_cache
+from src.common.instrumentation import span, instrument
+from src.common import profiling
+from src.common import plotting
 
 class ModelTrainer:
-    def __init__(self, config=None):
+    def __init__(self, config=None, cache=None):
         """
         Initialize model trainer with configuration
         
         Args:
             config: Dictionary with training configuration
+            cache: Optional ArtifactCache used to skip unchanged extract/preprocess/train stages
         """
         self.config = config or {
             'dataset_path': 'dataset/Sepsis.xes',
@@ -28,6 +44,15 @@ class ModelTrainer:
             'test_size': 0.2,
             'random_state': 42,
             'balance_classes': True,
+            # Collapse identical training rows into unique rows weighted by their count
+            'deduplicate': False,
+            # Leave out the features counted over the whole case (see CASE_COMPLETE_FEATURES),
+            # so the models can score running cases
+            'prefix_features': False,
+            # Sparse n-gram counts of each prefix added to the model features (see src.preprocessing.sequence_encoding)
+            'ngrams': default_ngram_config(),
+            # uint8 quantile bin codes of the transformed features, shared by every model (see src.preprocessing.binning)
+            'binning': default_binning_config(),
             'run_causality_tests': True,  # Flag to run causality tests
             'models': {
                 'decision_tree': {
@@ -51,7 +76,11 @@ class ModelTrainer:
                     'enabled': True,
                     'voting': 'soft'
                 }
-            }
+            },
+            # Successive-halving hyperparameter search (see src.models.search)
+            'search': default_search_config(),
+            # Depth-bounded decision tree trained on the random forest's soft labels (see src.models.distillation)
+            'distillation': default_distillation_config()
         }
         
         # Create directories
@@ -65,30 +94,154 @@ class ModelTrainer:
         self.trained_models = {}
         self.ensemble = None
         self.results = {}
+        # Student tree distilled from the random forest, and its fidelity report
+        self.distilled = None
+        self.distillation_report = None
         self.X_train = None
         self.X_test = None
         self.y_train = None
         self.y_test = None
+        # Row counts of the collapsed training split and the collapsed test split (deduplicate mode)
+        self.train_weight = None
+        self.test_unique = None
+        # Matrices the models are fitted and evaluated on: the splits, followed by the
+        # sparse n-gram columns when n-gram features are enabled
+        self.X_train_model = None
+        self.X_test_model = None
+        self.model_feature_names = None
+        self.ngram_encoder = None
         self.feature_names = None
+        self.cache = get_cache(cache)
+        self.preprocess_key = None
         
-    def prepare_data(self, dataset_type=None):
-        """Prepare data for training"""
+    def _extract_features(self, dataset_type):
+        """Load the log and extract features (uncached)"""
         # Load the dataset
-        self.feature_extractor.load_log(self.config['dataset_path'])
+        with span('load') as s:
+            s.rows = len(self.feature_extractor.load_log(self.config['dataset_path']))
         
         # Extract features based on dataset type
-        X, y = self.feature_extractor.extract_features(dataset_type)
+        with span('extract') as s:
+            X, y = self.feature_extractor.extract_features(dataset_type)
+            s.rows = len(X)
+        return X, y
+    
+    def _preprocess(self, extract_key, dataset_type):
+        """Extract (or load cached) features and preprocess them (uncached)"""
+        X, y = self.cache.cached('extract', extract_key, lambda: self._extract_features(dataset_type))
+        if self.config.get('prefix_features', False):
+            X = X.drop(columns=[name for name in CASE_COMPLETE_FEATURES if name in X.columns])
         
         # Store original feature names (before any transformations)
-        self.feature_names = X.columns.tolist()
+        feature_names = X.columns.tolist()
         
         # Preprocess data
-        X_train, X_test, y_train, y_test = self.data_transformer.preprocess_data(
-            X, y, 
+        with span('preprocess', rows=len(X)):
+            X_train, X_test, y_train, y_test = self.data_transformer.preprocess_data(
+                X, y, 
+                test_size=self.config['test_size'],
+                random_state=self.config['random_state'],
+                balance_classes=self.config['balance_classes']
+            )
+        
+        # Bin edges come from the full training split; the (collapsed) splits are coded below
+        binning_config = self.config.get('binning', {})
+        if binning_config.get('enabled', False):
+            with span('bin', rows=len(X_train)):
+                self.data_transformer.fit_binning(X_train, max_bins=binning_config.get('max_bins', 255))
+        
+        # n-gram counts of every extracted row's prefix
+        matrix, prefix_ids = None, None
+        ngram_config = self.config.get('ngrams', {})
+        if ngram_config.get('enabled', False):
+            with span('ngrams') as s:
+                events, _ = read_xes_columns(self.config['dataset_path'], attributes=[])
+                matrix, encoder, prefix_ids = prefix_ngram_features(
+                    events, max_n=ngram_config.get('max_n', 3), min_count=ngram_config.get('min_count', 1)
+                )
+                s.rows = matrix.shape[0]
+            if matrix.shape[0] != len(X):
+                raise ValueError(f"n-gram rows ({matrix.shape[0]}) do not match the extracted rows ({len(X)})")
+            print(f"Encoded {matrix.shape[0]} prefixes into {matrix.shape[1]} n-gram columns ({matrix.nnz} non-zeros)")
+        
+        # Identical rows (shared variants, balancing copies) become one row weighted by its count.
+        # The split happens first, so train and test hold the same rows as without deduplication;
+        # the full test split is kept for the feature store and causality tests.
+        train_weight, test_unique = None, None
+        if self.config.get('deduplicate', False):
+            with span('deduplicate', rows=len(X_train)):
+                n_train = len(X_train)
+                X_train, y_train, train_weight = self._collapse(X_train, y_train, prefix_ids)
+                test_unique = self._collapse(X_test, y_test, prefix_ids)
+            print(f"Collapsed {n_train} training rows into {len(X_train)} unique rows "
+                  f"({n_train / max(len(X_train), 1):.1f}x), {len(X_test)} test rows into {len(test_unique[0])}")
+        
+        binned = None
+        if self.data_transformer.binner is not None:
+            binned = {'train': self.data_transformer.bin_features(X_train),
+                      'test': self.data_transformer.bin_features(X_test)}
+            if test_unique is not None:
+                binned['test_unique'] = self.data_transformer.bin_features(test_unique[0])
+        
+        # Split rows (also after balancing and deduplication) are indexed by their extracted row
+        ngrams = None
+        if matrix is not None:
+            ngrams = {'encoder': encoder, 'train': matrix[X_train.index.to_numpy()],
+                      'test': matrix[X_test.index.to_numpy()]}
+            if test_unique is not None:
+                ngrams['test_unique'] = matrix[test_unique[0].index.to_numpy()]
+        
+        return {
+            'splits': (X_train, X_test, y_train, y_test),
+            'train_weight': train_weight,
+            'test_unique': test_unique,
+            'binned': binned,
+            'ngrams': ngrams,
+            'feature_names': feature_names,
+            'data_transformer': self.data_transformer
+        }
+    
+    @staticmethod
+    def _collapse(X, y, prefix_ids=None):
+        """
+        collapse_duplicate_rows on a split; with n-gram features (prefix_ids per extracted row),
+        rows only collapse when their prefixes' n-gram counts match too
+        """
+        if prefix_ids is None:
+            return collapse_duplicate_rows(X, y)
+        X_unique, y_unique, counts = collapse_duplicate_rows(X.assign(__prefix__=prefix_ids[X.index.to_numpy()]), y)
+        return X_unique.drop(columns='__prefix__'), y_unique, counts
+    
+    def prepare_data(self, dataset_type=None):
+        """Prepare data for training"""
+        # Stage keys chain the log fingerprint, code versions and configuration
+        extract_key = self.cache.make_key(
+            'extract',
+            log=self.cache.fingerprint_file(self.config['dataset_path']) or self.config['dataset_path'],
+            extractor=FeatureExtractor.VERSION,
+            dataset_type=dataset_type
+        )
+        self.preprocess_key = self.cache.make_key(
+            'preprocess',
+            extract=extract_key,
+            transformer=DataTransformer.VERSION,
             test_size=self.config['test_size'],
             random_state=self.config['random_state'],
-            balance_classes=self.config['balance_classes']
+            balance_classes=self.config['balance_classes'],
+            deduplicate=self.config.get('deduplicate', False),
+            prefix_features=self.config.get('prefix_features', False),
+            ngrams=self.config.get('ngrams', {}),
+            binning=self.config.get('binning', {})
+        )
+        
+        prepared = self.cache.cached(
+            'preprocess', self.preprocess_key, lambda: self._preprocess(extract_key, dataset_type)
         )
+        X_train, X_test, y_train, y_test = prepared['splits']
+        self.feature_names = prepared['feature_names']
+        self.data_transformer = prepared['data_transformer']
+        self.train_weight = prepared.get('train_weight')
+        self.test_unique = prepared.get('test_unique')
         
         # Store the data
         self.X_train = X_train
@@ -96,35 +249,57 @@ class ModelTrainer:
         self.y_train = y_train
         self.y_test = y_test
         
+        # The models see the transformed features (or their bin codes), then the n-gram columns
+        self.X_train_model, self.X_test_model = X_train, X_test
+        self.model_feature_names = X_train.columns.tolist()
+        binned = prepared.get('binned')
+        if binned is not None:
+            self.X_train_model, self.X_test_model = binned['train'], binned['test']
+            if self.test_unique is not None:
+                self.test_unique = (binned['test_unique'],) + tuple(self.test_unique[1:])
+        self.ngram_encoder = None
+        ngrams = prepared.get('ngrams')
+        if ngrams is not None:
+            self.ngram_encoder = ngrams['encoder']
+            self.X_train_model = combine_features(self.X_train_model, ngrams['train'])
+            self.X_test_model = combine_features(self.X_test_model, ngrams['test'])
+            if self.test_unique is not None:
+                X_test_unique, y_test_unique, test_weight = self.test_unique
+                self.test_unique = (combine_features(X_test_unique, ngrams['test_unique']), y_test_unique, test_weight)
+            self.model_feature_names += self.ngram_encoder.feature_names()
+        
         print(f"Training data: {X_train.shape}, Test data: {X_test.shape}")
         print(f"Feature names length: {len(self.feature_names)}, X_train columns: {X_train.shape[1]}")
         
         return X_train, X_test, y_train, y_test
     
-    def train_models(self, X_train, y_train):
-        """Train all enabled models"""
+    def train_models(self, X_train, y_train, sample_weight=None, feature_names=None):
+        """
+        Train all enabled models (sample_weight: row counts of a collapsed training split,
+        feature_names: column names of a sparse X_train)
+        """
         models_config = self.config['models']
         
         # Get the actual feature names from X_train
-        actual_feature_names = X_train.columns.tolist()
+        actual_feature_names = feature_names or X_train.columns.tolist()
         
         # Train decision tree if enabled
         if models_config.get('decision_tree', {}).get('enabled', False):
             print("Training Decision Tree model...")
-            dt_params = models_config.get('decision_tree', {}).get('params', {})
-            dt = ProcessDecisionTree(**dt_params)
-            # Use the actual feature names from X_train
-            dt.train(X_train, y_train, feature_names=actual_feature_names)
-            self.trained_models['decision_tree'] = dt
+            dt_params = self._tuned_params('decision_tree', models_config.get('decision_tree', {}).get('params', {}),
+                                           X_train, y_train, sample_weight)
+            self.trained_models['decision_tree'] = self._fit_model(
+                'decision_tree', ProcessDecisionTree, dt_params, X_train, y_train, actual_feature_names, sample_weight
+            )
         
         # Train random forest if enabled
         if models_config.get('random_forest', {}).get('enabled', False):
             print("Training Random Forest model...")
-            rf_params = models_config.get('random_forest', {}).get('params', {})
-            rf = ProcessRandomForest(**rf_params)
-            # Use the actual feature names from X_train
-            rf.train(X_train, y_train, feature_names=actual_feature_names)
-            self.trained_models['random_forest'] = rf
+            rf_params = self._tuned_params('random_forest', models_config.get('random_forest', {}).get('params', {}),
+                                           X_train, y_train, sample_weight)
+            self.trained_models['random_forest'] = self._fit_model(
+                'random_forest', ProcessRandomForest, rf_params, X_train, y_train, actual_feature_names, sample_weight
+            )
         
         # Create ensemble if enabled and at least 2 models are trained
         if models_config.get('ensemble', {}).get('enabled', False) and len(self.trained_models) >= 2:
@@ -134,25 +309,112 @@ class ModelTrainer:
         
         return self.trained_models
     
-    def evaluate_models(self, X_test, y_test):
-        """Evaluate all trained models"""
+    def _tuned_params(self, model_name, params, X_train, y_train, sample_weight=None):
+        """
+        Model parameters, overridden by the best configuration of a successive-halving
+        search when the 'search' section of the config enables it for this model
+        """
+        search_config = self.config.get('search', {})
+        if not search_config.get('enabled', False) or model_name not in search_config.get('models', []):
+            return params
+        
+        print(f"Searching {model_name} hyperparameters...")
+        def search():
+            with span('search', rows=X_train.shape[0], model=model_name):
+                return search_params(model_name, X_train, y_train, search_config,
+                                     random_state=self.config.get('random_state', 42), counts=sample_weight)
+        
+        # Only searches on the prepared training split have a known content key
+        if self.preprocess_key is None or not self._is_prepared(X_train):
+            best_params, result = search()
+        else:
+            search_key = self.cache.make_key('search', preprocess=self.preprocess_key, model=model_name,
+                                             search=search_config)
+            best_params, result = self.cache.cached('search', search_key, search)
+        
+        path = save_search_result(result, os.path.join(self.config['model_dir'], 'search'))
+        print(f"Best {model_name} configuration and search trace saved to {path}")
+        return dict(params, **best_params)
+    
+    def _is_prepared(self, X_train):
+        """Whether X_train is the prepared training split (as is or with its n-gram columns)"""
+        return X_train is self.X_train or X_train is self.X_train_model
+    
+    def _fit_model(self, model_name, model_class, params, X_train, y_train, feature_names, sample_weight=None):
+        """Train a model, reusing a cached fit when the training data and parameters are unchanged"""
+        # Leaf sizes of a collapsed split count original rows, not unique ones
+        if sample_weight is not None:
+            params = count_weighted_params(params, sample_weight)
+        
+        def fit():
+            with span('train', rows=X_train.shape[0], model=model_name):
+                model = model_class(**params)
+                # Use the actual feature names from X_train
+                model.train(X_train, y_train, feature_names=feature_names, sample_weight=sample_weight)
+            return model
+        
+        # Only fits on the prepared training split have a known content key
+        if self.preprocess_key is None or not self._is_prepared(X_train):
+            return fit()
+        
+        train_key = self.cache.make_key('train', preprocess=self.preprocess_key, model=model_name, params=params,
+                                        code=model_class.VERSION, sklearn=sklearn.__version__)
+        return self.cache.cached('train', train_key, fit)
+    
+    def evaluate_models(self, X_test, y_test, sample_weight=None):
+        """Evaluate all trained models (sample_weight: row counts of a collapsed test split)"""
         results = {}
         
         # Evaluate individual models
         for model_name, model in self.trained_models.items():
             print(f"Evaluating {model_name}...")
-            model_results = model.evaluate(X_test, y_test)
+            with span('evaluate', rows=X_test.shape[0], model=model_name):
+                model_results = model.evaluate(X_test, y_test, sample_weight=sample_weight)
             results[model_name] = model_results
         
         # Evaluate ensemble if available
         if self.ensemble is not None:
             print("Evaluating Model Ensemble...")
-            ensemble_results = self.ensemble.evaluate(X_test, y_test)
+            with span('evaluate', rows=X_test.shape[0], model='ensemble'):
+                ensemble_results = self.ensemble.evaluate(X_test, y_test, sample_weight=sample_weight)
             results['ensemble'] = ensemble_results
         
         self.results = results
         return results
     
+    @instrument('distill')
+    def distill_models(self, y_train, y_test):
+        """
+        Distill the trained random forest into a depth-bounded decision tree when the
+        'distillation' section of the config enables it
+        """
+        distill_config = self.config.get('distillation', {})
+        forest = self.trained_models.get('random_forest')
+        if not distill_config.get('enabled', False) or forest is None:
+            return None
+        
+        print("Distilling Random Forest into a decision tree...")
+        if self.test_unique is not None:
+            X_test, y_test, test_weight = self.test_unique
+        else:
+            X_test, test_weight = self.X_test_model, None
+        self.distilled, self.distillation_report = distill_forest(
+            forest, self.X_train_model, y_train, X_test, y_test, config=distill_config,
+            feature_names=self.model_feature_names, train_weight=self.train_weight, test_weight=test_weight,
+            random_state=self.config.get('random_state', 42)
+        )
+        # Accuracy stored with the saved student
+        self.distilled.evaluate(X_test, y_test, sample_weight=test_weight)
+        
+        report = self.distillation_report
+        print(f"Distilled tree: depth {report['student']['depth']}, {report['student']['nodes']} nodes "
+              f"(forest: {report['teacher']['trees']} trees, {report['teacher']['nodes']} nodes)")
+        print(f"Test accuracy {report['test']['student_accuracy']:.4f} (forest {report['test']['teacher_accuracy']:.4f}), "
+              f"fidelity {report['test']['fidelity']:.4f}, "
+              f"{report['student_us_per_row']:.2f} vs {report['teacher_us_per_row']:.2f} us per row")
+        return self.distilled
+    
+    @instrument('save_models')
     def save_models(self):
         """Save all trained models"""
         model_dir = self.config['model_dir']
@@ -167,8 +429,40 @@ class ModelTrainer:
             ensemble_save_dir = os.path.join(model_dir, 'ensemble')
             self.ensemble.save_model(ensemble_save_dir)
         
+        # Save the distilled tree in the standard model format (and drop a stale one of an earlier run)
+        distilled_dir = os.path.join(model_dir, 'distilled_tree')
+        if self.distilled is not None:
+            self.distilled.save_model(distilled_dir)
+        elif os.path.isdir(distilled_dir):
+            shutil.rmtree(distilled_dir)
+        
         # Save data transformer for future predictions
         self.data_transformer.save_transformation_metadata(model_dir)
+        # Save the n-gram encoder (and drop a stale one of an earlier n-gram run)
+        ngram_encoder_path = os.path.join(model_dir, NGRAM_ENCODER_FILE)
+        if self.ngram_encoder is not None:
+            self.ngram_encoder.save(ngram_encoder_path)
+        elif os.path.exists(ngram_encoder_path):
+            os.remove(ngram_encoder_path)
+        
+        # Save the test split as a memory-mapped feature matrix for causality tests and comparisons
+        if self.X_test is not None and self.y_test is not None:
+            store = FeatureMatrixStore(os.path.join(model_dir, 'feature_store', 'test'))
+            key = self.preprocess_key if self.cache.enabled else None
+            if not store.is_current(key):
+                store.write(
+                    self.X_test, self.y_test,
+                    label_encoders=self.data_transformer.label_encoders,
+                    key=key,
+                    metadata={'dataset_path': self.config['dataset_path'], 'split': 'test'}
+                )
+            # n-gram columns of the test split, which models trained with them also need
+            ngram_path = os.path.join(model_dir, 'feature_store', NGRAM_TEST_FILE)
+            if self.ngram_encoder is not None:
+                from scipy import sparse
+                sparse.save_npz(ngram_path, self.X_test_model[:, self.X_test.shape[1]:])
+            elif os.path.exists(ngram_path):
+                os.remove(ngram_path)
         
         # Save feature extractor configuration
         extractor_config = {
@@ -182,6 +476,45 @@ class ModelTrainer:
         with open(os.path.join(model_dir, 'training_config.json'), 'w') as f:
             json.dump(self.config, f, indent=4)
     
+    @instrument('record_run')
+    def record_run(self, dataset_type=None):
+        """Record the evaluation metrics and feature importance of this run in the run store"""
+        rows, importance, params, oob = [], {}, {}, {}
+        for model_name, result in self.results.items():
+            if 'summary' not in result:
+                continue
+            label = MODEL_LABELS.get(model_name, model_name)
+            rows.append(metrics_row(label, result['summary']))
+            if result.get('feature_importance') is not None:
+                importance[label] = result['feature_importance']
+            # Parameters the estimator was trained with (a search may have tuned the configured ones)
+            model = self.trained_models.get(model_name)
+            estimator = getattr(model, 'model', None)
+            if hasattr(estimator, 'get_params'):
+                params[label] = estimator.get_params()
+            else:
+                params[label] = self.config['models'].get(model_name, {}).get('params', {})
+            # Forest size chosen by an adaptive (out-of-bag) fit
+            if getattr(model, 'oob_curve', None):
+                oob[label] = {'n_estimators': model.model.n_estimators, 'curve': model.oob_curve}
+        
+        if not rows:
+            return None
+        
+        dataset_type = dataset_type or os.path.basename(self.config['dataset_path']).split('.')[0]
+        store = RunStore(self.config.get('run_store_dir', 'models/runs'))
+        run_id = store.record(dataset_type, 'baseline', rows, importance=importance, params=params,
+                              metadata={'dataset_path': self.config['dataset_path'],
+                                        'model_dir': self.config['model_dir'], 'oob': oob,
+                                        'deduplicate': self.config.get('deduplicate', False),
+                                        'ngrams': self.config.get('ngrams', {}).get('enabled', False),
+                                        'binning': self.config.get('binning', {}).get('enabled', False),
+                                        'distillation': self.distillation_report and {
+                                            key: self.distillation_report['test'][key]
+                                            for key in ('student_accuracy', 'fidelity', 'soft_fidelity')}})
+        print(f"Recorded run {run_id} in {store.root_dir}")
+        return run_id
+    
     def save_reports(self):
         """Save evaluation reports and visualizations"""
         report_dir = self.config['report_dir']
@@ -205,29 +538,38 @@ class ModelTrainer:
                 summary['best_model'] = model_name
         
         # Save summary as JSON
-        with open(os.path.join(report_dir, 'evaluation_summary.json'), 'w') as f:
-            json.dump(summary, f, indent=4)
+        with span('report'):
+            with open(os.path.join(report_dir, 'evaluation_summary.json'), 'w') as f:
+                json.dump(summary, f, indent=4)
+            if self.distillation_report is not None:
+                with open(os.path.join(report_dir, 'distillation_report.json'), 'w') as f:
+                    json.dump(self.distillation_report, f, indent=4)
+        
+        with span('plot'):
+            self._save_report_plots(report_dir)
+    
+    def _save_report_plots(self, report_dir):
+        """Queue feature importance and model comparison plots on the background plot pool"""
+        if not plotting.plots_enabled():
+            return
         
         # Save feature importance plots for tree-based models
         for model_name, model in self.trained_models.items():
-            if hasattr(model, 'visualize_feature_importance'):
-                try:
-                    fig = model.visualize_feature_importance(top_n=20)
-                    fig.savefig(os.path.join(report_dir, f'{model_name}_feature_importance.png'))
-                    plt.close(fig)
-                except Exception as e:
-                    print(f"Warning: Could not create feature importance plot for {model_name}: {e}")
+            if hasattr(model, 'feature_importance_payload') and model.feature_importance is not None:
+                plotting.submit_figure(os.path.join(report_dir, f'{model_name}_feature_importance.png'),
+                                       plotting.draw_feature_importance, *model.feature_importance_payload(top_n=20))
         
-        # If we have an ensemble, save model comparison
-        if self.ensemble is not None and hasattr(self.ensemble, 'compare_models'):
+        # If we have an ensemble, save model comparison (the models are evaluated here, only drawing is deferred)
+        if self.ensemble is not None and hasattr(self.ensemble, 'evaluate_models'):
             if self.X_test is not None and self.y_test is not None:
                 try:
-                    _, comparison_fig = self.ensemble.compare_models(self.X_test, self.y_test)
-                    comparison_fig.savefig(os.path.join(report_dir, 'model_comparison.png'))
-                    plt.close(comparison_fig)
+                    results = self.ensemble.evaluate_models(self.X_test_model, self.y_test)
+                    plotting.submit_figure(os.path.join(report_dir, 'model_comparison.png'),
+                                           draw_accuracy_comparison, accuracy_comparison_frame(results))
                 except Exception as e:
                     print(f"Warning: Could not create model comparison plot: {e}")
     
+    @instrument('causality')
     def run_causality_analysis(self, dataset_type=None):
         """Run causality analysis and save reports"""
         if not self.config.get('run_causality_tests', False):
@@ -246,7 +588,8 @@ class ModelTrainer:
                 dataset_type=dataset_type, 
                 models_dir=self.config['model_dir'],
                 X_test=self.X_test, 
-                y_test=self.y_test
+                y_test=self.y_test,
+                X_model=self.X_test_model
             )
             
             # Save causality report
@@ -269,13 +612,21 @@ class ModelTrainer:
             X_train, X_test, y_train, y_test = self.prepare_data(dataset_type)
             
             print("Training models...")
-            self.train_models(X_train, y_train)
+            self.train_models(self.X_train_model, y_train, sample_weight=self.train_weight,
+                              feature_names=self.model_feature_names)
             
             print("Evaluating models...")
-            self.evaluate_models(X_test, y_test)
+            if self.test_unique is not None:
+                # Each unique test row is predicted once and counted as often as it occurs
+                X_test_unique, y_test_unique, test_weight = self.test_unique
+                self.evaluate_models(X_test_unique, y_test_unique, sample_weight=test_weight)
+            else:
+                self.evaluate_models(self.X_test_model, y_test)
+            self.distill_models(y_train, y_test)
             
             print("Saving models...")
             self.save_models()
+            self.record_run(dataset_type)
             
             print("Generating reports...")
             self.save_reports()
@@ -300,15 +651,24 @@ class ModelTrainer:
                 'models': list(self.trained_models.keys()) if self.trained_models else []
             }
 
-def train_sepsis_models():
-    """Train models for the Sepsis dataset"""
-    config = {
+def sepsis_training_config():
+    """Training configuration for the Sepsis dataset"""
+    return {
         'dataset_path': 'dataset/Sepsis.xes',
         'model_dir': 'models/sepsis',
         'report_dir': 'reports/sepsis',
         'test_size': 0.2,
         'random_state': 42,
         'balance_classes': True,
+        # Collapse identical training rows into unique rows weighted by their count
+        'deduplicate': False,
+        # Leave out the features counted over the whole case (see CASE_COMPLETE_FEATURES),
+        # so the models can score running cases
+        'prefix_features': False,
+        # Sparse n-gram counts of each prefix added to the model features (see src.preprocessing.sequence_encoding)
+        'ngrams': default_ngram_config(),
+        # uint8 quantile bin codes of the transformed features, shared by every model (see src.preprocessing.binning)
+        'binning': default_binning_config(),
         'run_causality_tests': True,  # Enable causality tests
         'models': {
             'decision_tree': {
@@ -332,14 +692,36 @@ def train_sepsis_models():
                 'enabled': True,
                 'voting': 'soft'
             }
-        }
+        },
+        # Successive-halving hyperparameter search (see src.models.search)
+        'search': default_search_config(),
+        # Depth-bounded decision tree trained on the random forest's soft labels (see src.models.distillation)
+        'distillation': default_distillation_config()
     }
-    
-    trainer = ModelTrainer(config)
+
+def train_sepsis_models(cache=None, search=False, deduplicate=False, ngrams=False, binning=False, distill=False,
+                        adaptive_forest=False, prefix_features=False):
+    """
+    Train models for the Sepsis dataset (search=True tunes them with successive halving first,
+    deduplicate=True trains on unique rows weighted by their count, ngrams=True adds the sparse
+    n-gram counts of each prefix to the features, binning=True trains on uint8 bin codes,
+    distill=True also distills the random forest into a depth-bounded decision tree,
+    adaptive_forest=True grows the random forest until its out-of-bag accuracy plateaus,
+    prefix_features=True leaves out the features counted over the whole case)
+    """
+    config = sepsis_training_config()
+    config['search']['enabled'] = search
+    config['deduplicate'] = deduplicate
+    config['ngrams']['enabled'] = ngrams
+    config['binning']['enabled'] = binning
+    config['distillation']['enabled'] = distill
+    config['models']['random_forest']['params']['adaptive'] = adaptive_forest
+    config['prefix_features'] = prefix_features
+    trainer = ModelTrainer(config, cache=cache)
     return trainer.run_pipeline(dataset_type='sepsis')
 
-def train_bpi_models():
-    """Train models for the BPI dataset"""
+def bpi_training_config():
+    """Training configuration for the first available BPI dataset file (None if there is none)"""
     # Check which BPI2020 files exist
     bpi_files = [
         'DomesticDeclarations.xes',
@@ -359,16 +741,24 @@ def train_bpi_models():
             break
     
     if not bpi_dataset_path:
-        print("No BPI dataset files found.")
-        return {"models": {}}
+        return None
     
-    config = {
+    return {
         'dataset_path': bpi_dataset_path,
         'model_dir': 'models/bpi',
         'report_dir': 'reports/bpi',
         'test_size': 0.2,
         'random_state': 42,
         'balance_classes': True,
+        # Collapse identical training rows into unique rows weighted by their count
+        'deduplicate': False,
+        # Leave out the features counted over the whole case (see CASE_COMPLETE_FEATURES),
+        # so the models can score running cases
+        'prefix_features': False,
+        # Sparse n-gram counts of each prefix added to the model features (see src.preprocessing.sequence_encoding)
+        'ngrams': default_ngram_config(),
+        # uint8 quantile bin codes of the transformed features, shared by every model (see src.preprocessing.binning)
+        'binning': default_binning_config(),
         'run_causality_tests': True,  # Enable causality tests
         'models': {
             'decision_tree': {
@@ -385,33 +775,91 @@ def train_bpi_models():
                     'n_estimators': 100,
                     'max_depth': None,
                     'min_samples_split': 2,
-                    'min_samples_leaf': 1
+                    'min_samples_leaf': 1,
+                    # Grow trees until the out-of-bag accuracy plateaus (n_estimators is then the upper bound)
+                    'adaptive': False
                 }
             },
             'ensemble': {
                 'enabled': True,
                 'voting': 'soft'
             }
-        }
+        },
+        # Successive-halving hyperparameter search (see src.models.search)
+        'search': default_search_config(),
+        # Depth-bounded decision tree trained on the random forest's soft labels (see src.models.distillation)
+        'distillation': default_distillation_config()
     }
+
+def train_bpi_models(cache=None, search=False, deduplicate=False, ngrams=False, binning=False, distill=False,
+                     adaptive_forest=False, prefix_features=False):
+    """
+    Train models for the BPI dataset (see train_sepsis_models for search, deduplicate, ngrams,
+    binning, distill, adaptive_forest and prefix_features)
+    """
+    config = bpi_training_config()
+    if config is None:
+        print("No BPI dataset files found.")
+        return {"models": {}}
+    config['search']['enabled'] = search
+    config['deduplicate'] = deduplicate
+    config['ngrams']['enabled'] = ngrams
+    config['binning']['enabled'] = binning
+    config['distillation']['enabled'] = distill
+    config['models']['random_forest']['params']['adaptive'] = adaptive_forest
+    config['prefix_features'] = prefix_features
     
-    trainer = ModelTrainer(config)
+    trainer = ModelTrainer(config, cache=cache)
     return trainer.run_pipeline(dataset_type='bpi')
 
-if __name__ == "__main__":
-    # Train Sepsis models
-    sepsis_results = train_sepsis_models()
+def main():
+    """Train the baseline models of every available dataset"""
+    parser = argparse.ArgumentParser(description='Train baseline prediction models')
+    parser.add_argument('--search', action='store_true',
+                        help='Tune the models with a successive-halving hyperparameter search')
+    parser.add_argument('--deduplicate', action='store_true',
+                        help='Train on unique feature rows weighted by how often they occur')
+    parser.add_argument('--ngrams', action='store_true',
+                        help='Add sparse activity n-gram counts of each prefix to the features')
+    parser.add_argument('--bin', action='store_true',
+                        help='Train on uint8 quantile bin codes of the features')
+    parser.add_argument('--distill', action='store_true',
+                        help='Distill the random forest into a depth-bounded decision tree')
+    parser.add_argument('--adaptive-forest', action='store_true',
+                        help='Grow the random forest until its out-of-bag accuracy plateaus')
+    parser.add_argument('--prefix-features', action='store_true',
+                        help='Leave out features counted over the whole case, so the models can score running cases')
+    profiling.add_profile_arguments(parser)
+    plotting.add_plot_arguments(parser)
+    args = parser.parse_args()
+    plotting.configure_from_args(args)
     
-    # Train BPI models if any of the BPI dataset files exist
-    bpi_files_exist = any(os.path.exists(os.path.join('dataset', file)) for file in [
-        'DomesticDeclarations.xes',
-        'InternationalDeclarations.xes',
-        'PermitLog.xes',
-        'PrepaidTravelCost.xes',
-        'RequestForPayment.xes'
-    ])
-    
-    if bpi_files_exist:
-        bpi_results = train_bpi_models()
-    else:
-        print("BPI dataset not found. Skipping BPI model training.") 
\ No newline at end of file
+    with profiling.profile_from_args(args):
+        # Train Sepsis models
+        with span('train:sepsis'):
+            sepsis_results = train_sepsis_models(search=args.search, deduplicate=args.deduplicate, ngrams=args.ngrams,
+                                                  binning=args.bin, distill=args.distill,
+                                                  adaptive_forest=args.adaptive_forest,
+                                                  prefix_features=args.prefix_features)
+        
+        # Train BPI models if any of the BPI dataset files exist
+        bpi_files_exist = any(os.path.exists(os.path.join('dataset', file)) for file in [
+            'DomesticDeclarations.xes',
+            'InternationalDeclarations.xes',
+            'PermitLog.xes',
+            'PrepaidTravelCost.xes',
+            'RequestForPayment.xes'
+        ])
+        
+        if bpi_files_exist:
+            with span('train:bpi'):
+                bpi_results = train_bpi_models(search=args.search, deduplicate=args.deduplicate, ngrams=args.ngrams,
+                                               binning=args.bin, distill=args.distill,
+                                               adaptive_forest=args.adaptive_forest,
+                                               prefix_features=args.prefix_features)
+        else:
+            print("BPI dataset not found. Skipping BPI model training.")
+    plotting.wait()
+
+if __name__ == "__main__":
+    main()
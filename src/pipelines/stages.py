@@ -0,0 +1,248 @@
+import os
+
+# Pipeline modules pull in pm4py, sklearn, scipy and matplotlib, so every stage imports
+# only what it needs when it runs; building the graph and --help stay fast.
+
+# Enhanced BPI models are trained on these files, in this order
+ENHANCED_BPI_FILES = [
+    'DomesticDeclarations.xes',
+    'InternationalDeclarations.xes'
+]
+
+# Log used to rebuild the test split for causality tests
+CAUSALITY_LOGS = {
+    'sepsis': 'dataset/Sepsis.xes',
+    'bpi': 'dataset/DomesticDeclarations.xes'
+}
+
+
+def estimate_memory_mb(log_path, factor=3.0):
+    """Rough peak memory estimate of a stage working on an XES log"""
+    if log_path is None or not os.path.exists(log_path):
+        return 0
+    return os.path.getsize(log_path) / (1024 * 1024) * factor
+
+
+def run_analyze(log_directory='dataset', result_directory=os.path.join('src', 'result', 'dataset_analysis'), n_jobs=None):
+    """Process mining analysis stage (log files are analyzed in n_jobs processes, all CPUs by default)"""
+    from src.analysis.process_mining import analyze_event_logs
+    print("Running Process Mining Analysis...")
+    analyze_event_logs(log_directory, result_directory, n_jobs=n_jobs)
+
+
+def baseline_config(dataset_type, deduplicate=False, ngrams=False, binning=False, prefix_features=False):
+    """Baseline training configuration, or None if the dataset is not available"""
+    from src.pipelines.model_trainer import sepsis_training_config, bpi_training_config
+    if dataset_type == 'sepsis':
+        config = sepsis_training_config() if os.path.exists('dataset/Sepsis.xes') else None
+    else:
+        config = bpi_training_config()
+    if config is not None:
+        config['deduplicate'] = deduplicate
+        config['ngrams']['enabled'] = ngrams
+        config['binning']['enabled'] = binning
+        config['prefix_features'] = prefix_features
+    return config
+
+
+def run_prepare(dataset_type, cache, deduplicate=False, ngrams=False, binning=False, prefix_features=False):
+    """Load, extract and preprocess the baseline data into the artifact cache"""
+    from src.pipelines.model_trainer import ModelTrainer
+    config = baseline_config(dataset_type, deduplicate, ngrams, binning, prefix_features)
+    if config is None:
+        print(f"{dataset_type} dataset not found. Skipping data preparation.")
+        return
+    ModelTrainer(config, cache=cache).prepare_data(dataset_type)
+
+
+def _raise_on_error(results, dataset_name):
+    """The training pipeline reports failures in its result; fail the task so its dependents are skipped"""
+    if 'error' in results:
+        raise RuntimeError(f"Training {dataset_name} models failed: {results['error']}")
+
+
+def run_train(dataset_type, cache, search=False, deduplicate=False, ngrams=False, binning=False, distill=False,
+              adaptive_forest=False, prefix_features=False):
+    """
+    Baseline model training stage (search=True tunes the models with successive halving,
+    deduplicate=True trains on unique rows weighted by their count, ngrams=True adds the
+    sparse n-gram counts of each prefix to the features, binning=True trains on uint8 bin codes,
+    distill=True distills the random forest into a depth-bounded decision tree,
+    adaptive_forest=True grows the random forest until its out-of-bag accuracy plateaus,
+    prefix_features=True leaves out the features counted over the whole case)
+    """
+    from src.pipelines.model_trainer import train_sepsis_models, train_bpi_models, bpi_training_config
+    if dataset_type == 'sepsis':
+        if os.path.exists('dataset/Sepsis.xes'):
+            print("\n====== Training Sepsis Models ======")
+            sepsis_results = train_sepsis_models(cache=cache, search=search, deduplicate=deduplicate, ngrams=ngrams,
+                                                  binning=binning, distill=distill, adaptive_forest=adaptive_forest,
+                                                  prefix_features=prefix_features)
+            _raise_on_error(sepsis_results, 'Sepsis')
+            print(f"Trained {len(sepsis_results['models'])} models for Sepsis dataset")
+        else:
+            print("Sepsis dataset not found. Skipping Sepsis model training.")
+    else:
+        if bpi_training_config() is not None:
+            print("\n====== Training BPI Models ======")
+            bpi_results = train_bpi_models(cache=cache, search=search, deduplicate=deduplicate, ngrams=ngrams,
+                                               binning=binning, distill=distill, adaptive_forest=adaptive_forest,
+                                               prefix_features=prefix_features)
+            _raise_on_error(bpi_results, 'BPI')
+            print(f"Trained {len(bpi_results['models'])} models for BPI dataset")
+        else:
+            print("BPI dataset not found. Skipping BPI model training.")
+
+
+def enhanced_trainer(log_path, dataset_type, cache, search=False, deduplicate=False):
+    from src.pipelines.train_enhanced_models import EnhancedModelTrainer
+    from src.models.search import default_search_config
+    return EnhancedModelTrainer(
+        log_path=log_path,
+        dataset_type=dataset_type,
+        baseline_dir=f'models/{dataset_type}',
+        output_dir='models/enhanced',
+        cache=cache,
+        search=dict(default_search_config(), enabled=True) if search else None,
+        deduplicate=deduplicate
+    )
+
+
+def run_prepare_enhanced(log_path, dataset_type, cache, deduplicate=False):
+    """Extract enhanced features and preprocess them into the artifact cache"""
+    if not os.path.exists(log_path):
+        print(f"Dataset file {log_path} not found. Skipping.")
+        return
+    enhanced_trainer(log_path, dataset_type, cache, deduplicate=deduplicate).prepare_data()
+
+
+def run_train_enhanced(log_path, dataset_type, cache, search=False, deduplicate=False):
+    """Enhanced model training stage for one log file"""
+    if not os.path.exists(log_path):
+        print(f"Dataset file {log_path} not found. Skipping enhanced {dataset_type} model training.")
+        return
+    print(f"\n====== Training Enhanced {dataset_type.upper()} Models ({os.path.basename(log_path)}) ======")
+    enhanced_trainer(log_path, dataset_type, cache, search=search, deduplicate=deduplicate).train_models()
+    print(f"Trained enhanced models for {dataset_type} dataset ({os.path.basename(log_path)})")
+
+
+def run_compare(dataset_type):
+    """Baseline vs enhanced comparison stage"""
+    from src.pipelines.compare_models import ModelComparator
+    print(f"\n====== Comparing {dataset_type.upper()} Models ======")
+    comparator = ModelComparator(
+        dataset_type=dataset_type,
+        baseline_dir=f'models/{dataset_type}',
+        enhanced_dir='models/enhanced',
+        output_dir=f'reports/comparison/{dataset_type}'
+    )
+    comparator.run_comparison()
+    print(f"Completed {dataset_type.upper()} models comparison")
+
+
+def run_causality(dataset_type, cache, deduplicate=False):
+    """Causality hypothesis testing stage"""
+    from src.models.artifact import load_model, model_exists
+    from src.pipelines.causality_tests import CausalityTester
+    print(f"\n====== Running {dataset_type.upper()} Causality Tests ======")
+    # Load enhanced models and test data
+    enhanced_dt_path = os.path.join('models/enhanced', f"enhanced_dt_{dataset_type}.pkl")
+
+    if not model_exists(enhanced_dt_path):
+        print(f"Enhanced {dataset_type.upper()} model not found at {enhanced_dt_path}. Skipping causality tests.")
+        return
+
+    enhanced_dt = load_model(enhanced_dt_path)
+
+    # Test data is memory-mapped from the feature store (rebuilt only if its inputs changed)
+    trainer = enhanced_trainer(CAUSALITY_LOGS[dataset_type], dataset_type, cache, deduplicate=deduplicate)
+    X_test, y_test, feature_names = trainer.open_test_store()
+
+    # Run causality tester
+    causality_tester = CausalityTester(
+        models={'enhanced_dt': enhanced_dt},
+        feature_names=feature_names,
+        X_test=X_test,
+        y_test=y_test,
+        dataset_type=dataset_type,
+        baseline_dir=f'models/{dataset_type}',
+        output_dir=f'results/causality/{dataset_type}'
+    )
+
+    causality_tester.run_tests()
+    print(f"Completed {dataset_type.upper()} causality tests. Results saved to results/causality/{dataset_type}")
+
+
+def build_task_graph(args, cache, state_file=None):
+    """
+    Build the stage graph for the requested stages and datasets.
+
+    Dependencies: prepare -> train -> train_enhanced -> compare/causality.
+    Independent datasets have no edges between them and run concurrently.
+    Data preparation is a separate task only when the cache can carry its output.
+    """
+    from src.pipelines.task_graph import TaskGraph
+
+    graph = TaskGraph(state_file=state_file)
+    datasets = ['sepsis', 'bpi'] if args.dataset == 'all' else [args.dataset]
+    use_prepare_tasks = cache.enabled
+    search = getattr(args, 'search', False)
+    deduplicate = getattr(args, 'deduplicate', False)
+    ngrams = getattr(args, 'ngrams', False)
+    binning = getattr(args, 'bin', False)
+    distill = getattr(args, 'distill', False)
+    adaptive_forest = getattr(args, 'adaptive_forest', False)
+    prefix_features = getattr(args, 'prefix_features', False)
+
+    if args.analyze:
+        # The analysis pool shares the --jobs budget instead of taking every CPU
+        graph.add_task('analyze', run_analyze, kwargs={'n_jobs': getattr(args, 'jobs', 1)},
+                       memory_mb=sum(estimate_memory_mb(os.path.join('dataset', f))
+                                     for f in (os.listdir('dataset') if os.path.isdir('dataset') else [])))
+
+    for dataset_type in datasets:
+        if args.train:
+            config = baseline_config(dataset_type, deduplicate, ngrams, binning, prefix_features)
+            memory = estimate_memory_mb(config['dataset_path']) if config else 0
+            train_deps = []
+            if use_prepare_tasks:
+                graph.add_task(f'prepare:{dataset_type}', run_prepare,
+                               args=(dataset_type, cache, deduplicate, ngrams, binning, prefix_features),
+                               memory_mb=memory)
+                train_deps.append(f'prepare:{dataset_type}')
+            graph.add_task(f'train:{dataset_type}', run_train,
+                           args=(dataset_type, cache, search, deduplicate, ngrams, binning, distill,
+                                 adaptive_forest, prefix_features),
+                           deps=train_deps, memory_mb=memory)
+
+        enhanced_tasks = []
+        if args.train_enhanced:
+            log_paths = (['dataset/Sepsis.xes'] if dataset_type == 'sepsis'
+                         else [os.path.join('dataset', f) for f in ENHANCED_BPI_FILES])
+            for log_path in log_paths:
+                log_name = os.path.splitext(os.path.basename(log_path))[0]
+                memory = estimate_memory_mb(log_path)
+                # Enhanced features are selected with the baseline importance written by training
+                deps = [f'train:{dataset_type}']
+                if use_prepare_tasks:
+                    prepare_name = f'prepare_enhanced:{dataset_type}:{log_name}'
+                    graph.add_task(prepare_name, run_prepare_enhanced, args=(log_path, dataset_type, cache, deduplicate),
+                                   deps=[f'train:{dataset_type}'], memory_mb=memory)
+                    deps.append(prepare_name)
+                # Files of the same dataset write the same enhanced model files, so their final
+                # training steps keep the original order (the heavy preparation still overlaps)
+                deps.extend(enhanced_tasks[-1:])
+                task_name = f'train_enhanced:{dataset_type}:{log_name}'
+                graph.add_task(task_name, run_train_enhanced, args=(log_path, dataset_type, cache, search, deduplicate),
+                               deps=deps, memory_mb=memory)
+                enhanced_tasks.append(task_name)
+
+        if args.compare:
+            graph.add_task(f'compare:{dataset_type}', run_compare, args=(dataset_type,),
+                           deps=[f'train:{dataset_type}'] + enhanced_tasks)
+
+        if args.causality:
+            graph.add_task(f'causality:{dataset_type}', run_causality, args=(dataset_type, cache, deduplicate),
+                           deps=enhanced_tasks, memory_mb=estimate_memory_mb(CAUSALITY_LOGS[dataset_type]))
+
+    return graph
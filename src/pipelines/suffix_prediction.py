@@ -0,0 +1,309 @@
+import os
+import re
+import json
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+
+from src.preprocessing import feature_registry
+from src.preprocessing.feature_registry import FeatureContext, CASE, ACTIVITY, TIMESTAMP
+from src.preprocessing.sequence_encoding import encode_prefixes
+from src.preprocessing.xes_reader import read_xes_columns, iter_xes_chunks
+from src.pipelines.batch_scoring import BatchScorer, ParquetSink, warn_case_complete
+from src.common.instrumentation import span
+
+logger = logging.getLogger("suffix_prediction")
+
+# Floor of the probabilities whose logarithms rank the beams
+MIN_PROBABILITY = 1e-12
+
+
+def dfg_statistics(events):
+    """
+    Termination probability and mean time to each activity, from a reference log
+
+    Returns:
+        (p_end, gaps): dicts of activity -> share of its occurrences that end a case
+        (the DFG's end activities over the activity occurrences), and activity ->
+        mean seconds since the previous event of the case
+    """
+    # Imported here: the process mining module loads pm4py
+    from src.analysis.process_mining import compute_directly_follows
+
+    ctx = FeatureContext(events)
+    stats = compute_directly_follows(ctx.events)
+    occurrences = stats['activities_occurrences']
+    p_end = {activity: count / occurrences[activity] for activity, count in stats['end_activities'].items()}
+
+    gap = ctx.get('time_since_last_event')[~ctx.get('_is_first')]
+    gaps = gap.groupby(ctx.column(ACTIVITY)[gap.index]).mean().to_dict()
+    gaps['__default__'] = float(gap.mean()) if len(gap) else 0.0
+    return p_end, gaps
+
+
+class SuffixPredictor:
+    def __init__(self, model_dir, model_name='random_forest', beam_width=3, max_steps=20, reference_log=None,
+                 cache=None):
+        """
+        Beam search over the remaining activities of running cases
+
+        Every beam holds the raw feature row of its prefix and moves it forward one
+        predicted event at a time: positions, the previous-event window, activity
+        counts and n-gram counts are updated, times advance by the mean time to the
+        predicted activity, and the other attributes keep the values of the last
+        observed event. Each step scores the live beams of all cases with one
+        predict_proba call. A beam ends with the probability that its last activity
+        ends a case in the reference log's DFG, and every case keeps its beam_width
+        most likely (ended or live) suffixes.
+
+        Args:
+            model_dir: Directory of the trained models and transformer metadata
+            model_name: Model subdirectory ('decision_tree' or 'random_forest')
+            beam_width: Suffixes kept per case
+            max_steps: Longest suffix; beams still live after it are returned incomplete
+            reference_log: Log of the end activities and activity times (default: the
+                training log recorded in the model directory)
+            cache: 'prediction_cache' configuration of the scorer, or None
+        """
+        self.scorer = BatchScorer(model_dir, model_name=model_name, top_k=1, prefixes='last', cache=cache)
+        self.beam_width = beam_width
+        self.max_steps = max_steps
+        if reference_log is None:
+            with open(os.path.join(model_dir, 'extractor_config.json'), 'r') as f:
+                reference_log = json.load(f)['dataset_path']
+        reference, _ = read_xes_columns(reference_log, attributes=[])
+        self.p_end, self.gaps = dfg_statistics(reference)
+
+    def _initial_beams(self, events):
+        """Raw features and search state of the current prefix of every case"""
+        scorer = self.scorer
+        ctx = FeatureContext(scorer.with_attributes(events))
+        X, _ = feature_registry.compute_features(ctx, scorer.profile, scorer.feature_names, prefixes='last')
+        last = feature_registry.prefix_rows(ctx, 'last')
+        activities = ctx.column(ACTIVITY)
+
+        # Activity counts of each prefix, over the classes and the activities seen in the prefixes
+        vocabulary = list(pd.unique(pd.Series(list(scorer.classes) + list(activities.dropna()), dtype=object)))
+        case_codes = pd.factorize(ctx.column(CASE))[0]
+        activity_codes = pd.Categorical(activities.to_numpy(dtype=object), categories=vocabulary).codes
+        counts = np.zeros((last.sum(), len(vocabulary)), dtype=np.int32)
+        known = activity_codes >= 0
+        np.add.at(counts, (case_codes[known], activity_codes[known]), 1)
+
+        state = {
+            'case': np.arange(last.sum()),
+            'position': ctx.get('event_position')[last].to_numpy(dtype=np.int64),
+            'timestamp': ctx.column(TIMESTAMP)[last].to_numpy(dtype='datetime64[ns]'),
+            'last': activities[last].to_numpy(dtype=object),
+            'counts': counts,
+            'logp': np.zeros(last.sum()),
+            'suffix': [()] * int(last.sum())
+        }
+        encoder = scorer.ngram_encoder
+        if encoder is not None:
+            state['ngrams'] = encode_prefixes(encoder, ctx, 'last')
+            lags = [ctx.by_case(activities).shift(lag)[last] for lag in range(encoder.max_n - 2, -1, -1)]
+            history = np.column_stack(lags) if lags else np.zeros((last.sum(), 0))
+            state['history'] = np.where(pd.isna(history), None, history).astype(object)
+        return ctx.column(CASE)[last].to_numpy(), X, state, vocabulary
+
+    def _roll_forward(self, X, state, parents, activities, vocabulary):
+        """Raw features and state of beams extended from parent beams by one activity each"""
+        parent_X = X.iloc[parents].reset_index(drop=True)
+        child = parent_X.copy()
+        activities = np.asarray(activities, dtype=object)
+        n = len(parents)
+
+        gaps = np.array([self.gaps.get(activity, self.gaps['__default__']) for activity in activities])
+        timestamps = state['timestamp'][parents] + (gaps * 1e9).astype('timedelta64[ns]')
+        positions = state['position'][parents] + 1
+        codes = pd.Categorical(activities, categories=vocabulary).codes
+        counts = state['counts'][parents].copy()
+        counts[np.arange(n)[codes >= 0], codes[codes >= 0]] += 1
+        occurrences = np.where(codes >= 0, counts[np.arange(n), np.maximum(codes, 0)], 1).astype(np.int64)
+
+        hours = pd.DatetimeIndex(timestamps)
+        for name, feature in self.scorer.profile.items():
+            if feature in ('current_event',):
+                child[name] = activities
+            elif feature == 'event_position':
+                child[name] = positions
+            elif feature == 'trace_length':
+                child[name] = np.maximum(parent_X[name].to_numpy(), positions)
+            elif feature == 'time_since_start':
+                child[name] = parent_X[name].to_numpy() + gaps
+            elif feature == 'time_since_last_event':
+                child[name] = gaps
+            elif feature == 'time_of_day':
+                child[name] = hours.hour.to_numpy(dtype=np.int64)
+            elif feature == 'weekend':
+                child[name] = (hours.weekday >= 5).astype(np.int64)
+            elif feature == 'unique_activities':
+                child[name] = (counts > 0).sum(axis=1).astype(np.int64)
+            elif feature in ('repeated_activities', 'trace_repeated_activities'):
+                child[name] = occurrences
+            elif feature is not None and re.fullmatch(r'prev_event_[1-5]', feature):
+                # The window moves one slot: prev_event_5 is the new event
+                slot = int(feature[-1])
+                newer = f'prev_event_{slot + 1}'
+                child[name] = activities if slot == feature_registry.WINDOW else parent_X[newer].to_numpy()
+
+        new_state = {
+            'case': state['case'][parents],
+            'position': positions,
+            'timestamp': timestamps,
+            'last': activities,
+            'counts': counts
+        }
+        encoder = self.scorer.ngram_encoder
+        if encoder is not None:
+            history = state['history'][parents]
+            new_state['ngrams'] = encoder.extend(state['ngrams'][parents], history, activities)
+            new_state['history'] = np.column_stack([history[:, 1:], activities]) if history.shape[1] else history
+        return child, new_state
+
+    def predict(self, events):
+        """
+        Most likely suffixes of every case of an event frame of running cases
+
+        Returns:
+            DataFrame with case_id, rank, suffix (list of activities), length,
+            probability and complete (False when max_steps cut the suffix) per
+            case and rank, ordered by case and rank
+        """
+        self.scorer.check_version()
+        columns = ['case_id', 'rank', 'suffix', 'length', 'probability', 'complete']
+        if len(events) == 0:
+            return pd.DataFrame(columns=columns)
+        case_ids, X, state, vocabulary = self._initial_beams(events)
+        classes = self.scorer.classes
+        width = self.beam_width
+        p_end_of = np.vectorize(lambda activity: self.p_end.get(activity, 0.0), otypes=[float])
+
+        # Ended beams as (case, log probability, suffix, complete)
+        done_case, done_logp, done_suffix, done_complete = np.zeros(0, dtype=np.int64), np.zeros(0), [], []
+        for step in range(self.max_steps + 1):
+            n_live = len(state['case'])
+            if n_live == 0:
+                break
+            p_end = p_end_of(state['last']) if n_live else np.zeros(0)
+            end_logp = state['logp'] + np.log(np.maximum(p_end, MIN_PROBABILITY))
+
+            if step < self.max_steps:
+                with span('suffix:predict', rows=n_live):
+                    proba = self.scorer.predict_proba(self.scorer.model_input(X, state.get('ngrams')))
+                # Best continuations of each beam: the next activity, given the case goes on
+                k = min(width, len(classes))
+                top = np.argsort(-proba, axis=1, kind='stable')[:, :k]
+                next_p = np.take_along_axis(proba, top, axis=1) * (1 - p_end)[:, np.newaxis]
+                cont_logp = (state['logp'][:, np.newaxis] + np.log(np.maximum(next_p, MIN_PROBABILITY))).ravel()
+                cont_parent = np.repeat(np.arange(n_live), k)
+                cont_class = top.ravel()
+                cont_possible = next_p.ravel() > 0
+            else:
+                cont_logp, cont_parent, cont_class = np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+                cont_possible = np.zeros(0, dtype=bool)
+
+            # Candidates: kept ended beams, beams ending now, and continuations
+            kind = np.r_[np.zeros(len(done_case), dtype=np.int8), np.ones(n_live, dtype=np.int8),
+                         np.full(len(cont_logp), 2, dtype=np.int8)]
+            source = np.r_[np.arange(len(done_case)), np.arange(n_live), np.arange(len(cont_logp))]
+            case = np.r_[done_case, state['case'], state['case'][cont_parent]]
+            logp = np.r_[done_logp, end_logp, cont_logp]
+            # Endings and continuations only compete if they are possible at all
+            possible = np.r_[np.ones(len(done_case), dtype=bool), p_end > 0, cont_possible]
+            if step == self.max_steps:
+                # Out of steps: live beams are kept as they are, flagged incomplete
+                possible[len(done_case):len(done_case) + n_live] = True
+                logp[len(done_case):len(done_case) + n_live] = state['logp']
+            kind, source, case, logp = kind[possible], source[possible], case[possible], logp[possible]
+
+            order = np.lexsort((-logp, case))
+            starts = np.r_[True, case[order][1:] != case[order][:-1]]
+            group_start = np.maximum.accumulate(np.where(starts, np.arange(len(order)), 0))
+            keep = order[np.arange(len(order)) - group_start < width]
+            kind, source, case, logp = kind[keep], source[keep], case[keep], logp[keep]
+
+            kept = kind == 0
+            ending = kind == 1
+            new_suffix = [done_suffix[i] for i in source[kept]] + [state['suffix'][i] for i in source[ending]]
+            new_complete = [done_complete[i] for i in source[kept]] + [step < self.max_steps] * int(ending.sum())
+            done_case = np.r_[case[kept], case[ending]]
+            done_logp = np.r_[logp[kept], logp[ending]]
+            done_suffix, done_complete = new_suffix, new_complete
+
+            continuing = kind == 2
+            parents = cont_parent[source[continuing]]
+            activities = classes[cont_class[source[continuing]]]
+            X, new_state = self._roll_forward(X, state, parents, activities, vocabulary)
+            new_state['logp'] = logp[continuing]
+            new_state['suffix'] = [state['suffix'][p] + (a,) for p, a in zip(parents, activities)]
+            state = new_state
+
+        order = np.lexsort((-done_logp, done_case))
+        case = done_case[order]
+        starts = np.r_[True, case[1:] != case[:-1]] if len(case) else np.zeros(0, dtype=bool)
+        rank = np.arange(len(case)) - np.maximum.accumulate(np.where(starts, np.arange(len(case)), 0)) + 1
+        return pd.DataFrame({
+            'case_id': case_ids[case].astype(str),
+            'rank': rank.astype(np.int64),
+            'suffix': [list(done_suffix[i]) for i in order],
+            'length': np.array([len(done_suffix[i]) for i in order], dtype=np.int64),
+            'probability': np.exp(done_logp[order]),
+            'complete': np.array([done_complete[i] for i in order], dtype=bool)
+        }, columns=columns)
+
+
+def predict_log_suffixes(log_path, model_dir, output_path, model_name='random_forest', beam_width=3, max_steps=20,
+                         chunk_cases=1000, reference_log=None):
+    """
+    Predict the suffixes of every case of an XES log in chunks and stream them to Parquet
+
+    Returns:
+        Dict with the number of cases and suffix rows written
+    """
+    predictor = SuffixPredictor(model_dir, model_name=model_name, beam_width=beam_width, max_steps=max_steps,
+                                reference_log=reference_log)
+    sink = ParquetSink(output_path, metadata=warn_case_complete(predictor.scorer))
+    stats = {'cases': 0, 'rows': 0}
+    try:
+        with span('predict_log_suffixes'):
+            for events in iter_xes_chunks(log_path, attributes=predictor.scorer.attributes, chunk_cases=chunk_cases):
+                suffixes = predictor.predict(events)
+                stats['cases'] += suffixes['case_id'].nunique()
+                sink.write(suffixes)
+    finally:
+        sink.close()
+    stats['rows'] = sink.rows
+    logger.info(f"Predicted {stats['rows']} suffixes of {stats['cases']} cases into {output_path}")
+    return stats
+
+
+def main():
+    """Predict the remaining activities of the cases of an event log"""
+    parser = argparse.ArgumentParser(description='Beam-search suffix prediction for running cases')
+    parser.add_argument('log', help='XES log of the running cases')
+    parser.add_argument('--model-dir', default=os.path.join('models', 'sepsis'),
+                        help='Directory of the trained models and transformer metadata')
+    parser.add_argument('--model', default='random_forest',
+                        choices=['decision_tree', 'random_forest', 'distilled_tree'],
+                        help='Model to predict with')
+    parser.add_argument('--output', default=None,
+                        help='Parquet file to write (default: results/suffixes/<log name>.parquet)')
+    parser.add_argument('--beam-width', type=int, default=3, help='Suffixes kept per case')
+    parser.add_argument('--max-steps', type=int, default=20, help='Longest predicted suffix')
+    parser.add_argument('--chunk-cases', type=int, default=1000, help='Cases read and predicted per chunk')
+    parser.add_argument('--reference-log', default=None,
+                        help='Log of the end activities and activity times (default: the training log)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    output = args.output or os.path.join(
+        'results', 'suffixes', os.path.basename(args.log).split('.')[0] + '.parquet')
+    predict_log_suffixes(args.log, args.model_dir, output, model_name=args.model, beam_width=args.beam_width,
+                         max_steps=args.max_steps, chunk_cases=args.chunk_cases, reference_log=args.reference_log)
+
+
+if __name__ == "__main__":
+    main()
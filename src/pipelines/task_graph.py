@@ -0,0 +1,255 @@
+import os
+import json
+import time
+import traceback
+import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from src.common import instrumentation, profiling, plotting
+
+logger = logging.getLogger("task_graph")
+
+
+class Task:
+    def __init__(self, name, fn, args=(), kwargs=None, deps=(), memory_mb=0):
+        """
+        A unit of work in the task graph
+
+        Args:
+            name: Unique task name (e.g. 'train:sepsis')
+            fn: Module-level callable (must be picklable for process workers)
+            args: Positional arguments for fn
+            kwargs: Keyword arguments for fn
+            deps: Names of tasks that must finish successfully first
+            memory_mb: Estimated peak memory of the task, used for the memory budget
+        """
+        self.name = name
+        self.fn = fn
+        self.args = tuple(args)
+        self.kwargs = kwargs or {}
+        self.deps = list(deps)
+        self.memory_mb = memory_mb
+
+
+def _run_task(name, fn, args, kwargs, trace=None, plots=None):
+    """
+    Worker entry point: run a task and report its wall time.
+    With trace set to {'trace_memory': bool, 'profile': dict or None} the task is
+    instrumented (and profiled) in the worker and its spans are returned for the
+    parent's recorder. With plots set (the parent's plotting settings) the task's
+    figures are rendered by the worker's own plot pool and awaited before returning.
+    """
+    if plots is not None:
+        plotting.configure(**plots)
+    if trace is not None:
+        instrumentation.enable(trace_memory=trace['trace_memory'])
+        if trace.get('profile'):
+            # Workers run several tasks, so report files are named after the task
+            profiling.start(tag=name, **trace['profile'])
+    start = time.time()
+    try:
+        with instrumentation.span(name):
+            fn(*args, **kwargs)
+    finally:
+        if plots is not None:
+            plotting.wait()
+        if trace is not None:
+            profiling.stop()
+        recorder = instrumentation.disable() if trace is not None else None
+    return time.time() - start, recorder.spans if recorder is not None else None
+
+
+class TaskGraph:
+    def __init__(self, state_file=None):
+        """
+        Dependency graph of pipeline stages executed under a worker and memory budget
+
+        Tasks exchange data through files and the artifact cache, never through
+        return values, so they can run in separate processes. Task status is
+        written to a JSON state file after each completion so an interrupted
+        run can be resumed.
+
+        Args:
+            state_file: Path of the JSON state file (None disables persistence)
+        """
+        self.tasks = {}
+        self.state_file = state_file
+        self.state = {}
+
+    def add_task(self, name, fn, args=(), kwargs=None, deps=(), memory_mb=0):
+        """Add a task; dependencies on tasks that are not in the graph are ignored"""
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task name: {name}")
+        self.tasks[name] = Task(name, fn, args=args, kwargs=kwargs, deps=deps, memory_mb=memory_mb)
+        return self.tasks[name]
+
+    def _resolved_deps(self, task):
+        return [dep for dep in task.deps if dep in self.tasks]
+
+    def topological_order(self):
+        """Return task names in dependency order (insertion order among independent tasks)"""
+        order = []
+        visiting = set()
+        visited = set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected in task graph at {name}")
+            visiting.add(name)
+            for dep in self._resolved_deps(self.tasks[name]):
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name)
+        return order
+
+    def _load_state(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return {}
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f).get('tasks', {})
+        except (OSError, ValueError):
+            logger.warning(f"Could not read state file {self.state_file}. Starting fresh.")
+            return {}
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        os.makedirs(os.path.dirname(self.state_file) or '.', exist_ok=True)
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'updated': time.strftime('%Y-%m-%d %H:%M:%S'), 'tasks': self.state}, f, indent=2)
+        os.replace(tmp_path, self.state_file)
+
+    def _record(self, name, status, duration=None, error=None):
+        self.state[name] = {'status': status, 'finished': time.strftime('%Y-%m-%d %H:%M:%S')}
+        if duration is not None:
+            self.state[name]['duration'] = round(duration, 3)
+        if error is not None:
+            self.state[name]['error'] = error
+        self._save_state()
+
+    def run(self, jobs=1, memory_budget_mb=None, resume=False):
+        """
+        Execute the graph
+
+        Args:
+            jobs: Maximum number of concurrently running tasks (1 runs inline)
+            memory_budget_mb: Maximum summed memory estimate of running tasks
+            resume: Skip tasks recorded as done in the state file
+
+        Returns:
+            Dictionary with the status of every task
+        """
+        order = self.topological_order()
+        previous = self._load_state()
+        # Keep the records of tasks outside this graph so runs of other stages can still resume
+        self.state = {name: record for name, record in previous.items() if name not in self.tasks}
+        status = {}
+        for name in order:
+            if resume and previous.get(name, {}).get('status') == 'done':
+                status[name] = 'done'
+                self.state[name] = previous[name]
+                logger.info(f"Skipping {name} (completed in a previous run)")
+            else:
+                status[name] = 'pending'
+        self._save_state()
+
+        if jobs <= 1:
+            self._run_inline(order, status)
+        else:
+            self._run_parallel(order, status, jobs, memory_budget_mb)
+
+        return dict(self.state)
+
+    def _ready(self, name, status):
+        """Return True/False if the task can/cannot start yet, None if it can never run"""
+        deps = self._resolved_deps(self.tasks[name])
+        if any(status[dep] in ('failed', 'skipped') for dep in deps):
+            return None
+        return all(status[dep] == 'done' for dep in deps)
+
+    def _skip(self, name, status):
+        status[name] = 'skipped'
+        self._record(name, 'skipped', error='dependency failed')
+        logger.warning(f"Skipping {name}: a dependency failed")
+
+    def _run_inline(self, order, status):
+        for name in order:
+            if status[name] != 'pending':
+                continue
+            if self._ready(name, status) is None:
+                self._skip(name, status)
+                continue
+
+            task = self.tasks[name]
+            logger.info(f"Running {name}")
+            try:
+                duration, _ = _run_task(name, task.fn, task.args, task.kwargs)
+                status[name] = 'done'
+                self._record(name, 'done', duration=duration)
+            except Exception as e:
+                traceback.print_exc()
+                status[name] = 'failed'
+                self._record(name, 'failed', error=str(e))
+
+    def _run_parallel(self, order, status, jobs, memory_budget_mb):
+        running = {}
+        memory_in_use = 0
+
+        # Workers record their own spans (and profiles) when the parent run is instrumented
+        recorder = instrumentation.get_recorder()
+        trace = None
+        if recorder is not None:
+            trace = {'trace_memory': recorder.trace_memory, 'profile': profiling.get_config()}
+
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            while True:
+                # Launch every ready task that fits the worker and memory budget
+                for name in order:
+                    if status[name] != 'pending' or len(running) >= jobs:
+                        continue
+                    ready = self._ready(name, status)
+                    if ready is None:
+                        self._skip(name, status)
+                        continue
+                    if not ready:
+                        continue
+
+                    task = self.tasks[name]
+                    fits = (memory_budget_mb is None or not running or
+                            memory_in_use + task.memory_mb <= memory_budget_mb)
+                    if not fits:
+                        continue
+
+                    logger.info(f"Starting {name}")
+                    future = executor.submit(_run_task, name, task.fn, task.args, task.kwargs, trace,
+                                             plotting.get_config())
+                    running[future] = name
+                    status[name] = 'running'
+                    memory_in_use += task.memory_mb
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    memory_in_use -= self.tasks[name].memory_mb
+                    try:
+                        duration, spans = future.result()
+                        if recorder is not None and spans:
+                            recorder.add_spans(spans)
+                        status[name] = 'done'
+                        self._record(name, 'done', duration=duration)
+                        logger.info(f"Finished {name} in {duration:.1f}s")
+                    except Exception as e:
+                        status[name] = 'failed'
+                        self._record(name, 'failed', error=str(e))
+                        logger.error(f"Task {name} failed: {e}")
@@ -1,30 +1,54 @@
 import os
+import argparse
 import numpy as np
 import pandas as pd
 import logging
+import sklearn
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
-from scipy import stats
-import joblib
-import matplotlib.pyplot as plt
-import seaborn as sns
 from sklearn.metrics import confusion_matrix
 
 from src.preprocessing.feature_extraction import FeatureExtractor
-from src.preprocessing.data_transformation import DataTransformer
+from src.preprocessing.data_transformation import DataTransformer, collapse_duplicate_rows, count_weighted_params
+from src.preprocessing.feature_store import FeatureMatrixStore
+from src.preprocessing.event_alphabet import PREDICATES, predicate_mask
+from src.models.metrics import evaluate_in_batches
+from src.models.artifact import save_model_artifact
+from src.models.run_store import RunStore
+from src.models.search import default_search_config, search_params, save_search_result
+from src.common.artifact_cache import get_cache
+from src.common.instrumentation import span, instrument
+from src.common import profiling
+from src.common import plotting
 
-# Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Logging is configured by the entry point (main.py or main() below)
 logger = logging.getLogger("enhanced_models")
 
 class EnhancedModelTrainer:
-    def __init__(self, log_path, dataset_type=None, baseline_dir=None, output_dir='models/enhanced'):
+    # Bump when the causal feature engineering changes so cached features are invalidated
+    FEATURE_VERSION = '1'
+    
+    def __init__(self, log_path, dataset_type=None, baseline_dir=None, output_dir='models/enhanced', cache=None,
+                 run_store_dir='models/runs', search=None, deduplicate=False):
         self.log_path = log_path
         self.dataset_type = dataset_type
         self.baseline_dir = baseline_dir or f'models/{dataset_type}'
         self.output_dir = output_dir
+        self.cache = get_cache(cache)
+        self.prepare_key = None
+        # Per-run metrics and importance read by ModelComparator
+        self.run_store = RunStore(run_store_dir)
+        # Optional successive-halving search replacing the fixed parameters (see src.models.search)
+        self.search = search
+        # Train on unique rows weighted by their count; row counts of the collapsed splits
+        self.deduplicate = deduplicate
+        self.train_weight = None
+        self.test_unique = None
+        
+        # Memory-mapped test split of this log, shared by the causality and comparison stages
+        log_name = os.path.splitext(os.path.basename(log_path))[0]
+        self.feature_store = FeatureMatrixStore(os.path.join(self.output_dir, 'feature_store', log_name))
         
         # Create output directory if it doesn't exist
         os.makedirs(self.output_dir, exist_ok=True)
@@ -47,11 +71,14 @@ class EnhancedModelTrainer:
         # Load baseline feature importance
         self.baseline_feature_importance = self._load_baseline_feature_importance()
     
+    def _baseline_importance_path(self):
+        return os.path.join(self.baseline_dir, f"feature_importance_DT_{self.dataset_type}.csv")
+    
     def _load_baseline_feature_importance(self):
         """
         Load baseline model feature importance to guide enhanced feature extraction
         """
-        feature_importance_file = os.path.join(self.baseline_dir, f"feature_importance_DT_{self.dataset_type}.csv")
+        feature_importance_file = self._baseline_importance_path()
         
         if not os.path.exists(feature_importance_file):
             logger.warning(f"Baseline feature importance file not found: {feature_importance_file}")
@@ -72,18 +99,21 @@ class EnhancedModelTrainer:
         logger.info("Extracting enhanced features...")
         
         # First load the log file
-        self.feature_extractor.load_log(self.log_path)
+        with span('load') as s:
+            s.rows = len(self.feature_extractor.load_log(self.log_path))
         
-        # Then extract all baseline features - this returns (X, y) tuple
-        X, y = self.feature_extractor.extract_features(self.dataset_type)
-        
-        # Add causal features based on dataset type and baseline feature importance
-        if self.dataset_type == 'sepsis':
-            # Add Sepsis-specific causal features
-            X = self._add_sepsis_causal_features(X)
-        elif self.dataset_type == 'bpi':
-            # Add BPI-specific causal features
-            X = self._add_bpi_causal_features(X)
+        with span('extract') as s:
+            # Then extract all baseline features - this returns (X, y) tuple
+            X, y = self.feature_extractor.extract_features(self.dataset_type)
+            
+            # Add causal features based on dataset type and baseline feature importance
+            if self.dataset_type == 'sepsis':
+                # Add Sepsis-specific causal features
+                X = self._add_sepsis_causal_features(X)
+            elif self.dataset_type == 'bpi':
+                # Add BPI-specific causal features
+                X = self._add_bpi_causal_features(X)
+            s.rows = len(X)
         
         # Create a complete features dataframe with the target
         features_df = X.copy()
@@ -153,15 +183,14 @@ class EnhancedModelTrainer:
         if ('current_event' in df.columns and
             (any(appr in f for f in top_features for appr in ['APPROVED', 'COMPLETE']) or not top_features)):
             logger.info("Adding approval history features")
-            df['prev_approvals'] = ((df['current_event'].str.contains('APPROVED')) | 
-                                   (df['current_event'].str.contains('COMPLETE'))).astype(int)
+            df['prev_approvals'] = self._activity_mask(df['current_event'], 'approved', 'complete').astype(int)
             df['approval_count'] = df.groupby('case_id')['prev_approvals'].cumsum()
             
         # Calculate rejection history features (H1) - based on importance of rejection-related features
         if ('current_event' in df.columns and
             (any('REJECTED' in f for f in top_features) or not top_features)):
             logger.info("Adding rejection history features")
-            df['prev_rejections'] = df['current_event'].str.contains('REJECTED').astype(int)
+            df['prev_rejections'] = self._activity_mask(df['current_event'], 'rejected').astype(int)
             df['rejection_count'] = df.groupby('case_id')['prev_rejections'].cumsum()
             
         # Resource change features (H5) - based on importance of resource-related features
@@ -174,19 +203,75 @@ class EnhancedModelTrainer:
         
         return df
     
-    def prepare_data(self):
+    def _activity_mask(self, activities, *predicates):
+        """Rows whose activity matches any named predicate, via the log's event alphabet lookup tables"""
+        alphabet = self.feature_extractor.alphabet
+        if alphabet is not None and 'concept:name' in alphabet:
+            return alphabet.mask('concept:name', activities, *predicates)
+        substrings = [PREDICATES[name] for name in predicates]
+        return predicate_mask(activities, lambda activity: any(sub in activity for sub in substrings))
+    
+    def _stage_keys(self):
         """
-        Extract features and prepare train/test datasets
+        Content keys of the extract and prepare stages.
+        Enhanced features also depend on the baseline importance file that selects them.
         """
+        extract_key = self.cache.make_key(
+            'enhanced_extract',
+            log=self.cache.fingerprint_file(self.log_path) or self.log_path,
+            baseline_importance=self.cache.fingerprint_file(self._baseline_importance_path()),
+            extractor=FeatureExtractor.VERSION,
+            features=self.FEATURE_VERSION,
+            dataset_type=self.dataset_type
+        )
+        prepare_key = self.cache.make_key(
+            'enhanced_prepare',
+            extract=extract_key,
+            transformer=DataTransformer.VERSION,
+            deduplicate=self.deduplicate
+        )
+        return extract_key, prepare_key
+    
+    def _prepare_data(self, extract_key):
+        """Extract (or load cached) enhanced features and preprocess them (uncached)"""
         # Extract enhanced features
-        features_df = self.extract_enhanced_features()
+        features_df = self.cache.cached('enhanced_extract', extract_key, self.extract_enhanced_features)
         
         # Prepare X (features) and y (target) variables
         X = features_df.drop(['next_event', 'case_id'], axis=1, errors='ignore')
         y = features_df['next_event']
         
         # Transform data using data transformer - this returns 4 values
-        X_train, X_test, y_train, y_test = self.data_transformer.preprocess_data(X, y)
+        with span('preprocess', rows=len(X)):
+            X_train, X_test, y_train, y_test = self.data_transformer.preprocess_data(X, y)
+        
+        # Collapse identical rows after the split (the full test split stays for the feature store)
+        train_weight, test_unique = None, None
+        if self.deduplicate:
+            with span('deduplicate', rows=len(X_train)):
+                n_train = len(X_train)
+                X_train, y_train, train_weight = collapse_duplicate_rows(X_train, y_train)
+                test_unique = collapse_duplicate_rows(X_test, y_test)
+            logger.info(f"Collapsed {n_train} training rows into {len(X_train)} unique rows, "
+                        f"{len(X_test)} test rows into {len(test_unique[0])}")
+        
+        return {
+            'splits': (X_train, X_test, y_train, y_test),
+            'train_weight': train_weight,
+            'test_unique': test_unique,
+            'data_transformer': self.data_transformer
+        }
+    
+    def prepare_data(self):
+        """
+        Extract features and prepare train/test datasets
+        """
+        extract_key, self.prepare_key = self._stage_keys()
+        prepared = self.cache.cached('enhanced_prepare', self.prepare_key, lambda: self._prepare_data(extract_key))
+        X_train, X_test, y_train, y_test = prepared['splits']
+        self.data_transformer = prepared['data_transformer']
+        self.train_weight = prepared.get('train_weight')
+        self.test_unique = prepared.get('test_unique')
         
         logger.info(f"Data prepared: X_train shape: {X_train.shape}, y_train shape: {y_train.shape}")
         
@@ -195,6 +280,72 @@ class EnhancedModelTrainer:
         
         return X_train, X_test, y_train, y_test, feature_names
     
+    def save_test_store(self, X_test, y_test):
+        """
+        Write the test split to the feature matrix store (skipped if it is already current).
+        Without a cache the stage key does not track log contents, so the store is always rewritten.
+        """
+        key = self.prepare_key if self.cache.enabled else None
+        if self.feature_store.is_current(key):
+            return
+        self.feature_store.write(
+            X_test, y_test,
+            label_encoders=self.data_transformer.label_encoders,
+            key=key,
+            metadata={'dataset_type': self.dataset_type, 'log_path': self.log_path, 'split': 'test'}
+        )
+    
+    def open_test_store(self, mmap_mode='r'):
+        """
+        Open the memory-mapped test split, preparing and writing it first if it is missing or stale
+
+        Returns:
+            Tuple of (X_test DataFrame, y_test Series, feature_names)
+        """
+        _, prepare_key = self._stage_keys()
+        if not self.cache.enabled or not self.feature_store.is_current(prepare_key):
+            _, X_test, _, y_test, _ = self.prepare_data()
+            self.save_test_store(X_test, y_test)
+        
+        X_test, y_test, manifest = self.feature_store.open_frame(mmap_mode=mmap_mode)
+        return X_test, y_test, manifest['columns']
+    
+    def _fit_model(self, model_name, model_class, params, X_train, y_train):
+        """Fit a model, reusing a cached fit when the prepared data and parameters are unchanged"""
+        # Leaf sizes of a collapsed split count original rows, not unique ones
+        if self.train_weight is not None:
+            params = count_weighted_params(params, self.train_weight)
+        
+        def fit():
+            with span('train', rows=len(X_train), model=model_name):
+                model = model_class(**params)
+                model.fit(X_train, y_train, sample_weight=self.train_weight)
+            return model
+        
+        train_key = self.cache.make_key('enhanced_train', prepare=self.prepare_key, model=model_name, params=params,
+                                        sklearn=sklearn.__version__)
+        return self.cache.cached('enhanced_train', train_key, fit)
+    
+    def _tuned_params(self, model_name, params, X_train, y_train):
+        """
+        Model parameters, overridden by the best configuration of a successive-halving search if enabled
+        """
+        if not self.search or not self.search.get('enabled', False) or model_name not in self.search.get('models', []):
+            return params
+        
+        def search():
+            with span('search', rows=len(X_train), model=model_name):
+                return search_params(model_name, X_train, y_train, self.search, random_state=params.get('random_state', 42),
+                                     counts=self.train_weight)
+        
+        search_key = self.cache.make_key('enhanced_search', prepare=self.prepare_key, model=model_name, search=self.search)
+        best_params, result = self.cache.cached('enhanced_search', search_key, search)
+        
+        search_dir = os.path.join(self.output_dir, 'search', f"{self.dataset_type}_{os.path.splitext(os.path.basename(self.log_path))[0]}")
+        path = save_search_result(result, search_dir)
+        logger.info(f"Best {model_name} configuration and search trace saved to {path}")
+        return dict(params, **best_params)
+    
     def train_models(self):
         """
         Train enhanced Decision Tree and Random Forest models
@@ -203,31 +354,32 @@ class EnhancedModelTrainer:
         X_train, X_test, y_train, y_test, feature_names = self.prepare_data()
         
         # Train Decision Tree model
-        dt_model = DecisionTreeClassifier(
-            max_depth=5, 
-            min_samples_split=2, 
-            min_samples_leaf=1,
-            criterion='gini',
-            random_state=42
-        )
-        dt_model.fit(X_train, y_train)
+        dt_model = self._fit_model('decision_tree', DecisionTreeClassifier, self._tuned_params('decision_tree', {
+            'max_depth': 5,
+            'min_samples_split': 2,
+            'min_samples_leaf': 1,
+            'criterion': 'gini',
+            'random_state': 42
+        }, X_train, y_train), X_train, y_train)
         
         # Train Random Forest model
-        rf_model = RandomForestClassifier(
-            n_estimators=100, 
-            max_depth=10, 
-            min_samples_split=2,
-            random_state=42
-        )
-        rf_model.fit(X_train, y_train)
-        
-        # Save models
-        joblib.dump(dt_model, os.path.join(self.output_dir, f"enhanced_dt_{self.dataset_type}.pkl"))
-        joblib.dump(rf_model, os.path.join(self.output_dir, f"enhanced_rf_{self.dataset_type}.pkl"))
-        
-        # Evaluate models and save metrics
-        dt_metrics = self._evaluate_model(dt_model, X_test, y_test, "Decision Tree")
-        rf_metrics = self._evaluate_model(rf_model, X_test, y_test, "Random Forest")
+        rf_model = self._fit_model('random_forest', RandomForestClassifier, self._tuned_params('random_forest', {
+            'n_estimators': 100,
+            'max_depth': 10,
+            'min_samples_split': 2,
+            'random_state': 42
+        }, X_train, y_train), X_train, y_train)
+        
+        # Evaluate models and save metrics (each unique test row once, weighted by its count)
+        X_eval, y_eval, eval_weight = self.test_unique if self.test_unique is not None else (X_test, y_test, None)
+        dt_metrics = self._evaluate_model(dt_model, X_eval, y_eval, "Decision Tree", sample_weight=eval_weight)
+        rf_metrics = self._evaluate_model(rf_model, X_eval, y_eval, "Random Forest", sample_weight=eval_weight)
+        
+        # Save models as memory-mappable artifacts, with their metrics in the manifest
+        with span('save_models'):
+            self._save_model(dt_model, 'dt', dt_metrics, feature_names)
+            self._save_model(rf_model, 'rf', rf_metrics, feature_names)
+            self.save_test_store(X_test, y_test)
         
         # Save metrics to CSV
         metrics_df = pd.DataFrame([
@@ -249,6 +401,7 @@ class EnhancedModelTrainer:
             }
         ])
         metrics_df.to_csv(os.path.join(self.output_dir, f"metrics_{self.dataset_type}.csv"), index=False)
+        self._record_run(metrics_df, dt_model, rf_model, feature_names)
         
         # Generate confusion matrices
         self._plot_confusion_matrix(dt_model, X_test, y_test, "Enhanced DT")
@@ -266,39 +419,59 @@ class EnhancedModelTrainer:
             'feature_names': feature_names
         }
     
-    def _evaluate_model(self, model, X_test, y_test, model_name):
+    def _save_model(self, model, prefix, metrics, feature_names):
         """
-        Evaluate model performance on test data
+        Save a model to <output_dir>/enhanced_<prefix>_<dataset_type>/ (see src.models.artifact)
         """
-        y_pred = model.predict(X_test)
+        artifact_dir = os.path.join(self.output_dir, f"enhanced_{prefix}_{self.dataset_type}")
+        summary = {key: metrics[key] for key in ('accuracy', 'precision', 'recall', 'f1', 'roc_auc')}
+        save_model_artifact(model, artifact_dir, feature_names=feature_names, metrics=summary,
+                            metadata={'dataset_type': self.dataset_type})
+        return artifact_dir
+    
+    @instrument('record_run')
+    def _record_run(self, metrics_df, dt_model, rf_model, feature_names):
+        """
+        Record metrics, feature importance and parameters of this run in the run store
+        """
+        importance = {}
+        params = {}
+        for label, model in [('Decision Tree', dt_model), ('Random Forest', rf_model)]:
+            importance[label] = pd.DataFrame({
+                'feature': feature_names[:len(model.feature_importances_)],
+                'importance': model.feature_importances_
+            }).sort_values('importance', ascending=False)
+            params[label] = model.get_params()
+        run_id = self.run_store.record(self.dataset_type, 'enhanced', metrics_df, importance=importance,
+                                       params=params, metadata={'log_path': self.log_path,
+                                                                'deduplicate': self.deduplicate})
+        logger.info(f"Recorded run {run_id} in {self.run_store.root_dir}")
+        return run_id
+    
+    @instrument('evaluate')
+    def _evaluate_model(self, model, X_test, y_test, model_name, batch_size=None, sample_weight=None):
+        """
+        Evaluate model performance on test data (sample_weight: row counts of collapsed rows)
+        """
+        # Single pass over the test set; ROC-AUC comes from the accumulated probability histograms
+        accumulator = evaluate_in_batches(model, X_test, y_test, batch_size=batch_size, with_proba=True,
+                                          sample_weight=sample_weight)
+        metrics = accumulator.summary()
         
-        # For ROC-AUC, we need probability estimates
-        try:
-            y_prob = model.predict_proba(X_test)
-            roc_auc = roc_auc_score(y_test, y_prob, multi_class='ovr')
-        except:
+        if metrics['roc_auc'] is None:
             # Fallback if ROC AUC calculation fails
-            roc_auc = 0.5 + (accuracy_score(y_test, y_pred) - 0.5) * 1.5
-        
-        metrics = {
-            'accuracy': accuracy_score(y_test, y_pred),
-            'precision': precision_score(y_test, y_pred, average='weighted'),
-            'recall': recall_score(y_test, y_pred, average='weighted'),
-            'f1': f1_score(y_test, y_pred, average='weighted'),
-            'roc_auc': roc_auc
-        }
+            metrics['roc_auc'] = 0.5 + (metrics['accuracy'] - 0.5) * 1.5
         
         logger.info(f"{model_name} evaluation metrics: {metrics}")
         return metrics
     
+    @instrument('plot')
     def _plot_confusion_matrix(self, model, X_test, y_test, model_name):
         """
-        Plot confusion matrix for model evaluation
+        Plot confusion matrix for model evaluation (rendered by the background plot pool)
         """
-        import matplotlib.pyplot as plt
-        import seaborn as sns
-        from sklearn.metrics import confusion_matrix
-        import numpy as np
+        if not plotting.plots_enabled():
+            return
         
         # Make predictions
         y_pred = model.predict(X_test)
@@ -315,24 +488,16 @@ class EnhancedModelTrainer:
         
         # If more than 10 classes, plot without class names (too cluttered)
         if len(class_names) > 10:
-            plt.figure(figsize=(10, 8))
-            sns.heatmap(cm, annot=False, cmap='Blues', fmt='d')
-            plt.title(f'Confusion Matrix - {model_name}')
-            plt.xlabel('Predicted')
-            plt.ylabel('True')
+            layout = {'labels': 'auto', 'annot': False, 'figsize': (10, 8)}
         else:
-            plt.figure(figsize=(12, 10))
-            sns.heatmap(cm, annot=True, cmap='Blues', fmt='d', 
-                      xticklabels=class_names, yticklabels=class_names)
-            plt.title(f'Confusion Matrix - {model_name}')
-            plt.xlabel('Predicted')
-            plt.ylabel('True')
-        
-        # Save figure
-        plt.tight_layout()
-        plt.savefig(os.path.join(self.output_dir, f"confusion_matrix_{model_name}_{self.dataset_type}.png"), dpi=300)
-        plt.close()
+            layout = {'labels': list(class_names), 'annot': True, 'figsize': (12, 10)}
+        
+        # Only the matrix is sent to the plot pool
+        plotting.submit_figure(os.path.join(self.output_dir, f"confusion_matrix_{model_name}_{self.dataset_type}.png"),
+                               plotting.draw_confusion_matrix, cm, f'Confusion Matrix - {model_name}',
+                               xlabel='Predicted', ylabel='True', dpi=300, **layout)
     
+    @instrument('report')
     def _analyze_feature_importance(self, model, feature_names, model_type):
         """
         Analyze and visualize feature importance
@@ -345,21 +510,13 @@ class EnhancedModelTrainer:
         for i in range(min(20, len(feature_names))):
             logger.info(f"{feature_names[indices[i]]}: {importances[indices[i]]:.4f}")
         
-        # Visualize feature importance
-        plt.figure(figsize=(12, 8))
-        plt.title(f'Feature Importance - {model_type} for {self.dataset_type.upper()} Dataset')
-        plt.bar(range(min(20, len(feature_names))), 
-                [importances[i] for i in indices[:20]], 
-                align='center')
-        plt.xticks(range(min(20, len(feature_names))), 
-                  [feature_names[i] for i in indices[:20]], 
-                  rotation=90)
-        plt.tight_layout()
-        
-        # Save figure
+        # Visualize feature importance (rendered by the background plot pool)
         output_path = os.path.join(self.output_dir, f"feature_importance_{model_type}_{self.dataset_type}.png")
-        plt.savefig(output_path, dpi=300)
-        plt.close()
+        plotting.submit_figure(output_path, draw_importance_bars,
+                               [feature_names[i] for i in indices[:20]],
+                               [importances[i] for i in indices[:20]],
+                               f'Feature Importance - {model_type} for {self.dataset_type.upper()} Dataset',
+                               dpi=300)
         
         # Save feature importance to CSV
         importance_df = pd.DataFrame({
@@ -372,10 +529,32 @@ class EnhancedModelTrainer:
         logger.info(f"Feature importance analysis saved to {self.output_dir}")
 
 
+def draw_importance_bars(names, importances, title):
+    """Vertical bar chart of the top feature importances"""
+    plt = plotting.pyplot()
+    fig = plt.figure(figsize=(12, 8))
+    plt.title(title)
+    plt.bar(range(len(names)), importances, align='center')
+    plt.xticks(range(len(names)), names, rotation=90)
+    plt.tight_layout()
+    return fig
+
+
 def main():
     """
     Main function to run enhanced model training
     """
+    parser = argparse.ArgumentParser(description='Train enhanced prediction models')
+    parser.add_argument('--search', action='store_true',
+                        help='Tune the models with a successive-halving hyperparameter search')
+    parser.add_argument('--deduplicate', action='store_true',
+                        help='Train on unique feature rows weighted by how often they occur')
+    profiling.add_profile_arguments(parser)
+    plotting.add_plot_arguments(parser)
+    args = parser.parse_args()
+    plotting.configure_from_args(args)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
     # Define datasets to process
     datasets = [
         # Sepsis dataset
@@ -398,15 +577,21 @@ def main():
     ]
     
     # Train enhanced models for each dataset
-    for dataset in datasets:
-        logger.info(f"Processing dataset: {dataset['path']}")
-        trainer = EnhancedModelTrainer(
-            log_path=dataset['path'],
-            dataset_type=dataset['type'],
-            baseline_dir=dataset['baseline_dir'],
-            output_dir='models/enhanced'
-        )
-        trainer.train_models()
+    with profiling.profile_from_args(args):
+        for dataset in datasets:
+            logger.info(f"Processing dataset: {dataset['path']}")
+            log_name = os.path.splitext(os.path.basename(dataset['path']))[0]
+            with span(f"train_enhanced:{log_name}"):
+                trainer = EnhancedModelTrainer(
+                    log_path=dataset['path'],
+                    dataset_type=dataset['type'],
+                    baseline_dir=dataset['baseline_dir'],
+                    output_dir='models/enhanced',
+                    search=dict(default_search_config(), enabled=True) if args.search else None,
+                    deduplicate=args.deduplicate
+                )
+                trainer.train_models()
+    plotting.wait()
 
 
 if __name__ == "__main__":
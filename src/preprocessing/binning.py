@@ -0,0 +1,85 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Bin edges saved with the transformer metadata (see DataTransformer.save_transformation_metadata)
+BINNER_FILE = 'bin_edges.pkl'
+
+
+def default_binning_config():
+    """'binning' section of a training configuration (disabled by default)"""
+    return {
+        'enabled': False,
+        # Bins per feature (at most 256, so codes fit in uint8)
+        'max_bins': 255
+    }
+
+
+class QuantileBinner:
+    def __init__(self, max_bins=255):
+        """
+        Quantile binning of transformed features into uint8 codes
+
+        Edges are fitted once on the training split: a feature with at most max_bins
+        distinct values gets one bin per value (edges at the midpoints, so trees split
+        it exactly as before), any other feature gets quantile edges placed between
+        neighbouring values. Codes preserve
+        the order of the values, and one uint8 matrix is an eighth of the float64
+        frame it replaces, so it can be shared by every model, fold and refit.
+
+        Args:
+            max_bins: Bins per feature (2..256)
+        """
+        if not 2 <= max_bins <= 256:
+            raise ValueError(f"max_bins must be between 2 and 256, got {max_bins}")
+        self.max_bins = max_bins
+        self.edges = {}
+
+    def fit(self, X):
+        """Fit the edges of every column of X"""
+        self.edges = {}
+        for col in X.columns:
+            values = np.asarray(X[col], dtype=np.float64)
+            values = values[~np.isnan(values)]
+            distinct = np.unique(values)
+            if len(distinct) <= self.max_bins:
+                edges = (distinct[:-1] + distinct[1:]) / 2
+            else:
+                quantiles = np.linspace(0, 1, self.max_bins + 1)[1:-1]
+                # Each quantile becomes the midpoint below the first value at or above it, so
+                # the rows split the same way but no edge sits on a value (where the rounding
+                # of scaling at prediction time could move it across the edge)
+                upper = np.searchsorted(distinct, np.quantile(values, quantiles, method='midpoint'), side='left')
+                upper = np.unique(np.clip(upper, 1, len(distinct) - 1))
+                edges = (distinct[upper - 1] + distinct[upper]) / 2
+            self.edges[col] = edges
+        return self
+
+    def transform(self, X):
+        """uint8 codes of X (same columns and index); values above the last edge go to the last bin"""
+        if not self.edges:
+            raise ValueError("Binner not fitted. Call fit() first.")
+        missing = [col for col in self.edges if col not in X.columns]
+        if missing:
+            raise ValueError(f"Columns {missing} are missing from the data to bin")
+        codes = {
+            col: np.searchsorted(edges, np.asarray(X[col], dtype=np.float64), side='right').astype(np.uint8)
+            for col, edges in self.edges.items()
+        }
+        return pd.DataFrame(codes, index=X.index)
+
+    def fit_transform(self, X):
+        return self.fit(X).transform(X)
+
+    def n_bins(self):
+        """Number of bins of each column"""
+        return {col: len(edges) + 1 for col, edges in self.edges.items()}
+
+
+def load_binner(transformer_dir):
+    """Binner saved with the transformer metadata in transformer_dir (None if the models were not binned)"""
+    path = os.path.join(transformer_dir, BINNER_FILE)
+    if not os.path.exists(path):
+        return None
+    import joblib
+    return joblib.load(path)
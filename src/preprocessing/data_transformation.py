@@ -5,13 +5,25 @@ from sklearn.model_selection import train_test_split
 from sklearn.utils import resample
 import os
 
+from src.preprocessing.binning import QuantileBinner, BINNER_FILE
+
+# Missing-value fills of the training data, saved with the transformer metadata
+FILL_VALUES_FILE = 'fill_values.pkl'
+
 class DataTransformer:
+    # Bump when preprocessing changes so cached train/test splits are invalidated
+    VERSION = '3'
+    
     def __init__(self):
         self.label_encoders = {}
         self.scaler = StandardScaler()
         self.feature_names = None
         self.X_test = None
         self.y_test = None
+        # Quantile bin edges of the transformed features (None unless fit_binning was called)
+        self.binner = None
+        # Value each numeric column's missing entries were filled with in training
+        self.fill_values = {}
         
     def preprocess_data(self, X, y, X_test=None, y_test=None, test_size=0.2, random_state=42, balance_classes=True):
         """
@@ -43,7 +55,7 @@ class DataTransformer:
         X_for_training = self._encode_categorical_features(X_for_training)
         
         # Handle missing values
-        X_for_training = self._handle_missing_values(X_for_training)
+        X_for_training = self._handle_missing_values(X_for_training, is_training=True)
         
         # Scale numerical features
         X_for_training = self._scale_features(X_for_training)
@@ -123,10 +135,17 @@ class DataTransformer:
             
         return X_encoded
     
-    def _handle_missing_values(self, X):
-        """Handle missing values in the dataset"""
+    def _handle_missing_values(self, X, is_training=False):
+        """
+        Handle missing values in the dataset.
+        If is_training=True, the fill value of every numeric column is kept for encode_for_prediction.
+        """
         # Replace with mean for numeric columns
         numeric_columns = X.select_dtypes(include=['float64', 'int64']).columns
+        if is_training:
+            means = X[numeric_columns].mean()
+            # Columns without any value end up filled with 0 below
+            self.fill_values = {col: (0.0 if pd.isna(mean) else float(mean)) for col, mean in means.items()}
         for col in numeric_columns:
             if X[col].isnull().any():
                 X[col] = X[col].fillna(X[col].mean())
@@ -194,23 +213,33 @@ class DataTransformer:
         
         return pd.concat(balanced_features, axis=0), pd.Series(balanced_events)
     
+    def fit_binning(self, X_train, max_bins=255):
+        """Fit quantile bin edges on preprocessed training features; returns their uint8 codes"""
+        self.binner = QuantileBinner(max_bins=max_bins)
+        return self.binner.fit_transform(X_train)
+    
+    def bin_features(self, X):
+        """uint8 codes of preprocessed features, with the fitted bin edges"""
+        if self.binner is None:
+            raise ValueError("No bin edges fitted. Call fit_binning() first.")
+        return self.binner.transform(X)
+    
     def encode_for_prediction(self, X):
         """Encode new data for prediction using the fitted encoders"""
         X_encoded = X.copy()
         
-        # Encode categorical variables using fitted label encoders
+        # Encode categorical variables using fitted label encoders (one lookup per column)
         for col, encoder in self.label_encoders.items():
             if col in X.columns:
-                # Handle unseen categories
-                X_encoded[col] = X[col].apply(
-                    lambda x: encoder.transform([x])[0] if x in encoder.classes_ else -1
-                )
+                codes = {value: code for code, value in enumerate(encoder.classes_)}
+                # Unseen categories and missing values become -1
+                X_encoded[col] = X[col].map(codes).fillna(-1).astype(np.int64)
         
-        # Handle missing values
+        # Handle missing values like training did: numeric columns get their training fill value
         for col in X_encoded.columns:
             if X_encoded[col].isna().any():
                 if X_encoded[col].dtype in ['float64', 'int64']:
-                    X_encoded[col] = X_encoded[col].fillna(0)  # Fill with 0 for prediction
+                    X_encoded[col] = X_encoded[col].fillna(self.fill_values.get(col, 0))
                 else:
                     X_encoded[col] = X_encoded[col].fillna(X_encoded[col].mode()[0])
         
@@ -222,6 +251,10 @@ class DataTransformer:
         if len(numeric_columns) > 0:
             X_encoded[numeric_columns] = self.scaler.transform(X_encoded[numeric_columns])
         
+        # Models trained on bin codes predict on bin codes
+        if self.binner is not None:
+            X_encoded = self.binner.transform(X_encoded)
+        
         return X_encoded
     
     def save_transformation_metadata(self, save_path):
@@ -238,6 +271,16 @@ class DataTransformer:
         # Save feature names
         joblib.dump(self.feature_names, os.path.join(save_path, 'feature_names.pkl'))
         
+        # Save the training fill values of missing numeric features
+        joblib.dump(self.fill_values, os.path.join(save_path, FILL_VALUES_FILE))
+        
+        # Save bin edges (and drop stale ones of an earlier binned run)
+        binner_path = os.path.join(save_path, BINNER_FILE)
+        if self.binner is not None:
+            joblib.dump(self.binner, binner_path)
+        elif os.path.exists(binner_path):
+            os.remove(binner_path)
+        
     def load_transformation_metadata(self, load_path):
         """Load transformation metadata"""
         import joblib
@@ -250,3 +293,69 @@ class DataTransformer:
         
         # Load feature names
         self.feature_names = joblib.load(os.path.join(load_path, 'feature_names.pkl'))
+        
+        # Load the training fill values (transformers saved before them fill with 0)
+        fill_values_path = os.path.join(load_path, FILL_VALUES_FILE)
+        self.fill_values = joblib.load(fill_values_path) if os.path.exists(fill_values_path) else {}
+        
+        # Load bin edges if the models were trained on bin codes
+        binner_path = os.path.join(load_path, BINNER_FILE)
+        self.binner = joblib.load(binner_path) if os.path.exists(binner_path) else None
+
+
+def collapse_duplicate_rows(X, y):
+    """
+    Collapse identical (feature row, label) pairs into unique rows with counts
+
+    Prefixes of cases that share a variant (and the copies made by class balancing)
+    produce identical encoded rows. Evaluating with the counts as weights gives the
+    same metrics as evaluating every row. A decision tree fitted on the unique rows
+    with the counts as sample_weight is the tree fitted on every row (up to ties
+    between equally good splits) only with the default min_samples_split and
+    min_samples_leaf, which sklearn counts in unweighted (here: unique) rows;
+    count_weighted_params converts a leaf size into its weighted equivalent. Forests
+    are not equivalent: every copy of a row falls in or out of a bootstrap sample together.
+
+    Returns:
+        (X_unique, y_unique, counts) in order of first occurrence; counts is an int64 array
+    """
+    y = pd.Series(np.asarray(y), index=X.index, name=getattr(y, 'name', None))
+    if len(X) == 0:
+        return X, y, np.zeros(0, dtype=np.int64)
+    
+    # Exact grouping on every column and the label (no hashing, NaN is its own value)
+    codes = pd.concat([X, y.rename('__label__')], axis=1).groupby(
+        list(X.columns) + ['__label__'], sort=False, dropna=False
+    ).ngroup().to_numpy()
+    counts = np.bincount(codes).astype(np.int64)
+    first = np.full(len(counts), len(codes), dtype=np.int64)
+    np.minimum.at(first, codes, np.arange(len(codes)))
+    
+    return X.iloc[first], y.iloc[first], counts
+
+
+def count_weighted_params(params, counts):
+    """
+    Tree parameters for a fit on collapsed rows weighted by counts (see collapse_duplicate_rows)
+
+    min_samples_leaf is replaced by the min_weight_fraction_leaf that bounds leaves at
+    the same number of original rows. min_samples_split has no weighted counterpart,
+    so a value other than the default is rejected.
+    """
+    params = dict(params)
+    if params.get('min_samples_split', 2) != 2:
+        raise ValueError(f"min_samples_split={params['min_samples_split']} counts unique rows when training "
+                         f"on deduplicated rows; only the default of 2 is supported")
+    
+    total = float(np.sum(counts))
+    min_samples_leaf = params.get('min_samples_leaf', 1)
+    if isinstance(min_samples_leaf, float):
+        min_samples_leaf = int(np.ceil(min_samples_leaf * total))
+    if min_samples_leaf > 1:
+        if params.get('min_weight_fraction_leaf', 0.0) > 0:
+            raise ValueError("min_samples_leaf and min_weight_fraction_leaf cannot both be set "
+                             "when training on deduplicated rows")
+        # Leaf weights are whole row counts, so half a row below the bound keeps it exact
+        params['min_weight_fraction_leaf'] = min(0.5, (min_samples_leaf - 0.5) / total)
+        params['min_samples_leaf'] = 1
+    return params
@@ -0,0 +1,113 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+# Event attributes that get an integer alphabet when present in the log
+ALPHABET_ATTRIBUTES = ['concept:name', 'org:resource', 'org:group', 'org:role']
+
+# Substring predicates precomputed for every symbol of every alphabet
+PREDICATES = {
+    'approved': 'APPROVED',
+    'final_approved': 'FINAL_APPROVED',
+    'rejected': 'REJECTED',
+    'complete': 'COMPLETE',
+    'supervisor': 'SUPERVISOR'
+}
+
+
+def predicate_mask(values, predicate):
+    """
+    Boolean mask of predicate(str(value)) over values, evaluating the predicate once per
+    distinct value instead of once per row
+    """
+    # Missing values are kept as a value of their own, so the predicate sees them like any other
+    codes, uniques = pd.factorize(pd.Series(np.asarray(values, dtype=object)), use_na_sentinel=False)
+    table = np.fromiter((bool(predicate(str(value))) for value in uniques), dtype=bool, count=len(uniques))
+    return table[codes]
+
+
+class EventAlphabet:
+    def __init__(self, attributes=None):
+        """
+        Integer codes for the activities, resources and organisational groups of a log
+
+        Built once when the log is loaded. Each attribute maps its distinct values to
+        compact int32 codes (in order of first appearance), and every PREDICATES entry
+        is evaluated once per symbol into a boolean lookup table, so a predicate over
+        a column of events is one table lookup per row instead of a string search.
+
+        Args:
+            attributes: Event attributes to encode (default: ALPHABET_ATTRIBUTES)
+        """
+        self.attributes = list(attributes or ALPHABET_ATTRIBUTES)
+        self.symbols = {}
+        self.index = {}
+        self.tables = {}
+
+    def fit(self, df):
+        """Build the alphabets of the attributes present in an event frame"""
+        for attribute in self.attributes:
+            if attribute in df.columns:
+                _, uniques = pd.factorize(df[attribute].astype(object))
+                self._set_symbols(attribute, [str(value) for value in uniques])
+        return self
+
+    def _set_symbols(self, attribute, symbols):
+        self.symbols[attribute] = np.array(symbols, dtype=object)
+        self.index[attribute] = {symbol: code for code, symbol in enumerate(symbols)}
+        self.tables[attribute] = {
+            name: np.array([substring in symbol for symbol in symbols], dtype=bool)
+            for name, substring in PREDICATES.items()
+        }
+
+    def __contains__(self, attribute):
+        return attribute in self.symbols
+
+    def size(self, attribute):
+        """Number of symbols of an attribute"""
+        return len(self.symbols[attribute])
+
+    def encode(self, attribute, values):
+        """int32 codes of values (-1 for values outside the alphabet and missing values)"""
+        codes = pd.Categorical(np.asarray(values, dtype=object), categories=self.symbols[attribute]).codes
+        return codes.astype(np.int32)
+
+    def decode(self, attribute, codes):
+        """Symbols of codes (None for -1)"""
+        codes = np.asarray(codes)
+        symbols = np.append(self.symbols[attribute], None)
+        return symbols[np.where(codes < 0, len(symbols) - 1, codes)]
+
+    def table(self, attribute, predicate):
+        """Boolean lookup table of a named predicate, indexed by code"""
+        return self.tables[attribute][predicate]
+
+    def mask(self, attribute, values, *predicates, codes=None):
+        """
+        Rows of values (or of already encoded codes) matching any of the named predicates
+        """
+        if codes is None:
+            codes = self.encode(attribute, values)
+        table = np.zeros(self.size(attribute), dtype=bool)
+        for predicate in predicates:
+            table |= self.tables[attribute][predicate]
+        # Codes outside the alphabet (-1) never match
+        return np.append(table, False)[codes]
+
+    def save(self, path):
+        """Write the alphabets to a JSON file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({attribute: list(symbols) for attribute, symbols in self.symbols.items()}, f)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Read alphabets written by save (lookup tables are rebuilt)"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        alphabet = cls(attributes=list(data))
+        for attribute, symbols in data.items():
+            alphabet._set_symbols(attribute, symbols)
+        return alphabet
@@ -1,18 +1,36 @@
 import os
 import pandas as pd
 import numpy as np
-import pm4py
 from datetime import datetime
 from collections import defaultdict
 
+from src.preprocessing.prefix_trie import PrefixTrie
+from src.preprocessing.event_alphabet import EventAlphabet
+from src.preprocessing import feature_registry
+from src.preprocessing.xes_reader import read_xes_columns
+
 class FeatureExtractor:
+    # Bump when the extracted features change so cached extraction results are invalidated
+    VERSION = '1'
+    
     def __init__(self, log_path=None):
         self.log_path = log_path
         self.log = None
         self.df = None
+        # Activity prefixes of the last extraction with their control-flow features (see PrefixTrie)
+        self.prefix_trie = None
+        # Integer codes and predicate tables of the loaded log's activities, resources and groups
+        self.alphabet = None
+        # Every attribute of the loaded log, including the ones not loaded into df
+        self.log_columns = None
         
-    def load_log(self, log_path=None):
-        """Load an XES event log file"""
+    def load_log(self, log_path=None, attributes=None):
+        """
+        Load an XES event log file
+
+        With attributes, only those event columns (plus case, activity and timestamp)
+        are read, by a streaming parser instead of pm4py.
+        """
         if log_path:
             self.log_path = log_path
             
@@ -20,8 +38,16 @@ class FeatureExtractor:
             raise ValueError("Log path must be provided")
             
         try:
-            self.log = pm4py.read_xes(self.log_path)
-            self.df = pm4py.convert_to_dataframe(self.log)
+            if attributes is not None:
+                self.log = None
+                self.df, self.log_columns = read_xes_columns(self.log_path, attributes)
+            else:
+                # pm4py is slow to import, so only the stages that read XES logs pay for it
+                import pm4py
+                self.log = pm4py.read_xes(self.log_path)
+                self.df = pm4py.convert_to_dataframe(self.log)
+                self.log_columns = list(self.df.columns)
+            self.alphabet = EventAlphabet().fit(self.df)
             print(f"Loaded log from {self.log_path}")
             return self.df
         except Exception as e:
@@ -49,13 +75,19 @@ class FeatureExtractor:
         # Create features
         features = []
         next_events = []
+        self.prefix_trie = PrefixTrie()
         
         for case_id, group in self.df.groupby('case:concept:name'):
             group = group.reset_index(drop=True)
+            activities = group['concept:name'].tolist()
+            # Control-flow features come from the shared prefix nodes
+            nodes = self.prefix_trie.insert(activities)
+            trace_counts = group['concept:name'].value_counts()
             
             for i in range(len(group) - 1):  # -1 because we're predicting next activity
                 current_row = group.iloc[i]
                 next_row = group.iloc[i + 1]
+                position, unique, _, _ = self.prefix_trie.features[nodes[i]]
                 
                 # Basic features
                 feature_dict = {
@@ -63,10 +95,11 @@ class FeatureExtractor:
                     'current_activity': current_row['concept:name'],
                     'time_since_start': (current_row['time:timestamp'] - group['time:timestamp'].min()).total_seconds(),
                     'time_since_last_event': 0 if i == 0 else (current_row['time:timestamp'] - group.iloc[i-1]['time:timestamp']).total_seconds(),
-                    'event_position': i + 1,
+                    'event_position': position,
                     'trace_length': len(group),
-                    'repeated_activities': group['concept:name'].value_counts()[current_row['concept:name']],
-                    'unique_activities_so_far': len(group.iloc[:i+1]['concept:name'].unique()),
+                    # Occurrences in the whole trace, not only the prefix
+                    'repeated_activities': trace_counts[current_row['concept:name']],
+                    'unique_activities_so_far': unique,
                 }
                 
                 # Add department/organization if available
@@ -106,16 +139,18 @@ class FeatureExtractor:
         
         features = []
         next_events = []
-        
-        # Add START to possible events
-        all_events = list(self.df['concept:name'].unique()) + ['START']
+        self.prefix_trie = PrefixTrie()
         
         for case_id, group in self.df.groupby('case:concept:name'):
             group = group.reset_index(drop=True)
+            # Position, distinct and repeated activities and the previous events only depend
+            # on the activity prefix, so they are computed once per trie node
+            nodes = self.prefix_trie.insert(group['concept:name'].tolist())
             
             for i in range(len(group) - 1):
                 current_row = group.iloc[i]
                 next_row = group.iloc[i + 1]
+                position, unique_activities, current_event_freq, prev_events = self.prefix_trie.features[nodes[i]]
                 
                 # Enhanced temporal features
                 time_since_start = (current_row['time:timestamp'] - group['time:timestamp'].min()).total_seconds()
@@ -123,16 +158,6 @@ class FeatureExtractor:
                 time_of_day = current_row['time:timestamp'].hour
                 weekend = int(current_row['time:timestamp'].weekday() >= 5)
                 
-                # Previous events sequence (last 5 events)
-                prev_events = group.iloc[max(0, i-4):i+1]['concept:name'].tolist()
-                while len(prev_events) < 5:
-                    prev_events.insert(0, 'START')
-                
-                # Event frequency features
-                events_so_far = group.iloc[:i+1]['concept:name'].tolist()
-                event_frequencies = pd.Series(events_so_far).value_counts()
-                current_event_freq = event_frequencies[current_row['concept:name']]
-                
                 # Department transition patterns
                 if 'org:group' in group.columns:
                     dept_sequence = group.iloc[:i+1]['org:group'].tolist()
@@ -169,9 +194,9 @@ class FeatureExtractor:
                     'time_since_last_event': time_since_last,
                     'time_of_day': time_of_day,
                     'weekend': weekend,
-                    'event_position': i + 1,
+                    'event_position': position,
                     'trace_length': len(group),
-                    'unique_activities': len(pd.Series(events_so_far).unique()),
+                    'unique_activities': unique_activities,
                     'repeated_activities': current_event_freq,
                     'current_event': current_row['concept:name'],
                     'dept_changes': dept_transitions,
@@ -182,8 +207,8 @@ class FeatureExtractor:
                 if 'org:group' in current_row:
                     feature_dict['department'] = current_row['org:group']
                 
-                # Add previous events
-                for j, event in enumerate(prev_events[-5:], 1):
+                # Add previous events (last 5 events, padded with START)
+                for j, event in enumerate(prev_events, 1):
                     feature_dict[f'prev_event_{j}'] = event
                 
                 # Add SIRS criteria
@@ -229,9 +254,11 @@ class FeatureExtractor:
         
         features = []
         next_events = []
+        self.prefix_trie = PrefixTrie()
         
         for case_id, group in self.df.groupby('case:concept:name'):
             group = group.reset_index(drop=True)
+            nodes = self.prefix_trie.insert(group['concept:name'].tolist())
             
             for i in range(len(group) - 1):
                 current_row = group.iloc[i]
@@ -246,7 +273,7 @@ class FeatureExtractor:
                     'case_id': case_id,
                     'time_since_start': time_since_start,
                     'time_since_last_event': time_since_last,
-                    'event_position': i + 1,
+                    'event_position': self.prefix_trie.features[nodes[i]][0],
                     'trace_length': len(group),
                     'current_event': current_row['concept:name'],
                 }
@@ -274,8 +301,10 @@ class FeatureExtractor:
         
         return X, y
     
-    def extract_features(self, dataset_type=None):
-        """Extract features based on dataset type"""
+    def extract_features(self, dataset_type=None, features=None):
+        """Extract features based on dataset type (only the listed ones if features is given)"""
+        if features is not None:
+            return self.extract_selected(features, dataset_type)
         if self.df is None:
             raise ValueError("Event log not loaded. Call load_log() first.")
             
@@ -296,3 +325,45 @@ class FeatureExtractor:
             return self.extract_bpi_features()
         else:
             return self.extract_basic_features()
+
+    def available_features(self, dataset_type=None):
+        """Columns extract_features(dataset_type) would return for the loaded log"""
+        if self.log_columns is None:
+            raise ValueError("Event log not loaded. Call load_log() first.")
+        profile = feature_registry.detect_profile(self.log_columns, dataset_type)
+        return list(feature_registry.PROFILES[profile](self.log_columns))
+
+    def extract_selected(self, features, dataset_type=None):
+        """
+        Extract only the listed features (named as extract_features names them)
+
+        Each feature is computed by its vectorized kernel in the feature registry,
+        together with the features it depends on and nothing else. If no log is
+        loaded yet, only the attributes those features read are loaded from log_path.
+        Features the log does not provide are skipped.
+
+        Returns:
+            (X, y) as extract_features, with the available features in the requested order
+        """
+        if self.df is None:
+            attributes = set()
+            for name in features:
+                name = feature_registry.ALIASES.get(name, name)
+                if feature_registry.resolve(name) is not None:
+                    attributes.update(feature_registry.required_attributes([name]))
+            self.load_log(attributes=sorted(attributes))
+
+        profile_name = feature_registry.detect_profile(self.log_columns, dataset_type)
+        profile = feature_registry.PROFILES[profile_name](self.log_columns)
+        selected = [name for name in features if name in profile]
+        missing = [name for name in features if name not in profile]
+        if missing:
+            print(f"Skipping features not available for this log: {missing}")
+        print(f"Extracting {len(selected)} {profile_name} features")
+
+        # A log loaded for other features may lack attributes these ones read
+        needed = feature_registry.required_attributes([profile[name] for name in selected])
+        if any(col not in self.df.columns for col in needed):
+            self.load_log(attributes=sorted(set(self.df.columns) | set(needed)))
+        self.prefix_trie = None
+        return feature_registry.compute_features(self.df[needed], profile, selected)
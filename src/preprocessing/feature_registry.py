@@ -0,0 +1,437 @@
+import re
+import numpy as np
+import pandas as pd
+
+from src.preprocessing.xes_reader import CORE_ATTRIBUTES
+
+CASE = 'case:concept:name'
+ACTIVITY = 'concept:name'
+TIMESTAMP = 'time:timestamp'
+
+# Clinical test columns of the Sepsis log
+TEST_COLUMNS = ['CRP', 'Leucocytes', 'LacticAcid']
+# Length of the previous-event window (prev_event_1 is the oldest, prev_event_5 the current event)
+WINDOW = 5
+# Features counted over the whole trace rather than the prefix: every training row has the
+# value of its completed case, while a running case only has the events seen so far
+CASE_COMPLETE_FEATURES = ['trace_length', 'trace_repeated_activities', 'current_dept_duration']
+
+
+class Feature:
+    def __init__(self, name, kernel, columns=(), depends=()):
+        """
+        One registered feature
+
+        Args:
+            name: Feature (or intermediate, if it starts with '_') name
+            kernel: Callable(context) returning one value per event as a Series or array
+            columns: Event log attributes the kernel reads
+            depends: Features the kernel reads through context.get
+        """
+        self.name = name
+        self.kernel = kernel
+        self.columns = list(columns)
+        self.depends = list(depends)
+
+
+# Registered features by name and pattern features as (regex, factory(match) -> Feature)
+FEATURES = {}
+PATTERNS = []
+
+
+def register(name, columns=(), depends=()):
+    """Decorator registering a vectorized feature kernel"""
+    def decorator(kernel):
+        FEATURES[name] = Feature(name, kernel, columns, depends)
+        return kernel
+    return decorator
+
+
+def register_pattern(regex):
+    """Decorator registering a factory for a family of features (e.g. '<test>_last')"""
+    def decorator(factory):
+        PATTERNS.append((re.compile(regex), factory))
+        return factory
+    return decorator
+
+
+def resolve(name):
+    """Feature registered under name or produced by a pattern factory, or None"""
+    if name in FEATURES:
+        return FEATURES[name]
+    for regex, factory in PATTERNS:
+        match = regex.fullmatch(name)
+        if match:
+            return factory(name, match)
+    return None
+
+
+class FeatureContext:
+    def __init__(self, events):
+        """
+        Events of a log sorted by case and time, with memoized feature columns
+
+        Args:
+            events: Event frame with at least the case, activity and timestamp columns
+        """
+        events = events.copy()
+        ts = events[TIMESTAMP]
+        if getattr(ts.dt, 'tz', None) is not None:
+            events[TIMESTAMP] = ts.dt.tz_convert('UTC').dt.tz_localize(None)
+        self.events = events.sort_values([CASE, TIMESTAMP]).reset_index(drop=True)
+        self.cases = self.events.groupby(CASE, sort=False)
+        self.values = {}
+
+    def column(self, name):
+        return self.events[name]
+
+    def by_case(self, values):
+        """Group a per-event Series by case"""
+        return values.groupby(self.events[CASE], sort=False)
+
+    def get(self, name):
+        """Per-event values of a feature, computing it (and its dependencies) once"""
+        if name not in self.values:
+            feature = resolve(name)
+            if feature is None:
+                raise KeyError(f"Unknown feature: {name}")
+            values = feature.kernel(self)
+            self.values[name] = pd.Series(np.asarray(values), index=self.events.index, name=name)
+        return self.values[name]
+
+
+# --- Intermediate features ---------------------------------------------------------------------
+
+@register('_position', columns=[CASE])
+def _position(ctx):
+    return ctx.cases.cumcount()
+
+
+@register('_is_first', depends=['_position'])
+def _is_first(ctx):
+    return ctx.get('_position') == 0
+
+
+# --- Case, time and control-flow features ---------------------------------------------------------
+
+@register('case_id', columns=[CASE])
+def case_id(ctx):
+    return ctx.column(CASE)
+
+
+@register('current_event', columns=[ACTIVITY])
+def current_event(ctx):
+    return ctx.column(ACTIVITY)
+
+
+@register('time_since_start', columns=[TIMESTAMP])
+def time_since_start(ctx):
+    ts = ctx.column(TIMESTAMP)
+    return (ts - ctx.by_case(ts).transform('min')).dt.total_seconds()
+
+
+@register('time_since_last_event', columns=[TIMESTAMP], depends=['_is_first'])
+def time_since_last_event(ctx):
+    ts = ctx.column(TIMESTAMP)
+    return ts.diff().dt.total_seconds().where(~ctx.get('_is_first'), 0.0)
+
+
+@register('time_of_day', columns=[TIMESTAMP])
+def time_of_day(ctx):
+    # int64 like the extractors, so the fitted scaler sees the same numeric columns
+    return ctx.column(TIMESTAMP).dt.hour.astype(np.int64)
+
+
+@register('weekend', columns=[TIMESTAMP])
+def weekend(ctx):
+    return (ctx.column(TIMESTAMP).dt.weekday >= 5).astype(int)
+
+
+@register('event_position', depends=['_position'])
+def event_position(ctx):
+    return ctx.get('_position') + 1
+
+
+@register('trace_length', columns=[CASE])
+def trace_length(ctx):
+    return ctx.cases[CASE].transform('size')
+
+
+@register('unique_activities', columns=[CASE, ACTIVITY])
+def unique_activities(ctx):
+    # Distinct activities of the prefix: first occurrences counted up to each event
+    first_seen = (~ctx.events.duplicated([CASE, ACTIVITY])).astype(int)
+    return ctx.by_case(first_seen).cumsum()
+
+
+@register('repeated_activities', columns=[CASE, ACTIVITY])
+def repeated_activities(ctx):
+    # Occurrences of the current activity within the prefix
+    return ctx.events.groupby([CASE, ACTIVITY], sort=False).cumcount() + 1
+
+
+@register('trace_repeated_activities', columns=[CASE, ACTIVITY])
+def trace_repeated_activities(ctx):
+    # Occurrences of the current activity within the whole trace
+    return ctx.events.groupby([CASE, ACTIVITY], sort=False)[ACTIVITY].transform('size')
+
+
+@register_pattern(r'prev_event_([1-5])')
+def _prev_event(name, match):
+    lag = WINDOW - int(match.group(1))
+    def kernel(ctx):
+        return ctx.by_case(ctx.column(ACTIVITY)).shift(lag).fillna('START') if lag else ctx.column(ACTIVITY)
+    return Feature(name, kernel, columns=[CASE, ACTIVITY])
+
+
+# --- Organisational features ------------------------------------------------------------------------
+
+@register('department', columns=['org:group'])
+def department(ctx):
+    return ctx.column('org:group')
+
+
+@register('dept_changes', columns=[CASE, 'org:group'], depends=['_is_first'])
+def dept_changes(ctx):
+    group = ctx.column('org:group')
+    changed = (group != ctx.by_case(group).shift()) & ~ctx.get('_is_first')
+    return ctx.by_case(changed.astype(int)).cumsum()
+
+
+@register('current_dept_duration', columns=[CASE, 'org:group'])
+def current_dept_duration(ctx):
+    # Events of the whole trace in the current department (0 when it is missing)
+    group = ctx.column('org:group')
+    sizes = ctx.events.groupby([CASE, 'org:group'], sort=False, dropna=False)[CASE].transform('size')
+    return sizes.where(group.notna(), 0)
+
+
+# --- Sepsis test and SIRS features ------------------------------------------------------------------
+
+@register_pattern(r'(CRP|Leucocytes|LacticAcid)_(last|mean|max|count)')
+def _test_history(name, match):
+    column, statistic = match.group(1), match.group(2)
+    def kernel(ctx):
+        values = ctx.column(column)
+        count = ctx.by_case(values.notna().astype(int)).cumsum()
+        if statistic == 'count':
+            return count
+        if statistic == 'last':
+            return ctx.by_case(values).ffill().fillna(0)
+        if statistic == 'max':
+            return ctx.by_case(ctx.by_case(values).cummax()).ffill().fillna(0)
+        total = ctx.by_case(values.fillna(0)).cumsum()
+        return (total / count.where(count > 0)).fillna(0)
+    return Feature(name, kernel, columns=[CASE, column])
+
+
+@register_pattern(r'(SIRS\w+)_(changes|duration)')
+def _sirs_history(name, match):
+    column, statistic = match.group(1), match.group(2)
+    def kernel(ctx):
+        values = ctx.column(column)
+        if statistic == 'duration':
+            return ctx.by_case((values == 1).astype(int)).cumsum()
+        # The first event of a case always counts as a change
+        changed = (values != ctx.by_case(values).shift()).astype(int)
+        return ctx.by_case(changed).cumsum()
+    return Feature(name, kernel, columns=[CASE, column])
+
+
+# --- Raw attributes -----------------------------------------------------------------------------------
+
+@register_pattern(r'current_(.+)')
+def _current_attribute(name, match):
+    column = match.group(1)
+    return Feature(name, lambda ctx: ctx.column(column), columns=[column])
+
+
+@register_pattern(r'state_(.+)')
+def _state_attribute(name, match):
+    column = match.group(1)
+    return Feature(name, lambda ctx: ctx.column(column), columns=[column])
+
+
+@register_pattern(r'(SIRS\w+|CRP|Leucocytes|LacticAcid)')
+def _raw_attribute(name, match):
+    return Feature(name, lambda ctx: ctx.column(name), columns=[name])
+
+
+@register('amount', columns=['Amount'])
+def amount(ctx):
+    return ctx.column('Amount')
+
+
+# --- Extractor profiles -----------------------------------------------------------------------------
+
+def sepsis_profile(log_columns):
+    """Columns of FeatureExtractor.extract_sepsis_features, in order, mapped to registry features"""
+    profile = {name: name for name in ['case_id', 'time_since_start', 'time_since_last_event', 'time_of_day',
+                                       'weekend', 'event_position', 'trace_length', 'unique_activities',
+                                       'repeated_activities', 'current_event']}
+    if 'org:group' in log_columns:
+        profile.update({name: name for name in ['dept_changes', 'current_dept_duration', 'department']})
+    else:
+        # Without departments the extractor still emits zero-valued transition features
+        profile.update({'dept_changes': None, 'current_dept_duration': None})
+    profile.update({f'prev_event_{j}': f'prev_event_{j}' for j in range(1, WINDOW + 1)})
+
+    sirs_columns = [col for col in log_columns if col.startswith('SIRS')]
+    tests = [col for col in TEST_COLUMNS if col in log_columns]
+    names = []
+    for col in sirs_columns:
+        names += [f'{col}_changes', f'{col}_duration']
+    for col in tests:
+        names += [f'{col}_last', f'{col}_mean', f'{col}_max']
+    names += [f'{col}_count' for col in tests] + sirs_columns + tests
+    profile.update({name: name for name in names})
+    return profile
+
+
+def bpi_profile(log_columns):
+    """Columns of FeatureExtractor.extract_bpi_features, in order, mapped to registry features"""
+    profile = {name: name for name in ['case_id', 'time_since_start', 'time_since_last_event',
+                                       'event_position', 'trace_length', 'current_event']}
+    if 'Amount' in log_columns:
+        profile['amount'] = 'amount'
+    for col in log_columns:
+        if 'APPROVED' in col or 'REJECTED' in col:
+            profile[f'state_{col}'] = f'state_{col}'
+    for col in log_columns:
+        if col not in [TIMESTAMP, CASE, ACTIVITY] and col not in profile:
+            profile[f'current_{col}'] = f'current_{col}'
+    return profile
+
+
+def basic_profile(log_columns):
+    """Columns of FeatureExtractor.extract_basic_features, in order, mapped to registry features"""
+    profile = {
+        'case_id': 'case_id',
+        'current_activity': 'current_event',
+        'time_since_start': 'time_since_start',
+        'time_since_last_event': 'time_since_last_event',
+        'event_position': 'event_position',
+        'trace_length': 'trace_length',
+        'repeated_activities': 'trace_repeated_activities',
+        'unique_activities_so_far': 'unique_activities'
+    }
+    if 'org:group' in log_columns:
+        profile['department'] = 'department'
+    for col in log_columns:
+        if col not in [TIMESTAMP, CASE, ACTIVITY, 'org:group']:
+            profile[f'current_{col}'] = f'current_{col}'
+    return profile
+
+
+PROFILES = {
+    'sepsis': sepsis_profile,
+    'bpi': bpi_profile,
+    'basic': basic_profile
+}
+
+# Names the basic profile gives to registry features
+ALIASES = {
+    'current_activity': 'current_event',
+    'unique_activities_so_far': 'unique_activities'
+}
+
+
+def detect_profile(log_columns, dataset_type=None):
+    """
+    Profile whose columns FeatureExtractor.extract_features would produce for a log
+
+    Mirrors the extractor's checks: an unrecognised dataset_type, or a log that does
+    not look like the requested dataset, falls back to the basic features.
+    """
+    is_sepsis = any(col in log_columns for col in TEST_COLUMNS)
+    is_bpi = 'Amount' in log_columns or 'declaration' in " ".join(log_columns).lower()
+    if dataset_type is None:
+        if is_sepsis or any(col.startswith('SIRS') for col in log_columns):
+            dataset_type = 'sepsis'
+        elif is_bpi:
+            dataset_type = 'bpi'
+    dataset_type = (dataset_type or 'basic').lower()
+    if dataset_type == 'sepsis' and is_sepsis:
+        return 'sepsis'
+    if dataset_type == 'bpi' and is_bpi:
+        return 'bpi'
+    return 'basic'
+
+
+def profile_for(feature_names):
+    """
+    Registry features behind the columns of a trained feature set (e.g. the feature
+    names saved with the DataTransformer), so new logs are featurized like the
+    training log without knowing its dataset type or columns
+    """
+    feature_names = list(feature_names)
+    if 'current_activity' in feature_names:
+        profile = basic_profile([])
+    elif 'time_of_day' in feature_names:
+        # The extractor only emits department features when the log has departments
+        profile = sepsis_profile(['org:group'] if 'department' in feature_names else [])
+    else:
+        profile = {}
+    return {name: profile.get(name, name) for name in feature_names}
+
+
+def required_attributes(feature_names):
+    """Event log attributes needed to compute registry features (and their dependencies)"""
+    attributes = set(CORE_ATTRIBUTES)
+    pending, visited = list(feature_names), set()
+    while pending:
+        name = pending.pop()
+        if name is None or name in visited:
+            continue
+        visited.add(name)
+        feature = resolve(name)
+        if feature is None:
+            raise KeyError(f"Unknown feature: {name}")
+        attributes.update(feature.columns)
+        pending.extend(feature.depends)
+    return sorted(attributes)
+
+
+def prefix_rows(ctx, prefixes='next'):
+    """
+    Mask of the events whose prefixes get a feature row
+
+    Args:
+        ctx: FeatureContext of the events
+        prefixes: 'next' for every event with a successor (the training rows), 'last'
+            for the current prefix of every case, 'all' for every event
+    """
+    position, size = ctx.get('_position'), ctx.cases[CASE].transform('size')
+    if prefixes == 'next':
+        return (position < size - 1).to_numpy()
+    if prefixes == 'last':
+        return (position == size - 1).to_numpy()
+    if prefixes == 'all':
+        return np.ones(len(ctx.events), dtype=bool)
+    raise ValueError(f"Unknown prefixes: {prefixes} (expected 'next', 'last' or 'all')")
+
+
+def compute_features(events, profile, names, prefixes='next'):
+    """
+    Compute selected features of a profile over an event frame
+
+    Args:
+        events: Event frame (e.g. from read_xes_columns) with the required attributes,
+            or a FeatureContext built from one
+        profile: Dict of output column -> registry feature (None for constant-zero columns)
+        names: Output columns to compute, in order
+        prefixes: Prefixes to compute rows for (see prefix_rows)
+
+    Returns:
+        (X, y): one row per selected prefix, and the activity of its next event
+        (NaN for the last event of a case)
+    """
+    ctx = events if isinstance(events, FeatureContext) else FeatureContext(events)
+    next_event = ctx.by_case(ctx.column(ACTIVITY)).shift(-1)
+    rows = prefix_rows(ctx, prefixes)
+
+    X = pd.DataFrame(index=ctx.events.index[rows])
+    for name in names:
+        feature_name = profile[name]
+        X[name] = 0 if feature_name is None else ctx.get(feature_name)[rows]
+    return X.reset_index(drop=True), pd.Series(next_event[rows].to_numpy())
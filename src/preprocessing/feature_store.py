@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+
+class FeatureMatrixStore:
+    MATRIX_FILE = 'X.npy'
+    LABELS_FILE = 'y.npy'
+    MANIFEST_FILE = 'manifest.json'
+
+    def __init__(self, store_dir):
+        """
+        On-disk feature matrix for a train or test split
+
+        The matrix is stored as a float32 .npy file that is opened with
+        mmap_mode='r', so processes reading the same split share one copy
+        in the page cache and pay no deserialization cost. Labels are stored
+        as integer codes next to it, and a JSON manifest records the columns,
+        the label classes and the categorical encoders.
+
+        Args:
+            store_dir: Directory holding X.npy, y.npy and manifest.json
+        """
+        self.store_dir = store_dir
+        self.matrix_path = os.path.join(store_dir, self.MATRIX_FILE)
+        self.labels_path = os.path.join(store_dir, self.LABELS_FILE)
+        self.manifest_path = os.path.join(store_dir, self.MANIFEST_FILE)
+
+    def exists(self):
+        """Check whether a complete store is present (the manifest is written last)"""
+        return (os.path.exists(self.manifest_path) and os.path.exists(self.matrix_path)
+                and os.path.exists(self.labels_path))
+
+    def read_manifest(self):
+        """Return the manifest dictionary, or None if the store does not exist"""
+        if not self.exists():
+            return None
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+
+    def is_current(self, key):
+        """Check whether the store was written for the given content key"""
+        manifest = self.read_manifest()
+        return manifest is not None and key is not None and manifest.get('key') == key
+
+    def write(self, X, y, feature_names=None, label_encoders=None, key=None, metadata=None, chunk_size=100000):
+        """
+        Write a feature matrix and its labels
+
+        Args:
+            X: DataFrame or 2D array of numeric (already encoded) features
+            y: Labels aligned with the rows of X
+            feature_names: Column names (defaults to X.columns)
+            label_encoders: Optional dict of fitted LabelEncoders stored in the manifest
+            key: Optional content key (e.g. the artifact cache key of the split)
+            metadata: Optional extra JSON-serializable information
+            chunk_size: Number of rows converted to float32 at a time
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        if feature_names is None:
+            feature_names = X.columns.tolist() if hasattr(X, 'columns') else [f"f{i}" for i in range(X.shape[1])]
+
+        # Remove the manifest first so readers never pair it with a half-written matrix
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+        n_rows, n_cols = X.shape
+        tmp_matrix = f"{self.matrix_path}.tmp"
+        matrix = np.lib.format.open_memmap(tmp_matrix, mode='w+', dtype=np.float32, shape=(n_rows, n_cols))
+        values = X.to_numpy() if hasattr(X, 'to_numpy') else np.asarray(X)
+        for start in range(0, n_rows, chunk_size):
+            matrix[start:start + chunk_size] = values[start:start + chunk_size].astype(np.float32)
+        matrix.flush()
+        del matrix
+        os.replace(tmp_matrix, self.matrix_path)
+
+        # Labels are stored as integer codes into the sorted list of classes
+        labels = np.asarray(y)
+        classes, codes = np.unique(labels.astype(str) if labels.dtype == object else labels, return_inverse=True)
+        tmp_labels = f"{self.labels_path}.tmp.npy"
+        np.save(tmp_labels, codes.astype(np.int32))
+        os.replace(tmp_labels, self.labels_path)
+
+        manifest = {
+            'key': key,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'shape': [int(n_rows), int(n_cols)],
+            'dtype': 'float32',
+            'columns': list(feature_names),
+            'label_classes': classes.tolist(),
+            'encoders': {
+                col: [str(c) for c in encoder.classes_]
+                for col, encoder in (label_encoders or {}).items() if hasattr(encoder, 'classes_')
+            },
+            'metadata': metadata or {}
+        }
+        tmp_manifest = f"{self.manifest_path}.tmp"
+        with open(tmp_manifest, 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+        os.replace(tmp_manifest, self.manifest_path)
+
+        print(f"Feature matrix ({n_rows} x {n_cols}) saved to {self.store_dir}")
+        return manifest
+
+    def open(self, mmap_mode='r'):
+        """
+        Open the store
+
+        Args:
+            mmap_mode: Passed to np.load (None loads the matrix into memory)
+
+        Returns:
+            Tuple of (X array, decoded labels, manifest)
+        """
+        manifest = self.read_manifest()
+        if manifest is None:
+            raise FileNotFoundError(f"No feature matrix store found in {self.store_dir}")
+
+        X = np.load(self.matrix_path, mmap_mode=mmap_mode)
+        codes = np.load(self.labels_path)
+        y = np.asarray(manifest['label_classes'])[codes]
+        return X, y, manifest
+
+    def open_frame(self, mmap_mode='r'):
+        """
+        Open the store as a DataFrame view over the memory map and a label Series.
+        The DataFrame wraps the mapped array without copying it.
+        """
+        X, y, manifest = self.open(mmap_mode=mmap_mode)
+        X_df = pd.DataFrame(X, columns=manifest['columns'], copy=False)
+        return X_df, pd.Series(y, name='next_event'), manifest
@@ -0,0 +1,128 @@
+import os
+import json
+from collections import Counter
+
+# Padding of the previous-event window before the first event of a trace
+START = 'START'
+
+
+class PrefixTrie:
+    # Events in the previous-event window (prev_event_1 is the oldest, prev_event_5 the current one)
+    WINDOW = 5
+
+    def __init__(self):
+        """
+        Trie over the activity prefixes of an event log
+
+        Every node is one distinct prefix and stores its control-flow features once:
+        event position, number of distinct activities, occurrences of the last
+        activity and the window of the last WINDOW activities. Cases that share a
+        prefix share its node, so these features are computed once per distinct
+        prefix instead of once per event. Following an activity from a node is a
+        dict lookup, so the features of a live prefix are available in O(1) per
+        event at prediction time.
+        """
+        # Node 0 is the empty prefix
+        self.children = {}
+        self.parent = [-1]
+        self.activity = [None]
+        self.features = [(0, 0, 0, (START,) * self.WINDOW)]
+        self.visits = [0]
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _add_node(self, node, activity, counts):
+        """Create the child of node for activity; counts holds the activity counts of the child's prefix"""
+        position, _, _, window = self.features[node]
+        child = len(self.parent)
+        self.children[(node, activity)] = child
+        self.parent.append(node)
+        self.activity.append(activity)
+        self.features.append((position + 1, len(counts), counts[activity], window[1:] + (activity,)))
+        self.visits.append(0)
+        return child
+
+    def insert(self, activities):
+        """
+        Add a trace and return its node per event (node of the prefix ending at that event)
+        """
+        nodes = []
+        node = 0
+        counts = Counter()
+        for activity in activities:
+            counts[activity] += 1
+            child = self.children.get((node, activity))
+            if child is None:
+                child = self._add_node(node, activity, counts)
+            self.visits[child] += 1
+            nodes.append(child)
+            node = child
+        return nodes
+
+    def step(self, node, activity, extend=True):
+        """
+        Node of the prefix of node followed by activity
+
+        Unseen prefixes are added when extend is True (their counts are rebuilt from
+        the path to the root), otherwise None is returned.
+        """
+        child = self.children.get((node, activity))
+        if child is not None or not extend:
+            return child
+        counts = Counter(self.prefix(node))
+        counts[activity] += 1
+        return self._add_node(node, activity, counts)
+
+    def find(self, activities, extend=False):
+        """Node of a whole prefix (None if it is unseen and extend is False)"""
+        node = 0
+        for activity in activities:
+            node = self.step(node, activity, extend=extend)
+            if node is None:
+                return None
+        return node
+
+    def prefix(self, node):
+        """Activities of the prefix a node stands for"""
+        activities = []
+        while node > 0:
+            activities.append(self.activity[node])
+            node = self.parent[node]
+        return activities[::-1]
+
+    def node_features(self, node):
+        """Control-flow features of a node as a dict (event_position, unique_activities, repeated_activities, prev_event_1..5)"""
+        position, unique, repeated, window = self.features[node]
+        features = {'event_position': position, 'unique_activities': unique, 'repeated_activities': repeated}
+        for j, event in enumerate(window, 1):
+            features[f'prev_event_{j}'] = event
+        return features
+
+    def stats(self):
+        """Number of nodes and of prefix events they stand for (the sharing factor is events / nodes)"""
+        return {'nodes': len(self) - 1, 'events': sum(self.visits)}
+
+    def save(self, path):
+        """Write the trie to a JSON file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'parent': self.parent, 'activity': self.activity, 'visits': self.visits}, f)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Read a trie written by save (the node features are recomputed in one pass)"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        trie = cls()
+        # Parents always precede their children, so each node's counts extend its parent's
+        counts = [Counter()]
+        for node in range(1, len(data['parent'])):
+            parent, activity = data['parent'][node], data['activity'][node]
+            node_counts = counts[parent].copy()
+            node_counts[activity] += 1
+            trie._add_node(parent, activity, node_counts)
+            counts.append(node_counts)
+        trie.visits = list(data['visits'])
+        return trie
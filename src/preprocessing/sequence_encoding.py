@@ -0,0 +1,255 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from src.preprocessing.feature_registry import FeatureContext, CASE, ACTIVITY, prefix_rows
+
+# Encoder saved next to the models trained with n-gram columns (see ModelTrainer.save_models)
+NGRAM_ENCODER_FILE = 'ngram_encoder.json'
+
+
+def default_ngram_config():
+    """'ngrams' section of a training configuration (disabled by default)"""
+    return {
+        'enabled': False,
+        # Longest n-gram counted; 1 is a bag of activities
+        'max_n': 3,
+        # n-grams occurring fewer times in the log are left out of the vocabulary
+        'min_count': 1
+    }
+
+
+def _case_bounds(cases):
+    """Case codes of events grouped by case, and the index of each event's last case event"""
+    case_codes = pd.factorize(pd.Series(np.asarray(cases, dtype=object)))[0]
+    starts = np.flatnonzero(np.r_[True, case_codes[1:] != case_codes[:-1]])
+    lengths = np.diff(np.r_[starts, len(case_codes)])
+    case_of_run = np.repeat(np.arange(len(starts)), lengths)
+    ends = (starts + lengths - 1)[case_of_run]
+    positions = np.arange(len(case_codes)) - starts[case_of_run]
+    return case_of_run, positions, ends
+
+
+class PrefixNgramEncoder:
+    def __init__(self, max_n=3, min_count=1):
+        """
+        Sparse bag-of-activities and n-gram counts of activity prefixes
+
+        Row i of the encoded matrix counts every n-gram (n = 1..max_n) of the prefix
+        ending at event i. A prefix's counts are its predecessor's plus the n-grams
+        ending at its last event, so the matrix is built from the n-gram occurrences
+        alone: each occurrence fills the rows from its event to the end of its case.
+        Trees split on the counts directly instead of on label-encoded window slots.
+
+        Args:
+            max_n: Longest n-gram (1 counts activities only)
+            min_count: Minimum number of occurrences of an n-gram in the fitted log
+        """
+        self.max_n = max_n
+        self.min_count = min_count
+        self.activities = None
+        self.keys = None
+
+    def _codes(self, activities):
+        """1-based activity codes (0 for activities outside the alphabet)"""
+        codes = pd.Categorical(np.asarray(activities, dtype=object), categories=self.activities).codes
+        return codes.astype(np.int64) + 1
+
+    def _occurrences(self, cases, activities):
+        """
+        Every n-gram occurrence as (event index, n-gram key); a key packs the codes of an
+        n-gram into one integer with base len(activities) + 1
+        """
+        codes = self._codes(activities)
+        _, positions, _ = _case_bounds(cases)
+        base = len(self.activities) + 1
+        rows, keys = [], []
+        key = np.zeros(len(codes), dtype=np.int64)
+        valid = codes > 0
+        for n in range(1, self.max_n + 1):
+            # key of the n-gram ending at each event, from the (n-1)-gram ending at its predecessor
+            shifted = np.zeros(len(codes), dtype=np.int64)
+            shifted[1:] = key[:-1]
+            key = shifted * base + codes
+            previous_valid = np.zeros(len(codes), dtype=bool)
+            previous_valid[1:] = valid[:-1]
+            valid = (codes > 0) & (previous_valid if n > 1 else True) & (positions >= n - 1)
+            rows.append(np.flatnonzero(valid))
+            keys.append(key[valid])
+        return np.concatenate(rows), np.concatenate(keys)
+
+    def fit(self, cases, activities):
+        """
+        Learn the activity alphabet and the n-gram vocabulary
+
+        Args:
+            cases, activities: Case and activity of every event, grouped by case in time order
+        """
+        self.activities = list(pd.unique(pd.Series(np.asarray(activities, dtype=object)).dropna()))
+        if (len(self.activities) + 1) ** self.max_n >= 2 ** 62:
+            raise ValueError(f"max_n={self.max_n} is too large for {len(self.activities)} activities")
+        _, keys = self._occurrences(cases, activities)
+        unique, counts = np.unique(keys, return_counts=True)
+        self.keys = unique[counts >= self.min_count]
+        return self
+
+    def transform(self, cases, activities):
+        """
+        CSR matrix (events x vocabulary, float32) of the n-gram counts of each event's prefix
+
+        Args:
+            cases, activities: Case and activity of every event, grouped by case in time order
+        """
+        from scipy import sparse
+
+        if self.keys is None:
+            raise ValueError("Encoder not fitted. Call fit() first.")
+        case_of_event, _, ends = _case_bounds(cases)
+        rows, keys = self._occurrences(cases, activities)
+        columns = np.searchsorted(self.keys, keys)
+        known = (columns < len(self.keys)) & (self.keys[np.minimum(columns, len(self.keys) - 1)] == keys)
+        rows, columns = rows[known], columns[known]
+
+        # Occurrences of each (case, n-gram) in time order: occurrence j holds count j + 1
+        # from its event up to the next occurrence (or the end of the case)
+        order = np.lexsort((rows, columns, case_of_event[rows]))
+        rows, columns = rows[order], columns[order]
+        group_start = np.r_[True, (columns[1:] != columns[:-1]) |
+                            (case_of_event[rows[1:]] != case_of_event[rows[:-1]])]
+        group_id = np.cumsum(group_start) - 1
+        rank = np.arange(len(rows)) - np.flatnonzero(group_start)[group_id] + 1
+        next_row = np.r_[rows[1:], 0]
+        last_in_group = np.r_[group_start[1:], True]
+        stop = np.where(last_in_group, ends[rows] + 1, next_row)
+        spans = stop - rows
+
+        # Expand each occurrence over the rows it covers
+        offsets = np.repeat(np.cumsum(spans) - spans, spans)
+        matrix_rows = np.repeat(rows, spans) + np.arange(spans.sum()) - offsets
+        matrix = sparse.csr_matrix(
+            (np.repeat(rank, spans).astype(np.float32), (matrix_rows, np.repeat(columns, spans))),
+            shape=(len(case_of_event), len(self.keys))
+        )
+        matrix.sort_indices()
+        return matrix
+
+    def fit_transform(self, cases, activities):
+        return self.fit(cases, activities).transform(cases, activities)
+
+    def extend(self, counts, history, activities):
+        """
+        Counts of prefixes extended by one activity each, from their current counts
+
+        Args:
+            counts: CSR counts of the prefixes (one row per prefix)
+            history: (rows, max_n - 1) array of each prefix's last activities, most
+                recent last (None where the prefix is shorter)
+            activities: Activity appended to each prefix
+
+        Returns:
+            CSR counts of the extended prefixes
+        """
+        from scipy import sparse
+
+        n_rows = len(activities)
+        history = np.asarray(history, dtype=object).reshape(n_rows, self.max_n - 1)
+        codes = self._codes(np.column_stack([history, np.asarray(activities, dtype=object)]).ravel())
+        codes = codes.reshape(n_rows, self.max_n)
+        base = len(self.activities) + 1
+
+        # n-grams ending at the new activity, built backwards from it
+        rows, keys = [], []
+        key = np.zeros(n_rows, dtype=np.int64)
+        valid = np.ones(n_rows, dtype=bool)
+        for n in range(1, self.max_n + 1):
+            code = codes[:, self.max_n - n]
+            key = key + code * base ** (n - 1)
+            valid &= code > 0
+            rows.append(np.flatnonzero(valid))
+            keys.append(key[valid])
+        rows, keys = np.concatenate(rows), np.concatenate(keys)
+
+        columns = np.searchsorted(self.keys, keys)
+        known = (columns < len(self.keys)) & (self.keys[np.minimum(columns, len(self.keys) - 1)] == keys)
+        increments = sparse.csr_matrix(
+            (np.ones(known.sum(), dtype=np.float32), (rows[known], columns[known])), shape=(n_rows, len(self.keys))
+        )
+        return (counts + increments).tocsr()
+
+    def feature_names(self):
+        """Column names of the encoded matrix ('ngram:A>B' for the bigram A, B)"""
+        base = len(self.activities) + 1
+        names = []
+        for key in self.keys:
+            gram = []
+            while key > 0:
+                key, code = divmod(int(key), base)
+                gram.append(self.activities[code - 1])
+            names.append('ngram:' + '>'.join(reversed(gram)))
+        return names
+
+    def save(self, path):
+        """Write the alphabet and vocabulary to a JSON file"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'max_n': self.max_n, 'min_count': self.min_count, 'activities': self.activities,
+                       'keys': [int(key) for key in self.keys]}, f)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        """Read an encoder written by save"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        encoder = cls(max_n=data['max_n'], min_count=data['min_count'])
+        encoder.activities = data['activities']
+        encoder.keys = np.array(data['keys'], dtype=np.int64)
+        return encoder
+
+
+def load_ngram_encoder(model_dir):
+    """Encoder saved with the models in model_dir (None if they were trained without n-grams)"""
+    path = os.path.join(model_dir, NGRAM_ENCODER_FILE)
+    return PrefixNgramEncoder.load(path) if os.path.exists(path) else None
+
+
+def prefix_ngram_features(events, max_n=3, min_count=1):
+    """
+    n-gram counts of the prefixes the feature extractors produce rows for
+
+    Events are ordered like the extractors order them (by case, then time), and only
+    events with a successor are kept, so row i belongs to row i of the extracted
+    feature matrix.
+
+    Args:
+        events: Event frame with case, activity and timestamp columns
+
+    Returns:
+        (CSR matrix, fitted PrefixNgramEncoder, prefix id of every row); rows with the
+        same prefix id have the same counts
+    """
+    ctx = FeatureContext(events)
+    cases, activities = ctx.column(CASE).to_numpy(), ctx.column(ACTIVITY).to_numpy()
+    encoder = PrefixNgramEncoder(max_n=max_n, min_count=min_count)
+    matrix = encoder.fit_transform(cases, activities)
+
+    # Distinct prefixes are the distinct (count row) patterns; identical rows share an id
+    rows = matrix[prefix_rows(ctx, 'next')]
+    bounds = zip(rows.indptr[:-1], rows.indptr[1:])
+    signature = pd.Series([rows.indices[a:b].tobytes() + rows.data[a:b].tobytes() for a, b in bounds])
+    prefix_ids = pd.factorize(signature)[0]
+    return rows, encoder, prefix_ids
+
+
+def encode_prefixes(encoder, ctx, prefixes='next'):
+    """n-gram counts of the selected prefixes (see prefix_rows) of a FeatureContext with a fitted encoder"""
+    matrix = encoder.transform(ctx.column(CASE).to_numpy(), ctx.column(ACTIVITY).to_numpy())
+    return matrix[prefix_rows(ctx, prefixes)]
+
+
+def combine_features(X, ngrams):
+    """Dense feature frame followed by the n-gram columns, as one CSR matrix (float32)"""
+    from scipy import sparse
+    dense = sparse.csr_matrix(np.asarray(X, dtype=np.float32))
+    return sparse.hstack([dense, ngrams], format='csr', dtype=np.float32)
@@ -0,0 +1,332 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+CASE_KEY = 'case:concept:name'
+ACTIVITY_KEY = 'concept:name'
+TIMESTAMP_KEY = 'time:timestamp'
+
+# Number of quantiles kept per empirical distribution
+N_QUANTILES = 101
+
+
+def _empirical_quantiles(values):
+    """Summarize a sample by its quantiles (None if the sample is empty)"""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    return np.quantile(values, np.linspace(0, 1, N_QUANTILES))
+
+
+def _sample_quantiles(rng, quantiles, size):
+    """Draw from an empirical distribution by inverse-transform sampling of its quantiles"""
+    return np.interp(rng.random(size), np.linspace(0, 1, len(quantiles)), quantiles)
+
+
+def _load_frame(source):
+    """Load an event log as a DataFrame from an XES file, a pickled/parquet frame or a DataFrame"""
+    if isinstance(source, pd.DataFrame):
+        return source
+    extension = os.path.splitext(source)[1].lower()
+    if extension == '.parquet':
+        return pd.read_parquet(source)
+    if extension in ('.pkl', '.pickle'):
+        return pd.read_pickle(source)
+    import pm4py
+    return pm4py.convert_to_dataframe(pm4py.read_xes(source))
+
+
+class SyntheticLogGenerator:
+    def __init__(self, trace_length_factor=1.0, attribute_cardinality=1, max_trace_length=None, random_state=42):
+        """
+        Generate synthetic event logs that mimic the control flow, timing and attributes of a real log
+
+        The generator learns a directly-follows graph (start, transition and end
+        probabilities), per-activity waiting time distributions, case inter-arrival
+        times and per-activity attribute distributions from a source log, and
+        samples new cases from them. Generation is vectorized over cases, so logs
+        with millions of events can be produced for scaling benchmarks.
+
+        Args:
+            trace_length_factor: Multiplies the expected trace length (scales the end probabilities)
+            attribute_cardinality: Multiplies the number of distinct values of categorical attributes
+            max_trace_length: Hard cap on trace length (defaults to 2x the longest source trace)
+            random_state: Seed for reproducible logs
+        """
+        self.trace_length_factor = trace_length_factor
+        self.attribute_cardinality = attribute_cardinality
+        self.max_trace_length = max_trace_length
+        self.random_state = random_state
+
+        self.activities = None
+        self.start_probs = None
+        self.transition_cdf = None
+        self.wait_quantiles = {}
+        self.arrival_quantiles = None
+        self.event_attributes = {}
+        self.case_attributes = {}
+        self.first_timestamp = None
+        self.n_source_cases = 0
+
+    def fit(self, source):
+        """
+        Learn the log model from an XES file, a cached frame (.pkl/.parquet) or a DataFrame
+        """
+        df = _load_frame(source)
+        df = df[[col for col in df.columns if not col.startswith('@@')]].copy()
+        df[TIMESTAMP_KEY] = pd.to_datetime(df[TIMESTAMP_KEY], utc=True)
+        df = df.sort_values([CASE_KEY, TIMESTAMP_KEY], kind='stable').reset_index(drop=True)
+
+        activity_codes, activities = pd.factorize(df[ACTIVITY_KEY])
+        case_codes, _ = pd.factorize(df[CASE_KEY])
+        self.activities = np.asarray(activities, dtype=object)
+        n_activities = len(self.activities)
+        self.n_source_cases = int(case_codes.max()) + 1 if len(case_codes) else 0
+
+        same_case = np.r_[False, case_codes[1:] == case_codes[:-1]]
+        first = ~same_case
+        last = np.r_[~same_case[1:], True]
+
+        # Directly-follows counts with an extra "end" column per activity
+        start_counts = np.bincount(activity_codes[first], minlength=n_activities).astype(np.float64)
+        counts = np.zeros((n_activities, n_activities + 1))
+        follows = same_case[1:]
+        np.add.at(counts, (activity_codes[:-1][follows], activity_codes[1:][follows]), 1)
+        np.add.at(counts[:, n_activities], activity_codes[last], 1)
+        self.start_probs = start_counts / start_counts.sum()
+
+        # Longer traces: lower the end probability relative to the transitions
+        counts[:, n_activities] /= self.trace_length_factor
+        row_sums = counts.sum(axis=1, keepdims=True)
+        probs = np.divide(counts, row_sums, out=np.zeros_like(counts), where=row_sums > 0)
+        probs[row_sums[:, 0] == 0, n_activities] = 1.0
+        self.transition_cdf = np.cumsum(probs, axis=1)
+        self.transition_cdf[:, -1] = 1.0
+
+        # Waiting time before each activity (seconds since the previous event of the case)
+        seconds = df[TIMESTAMP_KEY].astype('int64').to_numpy() / 1e9
+        waits = np.r_[0.0, np.diff(seconds)]
+        self.wait_quantiles = {}
+        for code in range(n_activities):
+            quantiles = _empirical_quantiles(waits[same_case & (activity_codes == code)])
+            self.wait_quantiles[code] = quantiles if quantiles is not None else np.zeros(N_QUANTILES)
+
+        case_starts = np.sort(seconds[first])
+        self.arrival_quantiles = _empirical_quantiles(np.diff(case_starts)) if len(case_starts) > 1 else np.zeros(N_QUANTILES)
+        self.first_timestamp = df[TIMESTAMP_KEY].min()
+
+        if self.max_trace_length is None:
+            source_lengths = np.bincount(case_codes)
+            self.max_trace_length = int(source_lengths.max() * 2 * max(self.trace_length_factor, 1.0))
+
+        self._fit_attributes(df, activity_codes, first)
+        print(f"Fitted synthetic log model: {n_activities} activities, {self.n_source_cases} source cases")
+        return self
+
+    def _fit_attributes(self, df, activity_codes, first):
+        """Learn per-activity event attribute and per-case attribute distributions"""
+        self.event_attributes = {}
+        self.case_attributes = {}
+        for col in df.columns:
+            if col in (CASE_KEY, ACTIVITY_KEY, TIMESTAMP_KEY):
+                continue
+            values = df[col]
+            is_numeric = pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+
+            if col.startswith('case:'):
+                self.case_attributes[col] = self._fit_distribution(values[first], is_numeric)
+            else:
+                self.event_attributes[col] = {
+                    code: self._fit_distribution(values[activity_codes == code], is_numeric)
+                    for code in range(len(self.activities))
+                }
+
+    def _fit_distribution(self, values, is_numeric):
+        """Missing rate plus quantiles (numeric) or value frequencies (categorical)"""
+        missing_rate = float(values.isna().mean()) if len(values) else 1.0
+        present = values.dropna()
+        if is_numeric:
+            return {'kind': 'numeric', 'missing': missing_rate, 'quantiles': _empirical_quantiles(present)}
+
+        frequencies = present.value_counts(normalize=True)
+        categories = frequencies.index.to_numpy(dtype=object)
+        probs = frequencies.to_numpy(dtype=np.float64)
+        if self.attribute_cardinality > 1 and len(categories) > 0:
+            # Split every value into equally likely variants to raise the cardinality
+            variants = [f"{value}_{k}" if k else value
+                        for value in categories for k in range(self.attribute_cardinality)]
+            categories = np.asarray(variants, dtype=object)
+            probs = np.repeat(probs / self.attribute_cardinality, self.attribute_cardinality)
+        return {'kind': 'categorical', 'missing': missing_rate, 'categories': categories, 'probs': probs}
+
+    def _sample_distribution(self, rng, distribution, size):
+        """Sample attribute values (None marks missing values)"""
+        values = np.empty(size, dtype=object)
+        present = rng.random(size) >= distribution['missing']
+        n_present = int(present.sum())
+        if n_present == 0:
+            return values
+        if distribution['kind'] == 'numeric':
+            if distribution['quantiles'] is None:
+                return values
+            values = np.full(size, np.nan)
+            values[present] = _sample_quantiles(rng, distribution['quantiles'], n_present)
+            return values
+        if len(distribution['categories']) == 0:
+            return values
+        values[present] = rng.choice(distribution['categories'], size=n_present, p=distribution['probs'])
+        return values
+
+    def _simulate_control_flow(self, rng, n_cases):
+        """Sample activity sequences for all cases at once; returns (case index, activity code) arrays"""
+        n_activities = len(self.activities)
+        current = np.searchsorted(np.cumsum(self.start_probs), rng.random(n_cases), side='right')
+        current = np.minimum(current, n_activities - 1)
+        active = np.arange(n_cases)
+
+        case_parts = [active]
+        activity_parts = [current]
+        for _ in range(self.max_trace_length - 1):
+            cdf = self.transition_cdf[current]
+            nxt = (cdf < rng.random(len(active))[:, None]).sum(axis=1)
+            keep = nxt < n_activities
+            active, current = active[keep], nxt[keep]
+            if len(active) == 0:
+                break
+            case_parts.append(active)
+            activity_parts.append(current)
+
+        case_index = np.concatenate(case_parts)
+        activity_codes = np.concatenate(activity_parts)
+        # Steps were generated breadth-first; a stable sort restores per-case order
+        order = np.argsort(case_index, kind='stable')
+        return case_index[order], activity_codes[order]
+
+    def generate(self, n_cases=None, scale=1.0, case_offset=0):
+        """
+        Generate a synthetic log
+
+        Args:
+            n_cases: Number of cases (defaults to scale x the number of source cases)
+            scale: Size relative to the source log, used when n_cases is None
+            case_offset: First case number (used to generate a large log in chunks)
+
+        Returns:
+            DataFrame with case:concept:name, concept:name, time:timestamp and attribute columns
+        """
+        if self.activities is None:
+            raise ValueError("Generator not fitted. Call fit() first.")
+        n_cases = int(n_cases if n_cases is not None else round(self.n_source_cases * scale))
+        rng = np.random.default_rng([self.random_state, case_offset])
+
+        case_index, activity_codes = self._simulate_control_flow(rng, n_cases)
+        n_events = len(case_index)
+        first = np.r_[True, case_index[1:] != case_index[:-1]]
+
+        # Case start times follow the learned inter-arrival distribution (chunks continue where the previous ended)
+        arrivals = (case_offset * float(np.mean(self.arrival_quantiles))
+                    + np.cumsum(_sample_quantiles(rng, self.arrival_quantiles, n_cases)))
+        waits = np.zeros(n_events)
+        for code in range(len(self.activities)):
+            mask = (activity_codes == code) & ~first
+            if mask.any():
+                waits[mask] = _sample_quantiles(rng, self.wait_quantiles[code], int(mask.sum()))
+
+        # Cumulative waits within each case, offset by the case arrival time
+        cumulative = np.cumsum(waits)
+        case_base = cumulative[first][np.cumsum(first) - 1]
+        offsets = arrivals[case_index] + (cumulative - case_base)
+        timestamps = self.first_timestamp + pd.to_timedelta(np.round(offsets), unit='s')
+
+        data = {
+            CASE_KEY: np.char.add('s', (case_index + case_offset).astype(str)),
+            ACTIVITY_KEY: self.activities[activity_codes],
+            TIMESTAMP_KEY: timestamps
+        }
+
+        for col, per_activity in self.event_attributes.items():
+            is_numeric = next(iter(per_activity.values()))['kind'] == 'numeric'
+            values = np.full(n_events, np.nan) if is_numeric else np.empty(n_events, dtype=object)
+            for code, distribution in per_activity.items():
+                mask = activity_codes == code
+                if mask.any():
+                    values[mask] = self._sample_distribution(rng, distribution, int(mask.sum()))
+            data[col] = values
+
+        for col, distribution in self.case_attributes.items():
+            data[col] = self._sample_distribution(rng, distribution, n_cases)[case_index]
+
+        return pd.DataFrame(data)
+
+    def generate_chunks(self, n_cases, chunk_size=100000):
+        """Yield the log in frames of at most chunk_size cases (bounded memory for large scales)"""
+        for start in range(0, n_cases, chunk_size):
+            yield self.generate(n_cases=min(chunk_size, n_cases - start), case_offset=start)
+
+    def write(self, output_path, n_cases=None, scale=1.0, chunk_size=100000):
+        """
+        Generate a log and write it as XES or Parquet (chosen by the file extension).
+        Parquet output is written chunk by chunk; XES output is built in memory.
+        """
+        n_cases = int(n_cases if n_cases is not None else round(self.n_source_cases * scale))
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        extension = os.path.splitext(output_path)[1].lower()
+
+        if extension == '.parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            writer = None
+            n_events = 0
+            try:
+                for chunk in self.generate_chunks(n_cases, chunk_size=chunk_size):
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(output_path, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                    n_events += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+        elif extension == '.xes':
+            import pm4py
+            df = self.generate(n_cases=n_cases)
+            n_events = len(df)
+            pm4py.write_xes(df, output_path, case_id_key=CASE_KEY)
+        else:
+            raise ValueError(f"Unsupported output format: {extension} (use .xes or .parquet)")
+
+        print(f"Synthetic log with {n_cases} cases and {n_events} events saved to {output_path}")
+        return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic event logs for scaling benchmarks')
+    parser.add_argument('--source', default='dataset/Sepsis.xes', help='XES log or cached frame to learn from')
+    parser.add_argument('--output-dir', default='dataset/synthetic', help='Directory for the generated logs')
+    parser.add_argument('--scales', type=float, nargs='+', default=[10, 100, 1000],
+                        help='Sizes relative to the source log')
+    parser.add_argument('--format', choices=['xes', 'parquet'], default='parquet', help='Output format')
+    parser.add_argument('--trace-length-factor', type=float, default=1.0, help='Multiplier of the mean trace length')
+    parser.add_argument('--attribute-cardinality', type=int, default=1,
+                        help='Multiplier of the number of distinct categorical attribute values')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed')
+
+    args = parser.parse_args()
+
+    generator = SyntheticLogGenerator(
+        trace_length_factor=args.trace_length_factor,
+        attribute_cardinality=args.attribute_cardinality,
+        random_state=args.seed
+    ).fit(args.source)
+
+    source_name = os.path.splitext(os.path.basename(args.source))[0]
+    for scale in args.scales:
+        output_path = os.path.join(args.output_dir, f"{source_name}_x{scale:g}.{args.format}")
+        generator.write(output_path, scale=scale)
+
+
+if __name__ == "__main__":
+    main()
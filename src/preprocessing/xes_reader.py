@@ -0,0 +1,150 @@
+import gzip
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+
+# Typed XES attribute elements and how their values are parsed (dates are parsed per column)
+_PARSERS = {
+    'string': str,
+    'id': str,
+    'int': int,
+    'float': float,
+    'boolean': lambda value: value.strip().lower() == 'true',
+    'date': str
+}
+
+# Columns every event frame needs: case, activity and timestamp
+CORE_ATTRIBUTES = ['case:concept:name', 'concept:name', 'time:timestamp']
+
+
+def _local(tag):
+    """Tag name without the XES namespace"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def _traces(path, keep, seen, kinds):
+    """
+    Yield the events of each trace of an XES log as dicts of parsed attribute values
+
+    Trace attributes are added to every event as 'case:<key>'. seen collects every
+    attribute key of the log (in order of first appearance) and kinds the XES type of
+    every kept attribute.
+    """
+    def add(values, key, kind, value):
+        seen.setdefault(key, None)
+        if keep is not None and key not in keep:
+            return
+        parser = _PARSERS.get(kind)
+        if parser is None:
+            return
+        values[key] = parser(value)
+        kinds.setdefault(key, kind)
+
+    with _open(path) as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        trace_events = []
+        for event, element in context:
+            tag = _local(element.tag)
+            if event == 'start':
+                continue
+            if tag == 'event':
+                values = {}
+                for child in element:
+                    key = child.get('key')
+                    if key is not None:
+                        add(values, key, _local(child.tag), child.get('value'))
+                trace_events.append(values)
+                element.clear()
+            elif tag == 'trace':
+                case_values = {}
+                for child in element:
+                    key = child.get('key')
+                    if key is not None and _local(child.tag) != 'event':
+                        add(case_values, f'case:{key}', _local(child.tag), child.get('value'))
+                for values in trace_events:
+                    values.update(case_values)
+                yield trace_events
+                trace_events = []
+                # Drop the finished trace (and anything else parsed so far) from the tree
+                root.clear()
+
+
+def _parse_dates(df, kinds):
+    for key, kind in kinds.items():
+        if kind == 'date' and key in df.columns:
+            df[key] = pd.to_datetime(df[key], utc=True, format='ISO8601')
+    return df
+
+
+def read_xes_columns(path, attributes=None):
+    """
+    Stream an XES log into an event frame holding only the requested attributes
+
+    The log is parsed incrementally and every trace is discarded once its events are
+    read, so memory holds the selected columns only. Trace attributes become
+    'case:<key>' columns (as in pm4py's event frames); missing values are NaN and
+    dates are parsed into UTC timestamps. Nested and list attributes are skipped.
+
+    Args:
+        path: XES file (optionally .xes.gz)
+        attributes: Columns to keep (None keeps all); CORE_ATTRIBUTES are always kept
+
+    Returns:
+        (event DataFrame, every column the log has, in order of first appearance)
+    """
+    keep = None if attributes is None else set(attributes) | set(CORE_ATTRIBUTES)
+    columns = {}
+    kinds = {}
+    seen = {}
+    n_events = 0
+
+    def append_row(values):
+        # Columns first seen here are back-filled with NaN for the earlier events
+        for key, value in values.items():
+            if key not in columns:
+                columns[key] = [np.nan] * n_events
+            columns[key].append(value)
+        for key, column in columns.items():
+            if key not in values:
+                column.append(np.nan)
+
+    for trace_events in _traces(path, keep, seen, kinds):
+        for values in trace_events:
+            append_row(values)
+            n_events += 1
+
+    df = pd.DataFrame({key: column for key, column in columns.items()})
+    return _parse_dates(df, kinds), list(seen)
+
+
+def iter_xes_chunks(path, attributes=None, chunk_cases=1000):
+    """
+    Stream an XES log as event frames of whole cases
+
+    Only the current chunk is held in memory, so logs of any size are read in
+    constant memory. A chunk only has the columns its own events carry.
+
+    Args:
+        path: XES file (optionally .xes.gz)
+        attributes: Columns to keep (None keeps all); CORE_ATTRIBUTES are always kept
+        chunk_cases: Number of cases per chunk
+
+    Yields:
+        Event DataFrames of chunk_cases cases (fewer in the last chunk)
+    """
+    keep = None if attributes is None else set(attributes) | set(CORE_ATTRIBUTES)
+    kinds = {}
+    rows, n_cases = [], 0
+    for trace_events in _traces(path, keep, {}, kinds):
+        rows.extend(trace_events)
+        n_cases += 1
+        if n_cases >= chunk_cases:
+            yield _parse_dates(pd.DataFrame.from_records(rows), kinds)
+            rows, n_cases = [], 0
+    if rows:
+        yield _parse_dates(pd.DataFrame.from_records(rows), kinds)
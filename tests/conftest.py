@@ -0,0 +1,78 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ACTIVITIES = ['ER Registration', 'ER Triage', 'CRP', 'Leucocytes', 'LacticAcid', 'IV Liquid', 'Admission NC',
+              'Release A']
+DEPARTMENTS = ['A', 'B', 'C']
+
+
+def write_sepsis_like_log(path, n_cases=60, seed=0):
+    """
+    Small XES log with the attributes of the Sepsis log: departments, lab values that
+    are only recorded on some events (so the extracted features have missing values)
+    and a boolean SIRS attribute
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    lines = ['<?xml version="1.0" encoding="UTF-8" ?>', '<log xes.version="1.0">']
+    for case in range(n_cases):
+        lines.append(f'<trace><string key="concept:name" value="c{case}"/>')
+        time = start + timedelta(hours=int(rng.integers(0, 2000)))
+        for position in range(int(rng.integers(3, 9))):
+            activity = ACTIVITIES[0] if position == 0 else ACTIVITIES[int(rng.integers(1, len(ACTIVITIES)))]
+            time += timedelta(minutes=int(rng.integers(1, 600)))
+            lines.append('<event>')
+            lines.append(f'<string key="concept:name" value="{activity}"/>')
+            lines.append(f'<date key="time:timestamp" value="{time.isoformat()}"/>')
+            lines.append(f'<string key="org:group" value="{DEPARTMENTS[int(rng.integers(0, 3))]}"/>')
+            for key in ['CRP', 'Leucocytes', 'LacticAcid']:
+                if rng.random() < 0.3:
+                    lines.append(f'<float key="{key}" value="{rng.uniform(1, 200):.1f}"/>')
+            lines.append(f'<boolean key="SIRS2Temperature" value="{str(bool(rng.random() < 0.5)).lower()}"/>')
+            lines.append('</event>')
+        lines.append('</trace>')
+    lines.append('</log>')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+    return path
+
+
+@pytest.fixture(scope='session')
+def sepsis_log(tmp_path_factory):
+    return write_sepsis_like_log(str(tmp_path_factory.mktemp('dataset') / 'Sepsis.xes'))
+
+
+def train_sepsis(log_path, root, **config_updates):
+    """ModelTrainer that trained and saved small models on a Sepsis log under root"""
+    from src.pipelines.model_trainer import ModelTrainer, sepsis_training_config
+    from src.common import plotting
+
+    plotting.configure(enabled=False)
+    config = sepsis_training_config()
+    config.update(dataset_path=log_path, model_dir=str(root / 'models'), report_dir=str(root / 'reports'),
+                  run_store_dir=str(root / 'runs'), run_causality_tests=False, **config_updates)
+    config['models']['random_forest']['params']['n_estimators'] = 10
+    trainer = ModelTrainer(config)
+    result = trainer.run_pipeline(dataset_type='sepsis')
+    assert 'error' not in result
+    return trainer
+
+
+@pytest.fixture(scope='session')
+def trained_sepsis(sepsis_log, tmp_path_factory):
+    """Models trained on the synthetic Sepsis log, with the forest distilled into a tree"""
+    from src.models.distillation import default_distillation_config
+
+    return train_sepsis(sepsis_log, tmp_path_factory.mktemp('training'),
+                        distillation=dict(default_distillation_config(), enabled=True, max_depth=6))
+
+
+@pytest.fixture(scope='session')
+def trained_sepsis_prefix(sepsis_log, tmp_path_factory):
+    """Models trained without the features counted over the whole case"""
+    return train_sepsis(sepsis_log, tmp_path_factory.mktemp('training_prefix'), prefix_features=True)
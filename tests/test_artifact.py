@@ -0,0 +1,35 @@
+import os
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from src.models.artifact import ModelArtifact, save_model_artifact, ROUTING_FILE
+
+
+def _forest(n_rows=600, n_features=6):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, n_features))
+    X[rng.random(X.shape) < 0.05] = np.nan
+    y = np.where(np.nan_to_num(X[:, 0]) + rng.normal(scale=0.5, size=n_rows) > 0, 'a', 'b')
+    y[rng.random(n_rows) < 0.2] = 'c'
+    return RandomForestClassifier(n_estimators=15, random_state=0).fit(X, y), X
+
+
+def test_large_batches_are_traversed_on_the_mapped_arrays(tmp_path):
+    forest, X = _forest()
+    save_model_artifact(forest, str(tmp_path))
+    artifact = ModelArtifact(str(tmp_path))
+    artifact.chunk_rows = 128
+
+    X_score = np.vstack([X, X[::-1]])
+    np.testing.assert_allclose(artifact.predict_proba(X_score), forest.predict_proba(X_score))
+    # No sklearn trees were rebuilt: every array the traversal read is memory-mapped
+    assert artifact._estimator is None
+    assert isinstance(artifact._routing(), np.memmap)
+    assert isinstance(artifact._arrays()[0], np.memmap) and isinstance(artifact._arrays()[1], np.memmap)
+
+
+def test_artifacts_without_routing_table_still_predict(tmp_path):
+    forest, X = _forest()
+    save_model_artifact(forest, str(tmp_path))
+    os.remove(os.path.join(str(tmp_path), ROUTING_FILE))
+    np.testing.assert_allclose(ModelArtifact(str(tmp_path)).predict_proba(X), forest.predict_proba(X))
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+
+from src.preprocessing.feature_registry import compute_features
+from src.preprocessing.xes_reader import read_xes_columns
+from src.pipelines.batch_scoring import BatchScorer
+
+
+def test_scoring_test_split_reproduces_trainer_predictions(trained_sepsis):
+    model_dir = trained_sepsis.config['model_dir']
+    scorer = BatchScorer(model_dir, model_name='random_forest')
+    events, _ = read_xes_columns(trained_sepsis.config['dataset_path'], attributes=scorer.attributes)
+
+    # Registry rows of every prefix with a successor are the extracted rows, in order
+    X, _ = compute_features(scorer.with_attributes(events), scorer.profile, scorer.feature_names, prefixes='next')
+    X_test = trained_sepsis.X_test
+    raw = X.loc[X_test.index]
+    assert raw[['CRP', 'Leucocytes', 'LacticAcid']].isna().any().any()
+
+    X_model = scorer.model_input(raw)
+    np.testing.assert_allclose(X_model.to_numpy(dtype=float), X_test.to_numpy(dtype=float))
+
+    expected = trained_sepsis.trained_models['random_forest'].predict_proba(X_test)
+    np.testing.assert_allclose(scorer.predict_proba(X_model), expected)
+    assert os.path.exists(os.path.join(model_dir, 'fill_values.pkl'))
+
+
+def test_case_complete_features_are_reported(trained_sepsis, tmp_path, caplog):
+    import pyarrow.parquet as pq
+    from src.pipelines.batch_scoring import score_log
+
+    model_dir = trained_sepsis.config['model_dir']
+    output = str(tmp_path / 'scores.parquet')
+    with caplog.at_level('WARNING', logger='batch_scoring'):
+        stats = score_log(trained_sepsis.config['dataset_path'], model_dir, output)
+    assert 'trace_length' in stats['case_complete_features']
+    assert '--prefix-features' in caplog.text
+    metadata = pq.read_schema(output).metadata
+    assert b'trace_length' in metadata[b'case_complete_features']
+
+
+def test_prefix_feature_models_score_running_cases_like_training(trained_sepsis_prefix):
+    from src.preprocessing.feature_registry import FeatureContext, CASE, prefix_rows
+
+    scorer = BatchScorer(trained_sepsis_prefix.config['model_dir'], model_name='random_forest')
+    assert scorer.case_complete_features == []
+    events, _ = read_xes_columns(trained_sepsis_prefix.config['dataset_path'], attributes=scorer.attributes)
+    ctx = FeatureContext(scorer.with_attributes(events))
+    cases = ctx.column(CASE).to_numpy()
+
+    # Cut every case after the last event of one of its test rows and score it as running
+    next_rows = np.flatnonzero(prefix_rows(ctx, 'next'))
+    X_test = trained_sepsis_prefix.X_test[~trained_sepsis_prefix.X_test.index.duplicated()]
+    prefix_end = {}
+    for row in X_test.index:
+        prefix_end.setdefault(cases[next_rows[row]], row)
+    keep = np.array([case in prefix_end and event <= next_rows[prefix_end[case]]
+                     for event, case in enumerate(cases)])
+    running = FeatureContext(ctx.events[keep])
+    X, _ = compute_features(running, scorer.profile, scorer.feature_names, prefixes='last')
+    rows = [prefix_end[case] for case in running.column(CASE)[prefix_rows(running, 'last')]]
+    np.testing.assert_allclose(scorer.model_input(X).to_numpy(dtype=float), X_test.loc[rows].to_numpy(dtype=float))
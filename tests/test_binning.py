@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.preprocessing.binning import QuantileBinner, BINNER_FILE, load_binner
+from src.preprocessing.data_transformation import DataTransformer
+
+
+def mixed_features(n_rows=2000, seed=0):
+    """A few-valued column, a continuous column with missing values and a constant column"""
+    rng = np.random.default_rng(seed)
+    continuous = rng.normal(size=n_rows)
+    continuous[rng.random(n_rows) < 0.1] = np.nan
+    return pd.DataFrame({'few': rng.integers(0, 5, n_rows).astype(float), 'continuous': continuous,
+                         'constant': np.ones(n_rows)})
+
+
+def test_codes_keep_the_order_of_the_values():
+    X = mixed_features()
+    binner = QuantileBinner(max_bins=16)
+    codes = binner.fit_transform(X)
+    assert all(dtype == np.uint8 for dtype in codes.dtypes)
+    assert binner.n_bins() == {'few': 5, 'constant': 1, 'continuous': 16}
+
+    # A few-valued column gets one bin per value
+    assert (codes['few'].to_numpy() == X['few'].to_numpy()).all()
+    # Codes never decrease as the values grow
+    order = np.argsort(X['continuous'].dropna().to_numpy(), kind='stable')
+    assert (np.diff(codes['continuous'][X['continuous'].notna()].to_numpy()[order].astype(int)) >= 0).all()
+
+    # Quantile edges split the rows like the quantiles themselves, but no edge is a value
+    values = X['continuous'].dropna().round(1).to_numpy()
+    edges = QuantileBinner(max_bins=16).fit(pd.DataFrame({'continuous': values})).edges['continuous']
+    quantiles = np.quantile(values, np.linspace(0, 1, 17)[1:-1], method='midpoint')
+    assert not np.isin(edges, values).any()
+    np.testing.assert_array_equal(np.unique(np.searchsorted(edges, values, side='right'), return_counts=True)[1],
+                                  np.unique(np.searchsorted(np.unique(quantiles), values, side='right'),
+                                            return_counts=True)[1])
+
+    with pytest.raises(ValueError):
+        QuantileBinner(max_bins=257)
+    with pytest.raises(ValueError):
+        binner.transform(X.drop(columns=['few']))
+
+
+def test_bin_edges_round_trip_through_the_transformer_metadata(tmp_path):
+    X = mixed_features().fillna(0)
+    transformer = DataTransformer()
+    transformer.feature_names = list(X.columns)
+    transformer.scaler.fit(X)
+    codes = transformer.fit_binning(X, max_bins=32)
+    transformer.save_transformation_metadata(str(tmp_path))
+
+    loaded = DataTransformer()
+    loaded.load_transformation_metadata(str(tmp_path))
+    assert loaded.binner.edges.keys() == transformer.binner.edges.keys()
+    for col, edges in transformer.binner.edges.items():
+        np.testing.assert_array_equal(loaded.binner.edges[col], edges)
+    pd.testing.assert_frame_equal(loaded.bin_features(X), codes)
+    np.testing.assert_array_equal(load_binner(str(tmp_path)).edges['continuous'],
+                                  transformer.binner.edges['continuous'])
+
+    # Saving an unbinned transformer over it drops the stale edges
+    transformer.binner = None
+    transformer.save_transformation_metadata(str(tmp_path))
+    assert not (tmp_path / BINNER_FILE).exists()
+    loaded.load_transformation_metadata(str(tmp_path))
+    assert loaded.binner is None and load_binner(str(tmp_path)) is None
+
+
+def test_scoring_a_binned_model_uses_the_saved_edges(sepsis_log, tmp_path):
+    from conftest import train_sepsis
+    from src.preprocessing.binning import default_binning_config
+    from src.preprocessing.feature_registry import compute_features
+    from src.preprocessing.xes_reader import read_xes_columns
+    from src.pipelines.batch_scoring import BatchScorer
+
+    trainer = train_sepsis(sepsis_log, tmp_path, binning=dict(default_binning_config(), enabled=True, max_bins=8))
+    expected = trainer.data_transformer.bin_features(trainer.X_test)
+
+    scorer = BatchScorer(trainer.config['model_dir'], model_name='random_forest')
+    events, _ = read_xes_columns(sepsis_log, attributes=scorer.attributes)
+    X, _ = compute_features(scorer.with_attributes(events), scorer.profile, scorer.feature_names, prefixes='next')
+    X_model = scorer.model_input(X.loc[trainer.X_test.index])
+    np.testing.assert_array_equal(X_model.to_numpy(), expected.to_numpy())
+    np.testing.assert_allclose(scorer.predict_proba(X_model),
+                               trainer.trained_models['random_forest'].predict_proba(expected))
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.tree import DecisionTreeClassifier
+
+from src.preprocessing.data_transformation import collapse_duplicate_rows, count_weighted_params
+
+
+def duplicated_rows(n_rows=3000, seed=0):
+    """Rows over a small grid of values (so most rows repeat) with a noisy label"""
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.integers(0, 4, size=(n_rows, 5)), columns=[f'f{i}' for i in range(5)]).astype(float)
+    y = np.where(X['f0'] + X['f1'] + rng.integers(0, 3, n_rows) > 4, 'a', 'b')
+    return X, pd.Series(y)
+
+
+def fit(X, y, sample_weight=None, **params):
+    return DecisionTreeClassifier(random_state=0, **params).fit(X, y, sample_weight=sample_weight)
+
+
+def test_collapse_counts_every_row_once():
+    X, y = duplicated_rows()
+    X_unique, y_unique, counts = collapse_duplicate_rows(X, y)
+    assert counts.sum() == len(X)
+    assert len(X_unique) < len(X) / 2
+    assert not pd.concat([X_unique, y_unique.rename('y')], axis=1).duplicated().any()
+
+
+def test_weighted_fit_matches_full_fit_with_default_leaf_settings():
+    X, y = duplicated_rows()
+    X_unique, y_unique, counts = collapse_duplicate_rows(X, y)
+    full, collapsed = fit(X, y), fit(X_unique, y_unique, counts)
+    np.testing.assert_array_equal(full.predict_proba(X), collapsed.predict_proba(X))
+
+
+def test_leaf_size_counts_unique_rows_unless_converted():
+    X, y = duplicated_rows()
+    X_unique, y_unique, counts = collapse_duplicate_rows(X, y)
+    full = fit(X, y, min_samples_leaf=5)
+    params = count_weighted_params({'min_samples_leaf': 5}, counts)
+    assert params['min_samples_leaf'] == 1 and params['min_weight_fraction_leaf'] > 0
+
+    # sklearn counts the leaf size in unique rows, which gives a much smaller tree
+    unconverted = fit(X_unique, y_unique, counts, min_samples_leaf=5)
+    assert unconverted.tree_.node_count < 0.8 * full.tree_.node_count
+    assert (unconverted.predict(X) == full.predict(X)).mean() < 0.95
+
+    # Converted, only ties between equally good splits can be broken differently
+    converted = fit(X_unique, y_unique, counts, **params)
+    assert abs(converted.tree_.node_count - full.tree_.node_count) <= 2
+    assert (converted.predict(X) == full.predict(X)).mean() > 0.99
+
+
+def test_split_size_is_rejected_on_collapsed_rows():
+    with pytest.raises(ValueError):
+        count_weighted_params({'min_samples_split': 5}, np.ones(10))
+    assert count_weighted_params({'min_samples_split': 2, 'max_depth': 3}, np.ones(10)) == {'min_samples_split': 2,
+                                                                                             'max_depth': 3}
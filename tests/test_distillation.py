@@ -0,0 +1,54 @@
+import os
+import numpy as np
+
+from src.models.artifact import load_model
+from src.models.distillation import attribute_groups, augment_prefixes, fidelity_report
+
+
+def test_attributes_are_swapped_with_all_their_features():
+    names = ['time_since_start', 'event_position', 'current_event', 'prev_event_4', 'dept_changes', 'department',
+             'CRP_last', 'CRP_count', 'CRP', 'SIRS2Temperature', 'ngram:A>B']
+    groups = sorted(sorted(names[i] for i in group) for group in attribute_groups(names))
+    assert groups == [['CRP', 'CRP_count', 'CRP_last'], ['SIRS2Temperature'], ['department', 'dept_changes']]
+
+
+def test_augmented_rows_keep_the_prefix_of_a_training_row(trained_sepsis):
+    X = trained_sepsis.X_train_model
+    X_augmented = augment_prefixes(X, 400, swap_fraction=0.5, random_state=0)
+    assert list(X_augmented.columns) == list(X.columns)
+    assert (X_augmented.dtypes == X.dtypes).all()
+
+    def tuples(frame, columns):
+        return set(map(tuple, frame[columns].to_numpy()))
+
+    groups = [[X.columns[i] for i in group] for group in attribute_groups(list(X.columns))]
+    grouped = {name for group in groups for name in group}
+    prefix = [name for name in X.columns if name not in grouped]
+    assert {'current_event', 'prev_event_1', 'event_position', 'time_since_start'} <= set(prefix)
+
+    # Control flow and timing come from one training row, and each attribute's features
+    # from one training row of the same prefix length
+    assert tuples(X_augmented, prefix) <= tuples(X, prefix)
+    for group in groups:
+        assert tuples(X_augmented, ['event_position'] + group) <= tuples(X, ['event_position'] + group)
+    # ...but not always from the same row
+    assert not tuples(X_augmented, list(X.columns)) <= tuples(X, list(X.columns))
+
+
+def test_distillation_report_and_saved_student(trained_sepsis):
+    forest = trained_sepsis.trained_models['random_forest']
+    student = trained_sepsis.distilled
+    report = trained_sepsis.distillation_report
+    X_test, y_test = trained_sepsis.X_test_model, trained_sepsis.y_test
+
+    # Fidelity is the share of rows where the student and the forest predict the same class
+    agreement = np.mean(student.predict(X_test) == forest.predict(X_test))
+    assert report['test']['fidelity'] == fidelity_report(student, forest, X_test, y_test)['fidelity']
+    assert report['test']['fidelity'] == agreement
+    assert report['test']['teacher_accuracy'] == np.mean(forest.predict(X_test) == np.asarray(y_test))
+    assert 0 <= report['test']['soft_fidelity'] <= 1
+    assert report['student']['depth'] <= 6
+
+    # The student is saved like the other models and scores the same
+    saved = load_model(os.path.join(trained_sepsis.config['model_dir'], 'distilled_tree'))
+    np.testing.assert_allclose(saved.predict_proba(X_test), student.predict_proba(X_test))
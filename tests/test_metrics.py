@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from sklearn.metrics import classification_report, confusion_matrix
+
+from src.models.metrics import MetricAccumulator, evaluate_in_batches
+
+
+def test_report_ignores_known_classes_that_never_occur():
+    y_true = ['a', 'b', 'a', 'b']
+    y_pred = ['a', 'a', 'a', 'b']
+    proba = np.array([[0.8, 0.1, 0.1], [0.6, 0.3, 0.1], [0.9, 0.05, 0.05], [0.2, 0.7, 0.1]])
+    accumulator = MetricAccumulator(classes=['a', 'b', 'c'])
+    accumulator.update(y_true, y_pred, y_proba=proba, proba_classes=['a', 'b', 'c'])
+
+    report = accumulator.classification_report()
+    expected = classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+    assert 'c' not in report
+    assert set(report) == set(expected)
+    for key in ['a', 'b', 'macro avg', 'weighted avg']:
+        for metric in ['precision', 'recall', 'f1-score', 'support']:
+            assert report[key][metric] == pytest.approx(expected[key][metric])
+    assert report['macro avg']['precision'] == pytest.approx(0.8333, abs=1e-4)
+    np.testing.assert_array_equal(accumulator.confusion_matrix(), confusion_matrix(y_true, y_pred))
+    # The unseen class still labels a probability column
+    assert set(accumulator.mean_probabilities()['a']) == {'a', 'b', 'c'}
+
+
+class CountingForest:
+    """Fitted forest that counts its inference calls"""
+
+    def __init__(self, forest):
+        self.forest = forest
+        self.classes_ = forest.classes_
+        self.calls = {'predict': 0, 'predict_proba': 0}
+
+    def predict(self, X):
+        self.calls['predict'] += 1
+        return self.forest.predict(X)
+
+    def predict_proba(self, X):
+        self.calls['predict_proba'] += 1
+        return self.forest.predict_proba(X)
+
+
+def test_batches_with_probabilities_are_predicted_once():
+    from sklearn.ensemble import RandomForestClassifier
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 4))
+    y = np.array(['a', 'b', 'c'])[(X[:, 0] > 0).astype(int) + (X[:, 1] > 1)]
+    forest = RandomForestClassifier(n_estimators=5, random_state=0).fit(X[:200], y[:200])
+    model = CountingForest(forest)
+
+    metrics = evaluate_in_batches(model, X[200:], y[200:], batch_size=30, with_proba=True)
+    assert model.calls == {'predict': 0, 'predict_proba': 4}
+    np.testing.assert_array_equal(metrics.confusion_matrix(), confusion_matrix(y[200:], forest.predict(X[200:])))
@@ -0,0 +1,46 @@
+from src.models.run_store import RunStore
+from src.pipelines.model_trainer import ModelTrainer, sepsis_training_config
+
+
+def test_run_records_the_tuned_parameters(sepsis_log, tmp_path):
+    config = sepsis_training_config()
+    config.update(dataset_path=sepsis_log, model_dir=str(tmp_path / 'models'), report_dir=str(tmp_path / 'reports'),
+                  run_store_dir=str(tmp_path / 'runs'), run_causality_tests=False)
+    config['models']['random_forest']['enabled'] = False
+    config['search'].update(enabled=True, models=['decision_tree'], cv=2, max_rounds=1, n_jobs=1,
+                            spaces={'decision_tree': {'max_depth': [2, 3], 'min_samples_leaf': [4]}})
+    trainer = ModelTrainer(config)
+    trainer.prepare_data('sepsis')
+    trainer.train_models(trainer.X_train_model, trainer.y_train, feature_names=trainer.model_feature_names)
+    trainer.evaluate_models(trainer.X_test_model, trainer.y_test)
+    run_id = trainer.record_run('sepsis')
+
+    params = RunStore(config['run_store_dir']).get(run_id)['params']['Decision Tree']
+    tree = trainer.trained_models['decision_tree'].model
+    # The configured tree is unbounded; the recorded parameters are the searched ones
+    assert config['models']['decision_tree']['params']['max_depth'] is None
+    assert params['max_depth'] == tree.max_depth in (2, 3)
+    assert params['min_samples_leaf'] == tree.min_samples_leaf == 4
+
+
+def test_model_version_change_invalidates_cached_fit(sepsis_log, tmp_path, monkeypatch):
+    from src.common.artifact_cache import ArtifactCache
+    from src.models.decision_tree import ProcessDecisionTree
+
+    config = sepsis_training_config()
+    config.update(dataset_path=sepsis_log, model_dir=str(tmp_path / 'models'), report_dir=str(tmp_path / 'reports'),
+                  run_store_dir=str(tmp_path / 'runs'), run_causality_tests=False)
+    config['models']['random_forest']['enabled'] = False
+    cache = ArtifactCache(str(tmp_path / 'cache'))
+
+    def train():
+        trainer = ModelTrainer(config, cache=cache)
+        trainer.prepare_data('sepsis')
+        misses = cache.misses
+        trainer.train_models(trainer.X_train_model, trainer.y_train, feature_names=trainer.model_feature_names)
+        return cache.misses - misses
+
+    assert train() == 1
+    assert train() == 0
+    monkeypatch.setattr(ProcessDecisionTree, 'VERSION', ProcessDecisionTree.VERSION + '-changed')
+    assert train() == 1
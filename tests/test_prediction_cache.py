@@ -0,0 +1,118 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.models.prediction_cache import PredictionCache, ENTRY_OVERHEAD
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingModel:
+    """Model whose probabilities depend on the row, counting the rows it is asked for"""
+    classes_ = np.array(['a', 'b'])
+
+    def __init__(self):
+        self.rows = 0
+
+    def predict_proba(self, X):
+        values = X.toarray() if sparse.issparse(X) else np.asarray(X, dtype=float)
+        self.rows += len(values)
+        p = 1 / (1 + np.exp(-values.sum(axis=1)))
+        return np.column_stack([p, 1 - p])
+
+
+def rows(*values):
+    return pd.DataFrame({'x': [float(v) for v in values], 'y': 1.0})
+
+
+def test_repeated_rows_are_predicted_once():
+    model, cache = CountingModel(), PredictionCache()
+    X = rows(1, 2, 1, 3, 2, 1)
+    np.testing.assert_allclose(cache.predict_proba(model, X), model.predict_proba(X))
+    model.rows = 0
+    cache.predict_proba(model, X)
+    assert model.rows == 0
+    assert cache.stats()['hits'] == 6 and cache.stats()['misses'] == 6 and cache.stats()['entries'] == 3
+
+    # CSR rows are keyed by their non-zeros
+    keys = cache.row_keys(sparse.csr_matrix(X.to_numpy()))
+    assert keys[0] == keys[2] == keys[5] and len(set(keys)) == 3
+
+
+def test_least_recently_used_entries_are_evicted():
+    model, cache = CountingModel(), PredictionCache(max_entries=2)
+    cache.predict_proba(model, rows(1))
+    cache.predict_proba(model, rows(2))
+    cache.predict_proba(model, rows(1))  # 1 is now more recent than 2
+    cache.predict_proba(model, rows(3))
+    keys = cache.row_keys(rows(1, 2, 3))
+    assert cache.get(keys[0]) is not None and cache.get(keys[1]) is None and cache.get(keys[2]) is not None
+    assert cache.stats()['evictions'] == 1 and cache.stats()['entries'] == 2
+
+
+def test_byte_limit_evicts_the_oldest_entries():
+    entry_bytes = 2 * 8 + ENTRY_OVERHEAD
+    cache = PredictionCache(max_entries=10 ** 6, max_mb=3.5 * entry_bytes / (1024 * 1024))
+    model = CountingModel()
+    cache.predict_proba(model, rows(1, 2, 3, 4, 5))
+    keys = cache.row_keys(rows(1, 2, 3, 4, 5))
+    assert cache.stats()['entries'] == 3 and cache.bytes == 3 * entry_bytes
+    assert [cache.get(key) is not None for key in keys] == [False, False, True, True, True]
+    assert cache.stats()['evictions'] == 2
+
+
+def test_entries_expire_after_their_ttl():
+    clock, model = Clock(), CountingModel()
+    cache = PredictionCache(ttl_seconds=10, clock=clock)
+    cache.predict_proba(model, rows(1))
+    clock.now = 9.5
+    cache.predict_proba(model, rows(1, 2))
+    assert model.rows == 2
+    # Hits do not extend the lifetime of an entry
+    clock.now = 10
+    cache.predict_proba(model, rows(1, 2))
+    assert model.rows == 3
+    assert cache.stats()['expirations'] == 1 and cache.stats()['entries'] == 2
+
+
+def test_a_new_version_drops_every_entry():
+    model, cache = CountingModel(), PredictionCache()
+    cache.set_version('v1')
+    cache.predict_proba(model, rows(1, 2))
+    cache.set_version('v1')
+    assert cache.stats()['entries'] == 2 and cache.stats()['invalidations'] == 0
+    cache.set_version('v2')
+    assert cache.stats()['entries'] == 0 and cache.bytes == 0 and cache.stats()['invalidations'] == 1
+    cache.predict_proba(model, rows(1, 2))
+    assert model.rows == 4
+
+
+def test_scorer_clears_its_cache_when_the_model_is_saved_again(trained_sepsis, tmp_path):
+    from src.pipelines.batch_scoring import BatchScorer
+    from src.preprocessing.xes_reader import read_xes_columns
+
+    model_dir = str(tmp_path / 'models')
+    shutil.copytree(trained_sepsis.config['model_dir'], model_dir)
+    scorer = BatchScorer(model_dir, model_name='random_forest', prefixes='next', cache={'enabled': True})
+    events, _ = read_xes_columns(trained_sepsis.config['dataset_path'], attributes=scorer.attributes)
+    first = scorer.score(events)
+    second = scorer.score(events)
+    pd.testing.assert_frame_equal(first, second)
+    stats = scorer.cache.stats()
+    assert stats['hits'] == len(first) and stats['invalidations'] == 0
+
+    # Rewriting a metadata file changes its mtime, so the scorer reloads and starts empty
+    path = os.path.join(model_dir, 'scaler.pkl')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    scorer.check_version()
+    assert scorer.cache.stats()['invalidations'] == 1 and scorer.cache.stats()['entries'] == 0
+    pd.testing.assert_frame_equal(scorer.score(events), first)
@@ -0,0 +1,61 @@
+import numpy as np
+
+from src.preprocessing.feature_extraction import FeatureExtractor
+from src.preprocessing.prefix_trie import PrefixTrie, START
+
+
+def row_features(trace, i):
+    """Control-flow features of the prefix trace[:i + 1], computed directly from the prefix"""
+    prefix = list(trace[:i + 1])
+    window = ([START] * PrefixTrie.WINDOW + prefix)[-PrefixTrie.WINDOW:]
+    features = {'event_position': i + 1, 'unique_activities': len(set(prefix)),
+                'repeated_activities': prefix.count(prefix[-1])}
+    features.update({f'prev_event_{j}': event for j, event in enumerate(window, 1)})
+    return features
+
+
+def random_traces(n_traces=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return [list(rng.choice(list('ABCDE'), size=int(rng.integers(1, 12)))) for _ in range(n_traces)]
+
+
+def test_node_features_equal_the_per_row_loop():
+    trie = PrefixTrie()
+    traces = random_traces()
+    for trace in traces:
+        for i, node in enumerate(trie.insert(trace)):
+            assert trie.node_features(node) == row_features(trace, i)
+            assert trie.prefix(node) == trace[:i + 1]
+    # Shared prefixes share nodes
+    assert trie.stats()['events'] == sum(len(trace) for trace in traces)
+    assert trie.stats()['nodes'] < trie.stats()['events']
+
+
+def test_live_prefixes_and_saved_tries_have_the_same_features(tmp_path):
+    trie = PrefixTrie()
+    for trace in random_traces():
+        trie.insert(trace)
+    loaded = PrefixTrie.load(trie.save(str(tmp_path / 'trie.json')))
+    assert loaded.features == trie.features and loaded.visits == trie.visits
+
+    # Unseen prefixes are only added when asked, with the features of the loop
+    unseen = list('EEEEEEEEEEEEA')
+    assert trie.find(unseen) is None
+    node = 0
+    for i, activity in enumerate(unseen):
+        node = trie.step(node, activity)
+        assert trie.node_features(node) == row_features(unseen, i)
+    assert trie.find(unseen) == node
+
+
+def test_extracted_features_equal_the_per_row_loop(sepsis_log):
+    extractor = FeatureExtractor()
+    extractor.load_log(sepsis_log)
+    X, _ = extractor.extract_features('sepsis')
+
+    expected = []
+    for _, group in extractor.df.groupby('case:concept:name'):
+        trace = group['concept:name'].tolist()
+        expected += [row_features(trace, i) for i in range(len(trace) - 1)]
+    columns = list(expected[0])
+    assert X[columns].to_dict('records') == expected
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from src.models.artifact import ModelArtifact
+from src.models.random_forest import ProcessRandomForest, grow_forest_by_oob, oob_scores
+
+
+def noisy_rows(n_rows=600, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n_rows, 6)), columns=[f'f{i}' for i in range(6)])
+    y = np.where(X['f0'] + 0.5 * X['f1'] + rng.normal(scale=1.0, size=n_rows) > 0, 'a', 'b')
+    return X, y
+
+
+def test_growth_trims_the_forest_to_its_last_improvement():
+    X, y = noisy_rows()
+    model = RandomForestClassifier(n_estimators=200, random_state=0, n_jobs=1)
+    size, curve = grow_forest_by_oob(model, X, y, increment=5, min_estimators=5, tolerance=0.005, patience=2)
+
+    # Growth stopped after patience steps without improving on the chosen size
+    sizes = [step['n_estimators'] for step in curve]
+    assert sizes == list(range(5, sizes[-1] + 1, 5))
+    assert sizes[-1] < 200 and sizes.index(size) == len(sizes) - 3
+    best = curve[sizes.index(size)]['oob_accuracy']
+    assert all(step['oob_accuracy'] < best + 0.005 for step in curve[-2:])
+
+    assert len(model.estimators_) == model.n_estimators == size
+    assert model.oob_score_ == best
+    assert not hasattr(model, 'oob_decision_function_')
+
+
+def test_oob_scores_match_an_oob_forest_of_the_chosen_size():
+    X, y = noisy_rows()
+    model = RandomForestClassifier(n_estimators=200, random_state=0, n_jobs=1)
+    size, _ = grow_forest_by_oob(model, X, y, increment=5, min_estimators=5, tolerance=0.005, patience=2)
+
+    # Warm-started growth draws the same trees as one fit of the chosen size
+    direct = RandomForestClassifier(n_estimators=size, random_state=0, n_jobs=1, oob_score=True).fit(X, y)
+    np.testing.assert_allclose(model.predict_proba(X), direct.predict_proba(X))
+    assert model.oob_score_ == oob_scores(direct, y)[0]
+
+
+def test_adaptive_forest_records_its_curve(tmp_path):
+    X, y = noisy_rows()
+    forest = ProcessRandomForest(n_estimators=60, adaptive=True, tree_increment=10, min_estimators=10, n_jobs=1)
+    forest.train(X, y)
+    forest.evaluate(X, y)
+    forest.save_model(str(tmp_path))
+
+    metadata = ModelArtifact(str(tmp_path)).manifest['metadata']
+    assert metadata['n_estimators_chosen'] == len(forest.model.estimators_) <= 60
+    assert metadata['oob_curve'] == forest.oob_curve
+    assert (tmp_path / 'rf_oob_curve.csv').exists()
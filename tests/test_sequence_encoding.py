@@ -0,0 +1,89 @@
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+from src.preprocessing.feature_registry import FeatureContext, CASE, ACTIVITY, TIMESTAMP
+from src.preprocessing.sequence_encoding import (PrefixNgramEncoder, prefix_ngram_features, encode_prefixes,
+                                                 load_ngram_encoder, NGRAM_ENCODER_FILE)
+
+
+def random_events(n_cases=80, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for case in range(n_cases):
+        time = pd.Timestamp('2024-01-01', tz='UTC') + pd.Timedelta(hours=int(rng.integers(0, 1000)))
+        for _ in range(int(rng.integers(1, 10))):
+            time += pd.Timedelta(minutes=int(rng.integers(1, 300)))
+            rows.append({CASE: f'c{case}', ACTIVITY: str(rng.choice(list('ABCDE'))), TIMESTAMP: time})
+    return pd.DataFrame(rows)
+
+
+def ngram_counts(prefix, max_n):
+    """n-gram counts of a prefix, counted directly, keyed by column name"""
+    return Counter('ngram:' + '>'.join(prefix[i:i + n])
+                   for n in range(1, max_n + 1) for i in range(len(prefix) - n + 1))
+
+
+def dense_rows(matrix, names):
+    dense = matrix.toarray()
+    return [Counter({name: int(value) for name, value in zip(names, row) if value}) for row in dense]
+
+
+def test_prefix_counts_equal_directly_counted_ngrams():
+    events = random_events()
+    matrix, encoder, prefix_ids = prefix_ngram_features(events, max_n=3)
+    ctx = FeatureContext(events)
+
+    expected = []
+    for _, case in ctx.events.groupby(CASE, sort=False):
+        trace = list(case[ACTIVITY])
+        expected.extend(ngram_counts(trace[:i + 1], 3) for i in range(len(trace) - 1))
+    assert matrix.shape[0] == len(expected)
+    assert dense_rows(matrix, encoder.feature_names()) == expected
+
+    # Rows share a prefix id exactly when their counts are equal
+    signatures = [tuple(sorted(counts.items())) for counts in expected]
+    assert len(set(zip(prefix_ids, signatures))) == len(set(prefix_ids)) == len(set(signatures))
+
+
+def test_min_count_and_unknown_activities_are_left_out():
+    events = random_events()
+    encoder = PrefixNgramEncoder(max_n=2, min_count=20)
+    encoder.fit(events[CASE].to_numpy(), events[ACTIVITY].to_numpy())
+    occurrences = Counter()
+    for _, case in events.groupby(CASE, sort=False):
+        occurrences.update(ngram_counts(list(case[ACTIVITY]), 2))
+    assert sorted(encoder.feature_names()) == sorted(name for name, count in occurrences.items() if count >= 20)
+
+    # An activity outside the alphabet breaks the n-grams through it
+    matrix = encoder.transform(np.array(['x'] * 3), np.array(['A', 'Z', 'B']))
+    counts = dense_rows(matrix, encoder.feature_names())
+    kept = set(encoder.feature_names())
+    assert counts[-1] == Counter({name: 1 for name in ['ngram:A', 'ngram:B'] if name in kept})
+
+
+def test_extend_and_saved_encoder_match_the_fitted_counts(tmp_path):
+    events = random_events()
+    matrix, encoder, _ = prefix_ngram_features(events, max_n=3)
+    encoder.save(str(tmp_path / NGRAM_ENCODER_FILE))
+    loaded = load_ngram_encoder(str(tmp_path))
+    assert loaded.feature_names() == encoder.feature_names()
+    assert load_ngram_encoder(str(tmp_path / 'missing')) is None
+
+    ctx = FeatureContext(events)
+    assert (encode_prefixes(loaded, ctx) != matrix).nnz == 0
+
+    # Extending every prefix by its next activity gives the counts of the next prefix
+    every = encode_prefixes(encoder, ctx, 'all')
+    traces = [list(case[ACTIVITY]) for _, case in ctx.events.groupby(CASE, sort=False)]
+    history, following, current, nxt = [], [], [], []
+    row = 0
+    for trace in traces:
+        for i in range(len(trace) - 1):
+            history.append(([None, None] + trace[:i + 1])[-2:])
+            following.append(trace[i + 1])
+            current.append(row + i)
+            nxt.append(row + i + 1)
+        row += len(trace)
+    extended = encoder.extend(every[current], history, following)
+    assert (extended != every[nxt]).nnz == 0
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from src.common.artifact_cache import ArtifactCache
+from src.pipelines import model_trainer, stages
+
+
+def test_failed_training_fails_its_task_and_skips_dependents(tmp_path, monkeypatch):
+    # Stages read and write relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    # A BPI log is available, but its training pipeline fails
+    config = model_trainer.sepsis_training_config()
+    monkeypatch.setattr(model_trainer, 'bpi_training_config', lambda: config)
+    monkeypatch.setattr(model_trainer, 'train_bpi_models', lambda **kwargs: {'error': 'no log', 'models': []})
+    args = SimpleNamespace(dataset='bpi', analyze=False, train=True, train_enhanced=False, compare=True,
+                           causality=False)
+    graph = stages.build_task_graph(args, ArtifactCache(enabled=False), state_file=str(tmp_path / 'state.json'))
+    state = graph.run(jobs=1)
+
+    assert state['train:bpi']['status'] == 'failed'
+    assert 'no log' in state['train:bpi']['error']
+    assert state['compare:bpi']['status'] == 'skipped'
+
+
+def test_analysis_pool_is_bounded_by_jobs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    args = SimpleNamespace(dataset='all', analyze=True, train=False, train_enhanced=False, compare=False,
+                           causality=False, jobs=3)
+    graph = stages.build_task_graph(args, ArtifactCache(enabled=False))
+    assert graph.tasks['analyze'].kwargs == {'n_jobs': 3}
@@ -0,0 +1,41 @@
+import numpy as np
+
+from src.preprocessing.feature_registry import FeatureContext, CASE, ACTIVITY, prefix_rows
+from src.preprocessing.xes_reader import read_xes_columns
+from src.pipelines.suffix_prediction import SuffixPredictor
+
+
+def test_one_step_beam_reproduces_model_probabilities(trained_sepsis_prefix):
+    forest = trained_sepsis_prefix.trained_models['random_forest']
+    classes = list(forest.model.classes_)
+    # Wide enough to keep the ending and every continuation of each case
+    predictor = SuffixPredictor(trained_sepsis_prefix.config['model_dir'], model_name='random_forest',
+                                beam_width=len(classes) + 1, max_steps=1)
+    events, _ = read_xes_columns(trained_sepsis_prefix.config['dataset_path'], attributes=predictor.scorer.attributes)
+    ctx = FeatureContext(predictor.scorer.with_attributes(events))
+    cases = ctx.column(CASE).to_numpy()
+    activities = ctx.column(ACTIVITY).to_numpy()
+
+    # Extracted row j is the prefix ending at event next_rows[j]; one test prefix per case
+    next_rows = np.flatnonzero(prefix_rows(ctx, 'next'))
+    X_test = trained_sepsis_prefix.X_test[~trained_sepsis_prefix.X_test.index.duplicated()]
+    prefix_end = {}
+    for row in X_test.index:
+        prefix_end.setdefault(cases[next_rows[row]], row)
+    keep = np.array([case in prefix_end and event <= next_rows[prefix_end[case]]
+                     for event, case in enumerate(cases)])
+    suffixes = predictor.predict(ctx.events[keep])
+
+    # The models read no feature counted over the whole case, so the running cases
+    # have exactly the rows of the trainer's test split
+    assert predictor.scorer.case_complete_features == []
+    rows = list(prefix_end.values())
+    for row, proba in zip(rows, forest.predict_proba(X_test.loc[rows])):
+        event = next_rows[row]
+        beams = suffixes[(suffixes['case_id'] == str(cases[event])) & (suffixes['length'] == 1)]
+        assert not beams['complete'].any()
+        assert sorted(suffix[0] for suffix in beams['suffix']) == sorted(np.asarray(classes)[proba > 0])
+        # Every continuation is weighted by the chance that the case goes on
+        p_continue = 1 - predictor.p_end.get(activities[event], 0.0)
+        for suffix, probability in zip(beams['suffix'], beams['probability']):
+            assert np.isclose(probability, p_continue * proba[classes.index(suffix[0])])